@@ -0,0 +1,345 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This benchmark measures the Amazon AWS client of the SDK against the local
+# stand-ins of a Greengrass core and of the discovery service of the
+# "edge_st_sdk.testing" package, so that no Amazon AWS account nor Greengrass
+# core is needed.
+#
+# It reports the time taken by a discovery, the time taken to connect to the
+# core, the publish throughput at QoS 0 and 1, and the round-trip time
+# percentiles of the shadow updates, both through the shadow handler of the AWS
+# IoT SDK and through the request engine of the "aws_shadow_requests" module.
+#
+# The benchmarks are repeated, and the median of the repetitions is taken as the
+# result, to smooth out the noise of the machine.
+#
+# Each result is compared with a stored baseline, and the benchmark fails when
+# a result is worse than the baseline by more than the given tolerance. The
+# baseline depends on the machine it has been measured on: save a new one with
+# the "-s" option before comparing results on a different machine.
+#
+# The certificates of the stand-ins are generated through the "openssl" command
+# line tool, which is therefore required.
+
+
+# IMPORT
+
+from __future__ import print_function
+import sys
+import os
+import getopt
+import json
+import threading
+import time
+
+from edge_st_sdk.testing.local_core import LocalCore
+from edge_st_sdk.utils.edge_st_exceptions import ConfigurationException
+
+
+# CONSTANTS
+
+# Usage message.
+USAGE = """Usage:
+
+python <application>.py [-n <messages>] [-r <requests>] [-c <connections>] [-k <repetitions>] [-b <baseline>] [-t <tolerance>] [-s]
+
+"""
+
+# Help message.
+HELP = """-n, --messages
+    Number of messages to publish per quality of service (default: 5000)
+-r, --requests
+    Number of shadow updates per approach (default: 500)
+-c, --connections
+    Number of discoveries and connections (default: 10)
+-k, --repetitions
+    Number of repetitions of the benchmarks (default: 3)
+-b, --baseline
+    Path of the baseline (default: "baselines/benchmark_aws_client.json" next to this script)
+-t, --tolerance
+    Tolerated worsening with respect to the baseline, in percentage (default: 50)
+-s, --save
+    Save the results as the new baseline instead of comparing them
+-h, --help
+    Help information
+
+"""
+
+# Default path of the baseline.
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'baselines', 'benchmark_aws_client.json')
+
+# Results: name, unit, and whether higher values are better.
+RESULTS = [
+    ('discovery_p50', 'ms', False),
+    ('connect_p50', 'ms', False),
+    ('publish_qos0', 'msg/s', True),
+    ('publish_qos1', 'msg/s', True),
+    ('shadow_sdk_p50', 'ms', False),
+    ('shadow_sdk_p90', 'ms', False),
+    ('shadow_sdk_p99', 'ms', False),
+    ('shadow_engine_p50', 'ms', False),
+    ('shadow_engine_p90', 'ms', False),
+    ('shadow_engine_p99', 'ms', False)
+]
+
+# Timeout of the shadow requests, and maximum time waited for the messages.
+TIMEOUT_s = 10
+
+# Topic of the published messages.
+TOPIC = 'benchmark/telemetry'
+
+# Payload of the published messages and of the shadow updates.
+PAYLOAD = json.dumps({'Board_id': 'IoT_Device_1', 'Temperature': '25.3',
+    'Humidity': '45.1', 'Pressure': '1012.34'})
+STATE = '{"state":{"reported":{"temperature":%d}}}'
+
+
+# FUNCTIONS
+
+#
+# Running a function with the standard output discarded, to keep the messages
+# of the SDK out of the report.
+#
+def quietly(function, *args):
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            return function(*args)
+        finally:
+            sys.stdout = stdout
+
+#
+# Getting a percentile of a list of values, by the nearest-rank method.
+#
+def percentile(values, p):
+    values = sorted(values)
+    index = max(int(len(values) * p / 100.0 + 0.5) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+#
+# Measuring the time taken by the discovery, and by the connection to the core.
+#
+def measure_connections(core, count):
+    discoveries = []
+    connections = []
+    for i in range(count):
+        greengrass = core.get_greengrass()
+        start = time.time()
+        client = quietly(core.get_client, greengrass, 'Benchmark_Device_%d' % (i))
+        discoveries.append(time.time() - start)
+        start = time.time()
+        quietly(client.connect)
+        connections.append(time.time() - start)
+        quietly(client.disconnect)
+    return (percentile(discoveries, 50) * 1e3, percentile(connections, 50) * 1e3)
+
+#
+# Measuring the publish throughput: up to the messages received by the broker.
+#
+def measure_publish(core, client, qos, count):
+    broker = core.get_broker()
+    expected = broker.get_received() + count
+    start = time.time()
+    for _ in range(count):
+        client.publish(TOPIC, PAYLOAD, qos)
+    while broker.get_received() < expected:
+        if time.time() - start > TIMEOUT_s + count / 1000.0:
+            print('Only %d messages out of %d received at QoS %d.' % (count - expected + broker.get_received(), count, qos))
+            break
+        time.sleep(0.001)
+    return count / (time.time() - start)
+
+#
+# Measuring the round-trip time of the shadow updates, sent one at a time.
+#
+def measure_shadow(client, count):
+    response = threading.Event()
+    statuses = []
+
+    def callback(payload, response_status, token):
+        statuses.append(response_status)
+        response.set()
+
+    times = []
+    for i in range(count + 1):
+        response.clear()
+        start = time.time()
+        client.update_shadow_state(STATE % (i), callback, TIMEOUT_s)
+        response.wait(TIMEOUT_s + 1)
+        # The first update subscribes to the response topics: not measured.
+        if i:
+            times.append(time.time() - start)
+    failed = len([s for s in statuses if s != 'accepted'])
+    if failed:
+        print('%d shadow updates out of %d not accepted.' % (failed, count + 1))
+    return [percentile(times, p) * 1e3 for p in (50, 90, 99)]
+
+#
+# Running the benchmarks.
+#
+def run(core, messages, requests, connections):
+    results = {}
+    (results['discovery_p50'], results['connect_p50']) = \
+        measure_connections(core, connections)
+
+    greengrass = core.get_greengrass()
+    client = quietly(core.get_client, greengrass, 'Benchmark_Device')
+    quietly(client.connect)
+    try:
+        results['publish_qos0'] = measure_publish(core, client, 0, messages)
+        results['publish_qos1'] = measure_publish(core, client, 1, messages)
+        (results['shadow_sdk_p50'], results['shadow_sdk_p90'],
+            results['shadow_sdk_p99']) = measure_shadow(client, requests)
+        client.enable_shadow_requests()
+        (results['shadow_engine_p50'], results['shadow_engine_p90'],
+            results['shadow_engine_p99']) = measure_shadow(client, requests)
+    finally:
+        quietly(client.disconnect)
+    return results
+
+#
+# Running the benchmarks repeatedly, taking the median of each result.
+#
+def run_repeatedly(core, messages, requests, connections, repetitions):
+    runs = [run(core, messages, requests, connections) for _ in range(repetitions)]
+    return dict((name, percentile([r[name] for r in runs], 50)) for (name, _, _) in RESULTS)
+
+#
+# Reporting the results, compared with the baseline if any. Returning the
+# number of results worse than the baseline by more than the tolerance.
+#
+def report(results, baseline, tolerance):
+    regressions = 0
+    print('%-20s %8s %12s %12s %9s' % ('Benchmark', 'Unit', 'Result', 'Baseline', 'Change'))
+    for (name, unit, higher_is_better) in RESULTS:
+        value = results[name]
+        if name not in baseline:
+            print('%-20s %8s %12.2f %12s %9s' % (name, unit, value, '-', '-'))
+            continue
+        reference = baseline[name]
+        change = (value - reference) * 100.0 / reference if reference else 0.0
+        worsening = -change if higher_is_better else change
+        flag = ''
+        if worsening > tolerance:
+            regressions += 1
+            flag = '  REGRESSION'
+        print('%-20s %8s %12.2f %12.2f %+8.1f%%%s' % (name, unit, value, reference, change, flag))
+    return regressions
+
+
+# MAIN APPLICATION
+
+#
+# Main application.
+#
+def main(argv):
+    messages = 5000
+    requests = 500
+    connections = 10
+    repetitions = 3
+    baseline_path = BASELINE_PATH
+    tolerance = 50.0
+    save = False
+
+    # Reading input.
+    try:
+        opts, args = getopt.getopt(argv, "hn:r:c:k:b:t:s", ["help", "messages=", "requests=", "connections=", "repetitions=", "baseline=", "tolerance=", "save"])
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                print(HELP)
+                sys.exit(0)
+            if opt in ("-n", "--messages"):
+                messages = int(arg)
+            if opt in ("-r", "--requests"):
+                requests = int(arg)
+            if opt in ("-c", "--connections"):
+                connections = int(arg)
+            if opt in ("-k", "--repetitions"):
+                repetitions = int(arg)
+            if opt in ("-b", "--baseline"):
+                baseline_path = arg
+            if opt in ("-t", "--tolerance"):
+                tolerance = float(arg)
+            if opt in ("-s", "--save"):
+                save = True
+    except (getopt.GetoptError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    # Starting the local core.
+    core = LocalCore()
+    try:
+        core.start()
+    except ConfigurationException as e:
+        print('Cannot start the local core: %s' % (str(e)))
+        sys.exit(1)
+
+    # Measuring.
+    try:
+        print('Measuring %d connections, %d messages per QoS, %d shadow updates per approach, %d times...\n' % (connections, messages, requests, repetitions))
+        results = run_repeatedly(core, messages, requests, connections, repetitions)
+    finally:
+        core.stop()
+
+    # Saving or comparing with the baseline.
+    if save:
+        directory = os.path.dirname(baseline_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(baseline_path, 'w') as f:
+            json.dump(dict((name, round(value, 2)) for (name, value) in results.items()), f, indent=4, sort_keys=True)
+            f.write('\n')
+        report(results, {}, tolerance)
+        print('\nBaseline saved to "%s".' % (baseline_path))
+        return
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    else:
+        print('No baseline found at "%s".\n' % (baseline_path))
+    regressions = report(results, baseline, tolerance)
+    if regressions:
+        print('\n%d results worse than the baseline by more than %.0f%%.' % (regressions, tolerance))
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+
+    try:
+        main(sys.argv[1:])
+    except KeyboardInterrupt:
+        try:
+            sys.exit(0)
+        except SystemExit:
+            os._exit(0)
@@ -0,0 +1,559 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This benchmark measures how many BlueST devices, and how many samples per
+# second, a gateway can sustain through the flow of the "example_ble_aws_2.py"
+# application example, from the notifications of the devices to the messages
+# received by the core, without any Bluetooth Low Energy hardware nor Amazon AWS
+# account.
+#
+# The devices are simulated by the "edge_st_sdk.gateway.simulated_node" module:
+# each one exports the switch feature, notifying at the given switch rate, and
+# the environmental and inertial features, notifying at the swept sample rate.
+# As in the application example, the notifications are served by a
+# notification pump and dispatched on the main thread to listeners that publish
+# a message per switch notification and store the sensors samples, and a thread
+# periodically publishes the aggregated sensors data and updates the shadow of
+# each device. Each device has its own client, connected to the local stand-in
+# of a Greengrass core of the "edge_st_sdk.testing" package; the switch actuation
+# performed by the Lambda function of the example is not part of the flow.
+#
+# The stand-in core runs in the process of the benchmark, and each step of the
+# sweep runs the gateway in a new process, so that the CPU time and the memory
+# of the gateway are measured on their own. For each number of devices and
+# sample rate the benchmark reports:
+# - the share of the notifications emitted by the devices and handled by the
+#   gateway, and the share of the messages received by the core;
+# - the percentiles of the end-to-end latency of the switch messages, from the
+#   notification of the device to the reception by the core, and the 99th
+#   percentile of the age of the aggregated data when received by the core;
+# - the CPU time and the memory (RSS) used per device.
+# A step is saturated when notifications or messages get lost, or when the
+# latency exceeds the given maximum; the sweep of a sample rate stops at the
+# first saturated step, and the saturation points are summarized at the end.
+#
+# The certificates of the stand-in core are generated through the "openssl"
+# command line tool, which is therefore required.
+
+
+# IMPORT
+
+from __future__ import print_function
+import sys
+import os
+import getopt
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+
+from edge_st_sdk.aws.aws_greengrass import AWSGreengrass
+from edge_st_sdk.gateway.notification_pump import NotificationPump
+from edge_st_sdk.gateway.simulated_node import SWITCH_FEATURE
+from edge_st_sdk.gateway.simulated_node import SimulatedRadio
+from edge_st_sdk.gateway.simulated_node import create_bluest_node
+from edge_st_sdk.telemetry.sample_store import SampleStore
+from edge_st_sdk.telemetry.telemetry_encoder import TelemetryEncoder
+from edge_st_sdk.testing.local_core import ENDPOINT
+from edge_st_sdk.testing.local_core import LocalCore
+from edge_st_sdk.utils.edge_st_exceptions import ConfigurationException
+
+
+# CONSTANTS
+
+# Usage message.
+USAGE = """Usage:
+
+python <application>.py [-d <devices>] [-r <rates>] [-s <switch_rate>] [-p <period>] [-t <duration>] [-x <connections>] [-l <latency>]
+
+"""
+
+# Help message.
+HELP = """-d, --devices
+    Comma-separated numbers of devices to sweep (default: 1,10,25,50,100)
+-r, --rates
+    Comma-separated samples per second of each sensor feature to sweep (default: 1,10,50)
+-s, --switch-rate
+    Switch notifications per second per device (default: 1)
+-p, --period
+    Publishing period of the aggregated sensors data, in seconds (default: 1)
+-t, --duration
+    Duration of each step, in seconds (default: 10)
+-x, --connections
+    Maximum number of connections shared by the devices; one connection per device if 0 (default: 0)
+-l, --latency
+    Maximum 99th percentile of the switch latency before saturation, in milliseconds (default: 100)
+-h, --help
+    Help information
+
+"""
+
+# Thresholds of the saturation: minimum shares of the notifications handled and
+# of the messages received.
+MIN_HANDLED = 0.95
+MIN_DELIVERED = 0.99
+
+# Time waited for the last messages to reach the core at the end of a step.
+DRAIN_s = 0.5
+
+# Timeout of the shadow requests and of the flush of the publishing queues.
+TIMEOUT_s = 5
+
+# Capacity of the publishing queues, as in the application example.
+PUBLISH_PIPELINE_CAPACITY = 32
+
+# MQTT topics, as in the application example.
+MQTT_IOT_DEVICE_SWITCH_SENSE_TOPIC = "iot_device/switch_sense"
+MQTT_IOT_DEVICE_ENV_INE_TOPIC =      "iot_device/env_ine_sense"
+
+# Keys of the aggregated sensors data, as in the application example.
+TELEMETRY_KEYS = ['Temperature', 'Humidity', 'Pressure',
+    'ACC-X', 'ACC-Y', 'ACC-Z',
+    'GYR-X', 'GYR-Y', 'GYR-Z',
+    'MAG-X', 'MAG-Y', 'MAG-Z']
+SHADOW_KEYS = ['temperature', 'humidity', 'pressure',
+    'accelerometer_x', 'accelerometer_y', 'accelerometer_z',
+    'gyroscope_x', 'gyroscope_y', 'gyroscope_z',
+    'magnetometer_x', 'magnetometer_y', 'magnetometer_z']
+
+# Channels of the sensors data store, in the order of the keys above.
+SENSORS_CHANNELS = [
+    ('Temperature', ['Temperature']),
+    ('Humidity', ['Humidity']),
+    ('Pressure', ['Pressure']),
+    ('Accelerometer', ['X', 'Y', 'Z']),
+    ('Gyroscope', ['X', 'Y', 'Z']),
+    ('Magnetometer', ['X', 'Y', 'Z'])]
+
+# Number of sensor features of a device.
+SENSOR_FEATURES = len(SENSORS_CHANNELS)
+
+
+# FUNCTIONS
+
+#
+# Getting the CPU time of the process.
+#
+def cpu_time():
+    return time.process_time() if hasattr(time, 'process_time') else time.clock()
+
+#
+# Getting the resident memory of the process, in kB.
+#
+def get_rss_kB():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+#
+# Running a function with the standard output discarded, to keep the messages
+# of the SDK out of the report.
+#
+def quietly(function, *args):
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            return function(*args)
+        finally:
+            sys.stdout = stdout
+
+#
+# Getting a percentile of a list of values, by the nearest-rank method.
+#
+def percentile(values, p):
+    values = sorted(values)
+    index = max(int(len(values) * p / 100.0 + 0.5) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+#
+# Getting the key identifying a message, from its payload.
+#
+def get_message_key(payload):
+    if not isinstance(payload, bytes):
+        payload = payload.encode('utf-8')
+    return zlib.crc32(payload)
+
+#
+# Shadow callback, counting the updates not accepted.
+#
+def shadow_callback(payload, response_status, token):
+    if response_status != 'accepted':
+        shadow_failures[0] += 1
+
+
+# INTERFACES
+
+#
+# Listener of the switch feature, publishing a message per notification as the
+# application example does, and recording when the notification was emitted.
+#
+class SwitchListener(object):
+
+    #
+    # Constructor.
+    #
+    def __init__(self, client, emitted):
+        self._client = client
+        self._emitted = emitted
+        self._encoder = None
+
+    #
+    # To be called whenever the feature updates its data.
+    #
+    def on_update(self, feature, sample):
+        notifications[0] += 1
+        if self._encoder is None:
+            self._encoder = TelemetryEncoder.for_feature(feature)
+        sample_json_str = self._encoder.encode(
+            ['({:d}) {:s} {:s}'.format(
+                sample.get_timestamp(),
+                self._client.get_client_id(),
+                str(sample.get_data()[0])
+                )])
+        self._emitted[get_message_key(sample_json_str)] = sample.get_emission_time()
+        self._client.publish(MQTT_IOT_DEVICE_SWITCH_SENSE_TOPIC, sample_json_str, 0)
+
+
+#
+# Listener of the sensor features, storing the samples with the time they were
+# emitted.
+#
+class SensorsListener(object):
+
+    #
+    # Constructor.
+    #
+    def __init__(self, data, channel):
+        self._data = data
+        self._channel = channel
+
+    #
+    # To be called whenever the feature updates its data.
+    #
+    def on_update(self, feature, sample):
+        notifications[0] += 1
+        self._data.append(self._channel, sample.get_data(), sample.get_emission_time())
+
+
+# THREADS
+
+#
+# Publishing the aggregated sensors data and updating the shadows periodically,
+# as the application example does, recording the time the newest sample of each
+# message was emitted.
+#
+class SensorsThread(threading.Thread):
+
+    #
+    # Constructor.
+    #
+    def __init__(self, devices, period, emitted):
+        threading.Thread.__init__(self)
+        self._devices = devices
+        self._period = period
+        self._emitted = emitted
+        self._stop_event = threading.Event()
+        self.daemon = True
+
+    #
+    # Stopping the thread.
+    #
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    #
+    # Run the thread.
+    #
+    def run(self):
+        snapshots = {}
+        while not self._stop_event.wait(self._period):
+            for (client, data, telemetry_encoder, shadow_encoder) in self._devices:
+                snapshot = data.snapshot(snapshots.get(client))
+                snapshots[client] = snapshot
+                if not all(snapshot.valid):
+                    continue
+                values = snapshot.get_values()
+                sample_json_str = telemetry_encoder.encode(values)
+                self._emitted[get_message_key(sample_json_str)] = max(snapshot.timestamps)
+                client.publish(MQTT_IOT_DEVICE_ENV_INE_TOPIC, sample_json_str, 0)
+                client.update_shadow_state(shadow_encoder.encode(values), shadow_callback, TIMEOUT_s)
+
+
+# STEPS
+
+#
+# Running the gateway for a step of the sweep, in a process of its own.
+#
+def run_step(connection, settings):
+    try:
+        connection.send(measure_step(settings))
+    except BaseException as e:
+        connection.send({'error': '%s: %s' % (type(e).__name__, str(e))})
+    connection.close()
+
+#
+# Measuring the gateway for a step of the sweep.
+#
+def measure_step(settings):
+    global notifications, shadow_failures
+    notifications = [0]
+    shadow_failures = [0]
+    switch_emitted = {}
+    telemetry_emitted = {}
+    rss_start = get_rss_kB()
+
+    # Setting up the devices and their clients as the application example does.
+    edge = AWSGreengrass(ENDPOINT, settings['ca_path'], settings['cache_path'], discovery_port=settings['discovery_port'])
+    if settings['connections']:
+        edge.enable_multiplexing(settings['connections'])
+    sensors_store = SampleStore(SENSORS_CHANNELS)
+    pump = NotificationPump()
+    radio = SimulatedRadio()
+    nodes = []
+    devices = []
+    clients = []
+    for i in range(settings['devices']):
+        name = 'IoT_Device_%d' % (i + 1)
+        node = create_bluest_node(name, '00:00:00:00:%02x:%02x' % (i // 256, i % 256), settings['switch_rate'], settings['rate'], settings['rate'])
+        client = quietly(edge.get_client, name, settings['certificate_path'], settings['private_key_path'])
+        quietly(client.connect)
+        client.enable_publish_pipeline(PUBLISH_PIPELINE_CAPACITY, False)
+        client.enable_shadow_requests()
+        client.enable_shadow_diff()
+        client.enable_shadow_compaction(TIMEOUT_s)
+        clients.append(client)
+        data = sensors_store.add_device(name)
+        devices.append((client, data,
+            TelemetryEncoder(TELEMETRY_KEYS, [('Board_id', name)], as_strings=True),
+            TelemetryEncoder(SHADOW_KEYS, path=['state', 'desired'])))
+        node.connect()
+        pump.add_node(node)
+        for feature in node.get_features():
+            if feature.get_name() == SWITCH_FEATURE:
+                listener = SwitchListener(client, switch_emitted)
+            else:
+                listener = SensorsListener(data, sensors_store.get_channel_index(feature.get_name()))
+            pump.add_listener(feature, listener)
+            node.enable_notifications(feature)
+        nodes.append(node)
+
+    # Running, with the notifications scheduled from now on.
+    sensors_thread = SensorsThread(devices, settings['period'], telemetry_emitted)
+    for node in nodes:
+        radio.add_node(node)
+    pump.start()
+    radio.start()
+    sensors_thread.start()
+    start = time.time()
+    cpu_start = cpu_time()
+    while time.time() - start < settings['duration']:
+        pump.dispatch(0.05)
+    radio.stop()
+    elapsed = time.time() - start
+    cpu_s = cpu_time() - cpu_start
+    rss_end = get_rss_kB()
+    handled = notifications[0]
+
+    # Draining the notifications and the messages left.
+    sensors_thread.stop()
+    while pump.dispatch(0.1):
+        pass
+    pump.stop()
+    for client in clients:
+        client.disable_publish_pipeline(TIMEOUT_s)
+    result = {
+        'elapsed': elapsed,
+        'cpu_s': cpu_s,
+        'rss_kB': rss_end - rss_start,
+        'notifications': handled,
+        'dropped': pump.get_dropped(),
+        'shadow_failures': shadow_failures[0],
+        'switch_emitted': switch_emitted,
+        'telemetry_emitted': telemetry_emitted
+    }
+    for client in clients:
+        quietly(client.disconnect)
+    return result
+
+
+# MAIN APPLICATION
+
+#
+# Main application.
+#
+def main(argv):
+    devices_list = [1, 10, 25, 50, 100]
+    rates = [1, 10, 50]
+    switch_rate = 1.0
+    period = 1.0
+    duration = 10.0
+    connections = 0
+    max_latency_ms = 100.0
+
+    # Reading input.
+    try:
+        opts, args = getopt.getopt(argv, "hd:r:s:p:t:x:l:", ["help", "devices=", "rates=", "switch-rate=", "period=", "duration=", "connections=", "latency="])
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                print(HELP)
+                sys.exit(0)
+            if opt in ("-d", "--devices"):
+                devices_list = [int(value) for value in arg.split(',')]
+            if opt in ("-r", "--rates"):
+                rates = [float(value) for value in arg.split(',')]
+            if opt in ("-s", "--switch-rate"):
+                switch_rate = float(arg)
+            if opt in ("-p", "--period"):
+                period = float(arg)
+            if opt in ("-t", "--duration"):
+                duration = float(arg)
+            if opt in ("-x", "--connections"):
+                connections = int(arg)
+            if opt in ("-l", "--latency"):
+                max_latency_ms = float(arg)
+    except (getopt.GetoptError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    # Starting the local core, and recording when the messages are received.
+    core = LocalCore()
+    try:
+        core.start()
+    except ConfigurationException as e:
+        print('Cannot start the local core: %s' % (str(e)))
+        sys.exit(1)
+    received = {}
+
+    def publish_callback(client_id, topic, payload):
+        if topic in (MQTT_IOT_DEVICE_SWITCH_SENSE_TOPIC, MQTT_IOT_DEVICE_ENV_INE_TOPIC):
+            received[get_message_key(payload)] = time.time()
+
+    core.get_broker().add_publish_callback(publish_callback)
+    certificates = core.get_certificates()
+    cache_root = tempfile.mkdtemp(prefix='edge_st_benchmark_')
+    context = multiprocessing.get_context('spawn') if hasattr(multiprocessing, 'get_context') else multiprocessing
+
+    # Sweeping.
+    print('%8s %8s %9s %8s %10s %8s %8s %8s %9s %9s %10s  %s' % ('Devices', 'Rate Hz', 'Notif/s', 'Handled', 'Delivered', 'p50 ms', 'p90 ms', 'p99 ms', 'Age p99', 'CPU/dev', 'RSS/dev', 'Status'))
+    summary = []
+    try:
+        for rate in rates:
+            sustained = None
+            saturated = None
+            for devices in devices_list:
+                received.clear()
+                settings = {
+                    'ca_path': certificates.ca_certificate_path,
+                    'certificate_path': certificates.device_certificate_path,
+                    'private_key_path': certificates.device_private_key_path,
+                    'discovery_port': core.get_discovery_server().get_port(),
+                    'cache_path': os.path.join(cache_root, 'step_%d' % (len(summary) * len(devices_list) + devices)),
+                    'devices': devices,
+                    'rate': rate,
+                    'switch_rate': switch_rate,
+                    'period': period,
+                    'duration': duration,
+                    'connections': connections
+                }
+                (parent_connection, child_connection) = context.Pipe()
+                process = context.Process(target=run_step, args=(child_connection, settings))
+                process.start()
+                result = parent_connection.recv()
+                process.join()
+                if 'error' in result:
+                    print('Step with %d devices at %g Hz failed: %s' % (devices, rate, result['error']))
+                    saturated = (devices, None)
+                    break
+                time.sleep(DRAIN_s)
+
+                # Computing the results.
+                offered = devices * (switch_rate + SENSOR_FEATURES * rate) * result['elapsed']
+                handled = min(result['notifications'] / offered, 1.0) if offered else 1.0
+                switch_latencies = [received[key] - emitted for (key, emitted) in result['switch_emitted'].items() if key in received]
+                telemetry_ages = [received[key] - emitted for (key, emitted) in result['telemetry_emitted'].items() if key in received]
+                sent = len(result['switch_emitted']) + len(result['telemetry_emitted'])
+                delivered = float(len(switch_latencies) + len(telemetry_ages)) / sent if sent else 1.0
+                latencies_ms = [percentile(switch_latencies, p) * 1e3 for p in (50, 90, 99)] if switch_latencies else None
+                age_ms = percentile(telemetry_ages, 99) * 1e3 if telemetry_ages else None
+                is_saturated = handled < MIN_HANDLED or delivered < MIN_DELIVERED \
+                    or (latencies_ms is not None and latencies_ms[2] > max_latency_ms)
+                notifications_per_s = result['notifications'] / result['elapsed']
+                print('%8d %8g %9d %7.1f%% %9.1f%% %8s %8s %8s %9s %8.2f%% %7d kB  %s' % (
+                    devices, rate, notifications_per_s, handled * 100, delivered * 100,
+                    '%.2f' % latencies_ms[0] if latencies_ms else '-',
+                    '%.2f' % latencies_ms[1] if latencies_ms else '-',
+                    '%.2f' % latencies_ms[2] if latencies_ms else '-',
+                    '%.0f ms' % age_ms if age_ms is not None else '-',
+                    result['cpu_s'] / result['elapsed'] * 100 / devices,
+                    result['rss_kB'] / devices,
+                    'SATURATED' if is_saturated else 'ok'))
+                if is_saturated:
+                    saturated = (devices, notifications_per_s)
+                    break
+                sustained = (devices, notifications_per_s)
+            summary.append((rate, sustained, saturated))
+    finally:
+        core.stop()
+        shutil.rmtree(cache_root, True)
+
+    # Summarizing the saturation points.
+    print('\nSaturation points:')
+    for (rate, sustained, saturated) in summary:
+        line = '  at %g Hz: ' % (rate)
+        if sustained:
+            line += 'sustained up to %d devices (%d notifications/s)' % sustained
+        else:
+            line += 'not sustained with %d devices' % (devices_list[0])
+        if saturated:
+            line += ', saturated at %d devices.' % (saturated[0])
+        else:
+            line += ', not saturated within the sweep.'
+        print(line)
+
+
+if __name__ == "__main__":
+
+    try:
+        main(sys.argv[1:])
+    except KeyboardInterrupt:
+        try:
+            sys.exit(0)
+        except SystemExit:
+            os._exit(0)
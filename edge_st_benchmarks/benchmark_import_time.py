@@ -0,0 +1,257 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This benchmark guards the cold-start cost of the SDK, i.e. the time taken to
+# import its modules in a fresh interpreter, as paid by every tool or Lambda
+# function using it.
+#
+# Each import is measured in a new interpreter, excluding the start-up of the
+# interpreter itself, and the median of the repetitions is reported. The
+# modules that do not depend on a given edge backend must not load its
+# libraries, e.g. importing "edge_st_sdk" must not load the AWS IoT Python SDK,
+# which is imported only on the first use of the "aws" backend: the benchmark
+# fails whenever one of them does.
+#
+# Each result is also compared with a stored baseline, and the benchmark fails
+# when a result is worse than the baseline by more than the given tolerance and
+# by more than the given number of milliseconds, so that the shortest imports
+# do not fail on noise. The baseline depends on the machine it has been
+# measured on: save a new one with the "-s" option before comparing results on
+# a different machine.
+
+
+# IMPORT
+
+from __future__ import print_function
+import sys
+import os
+import getopt
+import json
+import subprocess
+
+
+# CONSTANTS
+
+# Usage message.
+USAGE = """Usage:
+
+python <application>.py [-k <repetitions>] [-b <baseline>] [-t <tolerance>] [-m <margin>] [-s]
+
+"""
+
+# Help message.
+HELP = """-k, --repetitions
+    Number of imports measured per benchmark, each in a new interpreter (default: 10)
+-b, --baseline
+    Path of the baseline (default: "baselines/benchmark_import_time.json" next to this script)
+-t, --tolerance
+    Tolerated worsening with respect to the baseline, in percentage (default: 50)
+-m, --margin
+    Tolerated worsening with respect to the baseline, in milliseconds (default: 5)
+-s, --save
+    Save the results as the new baseline instead of comparing them
+-h, --help
+    Help information
+
+"""
+
+# Default path of the baseline.
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'baselines', 'benchmark_import_time.json')
+
+# Root folder of the SDK, made importable by the measuring interpreters.
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries of the edge backends.
+BACKEND_LIBRARIES = ['AWSIoTPythonSDK']
+
+# Benchmarks: name, statement to measure, and whether the libraries of the
+# edge backends may be loaded.
+BENCHMARKS = [
+    ('import_sdk', 'import edge_st_sdk', False),
+    ('import_edge_client', 'import edge_st_sdk.edge_client', False),
+    ('import_device_registry', 'import edge_st_sdk.gateway.device_registry', False),
+    ('import_telemetry_encoder', 'import edge_st_sdk.telemetry.telemetry_encoder', False),
+    ('load_aws_backend', 'import edge_st_sdk; edge_st_sdk.get_backend("aws").get_class()', True)
+]
+
+# Script run by the measuring interpreters: it prints the time taken by the
+# statement in seconds and the libraries of the edge backends it has loaded.
+MEASURE = """
+import json, sys, time
+start = time.time()
+%s
+elapsed = time.time() - start
+print(json.dumps([elapsed, [m for m in %r if m in sys.modules]]))
+"""
+
+
+# FUNCTIONS
+
+#
+# Getting a percentile of a list of values, by the nearest-rank method.
+#
+def percentile(values, p):
+    values = sorted(values)
+    index = max(int(len(values) * p / 100.0 + 0.5) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+#
+# Measuring a statement once in a new interpreter. Returning the time taken in
+# milliseconds and the libraries of the edge backends loaded.
+#
+def measure_once(statement):
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join( \
+        [ROOT_PATH] + ([environment['PYTHONPATH']] if environment.get('PYTHONPATH') else []))
+    # Bytecode is written by the first run, so that every run reads it.
+    output = subprocess.check_output( \
+        [sys.executable, '-c', MEASURE % (statement, BACKEND_LIBRARIES)], \
+        env=environment, cwd=ROOT_PATH)
+    (elapsed, loaded) = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    return (elapsed * 1e3, loaded)
+
+#
+# Running the benchmarks. Returning the results and the number of benchmarks
+# loading libraries of the edge backends they must not load.
+#
+def run(repetitions):
+    results = {}
+    violations = 0
+    for (name, statement, backend_allowed) in BENCHMARKS:
+        # Warming up: compiling the modules.
+        measure_once(statement)
+        times = []
+        loaded = set()
+        for _ in range(repetitions):
+            (elapsed, libraries) = measure_once(statement)
+            times.append(elapsed)
+            loaded.update(libraries)
+        results[name] = percentile(times, 50)
+        if loaded and not backend_allowed:
+            violations += 1
+            print('"%s" loads %s.' % (statement, ', '.join(sorted(loaded))))
+    return (results, violations)
+
+#
+# Reporting the results, compared with the baseline if any. Returning the
+# number of results worse than the baseline by more than the tolerance and
+# the margin.
+#
+def report(results, baseline, tolerance, margin):
+    regressions = 0
+    print('%-26s %8s %12s %12s %9s' % ('Benchmark', 'Unit', 'Result', 'Baseline', 'Change'))
+    for (name, _, _) in BENCHMARKS:
+        value = results[name]
+        if name not in baseline:
+            print('%-26s %8s %12.2f %12s %9s' % (name, 'ms', value, '-', '-'))
+            continue
+        reference = baseline[name]
+        change = (value - reference) * 100.0 / reference if reference else 0.0
+        flag = ''
+        if change > tolerance and value - reference > margin:
+            regressions += 1
+            flag = '  REGRESSION'
+        print('%-26s %8s %12.2f %12.2f %+8.1f%%%s' % (name, 'ms', value, reference, change, flag))
+    return regressions
+
+
+# MAIN APPLICATION
+
+#
+# Main application.
+#
+def main(argv):
+    repetitions = 10
+    baseline_path = BASELINE_PATH
+    tolerance = 50.0
+    margin = 5.0
+    save = False
+
+    # Reading input.
+    try:
+        opts, args = getopt.getopt(argv, "hk:b:t:m:s", ["help", "repetitions=", "baseline=", "tolerance=", "margin=", "save"])
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                print(HELP)
+                sys.exit(0)
+            if opt in ("-k", "--repetitions"):
+                repetitions = int(arg)
+            if opt in ("-b", "--baseline"):
+                baseline_path = arg
+            if opt in ("-t", "--tolerance"):
+                tolerance = float(arg)
+            if opt in ("-m", "--margin"):
+                margin = float(arg)
+            if opt in ("-s", "--save"):
+                save = True
+    except (getopt.GetoptError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    # Measuring.
+    print('Measuring %d imports per benchmark...\n' % (repetitions))
+    (results, violations) = run(repetitions)
+    if violations:
+        print('\n%d imports load libraries of edge backends they do not use.' % (violations))
+        sys.exit(2)
+
+    # Saving or comparing with the baseline.
+    if save:
+        directory = os.path.dirname(baseline_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(baseline_path, 'w') as f:
+            json.dump(dict((name, round(value, 2)) for (name, value) in results.items()), f, indent=4, sort_keys=True)
+            f.write('\n')
+        report(results, {}, tolerance, margin)
+        print('\nBaseline saved to "%s".' % (baseline_path))
+        return
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    else:
+        print('No baseline found at "%s".\n' % (baseline_path))
+    regressions = report(results, baseline, tolerance, margin)
+    if regressions:
+        print('\n%d results worse than the baseline by more than %.0f%% and %.0f ms.' % (regressions, tolerance, margin))
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+
+    try:
+        main(sys.argv[1:])
+    except KeyboardInterrupt:
+        try:
+            sys.exit(0)
+        except SystemExit:
+            os._exit(0)
@@ -0,0 +1,190 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This benchmark compares the size and the CPU cost of the aggregated sensors
+# data messages of the "example_ble_aws_2.py" application example, i.e. JSON
+# documents with stringified values, with the same data encoded through the
+# codecs of the "edge_st_sdk.telemetry.payload_codec" module: JSON with numeric
+# values, CBOR, and MessagePack, the latter two also with floats written in
+# single precision.
+#
+# For each format it reports the bytes per message, the CPU time to encode and
+# to decode a message, and the daily traffic of the given number of devices
+# publishing at the given rate.
+
+
+# IMPORT
+
+from __future__ import print_function
+import sys
+import os
+import getopt
+import json
+import random
+import time
+
+from edge_st_sdk.telemetry import payload_codec
+
+
+# CONSTANTS
+
+# Usage message.
+USAGE = """Usage:
+
+python <application>.py [-d <devices>] [-r <rate>] [-n <messages>]
+
+"""
+
+# Help message.
+HELP = """-d, --devices
+    Number of devices (default: 10)
+-r, --rate
+    Messages per second per device (default: 1)
+-n, --messages
+    Number of messages to encode and decode per format (default: 20000)
+-h, --help
+    Help information
+
+"""
+
+# Client identifier.
+CLIENT_ID = 'IoT_Device_1'
+
+# Seconds per day.
+DAY_s = 24 * 60 * 60
+
+
+# FUNCTIONS
+
+#
+# Getting the CPU time of the process.
+#
+def cpu_time():
+    return time.process_time() if hasattr(time, 'process_time') else time.clock()
+
+#
+# Generating messages in the format of the application example, with numeric
+# values.
+#
+def generate_messages(count):
+    messages = []
+    for _ in range(count):
+        message = {
+            'Board_id': CLIENT_ID,
+            'Temperature': round(random.uniform(20, 30), 1),
+            'Humidity': round(random.uniform(30, 60), 1),
+            'Pressure': round(random.uniform(990, 1030), 2)}
+        for sensor in ('ACC', 'GYR', 'MAG'):
+            for axis in ('X', 'Y', 'Z'):
+                message[sensor + '-' + axis] = random.randint(-2000, 2000)
+        messages.append(message)
+    return messages
+
+#
+# Encoding a message as done by the application example.
+#
+def encode_by_hand(message):
+    return json.dumps(dict((key, value if key == 'Board_id' else str(value))
+        for (key, value) in message.items()))
+
+#
+# Measuring size and CPU time per message of an encoder and a decoder.
+#
+def measure(encode, decode, messages):
+    start = cpu_time()
+    payloads = [encode(message) for message in messages]
+    encode_s = (cpu_time() - start) / len(messages)
+    start = cpu_time()
+    for payload in payloads:
+        decode(payload)
+    decode_s = (cpu_time() - start) / len(messages)
+    size = float(sum(len(payload) for payload in payloads)) / len(messages)
+    return (size, encode_s, decode_s)
+
+
+# MAIN APPLICATION
+
+#
+# Main application.
+#
+def main(argv):
+    devices = 10
+    rate = 1
+    count = 20000
+
+    # Reading input.
+    try:
+        opts, args = getopt.getopt(argv, "hd:r:n:", ["help", "devices=", "rate=", "messages="])
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                print(HELP)
+                sys.exit(0)
+            if opt in ("-d", "--devices"):
+                devices = int(arg)
+            if opt in ("-r", "--rate"):
+                rate = float(arg)
+            if opt in ("-n", "--messages"):
+                count = int(arg)
+    except (getopt.GetoptError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    messages = generate_messages(count)
+    formats = [('json (str)', encode_by_hand, json.loads)]
+    for (name, codec) in (
+        ('json', payload_codec.JSONCodec()),
+        ('cbor', payload_codec.CBORCodec()),
+        ('cbor (f32)', payload_codec.CBORCodec(True)),
+        ('msgpack', payload_codec.MessagePackCodec()),
+        ('msgpack (f32)', payload_codec.MessagePackCodec(True))):
+        formats.append((name, codec.encode, codec.decode))
+
+    # Measuring.
+    print('Native "cbor2" package: %s.' % ('yes' if payload_codec.cbor2 else 'no'))
+    print('Native "msgpack" package: %s.' % ('yes' if payload_codec.msgpack else 'no'))
+    print('%d devices at %g messages/s each.\n' % (devices, rate))
+    print('%-14s %14s %8s %15s %15s %10s' % ('Format', 'Bytes/message', 'Ratio', 'Encode us/msg', 'Decode us/msg', 'MB/day'))
+    reference = None
+    for (name, encode, decode) in formats:
+        (size, encode_s, decode_s) = measure(encode, decode, messages)
+        reference = reference or size
+        print('%-14s %14.1f %7.0f%% %15.2f %15.2f %10.1f' % (name, size, size / reference * 100,
+            encode_s * 1e6, decode_s * 1e6, size * devices * rate * DAY_s / 1e6))
+
+
+if __name__ == "__main__":
+
+    try:
+        main(sys.argv[1:])
+    except KeyboardInterrupt:
+        try:
+            sys.exit(0)
+        except SystemExit:
+            os._exit(0)
@@ -0,0 +1,230 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This benchmark compares the serialization of the aggregated sensors data of
+# the "example_ble_aws_2.py" application example, i.e. a telemetry message and a
+# shadow update per sample, done by hand through "json.dumps()", "str()" and
+# string concatenation, with the serialization done through the precompiled
+# encoders of the "edge_st_sdk.telemetry.telemetry_encoder" module.
+#
+# For each approach it reports the CPU time per sample, the maximum number of
+# samples per second on a single core, and the share of a core needed to serve
+# the given number of devices at the given sampling rate.
+
+
+# IMPORT
+
+from __future__ import print_function
+import sys
+import os
+import getopt
+import json
+import random
+import time
+
+from edge_st_sdk.telemetry.telemetry_encoder import TelemetryEncoder
+
+
+# CONSTANTS
+
+# Usage message.
+USAGE = """Usage:
+
+python <application>.py [-d <devices>] [-r <rate>] [-n <samples>]
+
+"""
+
+# Help message.
+HELP = """-d, --devices
+    Number of devices (default: 10)
+-r, --rate
+    Samples per second per device (default: 100)
+-n, --samples
+    Number of samples to encode per approach (default: 20000)
+-h, --help
+    Help information
+
+"""
+
+# Keys of the aggregated sensors data.
+TELEMETRY_KEYS = ['Temperature', 'Humidity', 'Pressure',
+    'ACC-X', 'ACC-Y', 'ACC-Z',
+    'GYR-X', 'GYR-Y', 'GYR-Z',
+    'MAG-X', 'MAG-Y', 'MAG-Z']
+SHADOW_KEYS = ['temperature', 'humidity', 'pressure',
+    'accelerometer_x', 'accelerometer_y', 'accelerometer_z',
+    'gyroscope_x', 'gyroscope_y', 'gyroscope_z',
+    'magnetometer_x', 'magnetometer_y', 'magnetometer_z']
+
+# Client identifier.
+CLIENT_ID = 'IoT_Device_1'
+
+
+# FUNCTIONS
+
+#
+# Getting the CPU time of the process.
+#
+def cpu_time():
+    return time.process_time() if hasattr(time, 'process_time') else time.clock()
+
+#
+# Generating samples in the format of the BlueST environmental and inertial
+# features: floats for the environmental ones, integers for the inertial ones.
+#
+def generate_samples(count):
+    samples = []
+    for _ in range(count):
+        samples.append(
+            (round(random.uniform(20, 30), 1),
+             round(random.uniform(30, 60), 1),
+             round(random.uniform(990, 1030), 2),
+             [random.randint(-2000, 2000) for _ in range(3)],
+             [random.randint(-2000, 2000) for _ in range(3)],
+             [random.randint(-2000, 2000) for _ in range(3)]))
+    return samples
+
+#
+# Serializing a sample as done by the application example.
+#
+def encode_by_hand(sample):
+    (temperature, humidity, pressure, accelerometer, gyroscope, magnetometer) = sample
+    sample_json_str = json.dumps(
+        {'Board_id': '{:s}'.format(CLIENT_ID),
+         'Temperature': str(temperature),
+         'Humidity': str(humidity),
+         'Pressure': str(pressure),
+         'ACC-X': str(accelerometer[0]),
+         'ACC-Y': str(accelerometer[1]),
+         'ACC-Z': str(accelerometer[2]),
+         'GYR-X': str(gyroscope[0]),
+         'GYR-Y': str(gyroscope[1]),
+         'GYR-Z': str(gyroscope[2]),
+         'MAG-X': str(magnetometer[0]),
+         'MAG-Y': str(magnetometer[1]),
+         'MAG-Z': str(magnetometer[2])
+        })
+    state_json_str = \
+        '{"state":{"desired":{"pressure":' + str(pressure) + ', ' + \
+        '"humidity":' + str(humidity) + ', ' + \
+        '"temperature":' + str(temperature) + ', ' + \
+        '"accelerometer_x":' + str(accelerometer[0]) + ', ' + \
+        '"accelerometer_y":' + str(accelerometer[1]) + ', ' + \
+        '"accelerometer_z":' + str(accelerometer[2]) + ', ' + \
+        '"gyroscope_x":' + str(gyroscope[0]) + ', ' + \
+        '"gyroscope_y":' + str(gyroscope[1]) + ', ' + \
+        '"gyroscope_z":' + str(gyroscope[2]) + ', ' + \
+        '"magnetometer_x":' + str(magnetometer[0]) + ', ' + \
+        '"magnetometer_y":' + str(magnetometer[1]) + ', ' + \
+        '"magnetometer_z":' + str(magnetometer[2]) + '}}}'
+    return (sample_json_str, state_json_str)
+
+#
+# Serializing a sample through precompiled encoders.
+#
+def get_encode_with_encoders():
+    telemetry_encoder = TelemetryEncoder(TELEMETRY_KEYS,
+        [('Board_id', CLIENT_ID)], as_strings=True)
+    shadow_encoder = TelemetryEncoder(SHADOW_KEYS, path=['state', 'desired'])
+
+    def encode_with_encoders(sample):
+        (temperature, humidity, pressure, accelerometer, gyroscope, magnetometer) = sample
+        values = [temperature, humidity, pressure] \
+            + accelerometer + gyroscope + magnetometer
+        return (telemetry_encoder.encode(values), shadow_encoder.encode(values))
+
+    return encode_with_encoders
+
+#
+# Measuring the CPU time per sample of an approach.
+#
+def measure(encode, samples):
+    start = cpu_time()
+    size = 0
+    for sample in samples:
+        (telemetry, state) = encode(sample)
+        size += len(telemetry) + len(state)
+    return ((cpu_time() - start) / len(samples), float(size) / len(samples))
+
+
+# MAIN APPLICATION
+
+#
+# Main application.
+#
+def main(argv):
+    devices = 10
+    rate = 100
+    count = 20000
+
+    # Reading input.
+    try:
+        opts, args = getopt.getopt(argv, "hd:r:n:", ["help", "devices=", "rate=", "samples="])
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                print(HELP)
+                sys.exit(0)
+            if opt in ("-d", "--devices"):
+                devices = int(arg)
+            if opt in ("-r", "--rate"):
+                rate = int(arg)
+            if opt in ("-n", "--samples"):
+                count = int(arg)
+    except (getopt.GetoptError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    # Checking that both approaches produce the same documents.
+    samples = generate_samples(count)
+    encode_with_encoders = get_encode_with_encoders()
+    for sample in samples[:100]:
+        (expected_telemetry, expected_state) = encode_by_hand(sample)
+        (telemetry, state) = encode_with_encoders(sample)
+        assert json.loads(telemetry) == json.loads(expected_telemetry)
+        assert json.loads(state) == json.loads(expected_state)
+
+    # Measuring.
+    load = devices * rate
+    print('%d devices at %d samples/s each: %d samples/s.\n' % (devices, rate, load))
+    print('%-10s %14s %16s %14s %12s' % ('Approach', 'CPU us/sample', 'Max samples/s', 'CPU at load', 'Bytes/sample'))
+    for (name, encode) in (('json', encode_by_hand), ('encoder', encode_with_encoders)):
+        (cpu_s, size) = measure(encode, samples)
+        print('%-10s %14.2f %16d %13.1f%% %12.1f' % (name, cpu_s * 1e6, 1 / cpu_s, cpu_s * load * 100, size))
+
+
+if __name__ == "__main__":
+
+    try:
+        main(sys.argv[1:])
+    except KeyboardInterrupt:
+        try:
+            sys.exit(0)
+        except SystemExit:
+            os._exit(0)
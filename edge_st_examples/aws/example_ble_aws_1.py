@@ -75,6 +75,7 @@ from blue_st_sdk.features import *
 from blue_st_sdk.utils.blue_st_exceptions import InvalidOperationException
 
 from edge_st_sdk.aws.aws_greengrass import AWSGreengrass
+from edge_st_sdk.gateway.notification_pump import NotificationPump
 from edge_st_sdk.utils.edge_st_exceptions import WrongInstantiationException
 
 
@@ -307,43 +308,43 @@ class MyFeatureSwitchListener(FeatureListener):
 
 # DEVICES' CALLBACKS
 
+#
+# Getting the client identifier a switch message is meant for, to dispatch the
+# message to the callback of the right device.
+#
+def get_switch_client_id(topic, message_json):
+    (ts, client_id, switch_status) = message_json[feature_switch.FeatureSwitch.FEATURE_DATA_NAME].split(" ")
+    return client_id
+
 #
 # Custom MQTT message callback for first device.
 #
-def iot_device_1_callback(client, userdata, message):
+def iot_device_1_callback(topic, message_json):
     global iot_device_1_act_flag, iot_device_1_status
 
-    #print("Receiving: %s" % (message.payload))
+    #print("Receiving: %s" % (message_json))
 
-    # Getting the client identifier and the switch status from the message.
-    feature_name = feature_switch.FeatureSwitch.FEATURE_DATA_NAME
-    if feature_name in message.payload:
-        message_json = json.loads(message.payload)
-        (ts, client_id, switch_status) = message_json[feature_name].split(" ")
+    # Getting the switch status from the message.
+    (ts, client_id, switch_status) = message_json[feature_switch.FeatureSwitch.FEATURE_DATA_NAME].split(" ")
 
     # Set switch status.
-    if client_id == IOT_DEVICE_1_NAME:
-        iot_device_1_status = SwitchStatus.ON if switch_status != "0" else SwitchStatus.OFF
-        iot_device_1_act_flag = True
+    iot_device_1_status = SwitchStatus.ON if switch_status != "0" else SwitchStatus.OFF
+    iot_device_1_act_flag = True
 
 #
 # Custom MQTT message callback for second device.
 #
-def iot_device_2_callback(client, userdata, message):
+def iot_device_2_callback(topic, message_json):
     global iot_device_2_act_flag, iot_device_2_status
 
-    #print("Receiving: %s" % (message.payload))
+    #print("Receiving: %s" % (message_json))
 
-    # Getting the client identifier and the switch status from the message.
-    feature_name = feature_switch.FeatureSwitch.FEATURE_DATA_NAME
-    if feature_name in message.payload:
-        message_json = json.loads(message.payload)
-        (ts, client_id, switch_status) = message_json[feature_name].split(" ")
+    # Getting the switch status from the message.
+    (ts, client_id, switch_status) = message_json[feature_switch.FeatureSwitch.FEATURE_DATA_NAME].split(" ")
 
     # Set switch status.
-    if client_id == IOT_DEVICE_2_NAME:
-        iot_device_2_status = SwitchStatus.ON if switch_status != "0" else SwitchStatus.OFF
-        iot_device_2_act_flag = True
+    iot_device_2_status = SwitchStatus.ON if switch_status != "0" else SwitchStatus.OFF
+    iot_device_2_act_flag = True
 
 #
 # Handling actuation of devices.
@@ -491,9 +492,12 @@ def main(argv):
         iot_device_1_client.connect()
         iot_device_2_client.connect()
 
-        # Setting subscriptions.
-        iot_device_1_client.subscribe(MQTT_IOT_DEVICE_SWITCH_ACT_TOPIC, MQTT_QOS_1, iot_device_1_callback)
-        iot_device_2_client.subscribe(MQTT_IOT_DEVICE_SWITCH_ACT_TOPIC, MQTT_QOS_1, iot_device_2_callback)
+        # Setting subscriptions: messages are decoded once and dispatched only
+        # to the callback of the device they are meant for.
+        iot_device_1_client.set_route_key(get_switch_client_id)
+        iot_device_2_client.set_route_key(get_switch_client_id)
+        iot_device_1_client.add_route(MQTT_IOT_DEVICE_SWITCH_ACT_TOPIC, MQTT_QOS_1, iot_device_1_callback, IOT_DEVICE_1_NAME)
+        iot_device_2_client.add_route(MQTT_IOT_DEVICE_SWITCH_ACT_TOPIC, MQTT_QOS_1, iot_device_2_callback, IOT_DEVICE_2_NAME)
 
         # Resetting shadow states.
         state_json_str = '{"state":{"desired":{"switch_status":' + str(iot_device_1_status.value) + '}}}'
@@ -504,31 +508,39 @@ def main(argv):
         # Edge Computing Initialized.
         print('\nEdge Computing Initialized.')
 
+        # Serving the notifications of the devices on a separate thread, and
+        # dispatching them to the listeners on the main thread.
+        pump = NotificationPump()
+        pump.add_node(iot_device_1)
+        pump.add_node(iot_device_2)
+
         # Handling sensing of devices.
-        iot_device_1_feature_switch.add_listener(MyFeatureSwitchListener(iot_device_1_client, MQTT_IOT_DEVICE_SWITCH_SENSE_TOPIC))
-        iot_device_2_feature_switch.add_listener(MyFeatureSwitchListener(iot_device_2_client, MQTT_IOT_DEVICE_SWITCH_SENSE_TOPIC))
+        pump.add_listener(iot_device_1_feature_switch, MyFeatureSwitchListener(iot_device_1_client, MQTT_IOT_DEVICE_SWITCH_SENSE_TOPIC))
+        pump.add_listener(iot_device_2_feature_switch, MyFeatureSwitchListener(iot_device_2_client, MQTT_IOT_DEVICE_SWITCH_SENSE_TOPIC))
 
         # Enabling notifications.
         print('\nEnabling Bluetooth notifications...')
         iot_device_1.enable_notifications(iot_device_1_feature_switch)
         iot_device_2.enable_notifications(iot_device_2_feature_switch)
 
+        pump.start()
+
         # Demo running.
         print('\nDemo running (\"CTRL+C\" to quit)...\n')
 
         # Infinite loop.
         while True:
 
-            # Getting notifications.
-            if iot_device_1.wait_for_notifications(0.05) or iot_device_2.wait_for_notifications(0.05):
+            # Dispatching notifications.
+            if pump.dispatch(0.05):
                 continue
 
-            # Handling actuation of devices.
+            # Handling actuation of devices on the thread serving them.
             if iot_device_1_act_flag:
-                iot_device_act(iot_device_1, iot_device_1_feature_switch, iot_device_1_status, iot_device_1_client)
+                pump.call(iot_device_1, iot_device_act, iot_device_1, iot_device_1_feature_switch, iot_device_1_status, iot_device_1_client)
                 iot_device_1_act_flag = False
             elif iot_device_2_act_flag:
-                iot_device_act(iot_device_2, iot_device_2_feature_switch, iot_device_2_status, iot_device_2_client)
+                pump.call(iot_device_2, iot_device_act, iot_device_2, iot_device_2_feature_switch, iot_device_2_status, iot_device_2_client)
                 iot_device_2_act_flag = False
 
     except InvalidOperationException as e:
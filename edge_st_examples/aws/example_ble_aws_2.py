@@ -66,7 +66,6 @@ import sys
 import os
 import time
 import getopt
-import json
 import logging
 from enum import Enum
 import threading
@@ -81,6 +80,9 @@ from blue_st_sdk.features import *
 from blue_st_sdk.utils.blue_st_exceptions import InvalidOperationException
 
 from edge_st_sdk.aws.aws_greengrass import AWSGreengrass
+from edge_st_sdk.gateway.notification_pump import NotificationPump
+from edge_st_sdk.telemetry.sample_store import SampleStore
+from edge_st_sdk.telemetry.telemetry_encoder import TelemetryEncoder
 from edge_st_sdk.utils.edge_st_exceptions import WrongInstantiationException
 
 
@@ -99,7 +101,7 @@ from edge_st_sdk.utils.edge_st_exceptions import WrongInstantiationException
 USAGE = """Usage:
 
 Use certificate based mutual authentication:
-python <application>.py -e <endpoint> -r <root_ca_path>
+python <application>.py -e <endpoint> -r <root_ca_path> [-s <window_size>]
 
 """
 
@@ -108,6 +110,10 @@ HELP = """-e, --endpoint
     Your AWS IoT custom endpoint
 -r, --rootCA
     Root CA file path
+-s, --summaries
+    Publish the statistics of the sensors data over windows of up to the given
+    number of samples per feature, instead of the latest sensors data (requires
+    NumPy)
 -h, --help
     Help information
 
@@ -127,6 +133,13 @@ SCANNING_TIME_s = 5
 SHADOW_CALLBACK_TIMEOUT_s = 5
 SENSORS_DATA_PUBLISHING_TIME_s = 5
 
+# Maximum number of devices whose sensors data are summarized.
+SUMMARIES_MAX_DEVICES = 2
+
+# Publishing.
+PUBLISH_PIPELINE_CAPACITY = 32
+PUBLISH_BACKPRESSURE_SLOWDOWN = 4
+
 # MQTT QoS.
 MQTT_QOS_0 = 0
 MQTT_QOS_1 = 1
@@ -147,6 +160,27 @@ IOT_DEVICE_2_CERTIF_PATH = DEVICES_PATH + IOT_DEVICE_2_NAME + CERTIF_EXT
 IOT_DEVICE_1_PRIV_K_PATH = DEVICES_PATH + IOT_DEVICE_1_NAME + PRIV_K_EXT
 IOT_DEVICE_2_PRIV_K_PATH = DEVICES_PATH + IOT_DEVICE_2_NAME + PRIV_K_EXT
 
+# Keys of the aggregated sensors data.
+TELEMETRY_KEYS = ['Pressure', 'Humidity', 'Temperature',
+    'ACC-X', 'ACC-Y', 'ACC-Z',
+    'GYR-X', 'GYR-Y', 'GYR-Z',
+    'MAG-X', 'MAG-Y', 'MAG-Z']
+SHADOW_KEYS = ['pressure', 'humidity', 'temperature',
+    'accelerometer_x', 'accelerometer_y', 'accelerometer_z',
+    'gyroscope_x', 'gyroscope_y', 'gyroscope_z',
+    'magnetometer_x', 'magnetometer_y', 'magnetometer_z']
+
+# Channels of the sensors data store, in the order of the keys above and of
+# the features' index below: name and fields. Values are stored as doubles, as
+# the features provide floats, NaN for invalid samples.
+SENSORS_CHANNELS = [
+    ('Pressure', ['Pressure']),
+    ('Humidity', ['Humidity']),
+    ('Temperature', ['Temperature']),
+    ('Accelerometer', ['X', 'Y', 'Z']),
+    ('Gyroscope', ['X', 'Y', 'Z']),
+    ('Magnetometer', ['X', 'Y', 'Z'])]
+
 
 # SHADOW JSON SCHEMAS
 
@@ -224,11 +258,11 @@ def print_intro():
 # Reading input.
 #
 def read_input(argv):
-    global endpoint, root_ca_path
+    global endpoint, root_ca_path, summaries_window_size
 
     # Reading in command-line parameters.
     try:
-        opts, args = getopt.getopt(argv, "hwe:k:c:r:", ['help", "endpoint=", "key=","cert=","rootCA='])
+        opts, args = getopt.getopt(argv, "hwe:k:c:r:s:", ['help", "endpoint=", "key=","cert=","rootCA=","summaries='])
         if len(opts) == 0:
             raise getopt.GetoptError("No input parameters!")
         for opt, arg in opts:
@@ -239,7 +273,9 @@ def read_input(argv):
                 endpoint = arg
             if opt in ("-r", "--rootCA"):
                 root_ca_path = arg
-    except getopt.GetoptError:
+            if opt in ("-s", "--summaries"):
+                summaries_window_size = int(arg)
+    except (getopt.GetoptError, ValueError):
         print(USAGE)
         exit(1)
 
@@ -326,6 +362,7 @@ class MyFeatureSwitchListener(FeatureListener):
         super(MyFeatureSwitchListener, self).__init__()
         self._client = client
         self._topic = topic
+        self._encoder = None
 
     #
     # To be called whenever the feature updates its data.
@@ -338,14 +375,14 @@ class MyFeatureSwitchListener(FeatureListener):
         switch_status = feature_switch.FeatureSwitch.get_switch_status(sample)
 
         # Getting a JSON string representation of the message to publish.
-        sample_json_str = json.dumps(
-            {'{:s}'.format(
-                feature.get_fields_description()[0].get_name()): \
-                '({:d}) {:s} {:s}'.format(
-                    sample.get_timestamp(),
-                    self._client.get_client_id(),
-                    str(switch_status)
-                    )})
+        if self._encoder is None:
+            self._encoder = TelemetryEncoder.for_feature(feature)
+        sample_json_str = self._encoder.encode(
+            ['({:d}) {:s} {:s}'.format(
+                sample.get_timestamp(),
+                self._client.get_client_id(),
+                str(switch_status)
+                )])
 
         # Publishing the message.
         #print('Publishing: %s' % (sample_json_str))
@@ -361,9 +398,9 @@ class MyFeatureSensorsListener(FeatureListener):
     #
     # Constructor.
     #
-    def __init__(self, data):
+    def __init__(self, samples):
         super(MyFeatureSensorsListener, self).__init__()
-        self._data = data
+        self._samples = samples
 
     #
     # To be called whenever the feature updates its data.
@@ -374,69 +411,70 @@ class MyFeatureSensorsListener(FeatureListener):
     def on_update(self, feature, sample):
         data = [None] * len(AxesIndex)
 
-        # Getting value.
+        # Getting value and storing it as a whole, so that the publishing
+        # thread never reads a partially updated sample.
         if isinstance(feature, feature_pressure.FeaturePressure):
-            self._data[FeaturesIndex.PRESSURE.value] = feature_pressure.FeaturePressure.get_pressure(sample)
+            self._samples.append(FeaturesIndex.PRESSURE.value, [feature_pressure.FeaturePressure.get_pressure(sample)])
         elif isinstance(feature, feature_humidity.FeatureHumidity):
-            self._data[FeaturesIndex.HUMIDITY.value] = feature_humidity.FeatureHumidity.get_humidity(sample)
+            self._samples.append(FeaturesIndex.HUMIDITY.value, [feature_humidity.FeatureHumidity.get_humidity(sample)])
         elif isinstance(feature, feature_temperature.FeatureTemperature):
-            self._data[FeaturesIndex.TEMPERATURE.value] = feature_temperature.FeatureTemperature.get_temperature(sample)
+            self._samples.append(FeaturesIndex.TEMPERATURE.value, [feature_temperature.FeatureTemperature.get_temperature(sample)])
         elif isinstance(feature, feature_accelerometer.FeatureAccelerometer):
             data[AxesIndex.X.value] = feature_accelerometer.FeatureAccelerometer.get_acc_x(sample)
             data[AxesIndex.Y.value] = feature_accelerometer.FeatureAccelerometer.get_acc_y(sample)
             data[AxesIndex.Z.value] = feature_accelerometer.FeatureAccelerometer.get_acc_z(sample)
-            self._data[FeaturesIndex.ACCELEROMETER.value] = data
+            self._samples.append(FeaturesIndex.ACCELEROMETER.value, data)
         elif isinstance(feature, feature_gyroscope.FeatureGyroscope):
             data[AxesIndex.X.value] = feature_gyroscope.FeatureGyroscope.get_gyr_x(sample)
             data[AxesIndex.Y.value] = feature_gyroscope.FeatureGyroscope.get_gyr_y(sample)
             data[AxesIndex.Z.value] = feature_gyroscope.FeatureGyroscope.get_gyr_z(sample)
-            self._data[FeaturesIndex.GYROSCOPE.value] = data
+            self._samples.append(FeaturesIndex.GYROSCOPE.value, data)
         elif isinstance(feature, feature_magnetometer.FeatureMagnetometer):
             data[AxesIndex.X.value] = feature_magnetometer.FeatureMagnetometer.get_mag_x(sample)
             data[AxesIndex.Y.value] = feature_magnetometer.FeatureMagnetometer.get_mag_y(sample)
             data[AxesIndex.Z.value] = feature_magnetometer.FeatureMagnetometer.get_mag_z(sample)
-            self._data[FeaturesIndex.MAGNETOMETER.value] = data
+            self._samples.append(FeaturesIndex.MAGNETOMETER.value, data)
 
 
 # DEVICES' CALLBACKS
 
+#
+# Getting the client identifier a switch message is meant for, to dispatch the
+# message to the callback of the right device.
+#
+def get_switch_client_id(topic, message_json):
+    (ts, client_id, switch_status) = message_json[feature_switch.FeatureSwitch.FEATURE_DATA_NAME].split(" ")
+    return client_id
+
 #
 # Custom MQTT message callback for first device.
 #
-def iot_device_1_callback(client, userdata, message):
+def iot_device_1_callback(topic, message_json):
     global iot_device_1_act_flag, iot_device_1_status
 
-    #print("Receiving: %s" % (message.payload))
+    #print("Receiving: %s" % (message_json))
 
-    # Getting the client identifier and the switch status from the message.
-    feature_name = feature_switch.FeatureSwitch.FEATURE_DATA_NAME
-    if feature_name in message.payload:
-        message_json = json.loads(message.payload)
-        (ts, client_id, switch_status) = message_json[feature_name].split(" ")
+    # Getting the switch status from the message.
+    (ts, client_id, switch_status) = message_json[feature_switch.FeatureSwitch.FEATURE_DATA_NAME].split(" ")
 
     # Set switch status.
-    if client_id == IOT_DEVICE_1_NAME:
-        iot_device_1_status = SwitchStatus.ON if switch_status != "0" else SwitchStatus.OFF
-        iot_device_1_act_flag = True
+    iot_device_1_status = SwitchStatus.ON if switch_status != "0" else SwitchStatus.OFF
+    iot_device_1_act_flag = True
 
 #
 # Custom MQTT message callback for second device.
 #
-def iot_device_2_callback(client, userdata, message):
+def iot_device_2_callback(topic, message_json):
     global iot_device_2_act_flag, iot_device_2_status
 
-    #print("Receiving: %s" % (message.payload))
+    #print("Receiving: %s" % (message_json))
 
-    # Getting the client identifier and the switch status from the message.
-    feature_name = feature_switch.FeatureSwitch.FEATURE_DATA_NAME
-    if feature_name in message.payload:
-        message_json = json.loads(message.payload)
-        (ts, client_id, switch_status) = message_json[feature_name].split(" ")
+    # Getting the switch status from the message.
+    (ts, client_id, switch_status) = message_json[feature_switch.FeatureSwitch.FEATURE_DATA_NAME].split(" ")
 
     # Set switch status.
-    if client_id == IOT_DEVICE_2_NAME:
-        iot_device_2_status = SwitchStatus.ON if switch_status != "0" else SwitchStatus.OFF
-        iot_device_2_act_flag = True
+    iot_device_2_status = SwitchStatus.ON if switch_status != "0" else SwitchStatus.OFF
+    iot_device_2_act_flag = True
 
 #
 # Handling actuation of devices.
@@ -459,49 +497,30 @@ def iot_device_send_data(iot_device_data, iot_device_client, topic):
 
     #print('iot_device_send_data()')
 
-    # Getting data.
-    pressure = iot_device_data[FeaturesIndex.PRESSURE.value]
-    humidity = iot_device_data[FeaturesIndex.HUMIDITY.value]
-    temperature = iot_device_data[FeaturesIndex.TEMPERATURE.value]
-    accelerometer = iot_device_data[FeaturesIndex.ACCELEROMETER.value]
-    gyroscope = iot_device_data[FeaturesIndex.GYROSCOPE.value]
-    magnetometer = iot_device_data[FeaturesIndex.MAGNETOMETER.value]
+    # Getting a consistent copy of the latest data, if available.
+    snapshot = iot_device_data.snapshot()
+    if not all(snapshot.valid):
+        return
+    values = snapshot.get_values()
+
+    # Getting the encoders of the client, compiled once.
+    client_id = iot_device_client.get_client_id()
+    if client_id not in encoders:
+        encoders[client_id] = (
+            TelemetryEncoder(TELEMETRY_KEYS, [('Board_id', client_id)],
+                as_strings=True),
+            TelemetryEncoder(SHADOW_KEYS, path=['state', 'desired']))
+    (telemetry_encoder, shadow_encoder) = encoders[client_id]
 
     # Getting a JSON string representation of the message to publish.
-    sample_json_str = json.dumps(
-        {'Board_id': '{:s}'.format(iot_device_client.get_client_id()), 
-         'Temperature': str(temperature), 
-         'Humidity': str(humidity), 
-         'Pressure': str(pressure), 
-         'ACC-X': str(accelerometer[AxesIndex.X.value]), 
-         'ACC-Y': str(accelerometer[AxesIndex.Y.value]), 
-         'ACC-Z': str(accelerometer[AxesIndex.Z.value]), 
-         'GYR-X': str(gyroscope[AxesIndex.X.value]), 
-         'GYR-Y': str(gyroscope[AxesIndex.Y.value]), 
-         'GYR-Z': str(gyroscope[AxesIndex.Z.value]), 
-         'MAG-X': str(magnetometer[AxesIndex.X.value]), 
-         'MAG-Y': str(magnetometer[AxesIndex.Y.value]), 
-         'MAG-Z': str(magnetometer[AxesIndex.Z.value])
-        })
+    sample_json_str = telemetry_encoder.encode(values)
 
     # Publishing the message.
     #print('Publishing: %s' % (sample_json_str))
     iot_device_client.publish(topic, sample_json_str, MQTT_QOS_0)
 
     # Udating shadow state.
-    state_json_str = \
-        '{"state":{"desired":{"pressure":' + str(pressure) + ', ' + \
-        '"humidity":' + str(humidity) + ', ' + \
-        '"temperature":' + str(temperature) + ', ' + \
-        '"accelerometer_x":' + str(accelerometer[AxesIndex.X.value]) + ', ' + \
-        '"accelerometer_y":' + str(accelerometer[AxesIndex.Y.value]) + ', ' + \
-        '"accelerometer_z":' + str(accelerometer[AxesIndex.Z.value]) + ', ' + \
-        '"gyroscope_x":' + str(gyroscope[AxesIndex.X.value]) + ', ' + \
-        '"gyroscope_y":' + str(gyroscope[AxesIndex.Y.value]) + ', ' + \
-        '"gyroscope_z":' + str(gyroscope[AxesIndex.Z.value]) + ', ' + \
-        '"magnetometer_x":' + str(magnetometer[AxesIndex.X.value]) + ', ' + \
-        '"magnetometer_y":' + str(magnetometer[AxesIndex.Y.value]) + ', ' + \
-        '"magnetometer_z":' + str(magnetometer[AxesIndex.Z.value]) + '}}}'
+    state_json_str = shadow_encoder.encode(values)
     iot_device_client.update_shadow_state(state_json_str, custom_shadow_callback_update, SHADOW_CALLBACK_TIMEOUT_s)
 
 
@@ -537,6 +556,18 @@ def custom_shadow_callback_delete(payload, response_status, token):
     #if response_status == "accepted":
     #    state_json_str = json.loads(payload)
 
+#
+# Slowing down the publishing of sensors data while the messages of a client
+# are not being sent as fast as they are produced.
+#
+def publish_backpressure_callback(pressure, size):
+    if pressure:
+        print('Publishing slowed down: %d messages waiting.' % (size))
+        publish_backpressure.set()
+    else:
+        print('Publishing resumed: %d messages waiting.' % (size))
+        publish_backpressure.clear()
+
 
 # THREADS
 
@@ -562,7 +593,10 @@ class MyFeatureSensorsThread(threading.Thread):
     #
     def run(self):
         while True:
-            time.sleep(self._publishing_time)
+            if publish_backpressure.is_set():
+                time.sleep(self._publishing_time * PUBLISH_BACKPRESSURE_SLOWDOWN)
+            else:
+                time.sleep(self._publishing_time)
             iot_device_send_data(iot_device_1_data, iot_device_1_client, MQTT_IOT_DEVICE_ENV_INE_TOPIC)
             iot_device_send_data(iot_device_2_data, iot_device_2_client, MQTT_IOT_DEVICE_ENV_INE_TOPIC)
 
@@ -575,21 +609,27 @@ class MyFeatureSensorsThread(threading.Thread):
 def main(argv):
 
     # Global variables.
-    global endpoint, root_ca_path
+    global endpoint, root_ca_path, summaries_window_size
     global iot_device_1_client, iot_device_2_client
     global iot_device_1, iot_device_2
     global iot_device_1_feature_switch, iot_device_2_feature_switch
     global iot_device_1_status, iot_device_2_status
     global iot_device_1_act_flag, iot_device_2_act_flag
     global iot_device_1_data, iot_device_2_data
+    global encoders
+    global publish_backpressure
 
     # Initial state.
     iot_device_1_status = SwitchStatus.OFF
     iot_device_2_status = SwitchStatus.OFF
     iot_device_1_act_flag = False
     iot_device_2_act_flag = False
-    iot_device_1_data = [None] * len(FeaturesIndex)
-    iot_device_2_data = [None] * len(FeaturesIndex)
+    sensors_store = SampleStore(SENSORS_CHANNELS)
+    iot_device_1_data = sensors_store.add_device(IOT_DEVICE_1_NAME)
+    iot_device_2_data = sensors_store.add_device(IOT_DEVICE_2_NAME)
+    encoders = {}
+    publish_backpressure = threading.Event()
+    summaries_window_size = 0
 
     # Configure logging.
     configure_logging()
@@ -680,9 +720,26 @@ def main(argv):
         iot_device_1_client.connect()
         iot_device_2_client.connect()
 
-        # Setting subscriptions.
-        iot_device_1_client.subscribe(MQTT_IOT_DEVICE_SWITCH_ACT_TOPIC, MQTT_QOS_1, iot_device_1_callback)
-        iot_device_2_client.subscribe(MQTT_IOT_DEVICE_SWITCH_ACT_TOPIC, MQTT_QOS_1, iot_device_2_callback)
+        # Queueing the messages to publish, dropping them rather than blocking
+        # the producers when the queues are full.
+        iot_device_1_client.enable_publish_pipeline(PUBLISH_PIPELINE_CAPACITY, False, watermark_callback=publish_backpressure_callback)
+        iot_device_2_client.enable_publish_pipeline(PUBLISH_PIPELINE_CAPACITY, False, watermark_callback=publish_backpressure_callback)
+
+        # Sending only the changes of the shadow states.
+        iot_device_1_client.enable_shadow_diff()
+        iot_device_2_client.enable_shadow_diff()
+
+        # Folding the shadow updates issued while the core is unreachable into
+        # a single update per device, sent on reconnection.
+        iot_device_1_client.enable_shadow_compaction(SHADOW_CALLBACK_TIMEOUT_s)
+        iot_device_2_client.enable_shadow_compaction(SHADOW_CALLBACK_TIMEOUT_s)
+
+        # Setting subscriptions: messages are decoded once and dispatched only
+        # to the callback of the device they are meant for.
+        iot_device_1_client.set_route_key(get_switch_client_id)
+        iot_device_2_client.set_route_key(get_switch_client_id)
+        iot_device_1_client.add_route(MQTT_IOT_DEVICE_SWITCH_ACT_TOPIC, MQTT_QOS_1, iot_device_1_callback, IOT_DEVICE_1_NAME)
+        iot_device_2_client.add_route(MQTT_IOT_DEVICE_SWITCH_ACT_TOPIC, MQTT_QOS_1, iot_device_2_callback, IOT_DEVICE_2_NAME)
 
         # Resetting shadow states.
         state_json_str = '{"state":{"desired":{"switch_status":' + str(iot_device_1_status.value) + '}}}'
@@ -693,21 +750,39 @@ def main(argv):
         # Edge Computing Initialized.
         print('\nEdge Computing Initialized.')
 
-        # Handling sensing of devices.
-        iot_device_1_feature_switch.add_listener(MyFeatureSwitchListener(iot_device_1_client, MQTT_IOT_DEVICE_SWITCH_SENSE_TOPIC))
-        iot_device_1_feature_pressure.add_listener(MyFeatureSensorsListener(iot_device_1_data))
-        iot_device_1_feature_humidity.add_listener(MyFeatureSensorsListener(iot_device_1_data))
-        iot_device_1_feature_temperature.add_listener(MyFeatureSensorsListener(iot_device_1_data))
-        iot_device_1_feature_accelerometer.add_listener(MyFeatureSensorsListener(iot_device_1_data))
-        iot_device_1_feature_gyroscope.add_listener(MyFeatureSensorsListener(iot_device_1_data))
-        iot_device_1_feature_magnetometer.add_listener(MyFeatureSensorsListener(iot_device_1_data))
-        iot_device_2_feature_switch.add_listener(MyFeatureSwitchListener(iot_device_2_client, MQTT_IOT_DEVICE_SWITCH_SENSE_TOPIC))
-        iot_device_2_feature_pressure.add_listener(MyFeatureSensorsListener(iot_device_2_data))
-        iot_device_2_feature_humidity.add_listener(MyFeatureSensorsListener(iot_device_2_data))
-        iot_device_2_feature_temperature.add_listener(MyFeatureSensorsListener(iot_device_2_data))
-        iot_device_2_feature_accelerometer.add_listener(MyFeatureSensorsListener(iot_device_2_data))
-        iot_device_2_feature_gyroscope.add_listener(MyFeatureSensorsListener(iot_device_2_data))
-        iot_device_2_feature_magnetometer.add_listener(MyFeatureSensorsListener(iot_device_2_data))
+        # Serving the notifications of the devices on a separate thread, and
+        # dispatching them to the listeners on the main thread.
+        pump = NotificationPump()
+        pump.add_node(iot_device_1)
+        pump.add_node(iot_device_2)
+
+        # Handling sensing of devices: either keeping the latest sensors data,
+        # or adding every sample to the windows summarized.
+        if summaries_window_size:
+            # Imported here, as NumPy is needed only to summarize.
+            from edge_st_sdk.telemetry.window_aggregator import WindowAggregator
+            from edge_st_sdk.telemetry.window_aggregator import WindowListener
+            from edge_st_sdk.telemetry.window_aggregator import WindowPublisher
+            aggregator = WindowAggregator(SUMMARIES_MAX_DEVICES, summaries_window_size)
+            iot_device_1_listener = WindowListener(aggregator, IOT_DEVICE_1_NAME)
+            iot_device_2_listener = WindowListener(aggregator, IOT_DEVICE_2_NAME)
+        else:
+            iot_device_1_listener = MyFeatureSensorsListener(iot_device_1_data)
+            iot_device_2_listener = MyFeatureSensorsListener(iot_device_2_data)
+        pump.add_listener(iot_device_1_feature_switch, MyFeatureSwitchListener(iot_device_1_client, MQTT_IOT_DEVICE_SWITCH_SENSE_TOPIC))
+        pump.add_listener(iot_device_1_feature_pressure, iot_device_1_listener)
+        pump.add_listener(iot_device_1_feature_humidity, iot_device_1_listener)
+        pump.add_listener(iot_device_1_feature_temperature, iot_device_1_listener)
+        pump.add_listener(iot_device_1_feature_accelerometer, iot_device_1_listener)
+        pump.add_listener(iot_device_1_feature_gyroscope, iot_device_1_listener)
+        pump.add_listener(iot_device_1_feature_magnetometer, iot_device_1_listener)
+        pump.add_listener(iot_device_2_feature_switch, MyFeatureSwitchListener(iot_device_2_client, MQTT_IOT_DEVICE_SWITCH_SENSE_TOPIC))
+        pump.add_listener(iot_device_2_feature_pressure, iot_device_2_listener)
+        pump.add_listener(iot_device_2_feature_humidity, iot_device_2_listener)
+        pump.add_listener(iot_device_2_feature_temperature, iot_device_2_listener)
+        pump.add_listener(iot_device_2_feature_accelerometer, iot_device_2_listener)
+        pump.add_listener(iot_device_2_feature_gyroscope, iot_device_2_listener)
+        pump.add_listener(iot_device_2_feature_magnetometer, iot_device_2_listener)
 
         # Enabling notifications.
         print('\nEnabling Bluetooth notifications...')
@@ -726,26 +801,35 @@ def main(argv):
         iot_device_2.enable_notifications(iot_device_2_feature_gyroscope)
         iot_device_2.enable_notifications(iot_device_2_feature_magnetometer)
 
+        pump.start()
+
         # Demo running.
         print('\nDemo running (\"CTRL+C\" to quit)...\n')
 
-        # Starting threads.
-        sensors_thread = MyFeatureSensorsThread(SENSORS_DATA_PUBLISHING_TIME_s)
-        sensors_thread.start()
+        # Starting threads: either publishing the window summaries, or the
+        # latest sensors data and the corresponding shadow states.
+        if summaries_window_size:
+            summaries_publisher = WindowPublisher(aggregator, SENSORS_DATA_PUBLISHING_TIME_s)
+            summaries_publisher.add_client(IOT_DEVICE_1_NAME, iot_device_1_client, MQTT_IOT_DEVICE_ENV_INE_TOPIC, MQTT_QOS_0)
+            summaries_publisher.add_client(IOT_DEVICE_2_NAME, iot_device_2_client, MQTT_IOT_DEVICE_ENV_INE_TOPIC, MQTT_QOS_0)
+            summaries_publisher.start()
+        else:
+            sensors_thread = MyFeatureSensorsThread(SENSORS_DATA_PUBLISHING_TIME_s)
+            sensors_thread.start()
 
         # Infinite loop.
         while True:
 
-            # Getting notifications.
-            if iot_device_1.wait_for_notifications(0.05) or iot_device_2.wait_for_notifications(0.05):
+            # Dispatching notifications.
+            if pump.dispatch(0.05):
                 continue
 
-            # Handling actuation of devices.
+            # Handling actuation of devices on the thread serving them.
             if iot_device_1_act_flag:
-                iot_device_act(iot_device_1, iot_device_1_feature_switch, iot_device_1_status, iot_device_1_client)
+                pump.call(iot_device_1, iot_device_act, iot_device_1, iot_device_1_feature_switch, iot_device_1_status, iot_device_1_client)
                 iot_device_1_act_flag = False
             elif iot_device_2_act_flag:
-                iot_device_act(iot_device_2, iot_device_2_feature_switch, iot_device_2_status, iot_device_2_client)
+                pump.call(iot_device_2, iot_device_act, iot_device_2, iot_device_2_feature_switch, iot_device_2_status, iot_device_2_client)
                 iot_device_2_act_flag = False
 
     except InvalidOperationException as e:
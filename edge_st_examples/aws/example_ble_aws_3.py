@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This application example shows how to drive a Linux gateway through a
+# configuration file which describes the Bluetooth Low Energy (BLE) devices
+# implementing the "BlueST" protocol to handle: the MAC address of each device,
+# the identifier and the credentials of its shadow device on the Amazon AWS IoT
+# Cloud, and the features whose data have to be published, each one with its
+# topic and its publish policy.
+#
+# All the devices found in the configuration file are brought up in parallel,
+# i.e. each BLE device gets connected and its client connected to the AWS
+# Greengrass core, and the time taken by each device is reported. Then, data
+# of the features are published either as soon as they are notified, or
+# periodically.
+#
+# Please refer to the "example_ble_aws_3.json" configuration file, which
+# describes the devices of the "example_ble_aws_2.py" application example.
+
+
+# IMPORT
+
+from __future__ import print_function
+import sys
+import os
+import time
+import getopt
+
+from bluepy.btle import BTLEException
+
+from blue_st_sdk.manager import Manager
+
+from edge_st_sdk.aws.aws_greengrass import AWSGreengrass
+from edge_st_sdk.gateway.device_registry import DeviceRegistry
+from edge_st_sdk.gateway.device_registry import Gateway
+from edge_st_sdk.gateway.notification_pump import NotificationPump
+from edge_st_sdk.utils.edge_st_exceptions import ConfigurationException
+from edge_st_sdk.utils.edge_st_exceptions import WrongInstantiationException
+
+
+# PRECONDITIONS
+#
+# Please remember to add to the "PYTHONPATH" environment variable the location
+# of the "BlueSTSDK_Python" and the "EdgeSTSDK_Python" SDKs.
+#
+# On Linux:
+# export PYTHONPATH=/home/<user>/BlueSTSDK_Python:/home/<user>/EdgeSTSDK_Python
+
+
+# CONSTANTS
+
+# Usage message.
+USAGE = """Usage:
+
+Use certificate based mutual authentication:
+python <application>.py -e <endpoint> -r <root_ca_path> -c <configuration_path>
+
+"""
+
+# Help message.
+HELP = """-e, --endpoint
+    Your AWS IoT custom endpoint
+-r, --rootCA
+    Root CA file path
+-c, --config
+    Devices' configuration file path (default: example_ble_aws_3.json)
+-h, --help
+    Help information
+
+"""
+
+# Presentation message.
+INTRO = """###############################################
+# Edge IoT Example with Amazon Cloud Platform #
+###############################################"""
+
+# Timeouts.
+SCANNING_TIME_s = 5
+
+# Devices' configuration file.
+CONFIGURATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'example_ble_aws_3.json')
+
+
+# FUNCTIONS
+
+#
+# Printing intro.
+#
+def print_intro():
+    print('\n' + INTRO + '\n')
+
+#
+# Reading input.
+#
+def read_input(argv):
+    global endpoint, root_ca_path, configuration_path
+
+    # Reading in command-line parameters.
+    try:
+        opts, args = getopt.getopt(argv, "he:r:c:", ["help", "endpoint=", "rootCA=", "config="])
+        if len(opts) == 0:
+            raise getopt.GetoptError("No input parameters!")
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                print(HELP)
+                exit(0)
+            if opt in ("-e", "--endpoint"):
+                endpoint = arg
+            if opt in ("-r", "--rootCA"):
+                root_ca_path = arg
+            if opt in ("-c", "--config"):
+                configuration_path = arg
+    except getopt.GetoptError:
+        print(USAGE)
+        exit(1)
+
+    # Missing configuration parameters.
+    missing_configuration = False
+    if not endpoint:
+        print("Missing '-e' or '--endpoint'")
+        missing_configuration = True
+    if not root_ca_path:
+        print("Missing '-r' or '--rootCA'")
+        missing_configuration = True
+    if missing_configuration:
+        exit(2)
+
+
+# MAIN APPLICATION
+
+#
+# Main application.
+#
+def main(argv):
+
+    # Global variables.
+    global endpoint, root_ca_path, configuration_path
+
+    # Initial state.
+    endpoint = None
+    root_ca_path = None
+    configuration_path = CONFIGURATION_PATH
+
+    # Printing intro.
+    print_intro()
+
+    # Reading input.
+    read_input(argv)
+
+    try:
+        # Loading devices' configuration.
+        registry = DeviceRegistry.load(configuration_path)
+        print('%d devices configured.\n' % (len(registry.get_devices())))
+
+        # Discovery of Bluetooth devices.
+        print('Scanning Bluetooth devices...\n')
+        manager = Manager.instance()
+        manager.discover(False, SCANNING_TIME_s)
+        discovered_devices = manager.get_nodes()
+        if not discovered_devices:
+            print('\nNo Bluetooth devices found. Exiting...\n')
+            sys.exit(0)
+
+        # Bringing devices up in parallel.
+        print('Bringing devices up...\n')
+        edge = AWSGreengrass(endpoint, root_ca_path)
+        gateway = Gateway(registry, edge, NotificationPump())
+        start = time.time()
+        reports = gateway.bring_up(discovered_devices)
+        for report in reports:
+            print(report)
+        print('\n%d/%d devices brought up in %.3f s.' % (
+            len([report for report in reports if report.error is None]),
+            len(reports), time.time() - start))
+
+        # Demo running.
+        print('\nDemo running (\"CTRL+C\" to quit)...\n')
+        gateway.start()
+
+        # Infinite loop.
+        while True:
+
+            # Dispatching notifications.
+            gateway.dispatch(0.05)
+
+    except ConfigurationException as e:
+        print(e)
+        print('Exiting...\n')
+        sys.exit(0)
+    except BTLEException as e:
+        print(e)
+        print('Exiting...\n')
+        sys.exit(0)
+    except WrongInstantiationException as e:
+        print(e)
+        print('Exiting...\n')
+        sys.exit(0)
+    except KeyboardInterrupt:
+        try:
+            # Exiting.
+            print('\nExiting...\n')
+            sys.exit(0)
+        except SystemExit:
+            os._exit(0)
+
+
+if __name__ == "__main__":
+
+    try:
+        main(sys.argv[1:])
+    except KeyboardInterrupt:
+        try:
+            sys.exit(0)
+        except SystemExit:
+            os._exit(0)
@@ -1,3 +1,12 @@
+from edge_st_sdk.edge_backends import create_edge
+from edge_st_sdk.edge_backends import get_backend
+from edge_st_sdk.edge_backends import register_backend
+
 __all__ = [
-    'edge_client'
+    'async_edge_client', \
+    'create_edge', \
+    'edge_backends', \
+    'edge_client', \
+    'get_backend', \
+    'register_backend'
 ]
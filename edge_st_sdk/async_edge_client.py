@@ -0,0 +1,240 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+"""async_edge_client
+
+The async_edge_client module contains an interface for creating edge client
+classes to be driven by an :mod:`asyncio` event loop.
+
+Requires Python 3.5 or later.
+"""
+
+
+# IMPORT
+
+import asyncio
+from abc import ABCMeta
+from abc import abstractmethod
+
+
+# INTERFACE
+
+class AsyncEdgeClient(object, metaclass=ABCMeta):
+    """The AsyncEdgeClient class is an interface for creating edge client
+    classes whose operations are awaitable instead of blocking."""
+
+    @abstractmethod
+    async def connect(self):
+        """Connect to the core."""
+        raise NotImplementedError('You must define "connect()" to use the "AsyncEdgeClient" class.')
+
+    @abstractmethod
+    async def disconnect(self):
+        """Disconnect from the core."""
+        raise NotImplementedError('You must define "disconnect()" to use the "AsyncEdgeClient" class.')
+
+    @abstractmethod
+    async def publish(self, topic, payload, qos):
+        """Publish a new message to the desired topic with the given quality of
+        service.
+
+        With QoS 1 the coroutine completes when the broker acknowledges the
+        message.
+
+        Args:
+            topic (str): Topic name to publish to.
+            payload (str): Payload to publish (JSON formatted string).
+            qos (int): Quality of Service. Could be "0" or "1".
+        """
+        raise NotImplementedError('You must define "publish()" to use the "AsyncEdgeClient" class.')
+
+    @abstractmethod
+    async def subscribe(self, topic, qos):
+        """Subscribe to the desired topic with the given quality of service.
+
+        Args:
+            topic (str): Topic name to subscribe to.
+            qos (int): Quality of Service. Could be "0" or "1".
+
+        Returns:
+            :class:`AsyncSubscription`: Asynchronous iterator over the messages
+            published on the subscribed topic.
+        """
+        raise NotImplementedError('You must define "subscribe()" to use the "AsyncEdgeClient" class.')
+
+    @abstractmethod
+    async def unsubscribe(self, topic):
+        """Unsubscribe to the desired topic, closing all the subscriptions
+        opened on it.
+
+        Args:
+            topic (str): Topic name to unsubscribe to.
+        """
+        raise NotImplementedError('You must define "unsubscribe()" to use the "AsyncEdgeClient" class.')
+
+    @abstractmethod
+    async def get_shadow_state(self, timeout_s):
+        """Get the state of the shadow client.
+
+        Args:
+            timeout_s (int): Timeout in seconds to perform the request.
+
+        Returns:
+            str: The device shadow JSON document.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ShadowRequestException`
+                is raised if the request is rejected or times out.
+        """
+        raise NotImplementedError('You must define "get_shadow_state()" to use the "AsyncEdgeClient" class.')
+
+    @abstractmethod
+    async def update_shadow_state(self, payload, timeout_s):
+        """Update the state of the shadow client.
+
+        Args:
+            payload (json): JSON document string used to update the shadow JSON
+                document on the cloud.
+            timeout_s (int): Timeout in seconds to perform the request.
+
+        Returns:
+            str: The response JSON document.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ShadowRequestException`
+                is raised if the request is rejected or times out.
+        """
+        raise NotImplementedError('You must define "update_shadow_state()" to use the "AsyncEdgeClient" class.')
+
+    @abstractmethod
+    async def delete_shadow_state(self, timeout_s):
+        """Delete the state of the shadow client.
+
+        Args:
+            timeout_s (int): Timeout in seconds to perform the request.
+
+        Returns:
+            str: The response JSON document.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ShadowRequestException`
+                is raised if the request is rejected or times out.
+        """
+        raise NotImplementedError('You must define "delete_shadow_state()" to use the "AsyncEdgeClient" class.')
+
+
+# CLASSES
+
+class AsyncSubscription(object):
+    """Asynchronous iterator over the messages received on a topic.
+
+    Messages are handed over from the network thread of the underlying client
+    to the event loop through :meth:`push`, which is thread-safe.
+    """
+
+    _CLOSED = object()
+    """Sentinel put into the queue when the subscription gets closed."""
+
+    def __init__(self, topic, loop, max_pending=0):
+        """Constructor.
+
+        Args:
+            topic (str): Topic name the subscription refers to.
+            loop: Event loop the messages are delivered to.
+            max_pending (int): Maximum number of messages waiting to be
+                consumed; when exceeded, the newest messages are dropped. Zero
+                means unbounded.
+        """
+        self._topic = topic
+        self._loop = loop
+        self._queue = asyncio.Queue(max_pending)
+        self._closed = False
+        self._dropped = 0
+
+    def get_topic(self):
+        """Get the topic of the subscription.
+
+        Returns:
+            str: The topic name.
+        """
+        return self._topic
+
+    def get_dropped(self):
+        """Get the number of messages dropped because the consumer was too
+        slow.
+
+        Returns:
+            int: The number of dropped messages.
+        """
+        return self._dropped
+
+    def push(self, message):
+        """Deliver a message to the subscription.
+
+        Can be called from any thread.
+
+        Args:
+            message: The received message.
+        """
+        self._loop.call_soon_threadsafe(self._put, message)
+
+    def close(self):
+        """Close the subscription, ending the iteration once the pending
+        messages have been consumed.
+
+        Can be called from any thread.
+        """
+        self._loop.call_soon_threadsafe(self._put, self._CLOSED)
+
+    def _put(self, item):
+        if self._closed:
+            return
+        if item is self._CLOSED:
+            self._closed = True
+            # Make room for the sentinel, so that consumers always terminate.
+            if self._queue.full():
+                self._queue.get_nowait()
+                self._dropped += 1
+            self._queue.put_nowait(item)
+            return
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._dropped += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self._queue.get()
+        if item is self._CLOSED:
+            # Let other consumers of the same subscription terminate too.
+            self._queue.put_nowait(item)
+            raise StopAsyncIteration
+        return item
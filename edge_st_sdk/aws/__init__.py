@@ -1,4 +1,10 @@
 __all__ = [
+    'aws_async_client', \
     'aws_client', \
-    'aws_greengrass'
+    'aws_connection', \
+    'aws_discovery_cache', \
+    'aws_discovery_registry', \
+    'aws_greengrass', \
+    'aws_shadow_replica', \
+    'aws_shadow_requests'
 ]
@@ -0,0 +1,310 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+"""aws_async_client
+
+The aws_async_client module adapts an
+:class:`edge_st_sdk.aws.aws_client.AWSClient` to the
+:class:`edge_st_sdk.async_edge_client.AsyncEdgeClient` interface, so that a
+single :mod:`asyncio` event loop can drive many clients.
+
+Requires Python 3.7 or later.
+"""
+
+
+# IMPORT
+
+import asyncio
+import threading
+
+from edge_st_sdk.async_edge_client import AsyncEdgeClient
+from edge_st_sdk.async_edge_client import AsyncSubscription
+from edge_st_sdk.utils.edge_st_exceptions import ShadowRequestException
+
+
+# CLASSES
+
+class AWSAsyncClient(AsyncEdgeClient):
+    """Class responsible for exposing an Amazon AWS client through awaitable
+    operations.
+
+    Publishing and subscribing rely on the non-blocking API of the AWS IoT SDK,
+    whose completions are handed back to the event loop, so no thread is spent
+    waiting for them. Shadow requests are sent through the shadow request
+    engine of the client, enabled by the adapter, which correlates each request
+    with its own response, so that concurrent requests of the same kind do not
+    replace each other's callback as within the shadow handler of the AWS IoT
+    SDK. Connecting, disconnecting, and enabling the shadow request engine of a
+    connected client are blocking operations, hence they are run in the default
+    executor of the event loop.
+    """
+
+    def __init__(self, client, max_pending_messages=0):
+        """Constructor.
+
+        Args:
+            client (:class:`edge_st_sdk.aws.aws_client.AWSClient`): The client
+                to adapt, as obtained through a call to the
+                :meth:`edge_st_sdk.aws.aws_greengrass.AWSGreengrass.get_client`
+                method.
+            max_pending_messages (int): Maximum number of messages waiting to be
+                consumed on each subscription. Zero means unbounded.
+        """
+        self._client = client
+        self._max_pending_messages = max_pending_messages
+        self._subscriptions = {}
+        self._shadow_requests_lock = threading.Lock()
+
+    def get_client(self):
+        """Get the adapted client.
+
+        Returns:
+            :class:`edge_st_sdk.aws.aws_client.AWSClient`: The adapted client.
+        """
+        return self._client
+
+    def get_client_id(self):
+        """Get the client identifier.
+
+        Returns:
+            str: The client identifier, i.e. the name of the client.
+        """
+        return self._client.get_client_id()
+
+    async def connect(self, race_endpoints=False):
+        """Connect to the core.
+
+        Args:
+            race_endpoints (bool): If True, all the endpoints of the core are
+                tried at once and the first reachable one is used. Refer to
+                :meth:`edge_st_sdk.aws.aws_connection.AWSConnection.connect`.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._connect, race_endpoints)
+
+    def _connect(self, race_endpoints):
+        """Enable the shadow request engine of the client, and connect it to
+        the core.
+
+        Args:
+            race_endpoints (bool): Refer to :meth:`connect`.
+        """
+        self._enable_shadow_requests()
+        self._client.connect(race_endpoints)
+
+    def _enable_shadow_requests(self):
+        """Enable the shadow request engine of the client, if not enabled
+        yet."""
+        with self._shadow_requests_lock:
+            if self._client.get_shadow_requests() is None:
+                self._client.enable_shadow_requests()
+
+    async def disconnect(self):
+        """Disconnect from the core, closing all the subscriptions."""
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.close()
+        self._subscriptions.clear()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._client.disconnect)
+
+    async def publish(self, topic, payload, qos):
+        """Publish a new message to the desired topic with the given quality of
+        service.
+
+        With QoS 1 the coroutine completes when the broker acknowledges the
+        message.
+
+        Args:
+            topic (str): Topic name to publish to.
+            payload (str): Payload to publish (JSON formatted string).
+            qos (int): Quality of Service. Could be "0" or "1".
+        """
+        if qos == 0:
+            self._client.publish_async(topic, payload, qos)
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self._client.publish_async(topic, payload, qos,
+            lambda mid: _resolve(loop, future, mid)):
+            await future
+
+    async def subscribe(self, topic, qos):
+        """Subscribe to the desired topic with the given quality of service.
+
+        Subscribing more than once to the same topic is allowed: every
+        subscription receives all the messages.
+
+        Args:
+            topic (str): Topic name to subscribe to.
+            qos (int): Quality of Service. Could be "0" or "1".
+
+        Returns:
+            :class:`edge_st_sdk.async_edge_client.AsyncSubscription`:
+            Asynchronous iterator over the messages published on the subscribed
+            topic.
+        """
+        loop = asyncio.get_running_loop()
+        subscription = AsyncSubscription(topic, loop, self._max_pending_messages)
+        if topic in self._subscriptions:
+            self._subscriptions[topic].append(subscription)
+            return subscription
+
+        # Only one subscription per topic is made on the underlying client,
+        # whose messages are dispatched to all the asynchronous subscriptions.
+        subscriptions = [subscription]
+        self._subscriptions[topic] = subscriptions
+
+        def callback(client, userdata, message):
+            for s in list(subscriptions):
+                s.push(message)
+
+        future = loop.create_future()
+        if not self._client.subscribe_async(topic, qos, callback,
+            lambda mid, data: _resolve(loop, future, data)):
+            del self._subscriptions[topic]
+            subscription.close()
+            return subscription
+        await future
+        return subscription
+
+    async def unsubscribe(self, topic):
+        """Unsubscribe to the desired topic, closing all the subscriptions
+        opened on it.
+
+        Args:
+            topic (str): Topic name to unsubscribe to.
+        """
+        for subscription in self._subscriptions.pop(topic, []):
+            subscription.close()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self._client.unsubscribe_async(topic,
+            lambda mid: _resolve(loop, future, mid)):
+            await future
+
+    async def get_shadow_state(self, timeout_s):
+        """Get the state of the shadow client.
+
+        Args:
+            timeout_s (int): Timeout in seconds to perform the request.
+
+        Returns:
+            str: The device shadow JSON document.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ShadowRequestException`
+                is raised if the request is rejected or times out.
+        """
+        return await self._shadow_request(
+            lambda callback: self._client.get_shadow_state(callback, timeout_s))
+
+    async def update_shadow_state(self, payload, timeout_s):
+        """Update the state of the shadow client.
+
+        Args:
+            payload (json): JSON document string used to update the shadow JSON
+                document on the cloud.
+            timeout_s (int): Timeout in seconds to perform the request.
+
+        Returns:
+            str: The response JSON document.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ShadowRequestException`
+                is raised if the request is rejected or times out.
+        """
+        return await self._shadow_request(
+            lambda callback: self._client.update_shadow_state(payload, callback, timeout_s))
+
+    async def delete_shadow_state(self, timeout_s):
+        """Delete the state of the shadow client.
+
+        Args:
+            timeout_s (int): Timeout in seconds to perform the request.
+
+        Returns:
+            str: The response JSON document.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ShadowRequestException`
+                is raised if the request is rejected or times out.
+        """
+        return await self._shadow_request(
+            lambda callback: self._client.delete_shadow_state(callback, timeout_s))
+
+    async def _shadow_request(self, request):
+        """Perform a shadow request and wait for its response.
+
+        Args:
+            request: Function issuing the request, given the callback to be
+                called when the response comes back.
+
+        Returns:
+            str: The response JSON document.
+        """
+        if not self._client.is_connected():
+            raise ShadowRequestException('Shadow device %s is not connected.'
+                % (self._client.get_client_id()))
+        loop = asyncio.get_running_loop()
+        if self._client.get_shadow_requests() is None:
+            # The client has been connected without the adapter.
+            await loop.run_in_executor(None, self._enable_shadow_requests)
+        future = loop.create_future()
+
+        def callback(payload, response_status, token):
+            if response_status == 'accepted':
+                _resolve(loop, future, payload)
+            else:
+                _resolve(loop, future, ShadowRequestException(
+                    'Shadow request with token "%s" %s.' % (token, response_status),
+                    response_status, payload, token))
+
+        request(callback)
+        return await future
+
+
+# FUNCTIONS
+
+def _resolve(loop, future, result):
+    """Complete a future of the given event loop from any thread.
+
+    Args:
+        loop: Event loop the future belongs to.
+        future: Future to complete.
+        result: Result of the future, or exception to raise.
+    """
+    def set_result():
+        if future.done():
+            return
+        if isinstance(result, BaseException):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+    loop.call_soon_threadsafe(set_result)
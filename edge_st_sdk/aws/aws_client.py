@@ -1,212 +1,1358 @@
-################################################################################
-# COPYRIGHT(c) 2018 STMicroelectronics                                         #
-#                                                                              #
-# Redistribution and use in source and binary forms, with or without           #
-# modification, are permitted provided that the following conditions are met:  #
-#   1. Redistributions of source code must retain the above copyright notice,  #
-#      this list of conditions and the following disclaimer.                   #
-#   2. Redistributions in binary form must reproduce the above copyright       #
-#      notice, this list of conditions and the following disclaimer in the     #
-#      documentation and/or other materials provided with the distribution.    #
-#   3. Neither the name of STMicroelectronics nor the names of its             #
-#      contributors may be used to endorse or promote products derived from    #
-#      this software without specific prior written permission.                #
-#                                                                              #
-# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
-# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
-# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
-# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
-# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
-# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
-# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
-# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
-# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
-# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
-# POSSIBILITY OF SUCH DAMAGE.                                                  #
-################################################################################
-
-
-"""aws_client
-
-The aws_client module represents a client capable of connecting to the Amazon
-AWS IoT cloud and performing edge operations through the Greengrass SDK.
-"""
-
-
-# IMPORT
-
-import sys
-
-from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTShadowClient
-
-from edge_st_sdk.edge_client import EdgeClient
-import edge_st_sdk.aws.aws_greengrass
-from edge_st_sdk.utils.edge_st_exceptions import WrongInstantiationException
-
-
-# CLASSES
-
-class AWSClient(EdgeClient):
-    """Class responsible for handling an Amazon AWS client used for plain MQTT
-    communication with AWS IoT."""
-
-    def __init__(self, client_id, device_certificate_path, \
-        device_private_key_path, group_ca_path, core_info):
-        """Constructor.
-
-        Args:
-            client_id (str): Name of the client, as it is on the cloud.
-            device_certificate_path (str): Relative path of the device's
-                certificate stored on the core device.
-            device_private_key_path (str): Relative path of the device's
-                private key stored on the core device.
-            group_ca_path (str): Relative path of the certification authority's
-                certificate stored on the core device.
-            core_info (list): Information related to the core of the group to
-                which the client belongs.
-
-        Raises:
-            :exc:`edge_st_sdk.utils.edge_st_exceptions.WrongInstantiationException`
-                is raised if the discovery of the core has not been completed
-                yet, i.e. if the AWSClient has not been instantiated through a
-                call to the
-                :meth:`edge_st_sdk.aws.aws_greengrass.AWSGreengrass.get_client`
-                method.
-        """
-        # Check the client is created with the right pattern (Builder).
-        if not edge_st_sdk.aws.aws_greengrass.AWSGreengrass.discovery_completed():
-            raise WrongInstantiationException('Amazon AWS clients must be '
-                'obtained through a call to the \'get_client()\' method of an '
-                '\'AWSGreengrass\' object.')
-
-        # Saving informations.
-        self._connected = False
-        self._client_id = client_id
-        self._core_info = core_info
-        
-        # Creating a shadow client.
-        self._shadow_client = AWSIoTMQTTShadowClient(client_id)
-        self._shadow_client.configureCredentials(group_ca_path, device_private_key_path, device_certificate_path)
-
-        # Getting the underneath client and configurint it.
-        self._client = self._shadow_client.getMQTTConnection()
-        self._client.configureOfflinePublishQueueing(-1)  # Infinite offline Publish queueing.
-        self._client.configureDrainingFrequency(2)  # Draining: 2 Hz.
-        
-        # Creating a shadow handler with persistent subscription.
-        self._shadow_handler = self._shadow_client.createShadowHandlerWithName(self._client_id, True)
-
-    def get_client_id(self):
-        """Get the client identifier. 
-
-        Returns:
-            str: The client identifier, i.e. the name of the client.
-        """
-        return self._client_id
-
-    def connect(self):
-        """Connect to the core."""
-        # Iterate through the connection options for the core and use the first
-        # successful one.
-        for connectivity_info in self._core_info.connectivityInfoList:
-            self._current_host = connectivity_info.host
-            self._current_port = connectivity_info.port
-            print("Trying to connect to core at %s:%d..." % (self._current_host, self._current_port))
-            self._shadow_client.configureEndpoint(self._current_host, self._current_port)
-            self._shadow_client.configureAutoReconnectBackoffTime(1, 32, 20)
-            self._shadow_client.configureConnectDisconnectTimeout(10)  # 10 sec
-            self._shadow_client.configureMQTTOperationTimeout(5)  # 5 sec
-            try:
-                self._shadow_client.connect()
-                self._connected = True
-                break
-            except BaseException as e:
-                self._connected = False
-
-        if not self._connected:
-            print("Cannot connect to core %s. Exiting..." % self._core_info.coreThingArn)
-            sys.exit(-2)
-        else:
-            print("Shadow device %s successfully connected to core %s." % (self._client_id, self._core_info.coreThingArn))
-
-    def disconnect(self):
-        """Disconnect from the core."""
-        if self._connected:
-            self._shadow_client.disconnect()
-
-    def publish(self, topic, payload, qos):
-        """Publish a new message to the desired topic with the given quality of
-        service.
-
-        Args:
-            topic (str): Topic name to publish to.
-            payload (str): Payload to publish (JSON formatted string).
-            qos (int): Quality of Service. Could be "0" or "1".
-        """
-        if self._connected:
-            self._client.publish(topic, payload, qos)
-
-    def subscribe(self, topic, qos, callback):
-        """Subscribe to the desired topic with the given quality of service and
-        register a callback to handle the published messages.
-
-        Args:
-            topic (str): Topic name to publish to.
-            qos (int): Quality of Service. Could be "0" or "1".
-            callback: Function to be called when a new message for the
-                subscribed topic comes in.
-        """
-        if self._connected:
-            self._client.subscribe(topic, qos, callback)
-
-    def unsubscribe(self, topic):
-        """Unsubscribe to the desired topic.
-
-        Args:
-            topic (str): Topic name to unsubscribe to.
-        """
-        if self._connected:
-            self._client.unsubscribe(topic)
-
-    def get_shadow_state(self, callback, timeout_s):
-        """Get the state of the shadow client.
-
-        Retrieve the device shadow JSON document from the cloud by publishing an
-        empty JSON document to the corresponding shadow topics.
-
-        Args:
-            callback: Function to be called when the response for a shadow
-                request comes back.
-            timeout_s (int): Timeout in seconds to perform the request.
-        """
-        if self._connected:
-            self._shadow_handler.shadowGet(callback, timeout_s)
-
-    def update_shadow_state(self, payload, callback, timeout_s):
-        """Update the state of the shadow client.
-
-        Update the device shadow JSON document string on the cloud by publishing
-        the provided JSON document to the corresponding shadow topics.
-
-        Args:
-            payload (json): JSON document string used to update the shadow JSON
-                document on the cloud.
-            callback: Function to be called when the response for a shadow
-                request comes back.
-        """
-        if self._connected:
-            self._shadow_handler.shadowUpdate(payload, callback, timeout_s)
-
-    def delete_shadow_state(self, callback, timeout_s):
-        """Delete the state of the shadow client.
-        
-        Delete the device shadow from the cloud by publishing an empty JSON
-        document to the corresponding shadow topics.
-
-        Args:
-            callback: Function to be called when the response for a shadow
-                request comes back.
-            timeout_s (int): Timeout in seconds to perform the request.
-        """
-        if self._connected:
-            self._shadow_handler.shadowDelete(callback, timeout_s)
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""aws_client
+
+The aws_client module represents a client capable of connecting to the Amazon
+AWS IoT cloud and performing edge operations through the Greengrass SDK.
+"""
+
+
+# IMPORT
+
+import sys
+import json
+import threading
+import time
+from collections import deque
+
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishQueueDisabledException
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishQueueFullException
+
+from edge_st_sdk.edge_client import EdgeClient
+from edge_st_sdk.telemetry.payload_codec import JSONCodec
+from edge_st_sdk.aws.aws_connection import AWSConnection
+from edge_st_sdk.aws.aws_discovery_registry import AWSDiscoveryRegistry
+from edge_st_sdk.aws.aws_shadow_replica import AWSShadowReplica
+from edge_st_sdk.aws.aws_shadow_requests import AWSShadowRequests
+from edge_st_sdk.aws.aws_shadow_requests import MAX_IN_FLIGHT
+from edge_st_sdk.utils.drain_scheduler import AdaptiveDrainScheduler
+from edge_st_sdk.utils.edge_st_exceptions import WrongInstantiationException
+from edge_st_sdk.utils.persistent_queue import OverflowPolicy
+from edge_st_sdk.utils.persistent_queue import PersistentQueue
+from edge_st_sdk.utils.publish_coalescer import PublishCoalescer
+from edge_st_sdk.utils.publish_pipeline import PublishPipeline
+from edge_st_sdk.utils.shadow_compactor import ShadowUpdateCompactor
+from edge_st_sdk.utils import shadow_document
+from edge_st_sdk.utils.metrics import REGISTRY
+
+
+# CONSTANTS
+
+UNCHANGED_SHADOW_RESPONSE = '{"state":{}}'
+"""Response to a shadow update that changes nothing, and is not sent."""
+
+PUBLISHED_MESSAGES = REGISTRY.counter('edge_st_published_messages_total', \
+    'Messages handed over to the MQTT client.', ('client_id',))
+"""Metric counting the messages published."""
+
+DROPPED_MESSAGES = REGISTRY.counter('edge_st_dropped_messages_total', \
+    'Messages dropped by the publish pipeline.', ('client_id',))
+"""Metric counting the messages dropped by the publish pipeline."""
+
+PUBLISH_LATENCY = REGISTRY.histogram('edge_st_publish_latency_seconds', \
+    'Time taken by the MQTT client to publish a message, up to the '
+    'acknowledgement for QoS 1.', ('client_id',))
+"""Metric measuring the time taken to publish a message."""
+
+SHADOW_RTT = REGISTRY.histogram('edge_st_shadow_rtt_seconds', \
+    'Time between a shadow request and its response.', \
+    ('client_id', 'operation'))
+"""Metric measuring the round-trip time of the shadow requests."""
+
+OFFLINE_QUEUE_DEPTH = REGISTRY.gauge('edge_st_offline_queue_messages', \
+    'Messages stored in the offline queue.', ('client_id',))
+"""Metric measuring the size of the offline queue."""
+
+RECONNECTIONS = REGISTRY.counter('edge_st_reconnections_total', \
+    'Connections re-established after a loss.', ('client_id',))
+"""Metric counting the reconnections."""
+
+CALLBACK_DURATION = REGISTRY.histogram('edge_st_callback_duration_seconds', \
+    'Time taken by the callbacks of the subscriptions.', ('client_id',))
+"""Metric measuring the execution time of the callbacks."""
+
+
+# CLASSES
+
+class AWSClient(EdgeClient):
+    """Class responsible for handling an Amazon AWS client used for plain MQTT
+    communication with AWS IoT."""
+
+    OFFLINE_QUEUE_RETRY_s = 1
+    """Time in seconds to wait before retrying to drain the offline queue
+    after a failure."""
+
+    OFFLINE_QUEUE_POLL_s = 0.05
+    """Time in seconds between checks of the acknowledgements of the last
+    messages drained from the offline queue."""
+
+    def __init__(self, client_id, device_certificate_path, \
+        device_private_key_path, group_ca_path, core_info, connection=None, \
+        rediscover=None):
+        """Constructor.
+
+        Args:
+            client_id (str): Name of the client, as it is on the cloud.
+            device_certificate_path (str): Relative path of the device's
+                certificate stored on the core device.
+            device_private_key_path (str): Relative path of the device's
+                private key stored on the core device.
+            group_ca_path (str): Relative path of the certification authority's
+                certificate stored on the core device.
+            core_info (list): Information related to the core of the group to
+                which the client belongs.
+            connection (:class:`edge_st_sdk.aws.aws_connection.AWSConnection`):
+                Physical connection to share with other clients. If not given,
+                a dedicated connection is opened with the client's credentials.
+            rediscover: Function without arguments called when the connection
+                to the core fails, returning a new
+                :class:`edge_st_sdk.aws.aws_discovery_registry.AWSDiscoveryResult`
+                to try once more, or None to give up, e.g. when the core has
+                been discovered through stale cached information.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.WrongInstantiationException`
+                is raised if the discovery of the core has not been completed
+                yet, i.e. if the AWSClient has not been instantiated through a
+                call to the
+                :meth:`edge_st_sdk.aws.aws_greengrass.AWSGreengrass.get_client`
+                method.
+        """
+        # Check the client is created with the right pattern (Builder).
+        if not AWSDiscoveryRegistry.discovery_completed():
+            raise WrongInstantiationException('Amazon AWS clients must be '
+                'obtained through a call to the \'get_client()\' method of an '
+                '\'AWSGreengrass\' object.')
+
+        super(AWSClient, self).__init__()
+
+        # Saving informations.
+        self._connected = False
+        self._client_id = client_id
+        self._core_info = core_info
+        self._rediscover = rediscover
+        self._coalescer = None
+        self._coalesced_topics = None
+        self._publish_pipeline = None
+        self._pipeline_block = True
+        self._pipeline_timeout_s = None
+        self._subscriptions = {}
+        self._subscribed_callbacks = {}
+        self._callback_executor = None
+        self._timed_callbacks = {}
+        self._connection_lost = False
+        self._shadow_state = None
+        self._shadow_lock = threading.Lock()
+        self._shadow_replica = None
+        self._local_shadow_responses = 0
+        self._shadow_delta_callback = None
+        self._shadow_requests = None
+        self._shadow_compactor = None
+        self._shadow_compaction_timeout_s = None
+        self._shadow_flush_lock = threading.Lock()
+        self._offline_queue = None
+        self._publish_priorities = {}
+        self._interleave_live = True
+        self._drain_scheduler = None
+        self._drain_event = threading.Event()
+        self._drain_stop = None
+        self._drain_thread = None
+
+        # Resolving the metrics of the client.
+        self._published_messages = PUBLISHED_MESSAGES.labels(client_id)
+        self._dropped_messages = DROPPED_MESSAGES.labels(client_id)
+        self._publish_latency = PUBLISH_LATENCY.labels(client_id)
+        self._shadow_rtts = dict((operation, SHADOW_RTT.labels(client_id, operation)) \
+            for operation in ('get', 'update', 'delete'))
+        self._reconnections = RECONNECTIONS.labels(client_id)
+        self._callback_duration = CALLBACK_DURATION.labels(client_id)
+        OFFLINE_QUEUE_DEPTH.labels(client_id).set(0)
+
+        # Getting the physical connection.
+        if connection is None:
+            connection = AWSConnection(client_id, device_certificate_path, \
+                device_private_key_path, group_ca_path, core_info)
+            connection.attach()
+        self._connection = connection
+        self._attached = True
+        self._client = self._connection.get_mqtt_client()
+
+        # Creating a shadow handler with persistent subscription.
+        self._shadow_handler = self._connection.create_shadow_handler(self._client_id)
+
+    def get_client_id(self):
+        """Get the client identifier. 
+
+        Returns:
+            str: The client identifier, i.e. the name of the client.
+        """
+        return self._client_id
+
+    def is_connected(self):
+        """Check whether the client is connected to the core.
+
+        Returns:
+            bool: True if the client is connected, False otherwise.
+        """
+        return self._connected
+
+    def get_connection(self):
+        """Get the physical connection used by the client.
+
+        Returns:
+            :class:`edge_st_sdk.aws.aws_connection.AWSConnection`: The physical
+            connection.
+        """
+        return self._connection
+
+    def connect(self, race_endpoints=False):
+        """Connect to the core.
+
+        Args:
+            race_endpoints (bool): If True, all the endpoints of the core are
+                tried at once and the first reachable one is used. Refer to
+                :meth:`edge_st_sdk.aws.aws_connection.AWSConnection.connect`.
+        """
+        if self._connected:
+            return
+        if not self._attached:
+            self._connection.attach()
+            self._attached = True
+        self._connection.acquire()
+        self._connected = self._connection.connect(race_endpoints)
+        if not self._connected and self._rediscover:
+            discovery = self._rediscover()
+            if discovery and self._connection.set_core(discovery.group_ca_path, \
+                discovery.core_info):
+                self._core_info = discovery.core_info
+                self._connected = self._connection.connect(race_endpoints)
+
+        if not self._connected:
+            self._connection.release()
+            print("Cannot connect to core %s. Exiting..." % self._core_info.coreThingArn)
+            sys.exit(-2)
+        else:
+            print("Shadow device %s successfully connected to core %s." % (self._client_id, self._core_info.coreThingArn))
+            self._connection.add_online_callback(self._on_online)
+            self._connection.add_offline_callback(self._on_offline)
+            if self._shadow_requests:
+                self._shadow_requests.subscribe()
+            self._update_shadow_delta_registration()
+            if self._shadow_replica:
+                self._subscribe_shadow_replica()
+            self._drain_event.set()
+
+    def disconnect(self):
+        """Disconnect from the core."""
+        if self._coalescer:
+            self._coalescer.flush()
+        if self._connected:
+            self._connected = False
+            if self._shadow_replica:
+                self._shadow_replica.invalidate()
+            if self._shadow_requests:
+                self._shadow_requests.unsubscribe()
+            for topic, callback in list(self._subscriptions.items()):
+                self._connection.unsubscribe(topic, callback)
+            self._subscriptions.clear()
+            self._subscribed_callbacks.clear()
+            self._timed_callbacks.clear()
+            self._connection.remove_online_callback(self._on_online)
+            self._connection.remove_offline_callback(self._on_offline)
+            self._connection.release()
+            self._connection.detach()
+            self._attached = False
+
+    def _on_online(self):
+        """Count the reconnections after a loss of the connection, and send
+        the shadow updates folded meanwhile, if any."""
+        if self._connection_lost:
+            self._connection_lost = False
+            self._reconnections.inc()
+        compactor = self._shadow_compactor
+        if compactor is not None and compactor.has_pending():
+            # Not sending from the network thread, which has to receive the
+            # response.
+            thread = threading.Thread(target=self._flush_shadow_updates)
+            thread.daemon = True
+            thread.start()
+
+    def _on_offline(self):
+        """Record the loss of the connection."""
+        self._connection_lost = True
+
+    def publish(self, topic, payload, qos):
+        """Publish a new message to the desired topic with the given quality of
+        service.
+
+        Args:
+            topic (str): Topic name to publish to.
+            payload (str): Payload to publish (JSON formatted string).
+            qos (int): Quality of Service. Could be "0" or "1".
+
+        Returns:
+            bool: True if the message has been accepted by the publish
+            pipeline, if enabled, or handed over otherwise; False if it has
+            been dropped by the publish pipeline or the client is not
+            connected.
+        """
+        pipeline = self._publish_pipeline
+        if pipeline is not None:
+            if pipeline.submit(topic, payload, qos, self._pipeline_block, \
+                self._pipeline_timeout_s):
+                return True
+            self._dropped_messages.inc()
+            return False
+        return self._publish_now(topic, payload, qos)
+
+    def _publish_now(self, topic, payload, qos):
+        """Publish a message, coalescing it if enabled.
+
+        Args:
+            topic (str): Topic name to publish to.
+            payload (str): Payload to publish (JSON formatted string).
+            qos (int): Quality of Service. Could be "0" or "1".
+
+        Returns:
+            bool: True if the message has been handed over, False otherwise.
+        """
+        if self._coalescer and self._is_coalesced(topic):
+            self._coalescer.add(topic, payload, qos)
+            return True
+        return self._publish(topic, payload, qos)
+
+    def _is_coalesced(self, topic):
+        """Check whether the messages of a topic are coalesced.
+
+        Only topics whose payloads are JSON documents are coalesced, as the
+        envelopes are JSON documents.
+
+        Args:
+            topic (str): Topic name.
+
+        Returns:
+            bool: True if the messages of the topic are coalesced, False
+            otherwise.
+        """
+        if self._coalesced_topics is not None \
+            and topic not in self._coalesced_topics:
+            return False
+        return isinstance(self.get_payload_codec(topic), JSONCodec)
+
+    def publish_batch(self, messages):
+        """Publish a batch of messages.
+
+        If publish coalescing is enabled, the messages bound for the same
+        coalesced topic are sent as a single envelope message as soon as the
+        batch has been processed.
+
+        Args:
+            messages (list): List of (topic, payload, qos) tuples, with the
+                same meaning of the arguments of :meth:`publish`.
+        """
+        if self._publish_pipeline is not None:
+            for topic, payload, qos in messages:
+                self.publish(topic, payload, qos)
+            return
+        if not self._coalescer:
+            for topic, payload, qos in messages:
+                self._publish(topic, payload, qos)
+            return
+        topics = set()
+        for topic, payload, qos in messages:
+            if self._is_coalesced(topic):
+                self._coalescer.add(topic, payload, qos)
+                topics.add(topic)
+            else:
+                self._publish(topic, payload, qos)
+        self._coalescer.flush(topics)
+
+    def enable_publish_coalescing(self, max_messages=0, \
+        max_bytes=PublishCoalescer.MAX_PAYLOAD_BYTES, max_latency_s=1, \
+        topics=None):
+        """Enable the coalescing of the messages published on the same topic
+        into envelope messages.
+
+        Refer to :mod:`edge_st_sdk.utils.publish_coalescer` for the format of
+        the envelopes, which is suitable only for topics with JSON payloads.
+
+        Args:
+            max_messages (int): Maximum number of messages per envelope. Zero
+                means no limit.
+            max_bytes (int): Maximum size of an envelope in bytes. Zero means
+                no limit.
+            max_latency_s (float): Maximum time in seconds a message may wait
+                for its envelope to be published. Zero means that envelopes are
+                published only when full or when a batch has been processed.
+            topics (list): Topics to coalesce. All of them if not given. The
+                topics whose payloads are not JSON documents are never
+                coalesced.
+        """
+        self.disable_publish_coalescing()
+        self._coalesced_topics = set(topics) if topics is not None else None
+        self._coalescer = PublishCoalescer(self._publish, max_messages, \
+            max_bytes, max_latency_s)
+
+    def disable_publish_coalescing(self):
+        """Disable the coalescing of messages, publishing the pending
+        envelopes."""
+        coalescer = self._coalescer
+        self._coalescer = None
+        if coalescer:
+            coalescer.close()
+
+    def enable_publish_pipeline(self, capacity, block=True, timeout_s=None, \
+        high_watermark=0, low_watermark=0, watermark_callback=None):
+        """Enable the queueing of the published messages into a bounded
+        pipeline, sending them on a separate thread while the client is
+        connected, or the offline queue is enabled.
+
+        Refer to :mod:`edge_st_sdk.utils.publish_pipeline` for details.
+
+        Args:
+            capacity (int): Maximum number of queued messages.
+            block (bool): If True, :meth:`publish` waits for room in the queue
+                when full, otherwise it drops the message right away.
+            timeout_s (float): Maximum time :meth:`publish` waits for room in
+                the queue, in seconds. Wait forever if None.
+            high_watermark (int): Number of queued messages at which the
+                watermark callback is notified of the backpressure. The
+                capacity if 0.
+            low_watermark (int): Number of queued messages at which the
+                watermark callback is notified of the end of the backpressure.
+                Half of the high watermark if 0.
+            watermark_callback (function): Function called with a boolean
+                telling whether the backpressure is on, and with the number of
+                queued messages, when a watermark is crossed.
+        """
+        self.disable_publish_pipeline()
+        self._pipeline_block = block
+        self._pipeline_timeout_s = timeout_s
+        self._publish_pipeline = PublishPipeline(self._publish_now, capacity, \
+            self._is_publishable, high_watermark, low_watermark, \
+            watermark_callback)
+
+    def disable_publish_pipeline(self, timeout_s=None):
+        """Disable the publish pipeline, waiting for the queued messages to be
+        sent.
+
+        Args:
+            timeout_s (float): Maximum time to wait for the queued messages to
+                be sent, in seconds; the ones left are discarded. Wait forever
+                if None.
+
+        Returns:
+            int: The number of messages discarded.
+        """
+        pipeline = self._publish_pipeline
+        self._publish_pipeline = None
+        if pipeline is not None:
+            return pipeline.close(timeout_s)
+        return 0
+
+    def get_publish_pipeline(self):
+        """Get the publish pipeline, e.g. to submit messages with a specific
+        mode or to read the counters of the topics.
+
+        Returns:
+            :class:`edge_st_sdk.utils.publish_pipeline.PublishPipeline`: The
+            publish pipeline if enabled, None otherwise.
+        """
+        return self._publish_pipeline
+
+    def _is_publishable(self):
+        """Check whether messages can be handed over, either to the underlying
+        client or to the offline queue.
+
+        Returns:
+            bool: True if messages can be handed over, False otherwise.
+        """
+        return self._offline_queue is not None \
+            or (self._connected and self._connection.is_online())
+
+    def _publish(self, topic, payload, qos):
+        """Publish a message on the underlying client, or store it in the
+        offline queue, if enabled, while the connection is down or the queue is
+        being drained.
+
+        Args:
+            topic (str): Topic name to publish to.
+            payload (str): Payload to publish (JSON formatted string).
+            qos (int): Quality of Service. Could be "0" or "1".
+
+        Returns:
+            bool: True if the message has been handed over, False otherwise,
+            as reported by the underlying client when sent right away.
+        """
+        if self._enqueue(topic, payload, qos):
+            return True
+        if self._connected:
+            start_s = time.time()
+            try:
+                published = self._client.publish(topic, payload, qos)
+            except (publishQueueDisabledException, publishQueueFullException):
+                # The connection is down, and the in-memory queue of the
+                # underlying client is disabled or full.
+                if not self._enqueue(topic, payload, qos, True):
+                    return False
+                return True
+            if published:
+                self._publish_latency.observe(time.time() - start_s)
+                self._published_messages.inc()
+            return published
+        return False
+
+    def _enqueue(self, topic, payload, qos, offline=False):
+        """Store a message in the offline queue, if enabled, when it cannot be
+        sent right away.
+
+        Args:
+            topic (str): Topic name to publish to.
+            payload (str): Payload to publish (JSON formatted string).
+            qos (int): Quality of Service. Could be "0" or "1".
+            offline (bool): If True, the message is known not to be sendable,
+                e.g. because the underlying client refused it.
+
+        Returns:
+            bool: True if the message has been handled by the offline queue,
+            i.e. either stored or dropped because of the limits of the queue,
+            False if it has to be sent right away.
+        """
+        offline_queue = self._offline_queue
+        if offline_queue is None:
+            return False
+        if not offline and self._connected and self._connection.is_online() \
+            and (self._interleave_live or offline_queue.get_size() == 0):
+            return False
+        offline_queue.put(topic, payload, qos, self._publish_priorities.get(topic, 0))
+        self._drain_event.set()
+        return True
+
+    def enable_offline_queue(self, path, max_messages=0, max_bytes=0, \
+        overflow_policy=OverflowPolicy.DROP_OLDEST, priorities=None, \
+        sync=False, interleave_live=True, drain_scheduler=None):
+        """Store the messages published while the connection is down in a
+        bounded queue on disk, instead of the unbounded in-memory queue of the
+        underlying client, which is disabled, refer to
+        :meth:`edge_st_sdk.aws.aws_connection.AWSConnection.add_external_queue`.
+
+        The queue is drained as soon as the connection is up, at a rate which
+        adapts to how fast the messages get acknowledged, refer to
+        :mod:`edge_st_sdk.utils.drain_scheduler`. Messages left in the queue
+        when the process ends are sent after the next connection, provided
+        that the same path is used. Refer to
+        :mod:`edge_st_sdk.utils.persistent_queue`.
+
+        Messages published through :meth:`publish_async` which get queued are
+        acknowledged as soon as they are stored.
+
+        Args:
+            path (str): Path of the directory holding the queue, which must not
+                be shared with other clients.
+            max_messages (int): Maximum number of messages. Zero means no
+                limit.
+            max_bytes (int): Maximum size of the queue on disk in bytes. Zero
+                means no limit.
+            overflow_policy
+                (:class:`edge_st_sdk.utils.persistent_queue.OverflowPolicy`):
+                Policy applied when a new message does not fit the queue.
+            priorities (dict): Eviction priority, from 0 (lowest, default) to
+                255, keyed by topic, used by the
+                :attr:`edge_st_sdk.utils.persistent_queue.OverflowPolicy.PRIORITY`
+                policy.
+            sync (bool): If True, every queued message is flushed to the disk
+                before returning, so as to survive power failures too.
+            interleave_live (bool): If True, the messages published while the
+                queue is being drained are sent right away, interleaved with
+                the queued ones; otherwise they are appended to the queue, so
+                as to keep the publishing order.
+            drain_scheduler
+                (:class:`edge_st_sdk.utils.drain_scheduler.AdaptiveDrainScheduler`):
+                Scheduler pacing the draining of the queue. A scheduler with
+                the default settings is used if not given.
+        """
+        self.disable_offline_queue()
+        self._publish_priorities = dict(priorities) if priorities else {}
+        self._interleave_live = interleave_live
+        self._drain_scheduler = drain_scheduler if drain_scheduler \
+            else AdaptiveDrainScheduler()
+        self._offline_queue = PersistentQueue(path, max_messages, max_bytes, \
+            overflow_policy, sync=sync)
+        self._drain_stop = threading.Event()
+        self._drain_thread = threading.Thread(target=self._drain_offline_queue, \
+            args=(self._offline_queue, self._drain_stop))
+        self._drain_thread.daemon = True
+        self._drain_thread.start()
+        OFFLINE_QUEUE_DEPTH.labels(self._client_id).set_function( \
+            self._offline_queue.get_size)
+        self._connection.add_online_callback(self._drain_event.set)
+        self._connection.add_external_queue()
+        self._drain_event.set()
+
+    def disable_offline_queue(self):
+        """Stop storing the messages published while the connection is down in
+        the offline queue, which is closed and kept on disk."""
+        offline_queue = self._offline_queue
+        if offline_queue is None:
+            return
+        self._offline_queue = None
+        OFFLINE_QUEUE_DEPTH.labels(self._client_id).set_function(None)
+        OFFLINE_QUEUE_DEPTH.labels(self._client_id).set(0)
+        self._connection.remove_online_callback(self._drain_event.set)
+        self._connection.remove_external_queue()
+        self._drain_stop.set()
+        self._drain_event.set()
+        self._drain_thread.join()
+        offline_queue.close()
+
+    def get_offline_queue(self):
+        """Get the offline queue.
+
+        Returns:
+            :class:`edge_st_sdk.utils.persistent_queue.PersistentQueue`: The
+            offline queue, or None if not enabled.
+        """
+        return self._offline_queue
+
+    def get_drain_status(self):
+        """Get the progress of the draining of the offline queue.
+
+        Returns:
+            :class:`edge_st_sdk.utils.drain_scheduler.DrainStatus`: The
+            progress of the draining, with the number of messages still in the
+            queue and the estimated time to drain them, or None if the offline
+            queue is not enabled.
+        """
+        offline_queue = self._offline_queue
+        if offline_queue is None:
+            return None
+        return self._drain_scheduler.get_status(offline_queue.get_size())
+
+    def _drain_offline_queue(self, offline_queue, stop):
+        """Send the messages of the offline queue whenever the connection is
+        up, paced by the drain scheduler.
+
+        Many messages are sent before their acknowledgements come back, and a
+        message is removed from the queue only once acknowledged, so that it is
+        sent again after a restart if the process ends in the meantime. The
+        messages whose acknowledgement is missing are sent again, before
+        reading further messages; the ones still in flight are not.
+
+        Args:
+            offline_queue
+                (:class:`edge_st_sdk.utils.persistent_queue.PersistentQueue`):
+                The queue to drain.
+            stop (:class:`threading.Event`): Event set to stop draining.
+        """
+        scheduler = self._drain_scheduler
+        in_flight = {}
+        expired = deque()
+        while not stop.is_set():
+            self._drain_event.wait(self.OFFLINE_QUEUE_RETRY_s)
+            self._drain_event.clear()
+            scheduler.start()
+            in_flight.clear()
+            expired.clear()
+            message = None
+            while not stop.is_set() and self._connected \
+                and self._connection.is_online():
+                for token in scheduler.expire():
+                    lost = in_flight.pop(token, None)
+                    if lost is not None:
+                        expired.append(lost)
+                following = expired[0] if expired \
+                    else offline_queue.peek(message)
+                if following is None:
+                    if not scheduler.get_in_flight():
+                        break
+                    stop.wait(self.OFFLINE_QUEUE_POLL_s)
+                    continue
+                token = scheduler.acquire(self.OFFLINE_QUEUE_RETRY_s)
+                if token is None:
+                    continue
+                if expired:
+                    expired.popleft()
+                else:
+                    message = following
+                if not self._send_drained_message(offline_queue, following, \
+                    token, in_flight):
+                    break
+
+    def _send_drained_message(self, offline_queue, message, token, in_flight):
+        """Send a message of the offline queue, and remove it once
+        acknowledged.
+
+        Args:
+            offline_queue
+                (:class:`edge_st_sdk.utils.persistent_queue.PersistentQueue`):
+                The queue being drained.
+            message
+                (:class:`edge_st_sdk.utils.persistent_queue.PersistentQueueMessage`):
+                The message to send.
+            token (int): The token of the message given by the drain
+                scheduler.
+            in_flight (dict): The messages waiting for their acknowledgement,
+                by token, to which the message is added until acknowledged.
+
+        Returns:
+            bool: True if the message has been sent, False otherwise.
+        """
+        scheduler = self._drain_scheduler
+        in_flight[token] = message
+
+        def ack_callback(mid):
+            in_flight.pop(token, None)
+            offline_queue.remove(message)
+            scheduler.on_ack(token)
+
+        try:
+            self._client.publishAsync(message.topic, message.payload, \
+                message.qos, ack_callback if message.qos else None)
+        except Exception as e:
+            in_flight.pop(token, None)
+            scheduler.on_failure(token)
+            print("Draining the offline queue of %s failed: %s" % (self._client_id, str(e)))
+            return False
+        if not message.qos:
+            ack_callback(None)
+        return True
+
+    def publish_async(self, topic, payload, qos, ack_callback=None):
+        """Publish a new message to the desired topic with the given quality of
+        service without waiting for the acknowledgement.
+
+        Args:
+            topic (str): Topic name to publish to.
+            payload (str): Payload to publish (JSON formatted string).
+            qos (int): Quality of Service. Could be "0" or "1".
+            ack_callback: Function to be called with the packet identifier
+                when the PUBACK is received (QoS 1 only). If the message is
+                stored in the offline queue, it is called right away with None
+                as packet identifier.
+
+        Returns:
+            bool: True if the message has been handed over to the client or
+            to the offline queue, False otherwise.
+        """
+        if self._enqueue(topic, payload, qos):
+            if ack_callback and qos:
+                ack_callback(None)
+            return True
+        if self._connected:
+            try:
+                self._client.publishAsync(topic, payload, qos, ack_callback)
+            except (publishQueueDisabledException, publishQueueFullException):
+                # The connection is down, and the in-memory queue of the
+                # underlying client is disabled or full.
+                if not self._enqueue(topic, payload, qos, True):
+                    return False
+                if ack_callback and qos:
+                    ack_callback(None)
+            return True
+        return False
+
+    def set_callback_executor(self, executor):
+        """Set the executor running the callbacks of the subscriptions made
+        from now on, instead of the network thread of the MQTT client.
+
+        Args:
+            executor (:class:`edge_st_sdk.utils.callback_executor.CallbackExecutor`):
+                The executor. None to run the callbacks on the network thread.
+        """
+        self._callback_executor = executor
+
+    def _wrap_callback(self, topic, callback):
+        """Wrap the callback of a subscription, so that its execution time is
+        measured and it is run by the executor of the callbacks, if any.
+
+        Args:
+            topic (str): Topic name of the subscription.
+            callback: Function to be called when a new message for the
+                subscribed topic comes in.
+
+        Returns:
+            function: The callback to subscribe with.
+        """
+        timed_callback = self._timed_callbacks.get(callback)
+        if timed_callback is None:
+            duration = self._callback_duration
+
+            def timed_callback(client, userdata, message):
+                start_s = time.time()
+                try:
+                    callback(client, userdata, message)
+                finally:
+                    duration.observe(time.time() - start_s)
+
+            # The same wrapper is used for the same callback, so that messages
+            # matching several subscriptions are recognized as duplicates.
+            self._timed_callbacks[callback] = timed_callback
+        if self._callback_executor is None:
+            return timed_callback
+        return self._callback_executor.wrap(topic, timed_callback)
+
+    def _time_shadow_request(self, operation, callback):
+        """Wrap the callback of a shadow request, so that the round-trip time
+        is measured.
+
+        Args:
+            operation (str): The operation, i.e. "get", "update", or "delete".
+            callback: Function to be called when the response for the shadow
+                request comes back.
+
+        Returns:
+            function: The callback to send the request with.
+        """
+        rtt = self._shadow_rtts[operation]
+        start_s = time.time()
+
+        def timed_callback(payload, response_status, token):
+            if response_status != 'timeout':
+                rtt.observe(time.time() - start_s)
+            if callback:
+                callback(payload, response_status, token)
+
+        return timed_callback
+
+    def subscribe(self, topic, qos, callback):
+        """Subscribe to the desired topic with the given quality of service and
+        register a callback to handle the published messages.
+
+        Args:
+            topic (str): Topic name to publish to.
+            qos (int): Quality of Service. Could be "0" or "1".
+            callback: Function to be called when a new message for the
+                subscribed topic comes in.
+        """
+        if self._connected:
+            self._unsubscribe_local(topic)
+            self._subscribed_callbacks[topic] = callback
+            callback = self._wrap_callback(topic, callback)
+            self._subscriptions[topic] = callback
+            self._connection.subscribe(topic, qos, callback)
+
+    def subscribe_async(self, topic, qos, callback, ack_callback=None):
+        """Subscribe to the desired topic without waiting for the
+        acknowledgement.
+
+        Args:
+            topic (str): Topic name to subscribe to.
+            qos (int): Quality of Service. Could be "0" or "1".
+            callback: Function to be called when a new message for the
+                subscribed topic comes in.
+            ack_callback: Function to be called with the packet identifier and
+                the granted QoS when the SUBACK is received.
+
+        Returns:
+            bool: True if the request has been handed over to the client, False
+            otherwise.
+        """
+        if self._connected:
+            self._unsubscribe_local(topic)
+            self._subscribed_callbacks[topic] = callback
+            callback = self._wrap_callback(topic, callback)
+            self._subscriptions[topic] = callback
+            self._connection.subscribe(topic, qos, callback, ack_callback, False)
+            return True
+        return False
+
+    def unsubscribe(self, topic):
+        """Unsubscribe to the desired topic.
+
+        Args:
+            topic (str): Topic name to unsubscribe to.
+        """
+        if self._connected and topic in self._subscriptions:
+            self._forget_callback(topic)
+            self._connection.unsubscribe(topic, self._subscriptions.pop(topic))
+
+    def unsubscribe_async(self, topic, ack_callback=None):
+        """Unsubscribe to the desired topic without waiting for the
+        acknowledgement.
+
+        Args:
+            topic (str): Topic name to unsubscribe to.
+            ack_callback: Function to be called with the packet identifier when
+                the UNSUBACK is received.
+
+        Returns:
+            bool: True if the request has been handed over to the client, False
+            otherwise.
+        """
+        if self._connected and topic in self._subscriptions:
+            self._forget_callback(topic)
+            self._connection.unsubscribe(topic, self._subscriptions.pop(topic), \
+                ack_callback, False)
+            return True
+        return False
+
+    def _unsubscribe_local(self, topic):
+        """Unregister the callback previously registered by the client on a
+        topic, if any, without waiting for the acknowledgement.
+
+        Args:
+            topic (str): Topic name.
+        """
+        callback = self._subscriptions.pop(topic, None)
+        if callback is not None:
+            self._forget_callback(topic)
+            self._connection.unsubscribe(topic, callback, None, False)
+
+    def _forget_callback(self, topic):
+        """Forget the callback subscribed to a topic, dropping its wrapper
+        unless subscribed to other topics as well.
+
+        Args:
+            topic (str): Topic name.
+        """
+        callback = self._subscribed_callbacks.pop(topic, None)
+        if callback is not None \
+            and callback not in self._subscribed_callbacks.values():
+            self._timed_callbacks.pop(callback, None)
+
+    def get_shadow_state(self, callback, timeout_s, force_refresh=False):
+        """Get the state of the shadow client.
+
+        Retrieve the device shadow JSON document from the cloud by publishing an
+        empty JSON document to the corresponding shadow topics.
+
+        If the shadow replica is enabled and in sync, the document is taken from
+        the replica and the callback is called right away, with "accepted" as
+        response status.
+
+        Args:
+            callback: Function to be called when the response for a shadow
+                request comes back, if any.
+            timeout_s (int): Timeout in seconds to perform the request.
+            force_refresh (bool): If True, the request is sent to the core even
+                if the shadow replica is in sync.
+        """
+        if not self._connected:
+            return
+        replica = self._shadow_replica
+        if replica is None:
+            self._send_shadow_request('get', None, callback, timeout_s)
+            return
+        if replica.is_synchronized() and not force_refresh:
+            self._respond_locally(callback, replica.get_document(), 'replica')
+            return
+
+        def replica_callback(payload, response_status, token):
+            if response_status == 'accepted':
+                replica.load(payload)
+            elif response_status == 'rejected' and json.loads(payload).get('code') == 404:
+                replica.clear()
+            if callback:
+                callback(payload, response_status, token)
+
+        self._send_shadow_request('get', None, replica_callback, timeout_s)
+
+    def update_shadow_state(self, payload, callback, timeout_s):
+        """Update the state of the shadow client.
+
+        Update the device shadow JSON document string on the cloud by publishing
+        the provided JSON document to the corresponding shadow topics.
+
+        Args:
+            payload (json): JSON document string used to update the shadow JSON
+                document on the cloud.
+            callback: Function to be called when the response for a shadow
+                request comes back. If shadow diffing is enabled and nothing
+                changed, no request is sent and the callback is called right
+                away, with "accepted" as response status and an empty state.
+                If shadow compaction is enabled and the connection is down, the
+                callback is called with the response to the merged update.
+            timeout_s (int): Timeout in seconds to perform the request.
+        """
+        if not self._connected:
+            return
+        if self._shadow_state is not None:
+            payload = self._diff_shadow_update(payload)
+            if payload is None:
+                self._respond_locally(callback, UNCHANGED_SHADOW_RESPONSE, 'unchanged')
+                return
+        compactor = self._shadow_compactor
+        if compactor is not None and (compactor.has_pending() \
+            or not self._connection.is_online()):
+            # Folding the user's callback, so that it is called once.
+            compactor.add(payload, callback)
+            if self._connection.is_online():
+                self._flush_shadow_updates()
+            return
+        self._send_shadow_request('update', payload, \
+            self._wrap_diff_callback(callback), timeout_s)
+
+    def enable_shadow_compaction(self, timeout_s):
+        """Fold the shadow updates issued while the connection is down into a
+        single pending update, sent when the connection is back, instead of
+        queueing each of them.
+
+        Refer to :mod:`edge_st_sdk.utils.shadow_compactor` for the merging
+        rules.
+
+        Args:
+            timeout_s (int): Timeout in seconds of the merged update request.
+        """
+        self._shadow_compaction_timeout_s = timeout_s
+        if self._shadow_compactor is None:
+            self._shadow_compactor = ShadowUpdateCompactor()
+
+    def disable_shadow_compaction(self):
+        """Stop folding the shadow updates, sending the pending one if the
+        connection is up."""
+        if self._connection.is_online():
+            self._flush_shadow_updates()
+        self._shadow_compactor = None
+
+    def get_shadow_compactor(self):
+        """Get the shadow update compactor.
+
+        Returns:
+            :class:`edge_st_sdk.utils.shadow_compactor.ShadowUpdateCompactor`:
+            The compactor if enabled, None otherwise.
+        """
+        return self._shadow_compactor
+
+    def _flush_shadow_updates(self):
+        """Send the shadow updates folded while the connection was down as a
+        single update, preceded by the deletion of the keys recreated meanwhile,
+        if any."""
+        compactor = self._shadow_compactor
+        if compactor is None:
+            return
+        with self._shadow_flush_lock:
+            reset, payload, callback, folded = compactor.take()
+            if payload is None:
+                return
+            print("Sending %d shadow updates of %s as one." % (folded, self._client_id))
+            callback = self._wrap_diff_callback(callback)
+            if reset is None:
+                self._send_shadow_request('update', payload, callback, \
+                    self._shadow_compaction_timeout_s)
+                return
+
+            # Deleting the keys recreated afterwards first, and sending the
+            # merged update only once the deletion is accepted, as the shadow
+            # handler keeps a single callback per operation.
+            def reset_callback(response_payload, response_status, token):
+                if response_status != 'accepted':
+                    if callback:
+                        callback(response_payload, response_status, token)
+                    return
+                self._send_shadow_request('update', payload, callback, \
+                    self._shadow_compaction_timeout_s)
+
+            self._send_shadow_request('update', reset, reset_callback, \
+                self._shadow_compaction_timeout_s)
+
+    def delete_shadow_state(self, callback, timeout_s):
+        """Delete the state of the shadow client.
+        
+        Delete the device shadow from the cloud by publishing an empty JSON
+        document to the corresponding shadow topics.
+
+        Args:
+            callback: Function to be called when the response for a shadow
+                request comes back.
+            timeout_s (int): Timeout in seconds to perform the request.
+        """
+        if not self._connected:
+            return
+        self._reset_shadow_state()
+        replica = self._shadow_replica
+        if replica is None:
+            self._send_shadow_request('delete', None, callback, timeout_s)
+            return
+
+        def replica_callback(payload, response_status, token):
+            if response_status == 'accepted':
+                replica.clear()
+            if callback:
+                callback(payload, response_status, token)
+
+        self._send_shadow_request('delete', None, replica_callback, timeout_s)
+
+    def _send_shadow_request(self, operation, payload, callback, timeout_s):
+        """Send a request to the shadow, either through the shadow request
+        engine, if enabled, or through the shadow handler.
+
+        Args:
+            operation (str): The operation, i.e. "get", "update", or "delete".
+            payload (str): JSON document string of an update request; None for
+                the other requests.
+            callback: Function to be called when the response for the shadow
+                request comes back.
+            timeout_s (int): Timeout in seconds to perform the request.
+        """
+        callback = self._time_shadow_request(operation, callback)
+        shadow_requests = self._shadow_requests
+        if shadow_requests is not None:
+            shadow_requests.request(operation, payload, timeout_s, callback)
+            return
+        try:
+            if operation == 'get':
+                self._shadow_handler.shadowGet(callback, timeout_s)
+            elif operation == 'update':
+                self._shadow_handler.shadowUpdate(payload, callback, timeout_s)
+            else:
+                self._shadow_handler.shadowDelete(callback, timeout_s)
+        except (publishQueueDisabledException, publishQueueFullException):
+            # The connection is down, and the in-memory queue of the
+            # underlying client is disabled or full: failing the request as
+            # the request engine does.
+            print("Shadow %s request of %s not sent: connection down." % (operation, self._client_id))
+            callback(None, 'failed', None)
+
+    def enable_shadow_requests(self, max_in_flight=MAX_IN_FLIGHT, \
+        timer_wheel=None):
+        """Send the shadow requests through a request engine correlating them
+        with their responses, instead of through the shadow handler of the AWS
+        IoT SDK, which starts a timer thread per request and parses the
+        payloads again.
+
+        Refer to :mod:`edge_st_sdk.aws.aws_shadow_requests` for details. The
+        callbacks of the requests are called on the network thread of the MQTT
+        client, or on the thread of the timer wheel for timeouts, hence they
+        should return quickly.
+
+        Args:
+            max_in_flight (int): Maximum number of requests in flight. Unbounded
+                if 0.
+            timer_wheel (:class:`edge_st_sdk.utils.timer_wheel.TimerWheel`):
+                Wheel running the timeouts. The one shared by the clients if
+                not given.
+        """
+        self.disable_shadow_requests()
+        self._shadow_requests = AWSShadowRequests(self._connection, \
+            self._client_id, max_in_flight, timer_wheel)
+        if self._connected:
+            self._shadow_requests.subscribe()
+
+    def disable_shadow_requests(self):
+        """Send the shadow requests through the shadow handler again,
+        cancelling the requests pending on the request engine."""
+        shadow_requests = self._shadow_requests
+        self._shadow_requests = None
+        if shadow_requests is not None:
+            shadow_requests.unsubscribe()
+
+    def get_shadow_requests(self):
+        """Get the shadow request engine, e.g. to send requests returning
+        futures.
+
+        Returns:
+            :class:`edge_st_sdk.aws.aws_shadow_requests.AWSShadowRequests`:
+            The shadow request engine if enabled, None otherwise.
+        """
+        return self._shadow_requests
+
+    def register_shadow_delta_callback(self, callback):
+        """Register a callback to handle the changes of the desired state of
+        the shadow with respect to the reported state.
+
+        Args:
+            callback: Function to be called with the delta JSON document, the
+                "delta/<client_id>" response status, and a None token, whenever
+                the desired state changes.
+        """
+        self._shadow_delta_callback = callback
+        self._update_shadow_delta_registration()
+
+    def unregister_shadow_delta_callback(self):
+        """Unregister the callback handling the changes of the desired state of
+        the shadow."""
+        self._shadow_delta_callback = None
+        self._update_shadow_delta_registration()
+
+    def enable_shadow_replica(self, timeout_s):
+        """Keep a local copy of the shadow, so that :meth:`get_shadow_state`
+        can be answered without a request to the core.
+
+        The replica is kept current through the "update/documents" and
+        "update/delta" shadow topics, and it gets refreshed on the first
+        request after a loss of connection. To be called once connected.
+
+        Args:
+            timeout_s (int): Timeout in seconds of the request loading the
+                replica.
+        """
+        if self._shadow_replica:
+            return
+        self._shadow_replica = AWSShadowReplica()
+        self._connection.add_offline_callback(self._shadow_replica.invalidate)
+        self._connection.add_online_callback(self._shadow_replica.invalidate)
+        self._update_shadow_delta_registration()
+        if self._connected:
+            self._subscribe_shadow_replica()
+            self.get_shadow_state(None, timeout_s, True)
+
+    def disable_shadow_replica(self):
+        """Stop keeping a local copy of the shadow."""
+        replica = self._shadow_replica
+        if not replica:
+            return
+        self._shadow_replica = None
+        self._connection.remove_offline_callback(replica.invalidate)
+        self._connection.remove_online_callback(replica.invalidate)
+        self._update_shadow_delta_registration()
+        self.unsubscribe(self._get_shadow_topic('update/documents'))
+
+    def _subscribe_shadow_replica(self):
+        """Subscribe to the documents of the shadow to keep the replica
+        current."""
+        replica = self._shadow_replica
+
+        def documents_callback(client, userdata, message):
+            replica.apply_documents(message.payload)
+
+        self.subscribe(self._get_shadow_topic('update/documents'), 0, documents_callback)
+
+    def _update_shadow_delta_registration(self):
+        """Register to the delta messages of the shadow if either the replica
+        or a delta callback needs them."""
+        if not self._connected:
+            return
+        if self._shadow_replica or self._shadow_delta_callback:
+            self._shadow_handler.shadowRegisterDeltaCallback(self._on_shadow_delta)
+        else:
+            self._shadow_handler.shadowUnregisterDeltaCallback()
+
+    def _on_shadow_delta(self, payload, response_status, token):
+        """Handle a delta message of the shadow.
+
+        Args:
+            payload (str): The delta JSON document.
+            response_status (str): The "delta/<client_id>" status.
+            token (str): Always None.
+        """
+        replica = self._shadow_replica
+        if replica:
+            replica.apply_delta(payload)
+        callback = self._shadow_delta_callback
+        if callback:
+            callback(payload, response_status, token)
+
+    def _get_shadow_topic(self, action):
+        """Get the topic of a shadow action.
+
+        Args:
+            action (str): The action, e.g. "update/documents".
+
+        Returns:
+            str: The topic name.
+        """
+        return "$aws/things/%s/shadow/%s" % (self._client_id, action)
+
+    def enable_shadow_diff(self):
+        """Send only the changes to the shadow state.
+
+        A local copy of the state sent through :meth:`update_shadow_state` is
+        kept, so that each update carries only the keys whose value changed,
+        and no update is sent at all when nothing changed. The local copy is
+        discarded whenever an update is not accepted, so that the following
+        update is sent in full.
+        """
+        with self._shadow_lock:
+            if self._shadow_state is None:
+                self._shadow_state = {}
+
+    def disable_shadow_diff(self):
+        """Send the shadow state updates as they are."""
+        with self._shadow_lock:
+            self._shadow_state = None
+
+    def _reset_shadow_state(self):
+        """Discard the local copy of the shadow state, if any."""
+        with self._shadow_lock:
+            if self._shadow_state is not None:
+                self._shadow_state = {}
+
+    def _respond_locally(self, callback, payload, source):
+        """Answer a shadow request that has not been sent, calling its callback
+        with "accepted" as response status.
+
+        Args:
+            callback: Function to be called with the response, if any.
+            payload (str): JSON document string of the response.
+            source (str): Source of the response, part of its token.
+        """
+        if not callback:
+            return
+        with self._shadow_lock:
+            self._local_shadow_responses += 1
+            token = "%s_%s_%d" % (self._client_id, source, self._local_shadow_responses)
+        callback(payload, 'accepted', token)
+
+    def _diff_shadow_update(self, payload):
+        """Reduce a shadow update to the changes with respect to the state
+        sent so far.
+
+        Args:
+            payload (json): JSON document string used to update the shadow JSON
+                document on the cloud.
+
+        Returns:
+            str: The payload to send, or None if nothing changed.
+        """
+        document = json.loads(payload)
+        state = document.get('state')
+        if not isinstance(state, dict):
+            return payload
+        with self._shadow_lock:
+            if self._shadow_state is None:
+                return payload
+            changes = shadow_document.diff(self._shadow_state, state)
+            if not changes:
+                return None
+            shadow_document.merge(self._shadow_state, changes, False)
+        document['state'] = changes
+        return json.dumps(document, separators=(',', ':'))
+
+    def _wrap_diff_callback(self, callback):
+        """Wrap the callback of a shadow update so that the state sent so far is
+        forgotten if the update is not accepted, when shadow diffing is
+        enabled.
+
+        Args:
+            callback: Function to be called when the response for the shadow
+                request comes back, if any.
+
+        Returns:
+            The callback to register.
+        """
+        if self._shadow_state is None:
+            return callback
+
+        def diff_callback(response_payload, response_status, token):
+            if response_status != 'accepted':
+                self._reset_shadow_state()
+            if callback:
+                callback(response_payload, response_status, token)
+
+        return diff_callback
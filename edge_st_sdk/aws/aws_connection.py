@@ -0,0 +1,585 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+"""aws_connection
+
+The aws_connection module represents physical MQTT connections to the core of
+an Amazon AWS Greengrass group, which can be shared by many
+:class:`edge_st_sdk.aws.aws_client.AWSClient` objects, i.e. by many logical
+devices, each one with its own identity, topics, and shadow.
+
+Please note that the core authorizes messages according to the identity of the
+physical connection, i.e. of the device whose credentials have been used to
+open it: the subscriptions of the Greengrass group have to allow the devices
+owning the connections to act on the topics and on the shadows of the devices
+sharing them.
+"""
+
+
+# IMPORT
+
+import socket
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTShadowClient
+from AWSIoTPythonSDK.MQTTLib import DROP_NEWEST
+
+
+# CONSTANTS
+
+ENDPOINT_PROBE_TIMEOUT_s = 10
+"""Timeout in seconds of the TCP probes when racing the endpoints."""
+
+_preferred_endpoints = {}
+"""Endpoint of the last successful connection to each core, tried first."""
+
+_preferred_endpoints_lock = threading.Lock()
+"""Lock protecting the preferred endpoints."""
+
+
+# CLASSES
+
+class AWSConnection(object):
+    """Class responsible for handling a physical MQTT connection to the core,
+    shared by one or more clients."""
+
+    OFFLINE_QUEUE_SIZE = -1
+    """Size of the in-memory queue of the underlying client holding the
+    requests issued while the connection is down: infinite."""
+
+    DRAINING_FREQUENCY_Hz = 2
+    """Rate at which the underlying client sends the requests of its in-memory
+    queue after a reconnection."""
+
+    def __init__(self, client_id, device_certificate_path, \
+        device_private_key_path, group_ca_path, core_info):
+        """Constructor.
+
+        Args:
+            client_id (str): Name of the client owning the connection, as it is
+                on the cloud, used as MQTT client identifier.
+            device_certificate_path (str): Relative path of the owning device's
+                certificate stored on the core device.
+            device_private_key_path (str): Relative path of the owning device's
+                private key stored on the core device.
+            group_ca_path (str): Relative path of the certification authority's
+                certificate stored on the core device.
+            core_info (list): Information related to the core of the group to
+                which the client belongs.
+        """
+        self._client_id = client_id
+        self._device_certificate_path = device_certificate_path
+        self._device_private_key_path = device_private_key_path
+        self._group_ca_path = group_ca_path
+        self._core_info = core_info
+        self._connected = False
+        self._online = False
+        self._clients = 0
+        self._references = 0
+        self._lock = threading.RLock()
+        self._connect_lock = threading.Lock()
+        self._subscriptions = {}
+        self._online_callbacks = []
+        self._offline_callbacks = []
+        self._endpoint = None
+        self._endpoint_latencies = {}
+        self._endpoint_latencies_lock = threading.Lock()
+        self._external_queues = 0
+
+        # Creating a shadow client.
+        self._shadow_client = AWSIoTMQTTShadowClient(client_id)
+        self._shadow_client.configureCredentials(group_ca_path, device_private_key_path, device_certificate_path)
+
+        # Getting the underneath client and configuring it.
+        self._client = self._shadow_client.getMQTTConnection()
+        self._client.configureOfflinePublishQueueing(self.OFFLINE_QUEUE_SIZE)
+        self._client.configureDrainingFrequency(self.DRAINING_FREQUENCY_Hz)
+
+        # Getting notified about the status of the connection.
+        self._shadow_client.onOnline = self._on_online
+        self._shadow_client.onOffline = self._on_offline
+
+    def get_client_id(self):
+        """Get the MQTT client identifier of the connection.
+
+        Returns:
+            str: The MQTT client identifier.
+        """
+        return self._client_id
+
+    def get_core_info(self):
+        """Get the information related to the core the connection refers to.
+
+        Returns:
+            list: Information related to the core.
+        """
+        return self._core_info
+
+    def get_group_ca_path(self):
+        """Get the path of the certification authority's certificate used by
+        the connection.
+
+        Returns:
+            str: Path of the certification authority's certificate.
+        """
+        return self._group_ca_path
+
+    def set_core(self, group_ca_path, core_info):
+        """Set the core to connect to, e.g. after a new discovery, unless
+        already connected.
+
+        Args:
+            group_ca_path (str): Relative path of the certification authority's
+                certificate stored on the core device.
+            core_info (list): Information related to the core.
+
+        Returns:
+            bool: True if the core has been set, False if already connected.
+        """
+        with self._connect_lock:
+            if self._connected:
+                return False
+            self._group_ca_path = group_ca_path
+            self._core_info = core_info
+            self._shadow_client.configureCredentials(group_ca_path, \
+                self._device_private_key_path, self._device_certificate_path)
+            return True
+
+    def add_online_callback(self, callback):
+        """Register a function to be called whenever the connection gets
+        established, or re-established after a loss.
+
+        Args:
+            callback: Function without arguments, called on the network
+                thread.
+        """
+        with self._lock:
+            self._online_callbacks = self._online_callbacks + [callback]
+
+    def remove_online_callback(self, callback):
+        """Unregister a function registered through
+        :meth:`add_online_callback`.
+
+        Args:
+            callback: Function previously registered.
+        """
+        with self._lock:
+            self._online_callbacks = [c for c in self._online_callbacks if c != callback]
+
+    def add_offline_callback(self, callback):
+        """Register a function to be called whenever the connection gets lost.
+
+        Args:
+            callback: Function without arguments, called on the network
+                thread.
+        """
+        with self._lock:
+            self._offline_callbacks = self._offline_callbacks + [callback]
+
+    def remove_offline_callback(self, callback):
+        """Unregister a function registered through
+        :meth:`add_offline_callback`.
+
+        Args:
+            callback: Function previously registered.
+        """
+        with self._lock:
+            self._offline_callbacks = [c for c in self._offline_callbacks if c != callback]
+
+    def add_external_queue(self):
+        """Notify that a client sharing the connection stores the messages
+        published while the connection is down on its own, e.g. in a
+        :class:`edge_st_sdk.utils.persistent_queue.PersistentQueue`.
+
+        The in-memory queue of the underlying client is disabled as long as
+        there are such clients, so that the messages are neither kept in
+        memory nor sent twice: publishing while the connection is down raises
+        an exception instead, letting the clients store the messages. The
+        fixed rate draining of the underlying client has therefore nothing to
+        send after a reconnection, and the clients' own schedulers alone pace
+        the messages sent, e.g. the
+        :class:`edge_st_sdk.utils.drain_scheduler.AdaptiveDrainScheduler` of
+        :meth:`edge_st_sdk.aws.aws_client.AWSClient.enable_offline_queue`.
+
+        As the in-memory queue belongs to the connection, it is disabled for
+        all the clients sharing it: the messages that the clients without a
+        queue of their own publish while the connection is down, shadow
+        requests included, are not sent, and reported as such by
+        :class:`edge_st_sdk.aws.aws_client.AWSClient`.
+        """
+        with self._lock:
+            self._external_queues += 1
+            if self._external_queues == 1:
+                self._client.configureOfflinePublishQueueing(0, DROP_NEWEST)
+
+    def remove_external_queue(self):
+        """Notify that a client registered through :meth:`add_external_queue`
+        does not store the messages on its own any longer, restoring the
+        in-memory queue of the underlying client when it was the last one."""
+        with self._lock:
+            if not self._external_queues:
+                return
+            self._external_queues -= 1
+            if not self._external_queues:
+                self._client.configureOfflinePublishQueueing( \
+                    self.OFFLINE_QUEUE_SIZE, DROP_NEWEST)
+
+    def _on_online(self):
+        """Notify that the connection has been established."""
+        self._online = True
+        for callback in self._online_callbacks:
+            callback()
+
+    def _on_offline(self):
+        """Notify that the connection has been lost."""
+        self._online = False
+        for callback in self._offline_callbacks:
+            callback()
+
+    def get_mqtt_client(self):
+        """Get the underlying MQTT client.
+
+        Returns:
+            :class:`AWSIoTPythonSDK.MQTTLib.AWSIoTMQTTClient`: The MQTT client.
+        """
+        return self._client
+
+    def get_clients(self):
+        """Get the number of clients assigned to the connection and not
+        disconnected.
+
+        Returns:
+            int: The number of clients assigned to the connection.
+        """
+        return self._clients
+
+    def create_shadow_handler(self, shadow_name):
+        """Create a shadow handler with persistent subscription on the
+        connection.
+
+        Args:
+            shadow_name (str): Name of the shadow, i.e. of the client.
+
+        Returns:
+            :class:`AWSIoTPythonSDK.core.shadow.deviceShadow.deviceShadow`: The
+            shadow handler.
+        """
+        return self._shadow_client.createShadowHandlerWithName(shadow_name, True)
+
+    def attach(self):
+        """Assign a client to the connection."""
+        with self._lock:
+            self._clients += 1
+
+    def detach(self):
+        """Unassign a client from the connection, e.g. when disconnected, so
+        that it does not count when balancing the clients of a
+        :class:`AWSConnectionPool`."""
+        with self._lock:
+            self._clients = max(self._clients - 1, 0)
+
+    def acquire(self):
+        """Register a client using the connection."""
+        with self._lock:
+            self._references += 1
+
+    def release(self):
+        """Unregister a client using the connection, and disconnect from the
+        core when no more clients use it."""
+        with self._lock:
+            self._references -= 1
+            if self._references <= 0 and self._connected:
+                self._shadow_client.disconnect()
+                self._connected = False
+                self._online = False
+
+    def is_connected(self):
+        """Check whether the connection is established.
+
+        Returns:
+            bool: True if the connection is established, False otherwise.
+        """
+        return self._connected
+
+    def is_online(self):
+        """Check whether the connection is currently up, i.e. established and
+        not lost since, as far as the network thread knows.
+
+        Returns:
+            bool: True if the connection is up, False otherwise.
+        """
+        return self._online
+
+    def get_endpoint(self):
+        """Get the endpoint of the core the connection is established with.
+
+        Returns:
+            tuple: The (host, port) endpoint, or None if never connected.
+        """
+        return self._endpoint
+
+    def get_endpoint_latencies(self):
+        """Get the connect latency measured for each endpoint of the core while
+        racing them.
+
+        Returns:
+            dict: The latency in seconds keyed by (host, port) endpoint; None
+            for the endpoints that could not be reached. Probes still running
+            are not reported.
+        """
+        with self._endpoint_latencies_lock:
+            return dict(self._endpoint_latencies)
+
+    def connect(self, race_endpoints=False):
+        """Connect to the core, unless already connected.
+
+        The endpoint of the last successful connection to the same core is
+        tried first.
+
+        Args:
+            race_endpoints (bool): If True, all the endpoints of the core are
+                probed at once and the MQTT connection is attempted on the
+                reachable ones in the order they answer, so that unreachable
+                endpoints do not delay the connection. If False, the endpoints
+                are tried one at a time.
+
+        Returns:
+            bool: True if the connection is established, False otherwise.
+        """
+        # Serializing the connections, without blocking the other operations
+        # on the connection meanwhile.
+        with self._connect_lock:
+            if self._connected:
+                return True
+
+            endpoints = self._get_endpoints()
+            if race_endpoints:
+                endpoints = self._race_endpoints(endpoints)
+
+            # Iterate through the connection options for the core and use the
+            # first successful one.
+            connected = False
+            for (self._current_host, self._current_port) in endpoints:
+                print("Trying to connect to core at %s:%d..." % (self._current_host, self._current_port))
+                self._shadow_client.configureEndpoint(self._current_host, self._current_port)
+                self._shadow_client.configureAutoReconnectBackoffTime(1, 32, 20)
+                self._shadow_client.configureConnectDisconnectTimeout(10)  # 10 sec
+                self._shadow_client.configureMQTTOperationTimeout(5)  # 5 sec
+                try:
+                    self._shadow_client.connect()
+                    connected = True
+                    break
+                except BaseException:
+                    pass
+
+            with self._lock:
+                self._connected = connected
+                if connected:
+                    self._online = True
+                    self._endpoint = (self._current_host, self._current_port)
+                    with _preferred_endpoints_lock:
+                        _preferred_endpoints[self._core_info.coreThingArn] = self._endpoint
+            return connected
+
+    def _get_endpoints(self):
+        """Get the endpoints of the core, the preferred one first.
+
+        Returns:
+            list: The list of (host, port) endpoints.
+        """
+        endpoints = [(c.host, c.port) for c in self._core_info.connectivityInfoList]
+        with _preferred_endpoints_lock:
+            preferred = _preferred_endpoints.get(self._core_info.coreThingArn)
+        if preferred in endpoints:
+            endpoints.remove(preferred)
+            endpoints.insert(0, preferred)
+        return endpoints
+
+    def _race_endpoints(self, endpoints):
+        """Probe the given endpoints concurrently through TCP connections.
+
+        Please note that the MQTT connection itself cannot be raced, as
+        concurrent sessions with the same client identifier would take each
+        other over.
+
+        Args:
+            endpoints (list): The list of (host, port) endpoints.
+
+        Returns:
+            generator: The reachable endpoints, in the order they answer.
+        """
+        results = queue.Queue()
+        with self._endpoint_latencies_lock:
+            self._endpoint_latencies = {}
+
+        def probe(endpoint):
+            start = time.time()
+            try:
+                socket.create_connection(endpoint, ENDPOINT_PROBE_TIMEOUT_s).close()
+                latency = time.time() - start
+            except (socket.error, socket.timeout):
+                latency = None
+            with self._endpoint_latencies_lock:
+                self._endpoint_latencies[endpoint] = latency
+            if latency is None:
+                print("Core at %s:%d not reachable." % endpoint)
+            else:
+                print("Core at %s:%d reachable in %.3f s." % (endpoint[0], endpoint[1], latency))
+            results.put((endpoint, latency))
+
+        for endpoint in endpoints:
+            thread = threading.Thread(target=probe, args=(endpoint,))
+            thread.daemon = True
+            thread.start()
+
+        for _ in endpoints:
+            endpoint, latency = results.get()
+            if latency is not None:
+                yield endpoint
+
+    def subscribe(self, topic, qos, callback, ack_callback=None, wait=True):
+        """Register a callback to handle the messages published on the desired
+        topic, subscribing to it unless already subscribed.
+
+        Args:
+            topic (str): Topic name to subscribe to.
+            qos (int): Quality of Service. Could be "0" or "1".
+            callback: Function to be called when a new message for the
+                subscribed topic comes in.
+            ack_callback: Function to be called with the packet identifier and
+                the granted QoS when the SUBACK is received, if not waiting.
+            wait (bool): True to wait for the acknowledgement, False otherwise.
+        """
+        with self._lock:
+            callbacks = self._subscriptions.get(topic)
+            if callbacks is not None:
+                self._subscriptions[topic] = callbacks + [callback]
+                if ack_callback:
+                    ack_callback(None, (qos,))
+                return
+            self._subscriptions[topic] = [callback]
+
+        def dispatch(client, userdata, message):
+            for c in self._subscriptions.get(topic, ()):
+                c(client, userdata, message)
+
+        if wait:
+            self._client.subscribe(topic, qos, dispatch)
+        else:
+            self._client.subscribeAsync(topic, qos, ack_callback, dispatch)
+
+    def unsubscribe(self, topic, callback, ack_callback=None, wait=True):
+        """Unregister a callback handling the messages published on the
+        desired topic, unsubscribing to it when no more callbacks are
+        registered.
+
+        Args:
+            topic (str): Topic name to unsubscribe to.
+            callback: Function previously registered through
+                :meth:`subscribe`.
+            ack_callback: Function to be called with the packet identifier when
+                the UNSUBACK is received, if not waiting.
+            wait (bool): True to wait for the acknowledgement, False otherwise.
+        """
+        with self._lock:
+            callbacks = [c for c in self._subscriptions.get(topic, ()) if c is not callback]
+            if callbacks:
+                self._subscriptions[topic] = callbacks
+                if ack_callback:
+                    ack_callback(None)
+                return
+            self._subscriptions.pop(topic, None)
+        if wait:
+            self._client.unsubscribe(topic)
+        else:
+            self._client.unsubscribeAsync(topic, ack_callback)
+
+
+class AWSConnectionPool(object):
+    """Class responsible for sharing a bounded number of physical connections
+    among many clients.
+
+    Connections are opened on demand, with the credentials of the first client
+    assigned to them, until the maximum number of connections towards a core is
+    reached; then, each new client shares the least loaded connection.
+    """
+
+    def __init__(self, max_connections):
+        """Constructor.
+
+        Args:
+            max_connections (int): Maximum number of physical connections
+                towards each core.
+        """
+        self._max_connections = max_connections
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def get_connection(self, client_id, device_certificate_path, \
+        device_private_key_path, group_ca_path, core_info):
+        """Get a connection for a client.
+
+        Args:
+            client_id (str): Name of the client, as it is on the cloud.
+            device_certificate_path (str): Relative path of the device's
+                certificate stored on the core device.
+            device_private_key_path (str): Relative path of the device's
+                private key stored on the core device.
+            group_ca_path (str): Relative path of the certification authority's
+                certificate stored on the core device.
+            core_info (list): Information related to the core of the group to
+                which the client belongs.
+
+        Returns:
+            :class:`AWSConnection`: The connection to be used by the client.
+        """
+        with self._lock:
+            connections = self._connections.setdefault(core_info.coreThingArn, [])
+            if len(connections) < self._max_connections:
+                connection = AWSConnection(client_id, device_certificate_path, \
+                    device_private_key_path, group_ca_path, core_info)
+                connections.append(connection)
+            else:
+                connection = min(connections, key=lambda c: c.get_clients())
+            connection.attach()
+            return connection
+
+    def get_connections(self):
+        """Get the connections of the pool.
+
+        Returns:
+            list: The list of :class:`AWSConnection` objects of the pool.
+        """
+        with self._lock:
+            return [c for connections in self._connections.values() for c in connections]
@@ -0,0 +1,230 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+"""aws_discovery_cache
+
+The aws_discovery_cache module persists the results of the discovery of
+Amazon AWS Greengrass cores on disk, so that later runs can skip the discovery
+request to the cloud, or fall back to the last known results when the cloud is
+unreachable.
+"""
+
+
+# IMPORT
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from AWSIoTPythonSDK.core.greengrass.discovery.models import DiscoveryInfo
+
+
+# FUNCTIONS
+
+def write_group_ca(group_ca_dir, group_id, ca):
+    """Persist the certificate of the certification authority of a group.
+
+    The name of the file depends on its content, so that the same certificate
+    is never written twice.
+
+    Args:
+        group_ca_dir (str): Path of the directory where to store the
+            certificate.
+        group_id (str): Identifier of the group.
+        ca (str): Content of the certificate.
+
+    Returns:
+        str: Path of the certificate's file.
+    """
+    digest = hashlib.sha256(ca.encode('utf-8')).hexdigest()[:16]
+    group_ca_path = os.path.join(group_ca_dir, group_id + "_CA_" + digest + ".crt")
+    if not os.path.exists(group_ca_path):
+        _write_atomically(group_ca_path, ca)
+    return group_ca_path
+
+
+def _write_atomically(path, content):
+    """Write a file so that readers never see it partially written.
+
+    Args:
+        path (str): Path of the file.
+        content (str): Content of the file.
+    """
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    fd, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(content)
+    os.rename(temporary_path, path)
+
+
+# CLASSES
+
+class AWSDiscoveryCacheEntry(object):
+    """Class representing the cached discovery results of a thing."""
+
+    def __init__(self, thing_name, group_id, discovery_info, group_ca_path, \
+        timestamp, ttl_s):
+        """Constructor.
+
+        Args:
+            thing_name (str): Name of the thing the discovery was performed
+                for.
+            group_id (str): Identifier of the group of the core.
+            discovery_info
+                (:class:`AWSIoTPythonSDK.core.greengrass.discovery.models.DiscoveryInfo`):
+                Discovery information.
+            group_ca_path (str): Path of the certificate of the certification
+                authority of the group.
+            timestamp (float): Time of the discovery, in seconds since the
+                epoch.
+            ttl_s (int): Time to live of the entry in seconds.
+        """
+        self.thing_name = thing_name
+        self.group_id = group_id
+        self.discovery_info = discovery_info
+        self.group_ca_path = group_ca_path
+        self.timestamp = timestamp
+        self._ttl_s = ttl_s
+
+    def is_expired(self):
+        """Check whether the entry has outlived its time to live.
+
+        Returns:
+            bool: True if the entry is expired, False otherwise.
+        """
+        return time.time() - self.timestamp > self._ttl_s
+
+
+class AWSDiscoveryCache(object):
+    """Class responsible for storing discovery results on disk, keyed by thing
+    name and group.
+
+    Each thing has an index file pointing to its group and storing the raw
+    discovery information, while the certificates of the groups' certification
+    authorities are stored once, named after their content.
+    """
+
+    def __init__(self, cache_path, ttl_s):
+        """Constructor.
+
+        Args:
+            cache_path (str): Path of the directory of the cache.
+            ttl_s (int): Time to live of the entries in seconds. Expired
+                entries are still returned, so that they can be used while
+                being refreshed or when the cloud is unreachable.
+        """
+        self._cache_path = cache_path
+        self._ttl_s = ttl_s
+
+    def get_group_ca_dir(self):
+        """Get the directory where the groups' certificates are stored.
+
+        Returns:
+            str: Path of the directory.
+        """
+        return self._cache_path
+
+    def load(self, thing_name):
+        """Load the cached discovery results of a thing.
+
+        Args:
+            thing_name (str): Name of the thing.
+
+        Returns:
+            :class:`AWSDiscoveryCacheEntry`: The cached entry, expired or not,
+            or None if missing or unusable.
+        """
+        try:
+            with open(self._get_entry_path(thing_name), "r") as f:
+                entry = json.load(f)
+            if not os.path.exists(entry['group_ca_path']):
+                return None
+            return AWSDiscoveryCacheEntry(thing_name, entry['group_id'], \
+                DiscoveryInfo(entry['discovery_info']), entry['group_ca_path'], \
+                entry['timestamp'], self._ttl_s)
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def store(self, thing_name, discovery_info):
+        """Store the discovery results of a thing.
+
+        Only the first group and its first certificate are taken into
+        account.
+
+        Args:
+            thing_name (str): Name of the thing.
+            discovery_info
+                (:class:`AWSIoTPythonSDK.core.greengrass.discovery.models.DiscoveryInfo`):
+                Discovery information.
+
+        Returns:
+            :class:`AWSDiscoveryCacheEntry`: The stored entry.
+        """
+        group = discovery_info.getAllGroups()[0]
+        group_id = group.groupId
+        group_ca_path = write_group_ca(self._cache_path, group_id, group.caList[0])
+        timestamp = time.time()
+        _write_atomically(self._get_entry_path(thing_name), json.dumps({
+            'thing_name': thing_name,
+            'group_id': group_id,
+            'group_ca_path': group_ca_path,
+            'timestamp': timestamp,
+            'discovery_info': discovery_info.rawJson}))
+        return AWSDiscoveryCacheEntry(thing_name, group_id, discovery_info, \
+            group_ca_path, timestamp, self._ttl_s)
+
+    def remove(self, thing_name):
+        """Remove the cached discovery results of a thing, e.g. when found out
+        to be stale.
+
+        Args:
+            thing_name (str): Name of the thing.
+        """
+        try:
+            os.remove(self._get_entry_path(thing_name))
+        except (IOError, OSError):
+            pass
+
+    def _get_entry_path(self, thing_name):
+        """Get the path of the index file of a thing.
+
+        Args:
+            thing_name (str): Name of the thing.
+
+        Returns:
+            str: Path of the index file.
+        """
+        return os.path.join(self._cache_path, thing_name + ".json")
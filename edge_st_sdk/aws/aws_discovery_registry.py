@@ -0,0 +1,209 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+"""aws_discovery_registry
+
+The aws_discovery_registry module keeps track of the Amazon AWS Greengrass
+cores discovered so far, so that a single gateway process can serve devices
+belonging to several groups.
+"""
+
+
+# IMPORT
+
+import threading
+
+
+# CLASSES
+
+class AWSDiscoveryResult(object):
+    """Class representing the core discovered for a group."""
+
+    def __init__(self, group_id, core_info, group_ca_path, cached=False):
+        """Constructor.
+
+        Args:
+            group_id (str): Identifier of the group.
+            core_info (list): Information related to the core of the group.
+            group_ca_path (str): Path of the certificate of the certification
+                authority of the group.
+            cached (bool): True if taken from the discovery cache rather than
+                discovered right now.
+        """
+        self.group_id = group_id
+        self.core_info = core_info
+        self.group_ca_path = group_ca_path
+        self.cached = cached
+
+    def get_key(self):
+        """Get the key of the result within the registry.
+
+        Returns:
+            tuple: The (group identifier, core thing ARN) key.
+        """
+        return (self.group_id, self.core_info.coreThingArn)
+
+
+class AWSDiscoveryRegistry(object):
+    """Class responsible for discovering the cores of the groups things belong
+    to, at most once per group.
+
+    Discoveries for different things run in parallel, each one in the calling
+    thread, while concurrent requests for the same thing, or for the same
+    group when known in advance, wait for the discovery already in progress.
+    """
+
+    _discovery_completed = threading.Event()
+    """Event set as soon as a discovery of any registry has completed."""
+
+    def __init__(self, discover):
+        """Constructor.
+
+        Args:
+            discover: Function performing the discovery for a thing, given the
+                thing name followed by the additional arguments passed to
+                :meth:`get`, and returning an :class:`AWSDiscoveryResult`
+                object, or None if the discovery failed.
+        """
+        self._discover = discover
+        self._lock = threading.Lock()
+        self._results = {}
+        self._things = {}
+        self._pending = {}
+
+    def get(self, thing_name, group_id=None, *args):
+        """Get the core of the group of a thing, discovering it if needed.
+
+        Args:
+            thing_name (str): Name of the thing.
+            group_id (str): Identifier of the group of the thing, if known in
+                advance; the discovery is skipped when the group has already
+                been discovered.
+            *args: Additional arguments of the discovery function.
+
+        Returns:
+            :class:`AWSDiscoveryResult`: The discovered core, or None if the
+            discovery failed.
+        """
+        while True:
+            with self._lock:
+                result = self._lookup(thing_name, group_id)
+                if result:
+                    return result
+                pending_key = ('group', group_id) if group_id else ('thing', thing_name)
+                pending = self._pending.get(pending_key)
+                owner = pending is None
+                if owner:
+                    pending = threading.Event()
+                    self._pending[pending_key] = pending
+            if not owner:
+                # Waiting for the discovery in progress, then looking it up.
+                pending.wait()
+                continue
+            result = None
+            try:
+                result = self._discover(thing_name, *args)
+                if result:
+                    self.update(thing_name, result)
+            finally:
+                with self._lock:
+                    del self._pending[pending_key]
+                pending.set()
+            return result
+
+    def update(self, thing_name, result):
+        """Record the core discovered for a thing, replacing the previous one
+        of the same group and core.
+
+        Args:
+            thing_name (str): Name of the thing.
+            result (:class:`AWSDiscoveryResult`): The discovered core.
+        """
+        with self._lock:
+            key = result.get_key()
+            self._results[key] = result
+            self._things[thing_name] = key
+        AWSDiscoveryRegistry._discovery_completed.set()
+
+    def invalidate(self, result):
+        """Forget a core found out to be unusable, so that the things of its
+        group get discovered again. Nothing happens if the core has already
+        been replaced.
+
+        Args:
+            result (:class:`AWSDiscoveryResult`): The core to forget.
+        """
+        with self._lock:
+            key = result.get_key()
+            if self._results.get(key) is not result:
+                return
+            del self._results[key]
+            for thing_name in [t for (t, k) in self._things.items() if k == key]:
+                del self._things[thing_name]
+
+    @classmethod
+    def discovery_completed(self):
+        """Discovery completed.
+
+        Returns:
+            bool: True if a discovery has completed at least once, within any
+            registry, False otherwise.
+        """
+        return AWSDiscoveryRegistry._discovery_completed.is_set()
+
+    def get_results(self):
+        """Get the cores discovered so far.
+
+        Returns:
+            list: The list of :class:`AWSDiscoveryResult` objects.
+        """
+        with self._lock:
+            return list(self._results.values())
+
+    def _lookup(self, thing_name, group_id):
+        """Look up the core of the group of a thing.
+
+        Must be called with the lock held.
+
+        Args:
+            thing_name (str): Name of the thing.
+            group_id (str): Identifier of the group of the thing, if known.
+
+        Returns:
+            :class:`AWSDiscoveryResult`: The discovered core, or None.
+        """
+        key = self._things.get(thing_name)
+        if key:
+            return self._results[key]
+        if group_id:
+            for (result_group_id, _), result in self._results.items():
+                if result_group_id == group_id:
+                    self._things[thing_name] = result.get_key()
+                    return result
+        return None
@@ -1,183 +1,400 @@
-################################################################################
-# COPYRIGHT(c) 2018 STMicroelectronics                                         #
-#                                                                              #
-# Redistribution and use in source and binary forms, with or without           #
-# modification, are permitted provided that the following conditions are met:  #
-#   1. Redistributions of source code must retain the above copyright notice,  #
-#      this list of conditions and the following disclaimer.                   #
-#   2. Redistributions in binary form must reproduce the above copyright       #
-#      notice, this list of conditions and the following disclaimer in the     #
-#      documentation and/or other materials provided with the distribution.    #
-#   3. Neither the name of STMicroelectronics nor the names of its             #
-#      contributors may be used to endorse or promote products derived from    #
-#      this software without specific prior written permission.                #
-#                                                                              #
-# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
-# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
-# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
-# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
-# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
-# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
-# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
-# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
-# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
-# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
-# POSSIBILITY OF SUCH DAMAGE.                                                  #
-################################################################################
-
-
-"""aws_greengrass
-
-The aws_greengrass module is responsible for managing the discovery process of
-AWS devices and allocating the needed resources.
-
-"""
-
-
-# IMPORT
-
-import os
-import sys
-import uuid
-import logging
-
-from AWSIoTPythonSDK.core.greengrass.discovery.providers import DiscoveryInfoProvider
-from AWSIoTPythonSDK.core.protocol.connection.cores import ProgressiveBackOffCore
-from AWSIoTPythonSDK.exception.AWSIoTExceptions import DiscoveryInvalidRequestException
-
-import edge_st_sdk.aws.aws_client
-
-
-# CLASSES
-
-class AWSGreengrass(object):
-
-    MAX_DISCOVERY_ATTEMPTS = 10
-    """Maximum number of attempts when trying to discover the core."""
-
-    _GROUP_CA_PATH  = "./aws_group_ca/"
-    """Group Certification Authority path.""" 
-
-    _discovery_completed = False
-    """Discovery completed flag."""
-
-    def __init__(self, endpoint, root_ca_path):
-        """Constructor.
-
-        Initializing AWS Discovery.
-
-        Args:
-            endpoint (str): AWS endpoint.
-            root_ca_path (str): Path to the root Certification Authority file. 
-        """
-        self._endpoint = endpoint
-        self._root_ca_path = root_ca_path
-        self._group_ca_path = None
-        self._core_info = None
-
-    def _discover_core(self, client_id, device_certificate_path, device_private_key_path):
-        """Performing the discovery of the core belonging to the same group of
-        the given client identifier.
-
-        Args:
-            client_id (str): Name of a client, as it is on the cloud, belonging
-                to the same group of the core.
-            device_certificate_path (str): Relative path of a device's
-                certificate stored on the core device, belonging to the same
-                group of the core.
-            device_private_key_path (str): Relative path of a device's
-                private key stored on the core device, belonging to the same
-                group of the core.
-        """
-
-        # Progressive back off core
-        backOffCore = ProgressiveBackOffCore()
-
-        # Discover GGCs
-        discoveryInfoProvider = DiscoveryInfoProvider()
-        discoveryInfoProvider.configureEndpoint(self._endpoint)
-        discoveryInfoProvider.configureCredentials(self._root_ca_path, device_certificate_path, device_private_key_path)
-        discoveryInfoProvider.configureTimeout(10)  # 10 sec
-        retryCount = self.MAX_DISCOVERY_ATTEMPTS
-        discovered = False
-
-        while retryCount != 0:
-            try:
-                discoveryInfo = discoveryInfoProvider.discover(client_id)
-                caList = discoveryInfo.getAllCas()
-                coreList = discoveryInfo.getAllCores()
-                # We only pick the first ca and core info
-                groupId, ca = caList[0]
-                self._core_info = coreList[0]
-                print("Discovered GGC: %s from Group: %s" % (self._core_info.coreThingArn, groupId))
-
-                print("Now we persist the connectivity/identity information...")
-                self._group_ca_path = self._GROUP_CA_PATH + groupId + "_CA_" + str(uuid.uuid4()) + ".crt"
-                if not os.path.exists(self._GROUP_CA_PATH):
-                    os.makedirs(self._GROUP_CA_PATH)
-                group_ca_path_file = open(self._group_ca_path, "w")
-                group_ca_path_file.write(ca)
-                group_ca_path_file.close()
-                discovered = True
-                print("Now proceed to the connecting flow...")
-                break
-            except DiscoveryInvalidRequestException as e:
-                print("Invalid discovery request detected!")
-                print("Type: %s" % str(type(e)))
-                print("Error message: %s" % e.message)
-                print("Stopping...")
-                break
-            except BaseException as e:
-                print("Error in discovery!")
-                print("Type: %s" % str(type(e)))
-                print("Error message: %s" % e.message)
-                retryCount -= 1
-                print("\n%d/%d retries left\n" % (retryCount, self.MAX_DISCOVERY_ATTEMPTS))
-                print("Backing off...\n")
-                backOffCore.backOff()
-
-        if not discovered:
-            print("Discovery failed after %d retries. Exiting...\n" % (self.MAX_DISCOVERY_ATTEMPTS))
-            sys.exit(-1)
-
-        self._configure_logging()
-        AWSGreengrass._discovery_completed = True
-
-    def _configure_logging(self):
-        """Configure logging, required for using shadow devices."""
-        self._logger = logging.getLogger("AWSIoTPythonSDK.core")
-        self._logger.setLevel(logging.ERROR)
-        self._streamHandler = logging.StreamHandler()
-        self._formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        self._streamHandler.setFormatter(self._formatter)
-        self._logger.addHandler(self._streamHandler)
-
-    @classmethod
-    def discovery_completed(self):
-        """Discovery completed.
-
-        Returns:
-            bool: True if the discovery process has completed, False otherwise.
-        """ 
-        return AWSGreengrass._discovery_completed
-
-    def get_client(self, client_id, device_certificate_path, device_private_key_path):
-        """Get an Amazon AWS client.
-
-        Args:
-            client_id (str): Name of the client, as it is on the cloud.
-            device_certificate_path (str): Relative path of the device's
-                certificate stored on the core device.
-            device_private_key_path (str): Relative path of the device's
-                private key stored on the core device.
-
-        Returns:
-            :class:`edge_st_sdk.aws.aws_client.AWSClient`: Amazon AWS client.
-        """
-        # Performing the discovery of the core belonging to the same group of
-        # the client.
-        if not self._discovery_completed:
-            self._discover_core(client_id, device_certificate_path, device_private_key_path)
-
-        # Creating the client.
-        return edge_st_sdk.aws.aws_client.AWSClient(client_id, device_certificate_path, device_private_key_path, self._group_ca_path, self._core_info)
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""aws_greengrass
+
+The aws_greengrass module is responsible for managing the discovery process of
+AWS devices and allocating the needed resources.
+
+"""
+
+
+# IMPORT
+
+import sys
+import logging
+import threading
+import time
+
+from AWSIoTPythonSDK.core.greengrass.discovery.providers import DiscoveryInfoProvider
+from AWSIoTPythonSDK.core.protocol.connection.cores import ProgressiveBackOffCore
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import DiscoveryInvalidRequestException
+
+from edge_st_sdk.aws.aws_client import AWSClient
+from edge_st_sdk.aws.aws_connection import AWSConnectionPool
+from edge_st_sdk.aws.aws_discovery_cache import AWSDiscoveryCache
+from edge_st_sdk.aws.aws_discovery_cache import write_group_ca
+from edge_st_sdk.aws.aws_discovery_registry import AWSDiscoveryRegistry
+from edge_st_sdk.aws.aws_discovery_registry import AWSDiscoveryResult
+from edge_st_sdk.utils.metrics import REGISTRY
+
+
+# CONSTANTS
+
+DISCOVERY_DURATION = REGISTRY.histogram('edge_st_discovery_duration_seconds', \
+    'Time taken by the discovery of the core, retries included.', \
+    ('client_id', 'result'), (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, \
+    120.0))
+"""Metric measuring the duration of the discoveries."""
+
+
+# CLASSES
+
+class AWSGreengrass(object):
+
+    MAX_DISCOVERY_ATTEMPTS = 10
+    """Maximum number of attempts when trying to discover the core."""
+
+    _GROUP_CA_PATH  = "./aws_group_ca/"
+    """Group Certification Authority path.""" 
+
+    DISCOVERY_CACHE_PATH = "./aws_discovery_cache/"
+    """Default path of the discovery cache."""
+
+    DISCOVERY_CACHE_TTL_s = 3600
+    """Default time to live of the discovery cache's entries."""
+
+    DISCOVERY_PORT = 8443
+    """Default port of the discovery service."""
+
+    _logging_configured = False
+    """Logging configured flag."""
+
+    def __init__(self, endpoint, root_ca_path, \
+        discovery_cache_path=DISCOVERY_CACHE_PATH, \
+        discovery_cache_ttl_s=DISCOVERY_CACHE_TTL_s, \
+        discovery_port=DISCOVERY_PORT):
+        """Constructor.
+
+        Initializing AWS Discovery.
+
+        Args:
+            endpoint (str): AWS endpoint.
+            root_ca_path (str): Path to the root Certification Authority file. 
+            discovery_cache_path (str): Path of the directory where discovery
+                results are cached. None to disable caching.
+            discovery_cache_ttl_s (int): Time to live in seconds of the
+                cached discovery results, after which they get refreshed.
+            discovery_port (int): Port of the discovery service.
+        """
+        self._discovery_cache = None
+        if discovery_cache_path:
+            self._discovery_cache = AWSDiscoveryCache(discovery_cache_path, discovery_cache_ttl_s)
+        self._endpoint = endpoint
+        self._discovery_port = discovery_port
+        self._root_ca_path = root_ca_path
+        self._discovery_registry = AWSDiscoveryRegistry(self._discover_core)
+        self._connection_pool = None
+
+    def _discover_core(self, client_id, device_certificate_path, device_private_key_path):
+        """Performing the discovery of the core belonging to the same group of
+        the given client identifier.
+
+        Cached discovery results are used when available; expired ones are used
+        as well, while being refreshed in the background.
+
+        Args:
+            client_id (str): Name of a client, as it is on the cloud, belonging
+                to the same group of the core.
+            device_certificate_path (str): Relative path of a device's
+                certificate stored on the core device, belonging to the same
+                group of the core.
+            device_private_key_path (str): Relative path of a device's
+                private key stored on the core device, belonging to the same
+                group of the core.
+
+        Returns:
+            :class:`edge_st_sdk.aws.aws_discovery_registry.AWSDiscoveryResult`:
+            The discovered core, or None if the discovery failed.
+        """
+        entry = None
+        if self._discovery_cache:
+            entry = self._discovery_cache.load(client_id)
+
+        if entry:
+            print("Using cached discovery information for %s..." % (client_id))
+            result = self._get_discovery_result(entry.discovery_info, entry.group_ca_path, True)
+            if entry.is_expired():
+                thread = threading.Thread(target=self._refresh_discovery, \
+                    args=(client_id, device_certificate_path, device_private_key_path))
+                thread.daemon = True
+                thread.start()
+        else:
+            discovery_info = self._fetch_discovery_info(client_id, device_certificate_path, device_private_key_path)
+            if not discovery_info:
+                return None
+            print("Now we persist the connectivity/identity information...")
+            result = self._get_discovery_result(discovery_info, self._persist_discovery_info(client_id, discovery_info))
+            print("Now proceed to the connecting flow...")
+
+        self._configure_logging()
+        return result
+
+    def _fetch_discovery_info(self, client_id, device_certificate_path, device_private_key_path):
+        """Request the discovery information to the cloud.
+
+        Args:
+            client_id (str): Name of a client, as it is on the cloud.
+            device_certificate_path (str): Relative path of the device's
+                certificate stored on the core device.
+            device_private_key_path (str): Relative path of the device's
+                private key stored on the core device.
+
+        Returns:
+            :class:`AWSIoTPythonSDK.core.greengrass.discovery.models.DiscoveryInfo`:
+            The discovery information, or None if the discovery failed.
+        """
+
+        # Progressive back off core
+        backOffCore = ProgressiveBackOffCore()
+
+        # Discover GGCs
+        discoveryInfoProvider = DiscoveryInfoProvider()
+        discoveryInfoProvider.configureEndpoint(self._endpoint, self._discovery_port)
+        discoveryInfoProvider.configureCredentials(self._root_ca_path, device_certificate_path, device_private_key_path)
+        discoveryInfoProvider.configureTimeout(10)  # 10 sec
+        retryCount = self.MAX_DISCOVERY_ATTEMPTS
+        start_s = time.time()
+
+        while retryCount != 0:
+            try:
+                discovery_info = discoveryInfoProvider.discover(client_id)
+                DISCOVERY_DURATION.labels(client_id, 'success').observe(time.time() - start_s)
+                return discovery_info
+            except DiscoveryInvalidRequestException as e:
+                print("Invalid discovery request detected!")
+                print("Type: %s" % str(type(e)))
+                print("Error message: %s" % str(e))
+                print("Stopping...")
+                break
+            except BaseException as e:
+                print("Error in discovery!")
+                print("Type: %s" % str(type(e)))
+                print("Error message: %s" % str(e))
+                retryCount -= 1
+                print("\n%d/%d retries left\n" % (retryCount, self.MAX_DISCOVERY_ATTEMPTS))
+                print("Backing off...\n")
+                backOffCore.backOff()
+        DISCOVERY_DURATION.labels(client_id, 'failure').observe(time.time() - start_s)
+        return None
+
+    def _persist_discovery_info(self, client_id, discovery_info):
+        """Persist the discovery information, caching it if enabled.
+
+        Args:
+            client_id (str): Name of the client the discovery was performed
+                for.
+            discovery_info
+                (:class:`AWSIoTPythonSDK.core.greengrass.discovery.models.DiscoveryInfo`):
+                Discovery information.
+
+        Returns:
+            str: Path of the certificate of the certification authority of the
+            group.
+        """
+        if self._discovery_cache:
+            return self._discovery_cache.store(client_id, discovery_info).group_ca_path
+        # We only pick the first group and its first ca
+        group = discovery_info.getAllGroups()[0]
+        return write_group_ca(self._GROUP_CA_PATH, group.groupId, group.caList[0])
+
+    def _get_discovery_result(self, discovery_info, group_ca_path, cached=False):
+        """Get the core to connect to out of the discovery information.
+
+        Args:
+            discovery_info
+                (:class:`AWSIoTPythonSDK.core.greengrass.discovery.models.DiscoveryInfo`):
+                Discovery information.
+            group_ca_path (str): Path of the certificate of the certification
+                authority of the group.
+            cached (bool): True if the discovery information comes from the
+                discovery cache.
+
+        Returns:
+            :class:`edge_st_sdk.aws.aws_discovery_registry.AWSDiscoveryResult`:
+            The discovered core.
+        """
+        # We only pick the first group and its first core info
+        group = discovery_info.getAllGroups()[0]
+        core_info = group.coreConnectivityInfoList[0]
+        print("Discovered GGC: %s from Group: %s" % (core_info.coreThingArn, group.groupId))
+        return AWSDiscoveryResult(group.groupId, core_info, group_ca_path, cached)
+
+    def _rediscover(self, client_id, device_certificate_path, device_private_key_path, discovery):
+        """Discover again the core of a client which failed to connect to it,
+        provided that it had been discovered through cached information, which
+        may be stale, e.g. if the address or the certificate of the core have
+        changed meanwhile.
+
+        Args:
+            client_id (str): Name of the client, as it is on the cloud.
+            device_certificate_path (str): Relative path of the device's
+                certificate stored on the core device.
+            device_private_key_path (str): Relative path of the device's
+                private key stored on the core device.
+            discovery
+                (:class:`edge_st_sdk.aws.aws_discovery_registry.AWSDiscoveryResult`):
+                The core the client failed to connect to.
+
+        Returns:
+            :class:`edge_st_sdk.aws.aws_discovery_registry.AWSDiscoveryResult`:
+            The core discovered again, or None if the core had not been
+            discovered through cached information or the discovery failed.
+        """
+        if not discovery.cached:
+            return None
+        print("Cached discovery information for %s may be stale, discovering again..." % (client_id))
+        if self._discovery_cache:
+            self._discovery_cache.remove(client_id)
+        self._discovery_registry.invalidate(discovery)
+        result = self._discovery_registry.get(client_id, None, device_certificate_path, device_private_key_path)
+        if result is None or result.cached:
+            return None
+        return result
+
+    def _refresh_discovery(self, client_id, device_certificate_path, device_private_key_path):
+        """Refresh the cached discovery information, keeping the cached one if
+        the cloud is unreachable.
+
+        Args:
+            client_id (str): Name of a client, as it is on the cloud.
+            device_certificate_path (str): Relative path of the device's
+                certificate stored on the core device.
+            device_private_key_path (str): Relative path of the device's
+                private key stored on the core device.
+        """
+        discovery_info = self._fetch_discovery_info(client_id, device_certificate_path, device_private_key_path)
+        if not discovery_info:
+            print("Discovery refresh failed, keeping cached information.")
+            return
+        self._discovery_registry.update(client_id, self._get_discovery_result(discovery_info, self._persist_discovery_info(client_id, discovery_info)))
+
+    def _configure_logging(self):
+        """Configure logging, required for using shadow devices."""
+        if AWSGreengrass._logging_configured:
+            return
+        AWSGreengrass._logging_configured = True
+        self._logger = logging.getLogger("AWSIoTPythonSDK.core")
+        self._logger.setLevel(logging.ERROR)
+        self._streamHandler = logging.StreamHandler()
+        self._formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self._streamHandler.setFormatter(self._formatter)
+        self._logger.addHandler(self._streamHandler)
+
+    @classmethod
+    def discovery_completed(self):
+        """Discovery completed.
+
+        Returns:
+            bool: True if the discovery process has completed at least once,
+            False otherwise.
+        """ 
+        return AWSDiscoveryRegistry.discovery_completed()
+
+    def get_discovered_groups(self):
+        """Get the groups whose core has been discovered so far.
+
+        Returns:
+            list: The list of
+            :class:`edge_st_sdk.aws.aws_discovery_registry.AWSDiscoveryResult`
+            objects.
+        """
+        return self._discovery_registry.get_results()
+
+    def enable_multiplexing(self, max_connections):
+        """Make the clients obtained from now on share a bounded number of
+        physical connections towards the core.
+
+        Each client keeps its own identity, topics, and shadow, while the
+        network resources (TLS session and network threads) are shared.
+        Please refer to :mod:`edge_st_sdk.aws.aws_connection` for the
+        authorization requirements on the Greengrass group.
+
+        Args:
+            max_connections (int): Maximum number of physical connections
+                towards each core.
+        """
+        self._connection_pool = AWSConnectionPool(max_connections)
+
+    def get_client(self, client_id, device_certificate_path, device_private_key_path, group_id=None):
+        """Get an Amazon AWS client.
+
+        Thread-safe: clients of different groups can be obtained in parallel.
+
+        Args:
+            client_id (str): Name of the client, as it is on the cloud.
+            device_certificate_path (str): Relative path of the device's
+                certificate stored on the core device.
+            device_private_key_path (str): Relative path of the device's
+                private key stored on the core device.
+            group_id (str): Identifier of the group of the client, if known
+                in advance; the discovery is skipped when the core of the group
+                has already been discovered.
+
+        Returns:
+            :class:`edge_st_sdk.aws.aws_client.AWSClient`: Amazon AWS client.
+        """
+        # Performing the discovery of the core belonging to the same group of
+        # the client, unless already done.
+        discovery = self._discovery_registry.get(client_id, group_id, device_certificate_path, device_private_key_path)
+        if not discovery:
+            print("Discovery failed after %d retries. Exiting...\n" % (self.MAX_DISCOVERY_ATTEMPTS))
+            sys.exit(-1)
+
+        # Getting a shared connection, if multiplexing.
+        connection = None
+        if self._connection_pool:
+            connection = self._connection_pool.get_connection(client_id, device_certificate_path, device_private_key_path, discovery.group_ca_path, discovery.core_info)
+
+        # Creating the client, discovering the core again if it cannot be
+        # reached through cached information.
+        rediscover = lambda: self._rediscover(client_id, device_certificate_path, device_private_key_path, discovery)
+        return AWSClient(client_id, device_certificate_path, device_private_key_path, discovery.group_ca_path, discovery.core_info, connection, rediscover)
+
+    def get_async_client(self, client_id, device_certificate_path, device_private_key_path, group_id=None):
+        """Get an Amazon AWS client to be driven by an :mod:`asyncio` event
+        loop.
+
+        Requires Python 3.7 or later.
+
+        Args:
+            client_id (str): Name of the client, as it is on the cloud.
+            device_certificate_path (str): Relative path of the device's
+                certificate stored on the core device.
+            device_private_key_path (str): Relative path of the device's
+                private key stored on the core device.
+            group_id (str): Identifier of the group of the client, if known
+                in advance.
+
+        Returns:
+            :class:`edge_st_sdk.aws.aws_async_client.AWSAsyncClient`: Amazon
+            AWS asynchronous client.
+        """
+        # Importing here to keep this module usable on Python 2.
+        from edge_st_sdk.aws.aws_async_client import AWSAsyncClient
+        return AWSAsyncClient(self.get_client(client_id, device_certificate_path, device_private_key_path, group_id))
@@ -0,0 +1,189 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+"""aws_shadow_replica
+
+The aws_shadow_replica module keeps a local copy of a device shadow JSON
+document, kept current from the messages published by the core on the shadow
+topics, so that reading the state of the shadow does not require a round trip
+to the core.
+"""
+
+
+# IMPORT
+
+import json
+import threading
+import time
+
+from edge_st_sdk.utils import shadow_document
+
+
+# CLASSES
+
+class AWSShadowReplica(object):
+    """Class responsible for holding a local copy of a device shadow.
+
+    The replica is synchronized when loaded from the response to a "get"
+    request, and is kept current by applying the "update/documents" and
+    "update/delta" messages whose version is newer than the local one. As the
+    two messages of the same update may come in any order, an "update/documents"
+    message also overwrites a delta of the same version, which lacks the
+    reported state. The replica has to be invalidated whenever messages may
+    have been missed, e.g. when the connection gets lost.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self._lock = threading.Lock()
+        self._desired = {}
+        self._reported = {}
+        self._version = None
+        self._timestamp = None
+        self._synchronized = False
+
+    def is_synchronized(self):
+        """Check whether the replica is in sync with the shadow on the core.
+
+        Returns:
+            bool: True if the replica is in sync, False otherwise.
+        """
+        return self._synchronized
+
+    def get_version(self):
+        """Get the version of the local copy of the shadow.
+
+        Returns:
+            int: The version, or None if unknown.
+        """
+        return self._version
+
+    def invalidate(self):
+        """Mark the replica as out of sync."""
+        self._synchronized = False
+
+    def load(self, payload):
+        """Load the replica from the response to a "get" request.
+
+        Args:
+            payload (str): The "get/accepted" JSON document.
+        """
+        document = json.loads(payload)
+        state = document.get('state', {})
+        with self._lock:
+            self._desired = state.get('desired') or {}
+            self._reported = state.get('reported') or {}
+            self._version = document.get('version')
+            self._timestamp = document.get('timestamp')
+            self._synchronized = True
+
+    def clear(self):
+        """Empty the replica, e.g. when the shadow does not exist or has been
+        deleted."""
+        with self._lock:
+            self._desired = {}
+            self._reported = {}
+            self._timestamp = int(time.time())
+            self._synchronized = True
+
+    def apply_documents(self, payload):
+        """Apply an "update/documents" message.
+
+        Args:
+            payload (str): The "update/documents" JSON document.
+        """
+        document = json.loads(payload)
+        current = document.get('current', {})
+        version = current.get('version')
+        state = current.get('state', {})
+        with self._lock:
+            if not self._is_newer(version, True):
+                return
+            self._desired = state.get('desired') or {}
+            self._reported = state.get('reported') or {}
+            self._version = version
+            self._timestamp = document.get('timestamp', self._timestamp)
+
+    def apply_delta(self, payload):
+        """Apply an "update/delta" message, in case the corresponding
+        "update/documents" message has not been received.
+
+        Args:
+            payload (str): The "update/delta" JSON document.
+        """
+        document = json.loads(payload)
+        version = document.get('version')
+        with self._lock:
+            if not self._is_newer(version):
+                return
+            shadow_document.merge(self._desired, document.get('state', {}))
+            self._version = version
+            self._timestamp = document.get('timestamp', self._timestamp)
+
+    def get_document(self):
+        """Get the local copy of the shadow in the same format of the response
+        to a "get" request.
+
+        Returns:
+            str: The shadow JSON document.
+        """
+        with self._lock:
+            state = {}
+            if self._desired:
+                state['desired'] = self._desired
+            if self._reported:
+                state['reported'] = self._reported
+            delta = shadow_document.diff(self._reported, self._desired)
+            if delta:
+                state['delta'] = delta
+            document = {'state': state}
+            if self._version is not None:
+                document['version'] = self._version
+            if self._timestamp is not None:
+                document['timestamp'] = self._timestamp
+            return json.dumps(document)
+
+    def _is_newer(self, version, inclusive=False):
+        """Check whether a version is newer than the local one.
+
+        Must be called with the lock held.
+
+        Args:
+            version (int): The version to check.
+            inclusive (bool): If True, the local version itself counts as
+                newer.
+
+        Returns:
+            bool: True if the version is newer or unknown, False otherwise.
+        """
+        if version is None or self._version is None:
+            return True
+        if inclusive:
+            return version >= self._version
+        return version > self._version
@@ -0,0 +1,387 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""aws_shadow_requests
+
+The aws_shadow_requests module sends the requests to the shadow of a device
+and correlates them with their responses, without the per-request threads of
+the shadow handlers of the AWS IoT SDK.
+
+Each request gets a client token, spliced into its pre-serialized payload
+rather than parsed and serialized again, and a future completed when the
+response with the same token comes in on the "accepted" or "rejected" topic,
+or when the request times out. The tokens of the requests in flight are kept
+in a dictionary, and all the timeouts are run by a single
+:class:`edge_st_sdk.utils.timer_wheel.TimerWheel`. The number of requests in
+flight is capped: further requests wait to be sent, their timeout running.
+"""
+
+
+# IMPORT
+
+import re
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import Future
+
+from edge_st_sdk.utils.edge_st_exceptions import ShadowRequestException
+from edge_st_sdk.utils.timer_wheel import get_shared_timer_wheel
+
+
+# CONSTANTS
+
+OPERATIONS = ('get', 'update', 'delete')
+"""Operations of the shadow requests."""
+
+MAX_IN_FLIGHT = 8
+"""Default maximum number of requests in flight per shadow."""
+
+_TOKEN_PATTERN = re.compile(r'"clientToken"\s*:\s*"([^"]*)"')
+"""Pattern of the client token within a JSON object, at any depth."""
+
+_STRUCTURE_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]')
+"""Pattern of the strings and of the brackets within a JSON object."""
+
+
+# FUNCTIONS
+
+def find_token(payload):
+    """Find the client token of a JSON object, without parsing it.
+
+    Only the "clientToken" field of the object itself counts, not the ones of
+    the nested objects, e.g. within the state of the shadow. The candidates are
+    checked from the end of the object, where the responses of the shadow carry
+    the token, so that usually only the few characters after the last one are
+    scanned.
+
+    Args:
+        payload (str): The JSON object.
+
+    Returns:
+        The match of :data:`_TOKEN_PATTERN` of the client token, whose first
+        group is the token, None if the object has no client token.
+    """
+    for match in reversed(list(_TOKEN_PATTERN.finditer(payload))):
+        # The field is at the top level if the rest of the object closes
+        # exactly one bracket more than it opens.
+        depth = 0
+        for item in _STRUCTURE_PATTERN.finditer(payload, match.end()):
+            bracket = item.group(0)
+            if bracket in '{[':
+                depth += 1
+            elif bracket in '}]':
+                depth -= 1
+        if depth == -1:
+            return match
+    return None
+
+
+def splice_token(payload, token):
+    """Add a client token to a JSON object, without parsing it.
+
+    An existing client token of the object is replaced.
+
+    Args:
+        payload (str): The JSON object. An empty object if None or empty.
+        token (str): The client token.
+
+    Returns:
+        str: The JSON object with the client token.
+
+    Raises:
+        :exc:`ValueError` if the payload is not a JSON object.
+    """
+    field = '"clientToken":"%s"' % (token)
+    if not payload:
+        return '{' + field + '}'
+    start = payload.find('{')
+    if start < 0 or payload[:start].strip():
+        raise ValueError('The payload is not a JSON object.')
+    match = find_token(payload)
+    if match is not None:
+        return payload[:match.start()] + field + payload[match.end():]
+    rest = payload[start + 1:]
+    if rest.lstrip().startswith('}'):
+        return '{' + field + rest.lstrip()
+    return '{' + field + ',' + rest
+
+
+# CLASSES
+
+class _Request(object):
+    """Request to the shadow, waiting to be sent or for its response."""
+
+    __slots__ = ('operation', 'token', 'payload', 'callback', 'future', \
+        'timer')
+
+    def __init__(self, operation, token, payload, callback):
+        """Constructor.
+
+        Args:
+            operation (str): The operation.
+            token (str): The client token.
+            payload (str): The payload, with the client token.
+            callback (function): Function to call with the response.
+        """
+        self.operation = operation
+        self.token = token
+        self.payload = payload
+        self.callback = callback
+        self.future = Future()
+        self.timer = None
+
+
+class AWSShadowRequests(object):
+    """Class responsible for sending requests to the shadow of a device and
+    for completing their futures with the responses.
+
+    The futures are completed on the network thread of the MQTT client, for
+    responses, or on the thread of the timer wheel, for timeouts: callbacks
+    added to them should return quickly.
+    """
+
+    def __init__(self, connection, shadow_name, max_in_flight=MAX_IN_FLIGHT, \
+        timer_wheel=None):
+        """Constructor.
+
+        Args:
+            connection (:class:`edge_st_sdk.aws.aws_connection.AWSConnection`):
+                Connection to send the requests through.
+            shadow_name (str): Name of the shadow, i.e. of the client.
+            max_in_flight (int): Maximum number of requests in flight.
+                Unbounded if 0.
+            timer_wheel (:class:`edge_st_sdk.utils.timer_wheel.TimerWheel`):
+                Wheel running the timeouts. The shared one if not given.
+        """
+        self._connection = connection
+        self._shadow_name = shadow_name
+        self._max_in_flight = max_in_flight
+        self._timer_wheel = timer_wheel
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._waiting = deque()
+        self._token_prefix = '%s-%s-' % (shadow_name[:24], uuid.uuid4().hex[:8])
+        self._token_count = 0
+        self._subscribed = False
+        prefix = '$aws/things/%s/shadow/' % (shadow_name)
+        self._request_topics = dict((operation, prefix + operation) \
+            for operation in OPERATIONS)
+        self._response_topics = {}
+        for operation in OPERATIONS:
+            for status in ('accepted', 'rejected'):
+                self._response_topics['%s%s/%s' % (prefix, operation, status)] \
+                    = (operation, status)
+
+    def subscribe(self):
+        """Subscribe to the response topics, to be called once connected."""
+        if self._subscribed:
+            return
+        for topic in self._response_topics:
+            self._connection.subscribe(topic, 0, self._on_response)
+        self._subscribed = True
+
+    def unsubscribe(self):
+        """Unsubscribe to the response topics, failing the requests pending."""
+        if not self._subscribed:
+            return
+        self._subscribed = False
+        for topic in self._response_topics:
+            self._connection.unsubscribe(topic, self._on_response)
+        with self._lock:
+            requests = list(self._in_flight.values()) + list(self._waiting)
+            self._in_flight.clear()
+            self._waiting.clear()
+        for request in requests:
+            self._complete(request, None, 'cancelled')
+
+    def request(self, operation, payload, timeout_s, callback=None):
+        """Send a request to the shadow.
+
+        Args:
+            operation (str): The operation, i.e. "get", "update", or "delete".
+            payload (str): Pre-serialized JSON object of an update request;
+                None for the other requests.
+            timeout_s (float): Time to wait for the response, in seconds,
+                including the time waited to be sent.
+            callback (function): Function to call with the payload of the
+                response, the response status, and the token of the request,
+                as the callbacks of the shadow handlers of the AWS IoT SDK. The
+                response status is either "accepted", "rejected", "timeout",
+                "cancelled" if the client disconnects, or "failed" if the
+                request cannot be published.
+
+        Returns:
+            :class:`concurrent.futures.Future`: The future, completed with the
+            response JSON document when accepted, or with a
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ShadowRequestException`
+            when rejected, timed out, or cancelled.
+
+        Raises:
+            :exc:`ValueError` if the operation is not valid or the payload is
+                not a JSON object.
+        """
+        if operation not in self._request_topics:
+            raise ValueError('Invalid shadow operation "%s".' % (operation))
+        with self._lock:
+            self._token_count += 1
+            token = self._token_prefix + str(self._token_count)
+        request = _Request(operation, token, splice_token(payload, token), \
+            callback)
+        with self._lock:
+            send = not self._max_in_flight \
+                or len(self._in_flight) < self._max_in_flight
+            if send:
+                self._in_flight[token] = request
+            else:
+                self._waiting.append(request)
+        wheel = self._timer_wheel or get_shared_timer_wheel()
+        request.timer = wheel.schedule(timeout_s, self._on_timeout, request)
+        if send and not self._send(request):
+            self._send_waiting()
+        return request.future
+
+    def get_in_flight(self):
+        """Get the number of requests waiting for their response.
+
+        Returns:
+            int: The number of requests.
+        """
+        return len(self._in_flight)
+
+    def get_waiting(self):
+        """Get the number of requests waiting to be sent.
+
+        Returns:
+            int: The number of requests.
+        """
+        return len(self._waiting)
+
+    def _send(self, request):
+        """Publish a request.
+
+        Args:
+            request (:class:`_Request`): The request.
+
+        Returns:
+            bool: True if the request has been published, False if it has
+            failed.
+        """
+        try:
+            self._connection.get_mqtt_client().publish( \
+                self._request_topics[request.operation], request.payload, 0)
+            return True
+        except Exception as e:
+            with self._lock:
+                self._in_flight.pop(request.token, None)
+            self._complete(request, None, 'failed', str(e))
+            return False
+
+    def _send_waiting(self):
+        """Send the requests waiting for a free slot."""
+        while True:
+            with self._lock:
+                if not self._waiting or (self._max_in_flight \
+                    and len(self._in_flight) >= self._max_in_flight):
+                    return
+                request = self._waiting.popleft()
+                self._in_flight[request.token] = request
+            self._send(request)
+
+    def _complete(self, request, payload, status, reason=None):
+        """Complete the future of a request.
+
+        Args:
+            request (:class:`_Request`): The request.
+            payload (str): Payload of the response, if any.
+            status (str): Status of the response.
+            reason (str): Reason of the failure, if any.
+        """
+        if request.timer is not None:
+            request.timer.cancel()
+        if request.future.done():
+            return
+        if status == 'accepted':
+            request.future.set_result(payload)
+        else:
+            message = 'Shadow request with token "%s" %s.' \
+                % (request.token, status)
+            if reason:
+                message = '%s: %s' % (message[:-1], reason)
+            request.future.set_exception(ShadowRequestException( \
+                message, status, payload, request.token))
+        if request.callback:
+            try:
+                request.callback(payload, status, request.token)
+            except Exception as e:
+                # A failing callback must not affect the other requests.
+                print('Callback of shadow request with token "%s" failed: %s' \
+                    % (request.token, str(e)))
+
+    def _on_response(self, client, userdata, message):
+        """Complete the request a response is meant for.
+
+        Args:
+            client: The MQTT client.
+            userdata: User data of the MQTT client.
+            message: The response message.
+        """
+        response = self._response_topics.get(message.topic)
+        if response is None:
+            return
+        payload = message.payload
+        if not isinstance(payload, str):
+            payload = payload.decode('utf-8')
+        match = find_token(payload)
+        if match is None:
+            return
+        with self._lock:
+            request = self._in_flight.get(match.group(1))
+            if request is None or request.operation != response[0]:
+                return
+            del self._in_flight[request.token]
+        self._complete(request, payload, response[1])
+        self._send_waiting()
+
+    def _on_timeout(self, request):
+        """Fail a request whose response has not come in time.
+
+        Args:
+            request (:class:`_Request`): The request.
+        """
+        with self._lock:
+            in_flight = self._in_flight.pop(request.token, None) is not None
+            if not in_flight:
+                try:
+                    self._waiting.remove(request)
+                except ValueError:
+                    return
+        request.timer = None
+        self._complete(request, None, 'timeout')
+        if in_flight:
+            self._send_waiting()
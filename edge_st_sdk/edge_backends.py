@@ -0,0 +1,219 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""edge_backends
+
+The edge_backends module keeps the registry of the edge backends, i.e. of the
+classes discovering an edge computing platform and creating its clients, such
+as :class:`edge_st_sdk.aws.aws_greengrass.AWSGreengrass`.
+
+Backends are declared by name together with the module implementing them, which
+is imported only when the backend is used for the first time: importing the SDK
+does not load the libraries of the backends, e.g. the AWS IoT Python SDK, and
+tools that never talk to a given platform do not pay for it.
+"""
+
+
+# IMPORT
+
+import importlib
+import threading
+
+from edge_st_sdk.utils.edge_st_exceptions import ConfigurationException
+
+
+# CONSTANTS
+
+AWS = 'aws'
+"""Name of the Amazon AWS Greengrass backend."""
+
+
+# CLASSES
+
+class EdgeBackend(object):
+    """Class representing an edge backend, whose module is imported on first
+    use."""
+
+    def __init__(self, name, module_name, class_name):
+        """Constructor.
+
+        Args:
+            name (str): Name of the backend.
+            module_name (str): Dotted name of the module implementing the
+                backend.
+            class_name (str): Name of the class within the module, whose
+                objects create the clients of the backend.
+        """
+        self._name = name
+        self._module_name = module_name
+        self._class_name = class_name
+        self._class = None
+        self._lock = threading.Lock()
+
+    def get_name(self):
+        """Get the name of the backend.
+
+        Returns:
+            str: The name of the backend.
+        """
+        return self._name
+
+    def get_module_name(self):
+        """Get the dotted name of the module implementing the backend.
+
+        Returns:
+            str: The name of the module.
+        """
+        return self._module_name
+
+    def is_loaded(self):
+        """Check whether the module of the backend has been imported.
+
+        Returns:
+            bool: True if the module has been imported, False otherwise.
+        """
+        return self._class is not None
+
+    def get_class(self):
+        """Get the class of the backend, importing its module if needed.
+
+        Returns:
+            type: The class of the backend.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ConfigurationException`
+            is raised if the module cannot be imported, e.g. because a library
+            it depends on is not installed.
+        """
+        if self._class is None:
+            with self._lock:
+                if self._class is None:
+                    try:
+                        module = importlib.import_module(self._module_name)
+                    except ImportError as e:
+                        raise ConfigurationException('The "%s" edge backend '
+                            'is not available: %s.' % (self._name, str(e)))
+                    self._class = getattr(module, self._class_name)
+        return self._class
+
+    def create(self, *args, **kwargs):
+        """Create an object of the backend.
+
+        Args:
+            *args: Positional arguments of the constructor of the class.
+            **kwargs: Keyword arguments of the constructor of the class.
+
+        Returns:
+            object: The object of the backend.
+        """
+        return self.get_class()(*args, **kwargs)
+
+
+# FUNCTIONS
+
+_backends = {}
+"""Backends keyed by name."""
+
+_backends_lock = threading.Lock()
+"""Lock of the backends."""
+
+
+def register_backend(name, module_name, class_name):
+    """Declare an edge backend, without importing its module.
+
+    Args:
+        name (str): Name of the backend, replacing any backend with the same
+            name.
+        module_name (str): Dotted name of the module implementing the backend.
+        class_name (str): Name of the class within the module, whose objects
+            create the clients of the backend.
+
+    Returns:
+        :class:`EdgeBackend`: The backend.
+    """
+    backend = EdgeBackend(name, module_name, class_name)
+    with _backends_lock:
+        _backends[name] = backend
+    return backend
+
+
+def get_backend(name):
+    """Get an edge backend.
+
+    Args:
+        name (str): Name of the backend.
+
+    Returns:
+        :class:`EdgeBackend`: The backend.
+
+    Raises:
+        :exc:`ValueError` is raised if no backend has the given name.
+    """
+    with _backends_lock:
+        try:
+            return _backends[name]
+        except KeyError:
+            raise ValueError('Unknown edge backend "%s", not among "%s".' \
+                % (name, '", "'.join(sorted(_backends))))
+
+
+def get_backend_names():
+    """Get the names of the edge backends.
+
+    Returns:
+        list: The sorted list of the names of the backends.
+    """
+    with _backends_lock:
+        return sorted(_backends)
+
+
+def create_edge(name, *args, **kwargs):
+    """Create the object managing an edge computing platform, importing its
+    backend on first use.
+
+    E.g. ``create_edge("aws", endpoint, root_ca_path)`` is equivalent to
+    ``AWSGreengrass(endpoint, root_ca_path)``.
+
+    Args:
+        name (str): Name of the backend.
+        *args: Positional arguments of the constructor of the backend's class.
+        **kwargs: Keyword arguments of the constructor of the backend's class.
+
+    Returns:
+        object: The object of the backend, e.g. an
+        :class:`edge_st_sdk.aws.aws_greengrass.AWSGreengrass` object.
+
+    Raises:
+        :exc:`ValueError` is raised if no backend has the given name.
+        :exc:`edge_st_sdk.utils.edge_st_exceptions.ConfigurationException`
+        is raised if the backend cannot be imported.
+    """
+    return get_backend(name).create(*args, **kwargs)
+
+
+register_backend(AWS, 'edge_st_sdk.aws.aws_greengrass', 'AWSGreengrass')
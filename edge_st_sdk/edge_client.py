@@ -37,13 +37,36 @@ The edge_client module contains an interface for creating edge client classes.
 from abc import ABCMeta
 from abc import abstractmethod
 
+from edge_st_sdk.telemetry.payload_codec import JSONCodec
+from edge_st_sdk.telemetry.payload_codec import get_codec
+from edge_st_sdk.utils.topic_router import TopicRouter
+from edge_st_sdk.utils.topic_router import TopicTrie
+
 
 # INTERFACE
 
 class EdgeClient(object):
-    """The EdgeClient class is an interface for creating edge client classes."""
+    """The EdgeClient class is an interface for creating edge client classes.
+
+    Payloads are JSON documents by default; a different format can be chosen
+    per topic through :meth:`set_payload_codec`, and used through
+    :meth:`publish_object` and :meth:`subscribe_decoded`.
+
+    Handlers of the messages can be registered by topic filter and by key
+    through :meth:`add_route`, so that each message is decoded once and
+    dispatched only to the handlers it is meant for.
+    """
     __metaclass__ = ABCMeta
 
+    _DEFAULT_CODEC = JSONCodec()
+    """Codec of the topics without a specific one."""
+
+    def __init__(self):
+        """Constructor."""
+        self._payload_codecs = {}
+        self._codec_filters = TopicTrie()
+        self._router = TopicRouter(self.decode_payload)
+
     @abstractmethod
     def connect(self):
         """Connect to the core."""
@@ -66,6 +89,161 @@ class EdgeClient(object):
         """
         raise NotImplementedError('You must define "publish()" to use the "EdgeClient" class.')
 
+    def publish_batch(self, messages):
+        """Publish a batch of messages.
+
+        The default implementation publishes the messages one by one; clients
+        may override it to reduce the number of messages actually sent.
+
+        Args:
+            messages (list): List of (topic, payload, qos) tuples, with the
+                same meaning of the arguments of :meth:`publish`.
+        """
+        for topic, payload, qos in messages:
+            self.publish(topic, payload, qos)
+
+    def set_payload_codec(self, topic, codec):
+        """Set the format of the payloads of a topic.
+
+        Args:
+            topic (str): Topic name, or topic filter with wildcards.
+            codec: Either a
+                :class:`edge_st_sdk.telemetry.payload_codec.PayloadCodec`
+                object, or the name of a format among "json", "cbor", and
+                "msgpack". None restores the default JSON format.
+        """
+        # The codecs are replaced rather than changed, so that they can be
+        # looked up while being set.
+        codecs = dict(self._payload_codecs)
+        if codec is None:
+            codecs.pop(topic, None)
+        else:
+            codecs[topic] = get_codec(codec)
+        codec_filters = TopicTrie()
+        for (order, topic_filter) in enumerate(sorted(codecs, key=_specificity)):
+            if '+' in topic_filter or '#' in topic_filter:
+                codec_filters.add(topic_filter, (order, codecs[topic_filter]))
+        self._payload_codecs = codecs
+        self._codec_filters = codec_filters
+
+    def get_payload_codec(self, topic):
+        """Get the codec of the payloads of a topic.
+
+        A codec set for the topic name takes precedence over the ones set for
+        matching topic filters. As per the MQTT specification, filters starting
+        with a wildcard do not match topic names starting with "$". If several
+        topic filters match, the most specific one is used, i.e. the one with
+        the most levels, then without "#", then with the fewest "+".
+
+        Args:
+            topic (str): Topic name.
+
+        Returns:
+            :class:`edge_st_sdk.telemetry.payload_codec.PayloadCodec`: The
+            codec.
+        """
+        codec = self._payload_codecs.get(topic)
+        if codec is not None:
+            return codec
+        codecs = self._codec_filters.match(topic)
+        if codecs:
+            return min(codecs, key=lambda item: item[0])[1]
+        return self._DEFAULT_CODEC
+
+    def publish_object(self, topic, obj, qos):
+        """Publish an object to the desired topic, encoded in the format of
+        the topic.
+
+        Args:
+            topic (str): Topic name to publish to.
+            obj: Object to publish, e.g. a dictionary.
+            qos (int): Quality of Service. Could be "0" or "1".
+        """
+        self.publish(topic, self.get_payload_codec(topic).encode(obj), qos)
+
+    def decode_payload(self, topic, payload):
+        """Decode the payload of a message according to the format of its
+        topic.
+
+        Args:
+            topic (str): Topic name of the message.
+            payload (str): Payload of the message.
+
+        Returns:
+            The decoded object.
+
+        Raises:
+            :exc:`ValueError` is raised if the payload is malformed.
+        """
+        return self.get_payload_codec(topic).decode(payload)
+
+    def subscribe_decoded(self, topic, qos, callback):
+        """Subscribe to the desired topic, decoding the payloads of the
+        messages according to the format of their topic.
+
+        Messages whose payload cannot be decoded are discarded.
+
+        Args:
+            topic (str): Topic name to subscribe to.
+            qos (int): Quality of Service. Could be "0" or "1".
+            callback: Function to be called with the topic name and the
+                decoded object when a new message for the subscribed topic
+                comes in.
+        """
+        def decoding_callback(client, userdata, message):
+            try:
+                obj = self.decode_payload(message.topic, message.payload)
+            except ValueError as e:
+                print("Discarding message on topic %s: %s" % (message.topic, str(e)))
+                return
+            callback(message.topic, obj)
+
+        self.subscribe(topic, qos, decoding_callback)
+
+    def add_route(self, topic_filter, qos, handler, key=None):
+        """Register a handler of the messages published on a topic filter,
+        subscribing to the topic filter if needed.
+
+        Messages are decoded once according to the format of their topic,
+        whatever the number of handlers, and dispatched to the handlers of all
+        the matching topic filters; messages whose payload cannot be decoded
+        are discarded.
+
+        Args:
+            topic_filter (str): Topic filter, possibly with "+" and "#"
+                wildcards.
+            qos (int): Quality of Service. Could be "0" or "1".
+            handler: Function to be called with the topic name and the decoded
+                object.
+            key: If given, the handler is called only for the messages with
+                this key, refer to :meth:`set_route_key`.
+        """
+        if self._router.add_route(topic_filter, handler, key):
+            self.subscribe(topic_filter, qos, self._router.on_message)
+
+    def remove_route(self, topic_filter, handler, key=None):
+        """Unregister a handler of the messages published on a topic filter,
+        unsubscribing to the topic filter when no more handlers are left.
+
+        Args:
+            topic_filter (str): Topic filter the handler was registered for.
+            handler: The handler.
+            key: Key the handler was registered for.
+        """
+        if self._router.remove_route(topic_filter, handler, key):
+            self.unsubscribe(topic_filter)
+
+    def set_route_key(self, key):
+        """Set how to get the key of the messages dispatched to the handlers
+        registered through :meth:`add_route`.
+
+        Args:
+            key: Either a function called with the topic name and the decoded
+                object and returning the key, or the name of the member of the
+                decoded object holding the key, e.g. a client identifier.
+        """
+        self._router.set_key(key)
+
     @abstractmethod
     def subscribe(self, topic, qos, callback):
         """Subscribe to the desired topic with the given quality of service and
@@ -89,16 +267,19 @@ class EdgeClient(object):
         raise NotImplementedError('You must define "unsubscribe()" to use the "EdgeClient" class.')
 
     @abstractmethod
-    def get_shadow_state(self, callback, timeout_s):
+    def get_shadow_state(self, callback, timeout_s, force_refresh=False):
         """Get the state of the shadow client.
 
         Retrieve the device shadow JSON document from the cloud by publishing an
-        empty JSON document to the corresponding shadow topics.
+        empty JSON document to the corresponding shadow topics. Clients keeping
+        a local copy of the shadow may answer from it instead.
 
         Args:
             callback: Function to be called when the response for a shadow
                 request comes back.
             timeout_s (int): Timeout in seconds to perform the request.
+            force_refresh (bool): If True, the request is sent to the cloud
+                even if a local copy of the shadow is available.
         """
         raise NotImplementedError('You must define "get_shadow()" to use the "EdgeClient" class.')
 
@@ -131,3 +312,36 @@ class EdgeClient(object):
             timeout_s (int): Timeout in seconds to perform the request.
         """
         raise NotImplementedError('You must define "delete_shadow()" to use the "EdgeClient" class.')
+
+    @abstractmethod
+    def register_shadow_delta_callback(self, callback):
+        """Register a callback to handle the changes of the desired state of
+        the shadow with respect to the reported state.
+
+        Args:
+            callback: Function to be called with the delta JSON document
+                whenever the desired state of the shadow changes.
+        """
+        raise NotImplementedError('You must define "register_shadow_delta_callback()" to use the "EdgeClient" class.')
+
+    @abstractmethod
+    def unregister_shadow_delta_callback(self):
+        """Unregister the callback handling the changes of the desired state
+        of the shadow."""
+        raise NotImplementedError('You must define "unregister_shadow_delta_callback()" to use the "EdgeClient" class.')
+
+
+
+# FUNCTIONS
+
+def _specificity(topic_filter):
+    """Get the sorting key of a topic filter, from the most specific one.
+
+    Args:
+        topic_filter (str): Topic filter, possibly with wildcards.
+
+    Returns:
+        tuple: The sorting key.
+    """
+    levels = topic_filter.split('/')
+    return (-len(levels), '#' in levels, levels.count('+'), topic_filter)
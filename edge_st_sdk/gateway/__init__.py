@@ -0,0 +1,5 @@
+__all__ = [
+    'device_registry', \
+    'notification_pump', \
+    'simulated_node'
+]
@@ -0,0 +1,636 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""device_registry
+
+The device_registry module describes the devices handled by a gateway through
+a configuration file, and brings them up in parallel.
+
+The configuration file is a JSON document mapping the MAC address of each
+BLE node to the client identifier and the credentials of its edge client, and
+to the features whose samples are published, each one with its topic and its
+publish policy, e.g.::
+
+    {
+      "certificates_path": "./devices_ble_aws/",
+      "defaults": {"qos": 0, "policy": "periodic", "period_s": 5},
+      "devices": [
+        {
+          "mac": "d1:07:fd:84:30:8c",
+          "client_id": "IoT_Device_1",
+          "certificate": "IoT_Device_1.pem",
+          "private_key": "IoT_Device_1.prv",
+          "features": [
+            {"name": "Switch", "topic": "iot_device/switch_sense",
+             "policy": "on_update"},
+            {"name": "Temperature", "topic": "iot_device/env_sense"}
+          ]
+        }
+      ]
+    }
+
+Relative paths of certificates and private keys are resolved against
+"certificates_path", which in turn is resolved against the directory of the
+configuration file. Feature entries may omit any setting given in
+"defaults".
+"""
+
+
+# IMPORT
+
+import heapq
+import json
+import os
+import threading
+import time
+from enum import Enum
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from edge_st_sdk.telemetry.telemetry_encoder import TelemetryEncoder
+from edge_st_sdk.utils.edge_st_exceptions import ConfigurationException
+
+
+# CONSTANTS
+
+MAX_WORKERS = 16
+"""Default number of devices brought up in parallel."""
+
+BOARD_ID_KEY = 'Board_id'
+"""Key of the client identifier within the published messages."""
+
+
+# FUNCTIONS
+
+def _run_parallel(function, items, max_workers):
+    """Call a function on each item of a list through a pool of threads.
+
+    Args:
+        function (function): The function, called with an item.
+        items (list): The items.
+        max_workers (int): Maximum number of threads.
+
+    Returns:
+        list: The results, in the order of the items.
+    """
+    results = [None] * len(items)
+    pending = queue.Queue()
+    for index in range(len(items)):
+        pending.put(index)
+
+    def work():
+        while True:
+            try:
+                index = pending.get_nowait()
+            except queue.Empty:
+                return
+            results[index] = function(items[index])
+
+    threads = [threading.Thread(target=work) \
+        for _ in range(max(1, min(max_workers, len(items))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# CLASSES
+
+class PublishPolicy(Enum):
+    """Policies to publish the samples of a feature."""
+
+    ON_UPDATE = 'on_update'
+    """Every sample is published as soon as it is notified."""
+
+    PERIODIC = 'periodic'
+    """The latest sample is published periodically, if new."""
+
+
+class FeatureConfig(object):
+    """Class describing the publishing of a feature of a device."""
+
+    __slots__ = ('name', 'topic', 'qos', 'policy', 'period_s')
+
+    def __init__(self, name, topic, qos=0, policy=PublishPolicy.ON_UPDATE, \
+        period_s=None):
+        """Constructor.
+
+        Args:
+            name (str): Name of the feature.
+            topic (str): Topic to publish the samples to.
+            qos (int): Quality of Service.
+            policy (:class:`PublishPolicy`): Publish policy.
+            period_s (float): Publishing period in seconds, for the
+                :attr:`PublishPolicy.PERIODIC` policy.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ConfigurationException`
+                is raised if a periodic policy lacks its period.
+        """
+        if policy == PublishPolicy.PERIODIC and not period_s:
+            raise ConfigurationException( \
+                'Feature "%s" has a periodic policy without period.' % name)
+        self.name = name
+        self.topic = topic
+        self.qos = qos
+        self.policy = policy
+        self.period_s = period_s
+
+
+class DeviceConfig(object):
+    """Class describing a device, i.e. a BLE node and its edge client."""
+
+    __slots__ = ('mac', 'client_id', 'certificate_path', 'private_key_path', \
+        'group_id', 'features')
+
+    def __init__(self, mac, client_id, certificate_path, private_key_path, \
+        features, group_id=None):
+        """Constructor.
+
+        Args:
+            mac (str): MAC address of the node.
+            client_id (str): Identifier of the client, as it is on the cloud.
+            certificate_path (str): Path of the certificate of the device.
+            private_key_path (str): Path of the private key of the device.
+            features (list): List of :class:`FeatureConfig` objects.
+            group_id (str): Identifier of the group of the client, if known
+                in advance.
+        """
+        self.mac = mac.lower()
+        self.client_id = client_id
+        self.certificate_path = certificate_path
+        self.private_key_path = private_key_path
+        self.features = list(features)
+        self.group_id = group_id
+
+
+class DeviceRegistry(object):
+    """Class holding the configuration of the devices of a gateway."""
+
+    def __init__(self, devices):
+        """Constructor.
+
+        Args:
+            devices (list): List of :class:`DeviceConfig` objects.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ConfigurationException`
+                is raised if MAC addresses or client identifiers are repeated.
+        """
+        self._devices = {}
+        client_ids = set()
+        for device in devices:
+            if device.mac in self._devices:
+                raise ConfigurationException('Repeated MAC address "%s".' % device.mac)
+            if device.client_id in client_ids:
+                raise ConfigurationException('Repeated client identifier "%s".' \
+                    % device.client_id)
+            self._devices[device.mac] = device
+            client_ids.add(device.client_id)
+        self._order = [device.mac for device in devices]
+
+    @classmethod
+    def load(cls, path):
+        """Load the configuration of the devices from a file.
+
+        Args:
+            path (str): Path of the JSON configuration file.
+
+        Returns:
+            :class:`DeviceRegistry`: The registry.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ConfigurationException`
+                is raised if the file cannot be read or is not valid.
+        """
+        try:
+            with open(path, 'r') as config_file:
+                config = json.load(config_file)
+        except (IOError, OSError, ValueError) as e:
+            raise ConfigurationException('Cannot load configuration "%s": %s' \
+                % (path, str(e)))
+        return cls.from_dict(config, os.path.dirname(os.path.abspath(path)))
+
+    @classmethod
+    def from_dict(cls, config, base_path='.'):
+        """Create the registry out of a configuration.
+
+        Args:
+            config (dict): The configuration, as described in the module
+                documentation.
+            base_path (str): Directory against which "certificates_path" is
+                resolved.
+
+        Returns:
+            :class:`DeviceRegistry`: The registry.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ConfigurationException`
+                is raised if the configuration is not valid.
+        """
+        certificates_path = os.path.normpath(os.path.join(base_path, \
+            config.get('certificates_path', '.')))
+        defaults = config.get('defaults', {})
+        devices = []
+        try:
+            for device in config['devices']:
+                features = []
+                for feature in device.get('features', []):
+                    settings = dict(defaults)
+                    settings.update(feature)
+                    features.append(FeatureConfig(settings['name'], \
+                        settings['topic'], int(settings.get('qos', 0)), \
+                        PublishPolicy(settings.get('policy', PublishPolicy.ON_UPDATE.value)), \
+                        settings.get('period_s')))
+                devices.append(DeviceConfig(device['mac'], device['client_id'], \
+                    os.path.join(certificates_path, device['certificate']), \
+                    os.path.join(certificates_path, device['private_key']), \
+                    features, device.get('group_id')))
+        except KeyError as e:
+            raise ConfigurationException('Missing setting %s.' % str(e))
+        except (TypeError, ValueError) as e:
+            raise ConfigurationException('Invalid setting: %s' % str(e))
+        return cls(devices)
+
+    def get_devices(self):
+        """Get the configuration of the devices.
+
+        Returns:
+            list: List of :class:`DeviceConfig` objects, in the order of the
+            configuration.
+        """
+        return [self._devices[mac] for mac in self._order]
+
+    def get_device(self, mac):
+        """Get the configuration of a device.
+
+        Args:
+            mac (str): MAC address of the node.
+
+        Returns:
+            :class:`DeviceConfig`: The configuration, or None if the device is
+            not registered.
+        """
+        return self._devices.get(mac.lower())
+
+
+class BringUpReport(object):
+    """Class reporting the bring-up of a device."""
+
+    __slots__ = ('mac', 'client_id', 'node_s', 'client_s', 'total_s', 'error')
+
+    def __init__(self, mac, client_id):
+        """Constructor.
+
+        Args:
+            mac (str): MAC address of the node.
+            client_id (str): Identifier of the client.
+        """
+        self.mac = mac
+        """MAC address of the node."""
+        self.client_id = client_id
+        """Identifier of the client."""
+        self.node_s = None
+        """Time taken to connect to the node, in seconds."""
+        self.client_s = None
+        """Time taken to get and connect the client, in seconds."""
+        self.total_s = None
+        """Time taken by the whole bring-up, in seconds."""
+        self.error = None
+        """Description of the error if the bring-up failed, None otherwise."""
+
+    def __str__(self):
+        """Describe the bring-up.
+
+        Returns:
+            str: The description.
+        """
+        if self.error is not None:
+            return '%s (%s): failed: %s' % (self.client_id, self.mac, self.error)
+        return '%s (%s): %.3f s (node: %.3f s, client: %.3f s)' \
+            % (self.client_id, self.mac, self.total_s, self.node_s, self.client_s)
+
+
+class _Publication(object):
+    """Publishing of the samples of a feature of a device."""
+
+    __slots__ = ('client', 'config', 'encoder', 'sample', 'published')
+
+    def __init__(self, client, config, feature):
+        """Constructor.
+
+        Args:
+            client (:class:`edge_st_sdk.edge_client.EdgeClient`): The client.
+            config (:class:`FeatureConfig`): The configuration.
+            feature (:class:`blue_st_sdk.feature.Feature`): The feature.
+        """
+        self.client = client
+        self.config = config
+        self.encoder = TelemetryEncoder.for_feature(feature, \
+            [(BOARD_ID_KEY, client.get_client_id())])
+        self.sample = None
+        self.published = None
+
+    def on_update(self, feature, sample):
+        """Publish the sample or keep it as the latest one, depending on the
+        policy.
+
+        Args:
+            feature (:class:`blue_st_sdk.feature.Feature`): The feature.
+            sample (:class:`blue_st_sdk.feature.Sample`): The sample.
+        """
+        if self.config.policy == PublishPolicy.ON_UPDATE:
+            self.publish(sample)
+        else:
+            self.sample = sample
+
+    def publish(self, sample):
+        """Publish a sample.
+
+        Args:
+            sample (:class:`blue_st_sdk.feature.Sample`): The sample.
+        """
+        self.published = sample
+        self.client.publish(self.config.topic, self.encoder.encode_sample(sample), \
+            self.config.qos)
+
+
+class Gateway(object):
+    """Class responsible for bringing up the devices of a registry, and for
+    publishing the samples of their features according to their policies.
+
+    Notifications of the nodes are served by a
+    :class:`edge_st_sdk.gateway.notification_pump.NotificationPump`, whose
+    :meth:`dispatch` has to be called by the application, e.g. by its main
+    loop; samples of periodic features are published by a single thread.
+    """
+
+    def __init__(self, registry, edge, pump, max_workers=MAX_WORKERS):
+        """Constructor.
+
+        Args:
+            registry (:class:`DeviceRegistry`): The devices.
+            edge: Object providing the edge clients through a
+                "get_client(client_id, certificate_path, private_key_path,
+                group_id)" method, e.g. a
+                :class:`edge_st_sdk.aws.aws_greengrass.AWSGreengrass` object.
+            pump (:class:`edge_st_sdk.gateway.notification_pump.NotificationPump`):
+                The pump serving the notifications of the nodes.
+            max_workers (int): Maximum number of devices brought up in
+                parallel.
+        """
+        self._registry = registry
+        self._edge = edge
+        self._pump = pump
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._nodes = {}
+        self._clients = {}
+        self._periodic = []
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def bring_up(self, nodes):
+        """Bring up the registered devices among the given nodes, in parallel:
+        connect to each node and to its edge client, and set the publishing of
+        the configured features up.
+
+        Args:
+            nodes (list): Discovered nodes, e.g. the ones returned by
+                :meth:`blue_st_sdk.manager.Manager.get_nodes`. Unregistered
+                ones are ignored.
+
+        Returns:
+            list: List of :class:`BringUpReport` objects, one per registered
+            device; devices whose node has not been given are reported as
+            failed.
+        """
+        nodes = dict((node.get_tag().lower(), node) for node in nodes)
+        devices = self._registry.get_devices()
+        return _run_parallel(lambda device: self._bring_up_device(device, \
+            nodes.get(device.mac)), devices, self._max_workers)
+
+    def _bring_up_device(self, device, node):
+        """Bring up a device.
+
+        Args:
+            device (:class:`DeviceConfig`): The device.
+            node: The node of the device, or None if not discovered.
+
+        Returns:
+            :class:`BringUpReport`: The report.
+        """
+        report = BringUpReport(device.mac, device.client_id)
+        start = time.time()
+        if node is None:
+            report.error = 'node not discovered'
+            return report
+        client = None
+        node_added = False
+        listeners = []
+        try:
+            if not node.connect():
+                report.error = 'node connection failed'
+                self._disconnect_node(node)
+                return report
+            report.node_s = time.time() - start
+            client_start = time.time()
+            client = self._edge.get_client(device.client_id, \
+                device.certificate_path, device.private_key_path, device.group_id)
+            client.connect()
+            report.client_s = time.time() - client_start
+
+            # Publishing features.
+            features = dict((feature.get_name(), feature) \
+                for feature in node.get_features())
+            publications = []
+            for config in device.features:
+                feature = features.get(config.name)
+                if feature is None:
+                    raise ConfigurationException('feature "%s" not available' \
+                        % config.name)
+                publications.append((feature, _Publication(client, config, feature)))
+            self._pump.add_node(node)
+            node_added = True
+            for (feature, publication) in publications:
+                self._pump.add_listener(feature, publication)
+                listeners.append((feature, publication))
+                if self._running:
+                    self._pump.call(node, node.enable_notifications, feature)
+                else:
+                    node.enable_notifications(feature)
+        except (Exception, SystemExit) as e:
+            # Errors depend on the BLE stack and on the edge client, which
+            # exits when discovery or connection fail: the device is reported
+            # as failed and released, the other ones are brought up anyway.
+            if isinstance(e, SystemExit):
+                report.error = 'exited with code %s' % str(e.code)
+            else:
+                report.error = str(e) or type(e).__name__
+            for (feature, publication) in listeners:
+                self._pump.remove_listener(feature, publication)
+            if node_added:
+                self._pump.remove_node(node)
+            self._disconnect_node(node)
+            if client is not None:
+                try:
+                    client.disconnect()
+                except Exception:
+                    pass
+            return report
+        for (feature, publication) in publications:
+            if publication.config.policy == PublishPolicy.PERIODIC:
+                self._schedule(publication, time.time())
+        with self._lock:
+            self._nodes[device.mac] = node
+            self._clients[device.client_id] = client
+        report.total_s = time.time() - start
+        return report
+
+    @staticmethod
+    def _disconnect_node(node):
+        """Disconnect a node which failed to be brought up, ignoring errors.
+
+        Args:
+            node: The node.
+        """
+        try:
+            node.disconnect()
+        except Exception:
+            pass
+
+    def get_node(self, mac):
+        """Get the node of a device brought up.
+
+        Args:
+            mac (str): MAC address of the node.
+
+        Returns:
+            The node, or None if the device has not been brought up.
+        """
+        return self._nodes.get(mac.lower())
+
+    def get_client(self, client_id):
+        """Get the edge client of a device brought up.
+
+        Args:
+            client_id (str): Identifier of the client.
+
+        Returns:
+            :class:`edge_st_sdk.edge_client.EdgeClient`: The client, or None if
+            the device has not been brought up.
+        """
+        return self._clients.get(client_id)
+
+    def start(self):
+        """Start serving the nodes and publishing the samples of the periodic
+        features."""
+        self._pump.start()
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._publish_periodically)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving the nodes and publishing the samples."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._pump.stop()
+
+    def dispatch(self, timeout_s=None):
+        """Dispatch the notifications of the nodes to the listeners, refer to
+        :meth:`edge_st_sdk.gateway.notification_pump.NotificationPump.dispatch`.
+
+        Args:
+            timeout_s (float): Maximum time to wait for the first
+                notification, in seconds.
+
+        Returns:
+            int: The number of notifications dispatched.
+        """
+        return self._pump.dispatch(timeout_s)
+
+    def _schedule(self, publication, due):
+        """Schedule the publishing of a periodic feature.
+
+        Args:
+            publication (:class:`_Publication`): The publication.
+            due (float): Time of the publishing.
+        """
+        with self._condition:
+            heapq.heappush(self._periodic, (due, id(publication), publication))
+            self._condition.notify()
+
+    def _publish_periodically(self):
+        """Publish the latest samples of the periodic features when due.
+
+        The due publications are taken under the lock and published outside of
+        it, so that a slow publishing does not hold up the scheduling.
+        """
+        while True:
+            ready = []
+            with self._condition:
+                while self._running and not ready:
+                    if not self._periodic:
+                        self._condition.wait()
+                        continue
+                    now = time.time()
+                    # Each publication at most once per round.
+                    for _ in range(len(self._periodic)):
+                        (due, key, publication) = self._periodic[0]
+                        if due > now:
+                            break
+                        heapq.heapreplace(self._periodic, \
+                            (max(due + publication.config.period_s, now), key, \
+                            publication))
+                        sample = publication.sample
+                        if sample is not None and sample is not publication.published:
+                            ready.append((publication, sample))
+                    if not ready:
+                        self._condition.wait(max(self._periodic[0][0] - now, 0))
+                if not self._running:
+                    return
+            for (publication, sample) in ready:
+                try:
+                    publication.publish(sample)
+                except Exception as e:
+                    print('Publishing to "%s" failed: %s' \
+                        % (publication.config.topic, str(e)))
@@ -0,0 +1,455 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""notification_pump
+
+The notification_pump module serves the notifications of many BlueST nodes at
+once, and hands them to the listeners of the features through a single
+dispatch queue.
+
+Nodes exposing the pipe of the bluepy helper, or a :meth:`fileno` method as
+simulated nodes do, are served by a single thread waiting for any of them to
+be readable, so that latency does not grow with the number of nodes and the
+thread sleeps when no notifications come in. Other nodes are served by a
+worker thread each.
+
+As bluepy is not thread-safe, operations on a node, e.g. writing a feature,
+have to be run by the thread serving it, through
+:meth:`NotificationPump.call`.
+"""
+
+
+# IMPORT
+
+import fcntl
+import os
+import select
+import threading
+from collections import deque
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+# CONSTANTS
+
+WAIT_s = 0.1
+"""Maximum time waited by the serving threads before checking for commands
+and for being stopped."""
+
+MAX_WAITS_PER_WAKEUP = 64
+"""Maximum number of notifications read from a node before serving the other
+ones."""
+
+
+# FUNCTIONS
+
+def _get_fileno(node):
+    """Get the file descriptor signalling notifications of a node.
+
+    Args:
+        node: A :class:`blue_st_sdk.node.Node` or a
+            :class:`edge_st_sdk.gateway.simulated_node.SimulatedNode` object.
+
+    Returns:
+        int: The file descriptor, or None if not available.
+    """
+    if hasattr(node, 'fileno'):
+        return node.fileno()
+    helper = getattr(node, '_helper', None)
+    if helper is not None and helper.stdout is not None:
+        return helper.stdout.fileno()
+    return None
+
+
+# CLASSES
+
+class _QueuedListener(object):
+    """Feature listener putting the notifications into the dispatch queue."""
+
+    __slots__ = ('_pump', '_listener')
+
+    def __init__(self, pump, listener):
+        """Constructor.
+
+        Args:
+            pump (:class:`NotificationPump`): The pump.
+            listener (:class:`blue_st_sdk.feature.FeatureListener`): The
+                listener to dispatch the notifications to.
+        """
+        self._pump = pump
+        self._listener = listener
+
+    def on_update(self, feature, sample):
+        """Put a notification into the dispatch queue.
+
+        Args:
+            feature (:class:`blue_st_sdk.feature.Feature`): The feature.
+            sample (:class:`blue_st_sdk.feature.Sample`): The sample.
+        """
+        self._pump._enqueue(self._listener, feature, sample)
+
+
+class _NodeWorker(object):
+    """Worker thread serving a node."""
+
+    __slots__ = ('thread', 'stop', 'commands')
+
+    def __init__(self):
+        """Constructor."""
+        self.thread = None
+        self.stop = threading.Event()
+        self.commands = deque()
+
+
+class NotificationPump(object):
+    """Class responsible for serving the notifications of many nodes, and
+    for dispatching them to the listeners of the features through a single
+    queue.
+
+    Listeners registered through :meth:`add_listener` are called by the
+    thread calling :meth:`dispatch`, one notification after the other, in the
+    order the notifications came in.
+    """
+
+    def __init__(self, queue_size=0, use_workers=False, wait_s=WAIT_s):
+        """Constructor.
+
+        Args:
+            queue_size (int): Maximum number of notifications waiting to be
+                dispatched, further ones are dropped. Unbounded if 0.
+            use_workers (bool): If True, each node is served by a worker thread
+                even if its notifications can be waited for through a file
+                descriptor.
+            wait_s (float): Maximum time waited by the serving threads before
+                checking for commands and for being stopped.
+        """
+        self._queue = queue.Queue(queue_size)
+        self._use_workers = use_workers
+        self._wait_s = wait_s
+        self._lock = threading.Lock()
+        self._polled = {}
+        self._workers = {}
+        self._listeners = {}
+        self._commands = deque()
+        self._dropped = 0
+        self._running = False
+        self._thread = None
+        (self._wake_read_fd, self._wake_write_fd) = os.pipe()
+        for fd in (self._wake_read_fd, self._wake_write_fd):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def add_node(self, node):
+        """Start serving the notifications of a node.
+
+        Args:
+            node: A :class:`blue_st_sdk.node.Node` or a
+                :class:`edge_st_sdk.gateway.simulated_node.SimulatedNode`
+                object.
+        """
+        fileno = None if self._use_workers else _get_fileno(node)
+        with self._lock:
+            if node in self._polled or node in self._workers:
+                return
+            if fileno is not None:
+                polled = dict(self._polled)
+                polled[node] = fileno
+                self._polled = polled
+            else:
+                worker = _NodeWorker()
+                self._workers[node] = worker
+                if self._running:
+                    self._start_worker(node, worker)
+        self._wake()
+
+    def remove_node(self, node):
+        """Stop serving the notifications of a node.
+
+        Args:
+            node: The node.
+        """
+        with self._lock:
+            polled = dict(self._polled)
+            polled.pop(node, None)
+            self._polled = polled
+            worker = self._workers.pop(node, None)
+        if worker is not None:
+            worker.stop.set()
+        self._wake()
+
+    def get_nodes(self):
+        """Get the nodes served.
+
+        Returns:
+            list: The nodes.
+        """
+        with self._lock:
+            return list(self._polled.keys()) + list(self._workers.keys())
+
+    def add_listener(self, feature, listener):
+        """Add a listener of a feature, to be called through the dispatch
+        queue.
+
+        Args:
+            feature (:class:`blue_st_sdk.feature.Feature`): The feature.
+            listener (:class:`blue_st_sdk.feature.FeatureListener`): The
+                listener.
+        """
+        with self._lock:
+            if (feature, listener) in self._listeners:
+                return
+            queued_listener = _QueuedListener(self, listener)
+            self._listeners[(feature, listener)] = queued_listener
+        feature.add_listener(queued_listener)
+
+    def remove_listener(self, feature, listener):
+        """Remove a listener of a feature.
+
+        Args:
+            feature (:class:`blue_st_sdk.feature.Feature`): The feature.
+            listener (:class:`blue_st_sdk.feature.FeatureListener`): The
+                listener.
+        """
+        with self._lock:
+            queued_listener = self._listeners.pop((feature, listener), None)
+        if queued_listener is not None:
+            feature.remove_listener(queued_listener)
+
+    def call(self, node, function, *args):
+        """Run a function on the thread serving a node, e.g. to write a
+        feature of the node.
+
+        Args:
+            node: The node.
+            function (function): The function.
+            *args: Arguments of the function.
+        """
+        with self._lock:
+            worker = self._workers.get(node)
+        if worker is not None:
+            worker.commands.append((function, args))
+        else:
+            self._commands.append((function, args))
+            self._wake()
+
+    def start(self):
+        """Start serving the nodes."""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._serve_polled_nodes)
+            self._thread.daemon = True
+            self._thread.start()
+            for (node, worker) in self._workers.items():
+                self._start_worker(node, worker)
+
+    def stop(self):
+        """Stop serving the nodes, waiting for the serving threads to end."""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            threads = [self._thread]
+            for worker in self._workers.values():
+                worker.stop.set()
+                threads.append(worker.thread)
+            self._workers = dict((node, _NodeWorker()) \
+                for node in self._workers.keys())
+            self._thread = None
+        self._wake()
+        for thread in threads:
+            if thread is not None and thread is not threading.current_thread():
+                thread.join()
+
+    def dispatch(self, timeout_s=None):
+        """Dispatch the notifications waiting in the queue to the listeners.
+
+        Args:
+            timeout_s (float): Maximum time to wait for the first
+                notification, in seconds. Wait forever if None, do not wait if
+                0.
+
+        Returns:
+            int: The number of notifications dispatched.
+        """
+        try:
+            item = self._queue.get(timeout_s is None or timeout_s > 0, timeout_s)
+        except queue.Empty:
+            return 0
+        count = 0
+        while True:
+            (listener, feature, sample) = item
+            try:
+                listener.on_update(feature, sample)
+            except Exception as e:
+                # A failing listener must not stop the dispatching.
+                print('Listener of feature "%s" failed: %s' \
+                    % (feature.get_name(), str(e)))
+            count += 1
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return count
+
+    def get_queue_size(self):
+        """Get the number of notifications waiting to be dispatched.
+
+        Returns:
+            int: The number of notifications.
+        """
+        return self._queue.qsize()
+
+    def get_dropped(self):
+        """Get the number of notifications dropped because the dispatch queue
+        was full.
+
+        Returns:
+            int: The number of notifications.
+        """
+        return self._dropped
+
+    def _enqueue(self, listener, feature, sample):
+        """Put a notification into the dispatch queue, never blocking the
+        serving threads.
+
+        Args:
+            listener (:class:`blue_st_sdk.feature.FeatureListener`): The
+                listener.
+            feature (:class:`blue_st_sdk.feature.Feature`): The feature.
+            sample (:class:`blue_st_sdk.feature.Sample`): The sample.
+        """
+        try:
+            self._queue.put_nowait((listener, feature, sample))
+        except queue.Full:
+            self._dropped += 1
+
+    def _wake(self):
+        """Wake the thread serving the polled nodes up."""
+        try:
+            os.write(self._wake_write_fd, b'\0')
+        except OSError:
+            pass
+
+    def _run_commands(self, commands):
+        """Run the pending commands.
+
+        Args:
+            commands (:class:`collections.deque`): The commands.
+        """
+        while commands:
+            (function, args) = commands.popleft()
+            try:
+                function(*args)
+            except Exception as e:
+                print('Command "%s" failed: %s' \
+                    % (getattr(function, '__name__', function), str(e)))
+
+    def _serve_polled_nodes(self):
+        """Serve the nodes whose notifications can be waited for through a
+        file descriptor."""
+        served = None
+        poller = None
+        nodes = {}
+        while self._running:
+            if served is not self._polled:
+                served = self._polled
+                poller = select.poll()
+                poller.register(self._wake_read_fd, select.POLLIN)
+                nodes = {}
+                for (node, fileno) in served.items():
+                    poller.register(fileno, select.POLLIN)
+                    nodes[fileno] = node
+            try:
+                events = poller.poll(self._wait_s * 1000)
+            except (select.error, OSError):
+                # Interrupted by a signal.
+                continue
+            for (fileno, event) in events:
+                if fileno == self._wake_read_fd:
+                    os.read(self._wake_read_fd, 4096)
+                    continue
+                node = nodes.get(fileno)
+                if node is None:
+                    continue
+                if not event & select.POLLIN:
+                    print('Node "%s" closed.' % node.get_name())
+                    self.remove_node(node)
+                    continue
+                self._serve_node(node, 0)
+            self._run_commands(self._commands)
+
+    def _serve_node(self, node, timeout_s):
+        """Read the notifications of a node.
+
+        Args:
+            node: The node.
+            timeout_s (float): Maximum time to wait for a notification.
+
+        Returns:
+            bool: True if the node can still be served, False otherwise.
+        """
+        try:
+            for _ in range(MAX_WAITS_PER_WAKEUP):
+                if not node.wait_for_notifications(timeout_s):
+                    break
+                timeout_s = 0
+            return True
+        except Exception as e:
+            # Errors are specific to the BLE stack, e.g. bluepy's
+            # "BTLEException" on disconnection: the node is not served anymore,
+            # the other ones are.
+            print('Node "%s" stopped: %s' % (node.get_name(), str(e)))
+            self.remove_node(node)
+            return False
+
+    def _start_worker(self, node, worker):
+        """Start the worker thread of a node.
+
+        Args:
+            node: The node.
+            worker (:class:`_NodeWorker`): The worker.
+        """
+        worker.thread = threading.Thread(target=self._serve_worker_node, \
+            args=(node, worker))
+        worker.thread.daemon = True
+        worker.thread.start()
+
+    def _serve_worker_node(self, node, worker):
+        """Serve a node on its own thread.
+
+        Args:
+            node: The node.
+            worker (:class:`_NodeWorker`): The worker.
+        """
+        while not worker.stop.is_set():
+            if not self._serve_node(node, self._wait_s):
+                break
+            self._run_commands(worker.commands)
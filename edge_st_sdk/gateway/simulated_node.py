@@ -0,0 +1,624 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""simulated_node
+
+The simulated_node module provides stand-ins for BlueST nodes, which notify
+samples of their features at given rates without any Bluetooth Low Energy
+hardware, so that gateway applications can be exercised and their scaling
+measured on a plain Linux machine.
+
+Simulated nodes and features expose the subset of the interface of the
+:class:`blue_st_sdk.node.Node` and :class:`blue_st_sdk.feature.Feature`
+classes used by gateway applications. As with BlueST nodes, samples are
+notified to the listeners of the features by the thread calling
+:meth:`SimulatedNode.wait_for_notifications`; a single
+:class:`SimulatedRadio` thread schedules the notifications of all the nodes,
+and wakes them up through pipes, as the bluepy helper does for real nodes.
+"""
+
+
+# IMPORT
+
+import datetime
+import fcntl
+import heapq
+import os
+import random
+import select
+import threading
+import time
+
+
+# CONSTANTS
+
+READ_SIZE = 4096
+"""Maximum number of notifications read from the pipe of a node at once."""
+
+SWITCH_FEATURE = 'Switch'
+"""Name of the switch feature of the BlueST protocol."""
+
+ENVIRONMENTAL_FEATURES = ('Temperature', 'Humidity', 'Pressure')
+"""Names of the environmental features of the BlueST protocol."""
+
+INERTIAL_FEATURES = ('Accelerometer', 'Gyroscope', 'Magnetometer')
+"""Names of the inertial features of the BlueST protocol."""
+
+
+# CLASSES
+
+class SimulatedField(object):
+    """Class describing a field of a simulated feature."""
+
+    __slots__ = ('_name', '_unit', '_min', '_max')
+
+    def __init__(self, name, unit='', minimum=0, maximum=1):
+        """Constructor.
+
+        Args:
+            name (str): Name of the field.
+            unit (str): Unit of the field.
+            minimum: Minimum value of the field.
+            maximum: Maximum value of the field.
+        """
+        self._name = name
+        self._unit = unit
+        self._min = minimum
+        self._max = maximum
+
+    def get_name(self):
+        """Get the name of the field.
+
+        Returns:
+            str: The name of the field.
+        """
+        return self._name
+
+    def get_unit(self):
+        """Get the unit of the field.
+
+        Returns:
+            str: The unit of the field.
+        """
+        return self._unit
+
+    def get_min(self):
+        """Get the minimum value of the field.
+
+        Returns:
+            The minimum value of the field.
+        """
+        return self._min
+
+    def get_max(self):
+        """Get the maximum value of the field.
+
+        Returns:
+            The maximum value of the field.
+        """
+        return self._max
+
+
+class SimulatedSample(object):
+    """Class holding a sample of a simulated feature."""
+
+    __slots__ = ('_data', '_description', '_timestamp', '_emission_time')
+
+    def __init__(self, data, description, timestamp, emission_time):
+        """Constructor.
+
+        Args:
+            data (list): Values of the sample.
+            description (list): List of :class:`SimulatedField` objects.
+            timestamp (int): Counter of the samples of the feature.
+            emission_time (float): Time when the node emitted the sample, in
+                seconds since the epoch.
+        """
+        self._data = data
+        self._description = description
+        self._timestamp = timestamp
+        self._emission_time = emission_time
+
+    def get_data(self):
+        """Get the values of the sample.
+
+        Returns:
+            list: The values.
+        """
+        return self._data
+
+    def get_description(self):
+        """Get the description of the fields of the sample.
+
+        Returns:
+            list: List of :class:`SimulatedField` objects.
+        """
+        return self._description
+
+    def get_timestamp(self):
+        """Get the counter of the samples of the feature.
+
+        Returns:
+            int: The counter.
+        """
+        return self._timestamp
+
+    def get_notification_time(self):
+        """Get the time when the node emitted the sample.
+
+        Returns:
+            :class:`datetime.datetime`: The time.
+        """
+        return datetime.datetime.fromtimestamp(self._emission_time)
+
+    def get_emission_time(self):
+        """Get the time when the node emitted the sample, e.g. to measure the
+        latency of its processing.
+
+        Returns:
+            float: The time, in seconds since the epoch.
+        """
+        return self._emission_time
+
+
+class SimulatedFeature(object):
+    """Class simulating a feature of a node, emitting samples at a given
+    rate.
+
+    Values are generated by a given function, or uniformly at random within
+    the range of each field.
+    """
+
+    def __init__(self, name, fields, rate_Hz, generator=None):
+        """Constructor.
+
+        Args:
+            name (str): Name of the feature.
+            fields (list): List of :class:`SimulatedField` objects.
+            rate_Hz (float): Samples per second.
+            generator (function): Function called with the counter of the
+                samples and returning the values of a sample. Random values if
+                not given.
+        """
+        self._name = name
+        self._fields = list(fields)
+        self._rate_Hz = rate_Hz
+        self._generator = generator
+        self._listeners = []
+        self._timestamp = 0
+        self._last_sample = None
+        self._node = None
+
+    def get_name(self):
+        """Get the name of the feature.
+
+        Returns:
+            str: The name of the feature.
+        """
+        return self._name
+
+    def get_fields_description(self):
+        """Get the description of the fields of the feature.
+
+        Returns:
+            list: List of :class:`SimulatedField` objects.
+        """
+        return list(self._fields)
+
+    def get_rate(self):
+        """Get the samples per second emitted by the feature.
+
+        Returns:
+            float: The rate.
+        """
+        return self._rate_Hz
+
+    def get_parent_node(self):
+        """Get the node the feature belongs to.
+
+        Returns:
+            :class:`SimulatedNode`: The node.
+        """
+        return self._node
+
+    def get_last_sample(self):
+        """Get the last sample notified.
+
+        Returns:
+            :class:`SimulatedSample`: The sample, or None if no sample has been
+            notified yet.
+        """
+        return self._last_sample
+
+    def add_listener(self, listener):
+        """Add a listener of the samples.
+
+        Args:
+            listener (:class:`blue_st_sdk.feature.FeatureListener`): The
+                listener.
+        """
+        if listener is not None and listener not in self._listeners:
+            self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener):
+        """Remove a listener of the samples.
+
+        Args:
+            listener (:class:`blue_st_sdk.feature.FeatureListener`): The
+                listener.
+        """
+        if listener in self._listeners:
+            self._listeners = [l for l in self._listeners if l is not listener]
+
+    def _generate(self):
+        """Generate the values of a sample.
+
+        Returns:
+            list: The values.
+        """
+        if self._generator is not None:
+            return self._generator(self._timestamp)
+        values = []
+        for field in self._fields:
+            if isinstance(field.get_min(), int) and isinstance(field.get_max(), int):
+                values.append(random.randint(field.get_min(), field.get_max()))
+            else:
+                values.append(random.uniform(field.get_min(), field.get_max()))
+        return values
+
+    def _notify(self, emission_time):
+        """Generate a sample and notify it to the listeners.
+
+        Args:
+            emission_time (float): Time when the node emitted the sample.
+        """
+        self._timestamp += 1
+        sample = SimulatedSample(self._generate(), self._fields, \
+            self._timestamp, emission_time)
+        self._last_sample = sample
+        for listener in self._listeners:
+            listener.on_update(self, sample)
+
+
+class SimulatedNode(object):
+    """Class simulating a BlueST node.
+
+    Notifications scheduled by a :class:`SimulatedRadio` are signalled
+    through a pipe, whose read end is exposed by :meth:`fileno` to wait for
+    notifications of many nodes at once.
+    """
+
+    def __init__(self, name, tag, features):
+        """Constructor.
+
+        Args:
+            name (str): Name of the node.
+            tag (str): Tag of the node, i.e. its MAC address.
+            features (list): List of :class:`SimulatedFeature` objects.
+        """
+        self._name = name
+        self._tag = tag
+        self._features = list(features)
+        for feature in self._features:
+            feature._node = self
+        self._enabled = set()
+        self._connected = False
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        (self._read_fd, self._write_fd) = os.pipe()
+        for fd in (self._read_fd, self._write_fd):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def get_name(self):
+        """Get the name of the node.
+
+        Returns:
+            str: The name of the node.
+        """
+        return self._name
+
+    def get_tag(self):
+        """Get the tag of the node, i.e. its MAC address.
+
+        Returns:
+            str: The tag of the node.
+        """
+        return self._tag
+
+    def get_features(self):
+        """Get the features of the node.
+
+        Returns:
+            list: List of :class:`SimulatedFeature` objects.
+        """
+        return list(self._features)
+
+    def get_feature(self, name):
+        """Get a feature of the node.
+
+        Args:
+            name (str): Name of the feature.
+
+        Returns:
+            :class:`SimulatedFeature`: The feature, or None if not found.
+        """
+        for feature in self._features:
+            if feature.get_name() == name:
+                return feature
+        return None
+
+    def connect(self):
+        """Connect to the node.
+
+        Returns:
+            bool: True.
+        """
+        self._connected = True
+        return True
+
+    def disconnect(self):
+        """Disconnect from the node, disabling all notifications."""
+        self._connected = False
+        self._enabled.clear()
+
+    def is_connected(self):
+        """Check whether the node is connected.
+
+        Returns:
+            bool: True if the node is connected, False otherwise.
+        """
+        return self._connected
+
+    def enable_notifications(self, feature):
+        """Enable the notifications of a feature.
+
+        Args:
+            feature (:class:`SimulatedFeature`): The feature.
+
+        Returns:
+            bool: True if the notifications have been enabled, False if the
+            node is not connected.
+        """
+        if not self._connected:
+            return False
+        self._enabled.add(feature)
+        return True
+
+    def disable_notifications(self, feature):
+        """Disable the notifications of a feature.
+
+        Args:
+            feature (:class:`SimulatedFeature`): The feature.
+
+        Returns:
+            bool: True.
+        """
+        self._enabled.discard(feature)
+        return True
+
+    def notifications_enabled(self, feature):
+        """Check whether the notifications of a feature are enabled.
+
+        Args:
+            feature (:class:`SimulatedFeature`): The feature.
+
+        Returns:
+            bool: True if the notifications are enabled, False otherwise.
+        """
+        return feature in self._enabled
+
+    def fileno(self):
+        """Get the file descriptor signalling pending notifications.
+
+        Returns:
+            int: The file descriptor.
+        """
+        return self._read_fd
+
+    def close(self):
+        """Release the pipe of the node."""
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+    def wait_for_notifications(self, timeout_s):
+        """Wait for notifications and notify the samples to the listeners of
+        the features.
+
+        Args:
+            timeout_s (float): Timeout in seconds.
+
+        Returns:
+            bool: True if at least a notification has been received, False
+            otherwise.
+        """
+        if timeout_s > 0:
+            select.select([self._read_fd], [], [], timeout_s)
+        try:
+            count = len(os.read(self._read_fd, READ_SIZE))
+        except OSError:
+            return False
+        with self._pending_lock:
+            pending = self._pending[:count]
+            del self._pending[:count]
+        for (feature, emission_time) in pending:
+            if feature in self._enabled:
+                feature._notify(emission_time)
+        return count > 0
+
+    def _emit(self, feature, emission_time):
+        """Signal a pending notification of a feature.
+
+        Args:
+            feature (:class:`SimulatedFeature`): The feature.
+            emission_time (float): Time of the emission.
+        """
+        with self._pending_lock:
+            self._pending.append((feature, emission_time))
+        try:
+            os.write(self._write_fd, b'\0')
+        except OSError:
+            # Pipe full: the node is not served fast enough, the notification
+            # is lost, as it happens over the air.
+            with self._pending_lock:
+                self._pending.pop()
+
+
+class SimulatedRadio(object):
+    """Class responsible for scheduling the notifications of simulated nodes
+    on a single thread.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self._schedule = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stop = False
+        self._sequence = 0
+
+    def add_node(self, node):
+        """Start emitting the notifications of the features of a node.
+
+        Args:
+            node (:class:`SimulatedNode`): The node.
+        """
+        now = time.time()
+        with self._condition:
+            for feature in node.get_features():
+                if feature.get_rate() > 0:
+                    # Random phase, to avoid all the nodes emitting at once.
+                    due = now + random.random() / feature.get_rate()
+                    self._push(due, node, feature)
+            self._condition.notify()
+
+    def remove_node(self, node):
+        """Stop emitting the notifications of the features of a node.
+
+        Args:
+            node (:class:`SimulatedNode`): The node.
+        """
+        with self._condition:
+            self._schedule = [entry for entry in self._schedule \
+                if entry[2] is not node]
+            heapq.heapify(self._schedule)
+
+    def _push(self, due, node, feature):
+        """Schedule a notification.
+
+        Args:
+            due (float): Time of the notification.
+            node (:class:`SimulatedNode`): The node.
+            feature (:class:`SimulatedFeature`): The feature.
+        """
+        self._sequence += 1
+        heapq.heappush(self._schedule, (due, self._sequence, node, feature))
+
+    def start(self):
+        """Start emitting notifications."""
+        self._stop = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop emitting notifications."""
+        with self._condition:
+            self._stop = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        """Emit the notifications when due."""
+        with self._condition:
+            while not self._stop:
+                if not self._schedule:
+                    self._condition.wait()
+                    continue
+                now = time.time()
+                (due, _, node, feature) = self._schedule[0]
+                if due > now:
+                    self._condition.wait(due - now)
+                    continue
+                heapq.heappop(self._schedule)
+                node._emit(feature, due)
+                # Catching up with a late schedule rather than bursting.
+                self._push(max(due + 1.0 / feature.get_rate(), now), node, feature)
+
+
+# FUNCTIONS
+
+def create_bluest_node(name, tag, switch_rate_Hz, environmental_rate_Hz, \
+    inertial_rate_Hz):
+    """Create a node exporting the switch, environmental, and inertial
+    features of the BlueST protocol, with the same names, fields, and ranges,
+    as the nodes of the application examples do.
+
+    The switch toggles at each notification; the other features notify random
+    values.
+
+    Args:
+        name (str): Name of the node.
+        tag (str): Tag of the node, i.e. its MAC address.
+        switch_rate_Hz (float): Notifications per second of the switch
+            feature. No switch feature if 0.
+        environmental_rate_Hz (float): Notifications per second of each
+            environmental feature. No environmental features if 0.
+        inertial_rate_Hz (float): Notifications per second of each inertial
+            feature. No inertial features if 0.
+
+    Returns:
+        :class:`SimulatedNode`: The node.
+    """
+    features = []
+    if switch_rate_Hz > 0:
+        features.append(SimulatedFeature(SWITCH_FEATURE, \
+            [SimulatedField('Status', '', 0, 1)], switch_rate_Hz, \
+            lambda timestamp: [timestamp % 2]))
+    if environmental_rate_Hz > 0:
+        features.append(SimulatedFeature('Temperature', \
+            [SimulatedField('Temperature', 'C', 20.0, 30.0)], \
+            environmental_rate_Hz))
+        features.append(SimulatedFeature('Humidity', \
+            [SimulatedField('Humidity', '%', 30.0, 60.0)], \
+            environmental_rate_Hz))
+        features.append(SimulatedFeature('Pressure', \
+            [SimulatedField('Pressure', 'mb', 990.0, 1030.0)], \
+            environmental_rate_Hz))
+    if inertial_rate_Hz > 0:
+        features.append(SimulatedFeature('Accelerometer', \
+            [SimulatedField(axis, 'mg', -2000, 2000) \
+            for axis in ('X', 'Y', 'Z')], inertial_rate_Hz))
+        features.append(SimulatedFeature('Gyroscope', \
+            [SimulatedField(axis, 'dps', -2000.0, 2000.0) \
+            for axis in ('X', 'Y', 'Z')], inertial_rate_Hz))
+        features.append(SimulatedFeature('Magnetometer', \
+            [SimulatedField(axis, 'mGa', -2000, 2000) \
+            for axis in ('X', 'Y', 'Z')], inertial_rate_Hz))
+    return SimulatedNode(name, tag, features)
@@ -0,0 +1,6 @@
+__all__ = [
+    'payload_codec', \
+    'sample_store', \
+    'telemetry_encoder', \
+    'window_aggregator'
+]
@@ -0,0 +1,713 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""payload_codec
+
+The payload_codec module converts the payloads of MQTT messages from and to
+Python objects, in one of the following formats:
+
+* JSON, as text, the default one;
+* CBOR (RFC 7049), as binary data;
+* MessagePack, as binary data.
+
+Binary formats keep numbers as numbers, and are much more compact than JSON
+documents holding stringified values. The "cbor2" and "msgpack" packages are
+used when installed; otherwise the built-in pure Python implementations are
+used, which support None, booleans, integers, floats, text and binary strings,
+lists and dictionaries, nested up to :data:`MAX_DEPTH` levels.
+
+Decoding never raises anything but :exc:`ValueError` on malformed payloads,
+whatever the format and the implementation, so that a bad inbound message can
+be discarded without disrupting the thread receiving it.
+"""
+
+
+# IMPORT
+
+import json
+import struct
+import sys
+from abc import ABCMeta
+from abc import abstractmethod
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# CONSTANTS
+
+_PY2 = sys.version_info[0] == 2
+"""True when running on Python 2, where "str" objects are text."""
+
+_TEXT_TYPES = (type(u''), str)
+"""Types encoded as text strings."""
+
+_BINARY_TYPES = (bytearray,) if _PY2 else (bytes, bytearray)
+"""Types encoded as binary strings."""
+
+_INTEGER_TYPES = (int, long) if _PY2 else (int,)
+"""Types encoded as integers."""
+
+MAX_DEPTH = 64
+"""Maximum nesting depth of the lists and dictionaries decoded by the built-in
+implementations."""
+
+_DECODING_ERRORS = (TypeError, KeyError, RuntimeError, OverflowError, \
+    struct.error)
+"""Errors other than :exc:`ValueError` raised by malformed payloads, e.g.
+unhashable keys or too deep nesting (:exc:`RecursionError` being a
+:exc:`RuntimeError`)."""
+
+
+# INTERFACE
+
+class PayloadCodec(object):
+    """The PayloadCodec class is an interface for converting the payloads of
+    MQTT messages from and to Python objects."""
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def get_name(self):
+        """Get the name of the format.
+
+        Returns:
+            str: The name of the format.
+        """
+        raise NotImplementedError('You must define "get_name()" to use the "PayloadCodec" class.')
+
+    @abstractmethod
+    def encode(self, obj):
+        """Encode an object into a payload.
+
+        Args:
+            obj: The object.
+
+        Returns:
+            str: The payload, either text or binary data.
+        """
+        raise NotImplementedError('You must define "encode()" to use the "PayloadCodec" class.')
+
+    @abstractmethod
+    def decode(self, payload):
+        """Decode a payload into an object.
+
+        Args:
+            payload (str): The payload, either text or binary data.
+
+        Returns:
+            The object.
+
+        Raises:
+            :exc:`ValueError` is raised if the payload is malformed.
+        """
+        raise NotImplementedError('You must define "decode()" to use the "PayloadCodec" class.')
+
+
+# CLASSES
+
+class JSONCodec(PayloadCodec):
+    """Codec of JSON documents."""
+
+    NAME = 'json'
+    """Name of the format."""
+
+    def get_name(self):
+        """Get the name of the format.
+
+        Returns:
+            str: The name of the format.
+        """
+        return self.NAME
+
+    def encode(self, obj):
+        """Encode an object into a compact JSON document.
+
+        Args:
+            obj: The object.
+
+        Returns:
+            str: The JSON document.
+        """
+        return json.dumps(obj, separators=(',', ':'))
+
+    def decode(self, payload):
+        """Decode a JSON document into an object.
+
+        Args:
+            payload (str): The JSON document.
+
+        Returns:
+            The object.
+
+        Raises:
+            :exc:`ValueError` is raised if the payload is malformed.
+        """
+        try:
+            if isinstance(payload, (bytes, bytearray)):
+                payload = payload.decode('utf-8')
+            return json.loads(payload)
+        except _DECODING_ERRORS as e:
+            raise ValueError('Malformed JSON document: %s.' % (str(e)))
+
+
+class CBORCodec(PayloadCodec):
+    """Codec of CBOR data items.
+
+    The built-in encoder writes floats in single precision whenever this does
+    not lose precision, and in double precision otherwise.
+    """
+
+    NAME = 'cbor'
+    """Name of the format."""
+
+    def __init__(self, single_floats=False):
+        """Constructor.
+
+        Args:
+            single_floats (bool): If True, floats are always written in single
+                precision, i.e. with about 7 significant digits, which is
+                enough for most sensor readings and saves 4 bytes per float.
+        """
+        self._single_floats = single_floats
+
+    def get_name(self):
+        """Get the name of the format.
+
+        Returns:
+            str: The name of the format.
+        """
+        return self.NAME
+
+    def encode(self, obj):
+        """Encode an object into a CBOR data item.
+
+        Args:
+            obj: The object.
+
+        Returns:
+            bytes: The CBOR data item.
+        """
+        if cbor2 is not None and not self._single_floats:
+            return cbor2.dumps(obj)
+        chunks = []
+        _encode_cbor(obj, chunks, self._single_floats)
+        return b''.join(chunks)
+
+    def decode(self, payload):
+        """Decode a CBOR data item into an object.
+
+        Args:
+            payload (bytes): The CBOR data item.
+
+        Returns:
+            The object.
+
+        Raises:
+            :exc:`ValueError` is raised if the payload is malformed.
+        """
+        if cbor2 is not None:
+            try:
+                return cbor2.loads(payload)
+            except Exception as e:
+                raise ValueError(str(e))
+        try:
+            data = bytearray(payload)
+            obj, offset = _decode_cbor(data, 0, 0)
+        except _DECODING_ERRORS as e:
+            raise ValueError('Malformed CBOR data item: %s.' % (str(e)))
+        if offset != len(data):
+            raise ValueError('Trailing data after the CBOR data item.')
+        return obj
+
+
+class MessagePackCodec(PayloadCodec):
+    """Codec of MessagePack objects.
+
+    The built-in encoder writes floats in single precision whenever this does
+    not lose precision, and in double precision otherwise.
+    """
+
+    NAME = 'msgpack'
+    """Name of the format."""
+
+    def __init__(self, single_floats=False):
+        """Constructor.
+
+        Args:
+            single_floats (bool): If True, floats are always written in single
+                precision, i.e. with about 7 significant digits, which is
+                enough for most sensor readings and saves 4 bytes per float.
+        """
+        self._single_floats = single_floats
+
+    def get_name(self):
+        """Get the name of the format.
+
+        Returns:
+            str: The name of the format.
+        """
+        return self.NAME
+
+    def encode(self, obj):
+        """Encode an object into a MessagePack object.
+
+        Args:
+            obj: The object.
+
+        Returns:
+            bytes: The MessagePack object.
+        """
+        if msgpack is not None:
+            return msgpack.packb(obj, use_bin_type=True, \
+                use_single_float=self._single_floats)
+        chunks = []
+        _encode_msgpack(obj, chunks, self._single_floats)
+        return b''.join(chunks)
+
+    def decode(self, payload):
+        """Decode a MessagePack object into an object.
+
+        Args:
+            payload (bytes): The MessagePack object.
+
+        Returns:
+            The object.
+
+        Raises:
+            :exc:`ValueError` is raised if the payload is malformed.
+        """
+        if msgpack is not None:
+            try:
+                return msgpack.unpackb(payload, raw=False)
+            except Exception as e:
+                raise ValueError(str(e))
+        try:
+            data = bytearray(payload)
+            obj, offset = _decode_msgpack(data, 0, 0)
+        except _DECODING_ERRORS as e:
+            raise ValueError('Malformed MessagePack object: %s.' % (str(e)))
+        if offset != len(data):
+            raise ValueError('Trailing data after the MessagePack object.')
+        return obj
+
+
+# FUNCTIONS
+
+_codecs = {
+    JSONCodec.NAME: JSONCodec(),
+    CBORCodec.NAME: CBORCodec(),
+    MessagePackCodec.NAME: MessagePackCodec()
+}
+"""Codecs keyed by name of the format."""
+
+
+def get_codec(codec):
+    """Get a codec.
+
+    Args:
+        codec: Either a :class:`PayloadCodec` object, returned as it is, or the
+            name of a format among "json", "cbor", and "msgpack".
+
+    Returns:
+        :class:`PayloadCodec`: The codec.
+
+    Raises:
+        :exc:`ValueError` is raised if the format is unknown.
+    """
+    if isinstance(codec, PayloadCodec):
+        return codec
+    try:
+        return _codecs[codec]
+    except KeyError:
+        raise ValueError('Unknown payload format "%s".' % codec)
+
+
+def _is_single(value, lossy):
+    """Check whether a float can be written in single precision.
+
+    Args:
+        value (float): The value.
+        lossy (bool): If True, losing precision is allowed, but not range.
+
+    Returns:
+        bool: True if the value can be written in single precision, False
+        otherwise.
+    """
+    try:
+        single = struct.unpack('>f', struct.pack('>f', value))[0]
+    except OverflowError:
+        return False
+    return lossy or single == value or value != value
+
+
+def _cbor_head(major, length):
+    """Encode the head of a CBOR data item.
+
+    Args:
+        major (int): The major type.
+        length (int): The argument, i.e. a length or an unsigned integer.
+
+    Returns:
+        bytes: The head.
+    """
+    major <<= 5
+    if length < 24:
+        return struct.pack('>B', major | length)
+    if length < 0x100:
+        return struct.pack('>BB', major | 24, length)
+    if length < 0x10000:
+        return struct.pack('>BH', major | 25, length)
+    if length < 0x100000000:
+        return struct.pack('>BI', major | 26, length)
+    if length < 0x10000000000000000:
+        return struct.pack('>BQ', major | 27, length)
+    raise ValueError('Integer too large for CBOR: %d.' % length)
+
+
+def _encode_cbor(obj, chunks, single_floats):
+    """Encode an object into CBOR.
+
+    Args:
+        obj: The object.
+        chunks (list): List to which the encoded chunks are appended.
+        single_floats (bool): If True, floats are always written in single
+            precision.
+    """
+    if obj is None:
+        chunks.append(b'\xf6')
+    elif obj is True:
+        chunks.append(b'\xf5')
+    elif obj is False:
+        chunks.append(b'\xf4')
+    elif isinstance(obj, _INTEGER_TYPES):
+        chunks.append(_cbor_head(0, obj) if obj >= 0 else _cbor_head(1, -1 - obj))
+    elif isinstance(obj, float):
+        if _is_single(obj, single_floats):
+            chunks.append(struct.pack('>Bf', 0xfa, obj))
+        else:
+            chunks.append(struct.pack('>Bd', 0xfb, obj))
+    elif isinstance(obj, _TEXT_TYPES):
+        data = obj.encode('utf-8') if not (_PY2 and isinstance(obj, str)) else obj
+        chunks.append(_cbor_head(3, len(data)))
+        chunks.append(data)
+    elif isinstance(obj, _BINARY_TYPES):
+        chunks.append(_cbor_head(2, len(obj)))
+        chunks.append(bytes(obj))
+    elif isinstance(obj, (list, tuple)):
+        chunks.append(_cbor_head(4, len(obj)))
+        for item in obj:
+            _encode_cbor(item, chunks, single_floats)
+    elif isinstance(obj, dict):
+        chunks.append(_cbor_head(5, len(obj)))
+        for key, value in obj.items():
+            _encode_cbor(key, chunks, single_floats)
+            _encode_cbor(value, chunks, single_floats)
+    else:
+        raise TypeError('Cannot encode %s objects into CBOR.' % type(obj).__name__)
+
+
+def _decode_half(bits):
+    """Decode a half precision float.
+
+    Args:
+        bits (int): The 16 bits of the float.
+
+    Returns:
+        float: The value.
+    """
+    exponent = (bits >> 10) & 0x1f
+    mantissa = bits & 0x3ff
+    if exponent == 0:
+        value = mantissa * 2.0 ** -24
+    elif exponent == 0x1f:
+        value = float('nan') if mantissa else float('inf')
+    else:
+        value = (mantissa + 1024) * 2.0 ** (exponent - 25)
+    return -value if bits & 0x8000 else value
+
+
+def _read(data, offset, size):
+    """Read bytes from a buffer.
+
+    Args:
+        data (bytearray): The buffer.
+        offset (int): The offset of the bytes.
+        size (int): The number of bytes.
+
+    Returns:
+        tuple: The bytes and the offset following them.
+
+    Raises:
+        :exc:`ValueError` is raised if the buffer is too short.
+    """
+    end = offset + size
+    if end > len(data):
+        raise ValueError('Truncated payload.')
+    return data[offset:end], end
+
+
+def _decode_cbor(data, offset, depth):
+    """Decode a CBOR data item.
+
+    Args:
+        data (bytearray): The buffer.
+        offset (int): The offset of the data item.
+        depth (int): The nesting depth of the data item.
+
+    Returns:
+        tuple: The object and the offset following the data item.
+
+    Raises:
+        :exc:`ValueError` is raised if the data item is malformed, not
+            supported, or nested too deeply.
+    """
+    if depth > MAX_DEPTH:
+        raise ValueError('CBOR data item nested too deeply.')
+    head, offset = _read(data, offset, 1)
+    major = head[0] >> 5
+    info = head[0] & 0x1f
+    if major == 7:
+        if info == 20:
+            return False, offset
+        if info == 21:
+            return True, offset
+        if info in (22, 23):
+            return None, offset
+        if info == 25:
+            raw, offset = _read(data, offset, 2)
+            return _decode_half(struct.unpack('>H', bytes(raw))[0]), offset
+        if info == 26:
+            raw, offset = _read(data, offset, 4)
+            return struct.unpack('>f', bytes(raw))[0], offset
+        if info == 27:
+            raw, offset = _read(data, offset, 8)
+            return struct.unpack('>d', bytes(raw))[0], offset
+        raise ValueError('Unsupported CBOR simple value %d.' % info)
+    if info < 24:
+        argument = info
+    elif info <= 27:
+        size = 1 << (info - 24)
+        raw, offset = _read(data, offset, size)
+        argument = struct.unpack('>' + 'BHIQ'[info - 24], bytes(raw))[0]
+    else:
+        raise ValueError('Unsupported CBOR additional information %d.' % info)
+    if major == 0:
+        return argument, offset
+    if major == 1:
+        return -1 - argument, offset
+    if major == 2:
+        raw, offset = _read(data, offset, argument)
+        return bytes(raw), offset
+    if major == 3:
+        raw, offset = _read(data, offset, argument)
+        return raw.decode('utf-8'), offset
+    if major == 4:
+        items = []
+        for _ in range(argument):
+            item, offset = _decode_cbor(data, offset, depth + 1)
+            items.append(item)
+        return items, offset
+    if major == 5:
+        items = {}
+        for _ in range(argument):
+            key, offset = _decode_cbor(data, offset, depth + 1)
+            items[key], offset = _decode_cbor(data, offset, depth + 1)
+        return items, offset
+    # Tags are skipped.
+    return _decode_cbor(data, offset, depth + 1)
+
+
+def _encode_msgpack(obj, chunks, single_floats):
+    """Encode an object into MessagePack.
+
+    Args:
+        obj: The object.
+        chunks (list): List to which the encoded chunks are appended.
+        single_floats (bool): If True, floats are always written in single
+            precision.
+    """
+    if obj is None:
+        chunks.append(b'\xc0')
+    elif obj is True:
+        chunks.append(b'\xc3')
+    elif obj is False:
+        chunks.append(b'\xc2')
+    elif isinstance(obj, _INTEGER_TYPES):
+        if 0 <= obj < 0x80:
+            chunks.append(struct.pack('>B', obj))
+        elif -32 <= obj < 0:
+            chunks.append(struct.pack('>b', obj))
+        elif obj >= 0:
+            for limit, code, fmt in ((0x100, 0xcc, 'B'), (0x10000, 0xcd, 'H'), \
+                (0x100000000, 0xce, 'I'), (0x10000000000000000, 0xcf, 'Q')):
+                if obj < limit:
+                    chunks.append(struct.pack('>B' + fmt, code, obj))
+                    break
+            else:
+                raise ValueError('Integer too large for MessagePack: %d.' % obj)
+        else:
+            for limit, code, fmt in ((0x80, 0xd0, 'b'), (0x8000, 0xd1, 'h'), \
+                (0x80000000, 0xd2, 'i'), (0x8000000000000000, 0xd3, 'q')):
+                if obj >= -limit:
+                    chunks.append(struct.pack('>B' + fmt, code, obj))
+                    break
+            else:
+                raise ValueError('Integer too large for MessagePack: %d.' % obj)
+    elif isinstance(obj, float):
+        if _is_single(obj, single_floats):
+            chunks.append(struct.pack('>Bf', 0xca, obj))
+        else:
+            chunks.append(struct.pack('>Bd', 0xcb, obj))
+    elif isinstance(obj, _TEXT_TYPES):
+        data = obj.encode('utf-8') if not (_PY2 and isinstance(obj, str)) else obj
+        chunks.append(_msgpack_head(len(data), 0xa0, 32, (0xd9, 0xda, 0xdb)))
+        chunks.append(data)
+    elif isinstance(obj, _BINARY_TYPES):
+        chunks.append(_msgpack_head(len(obj), None, 0, (0xc4, 0xc5, 0xc6)))
+        chunks.append(bytes(obj))
+    elif isinstance(obj, (list, tuple)):
+        chunks.append(_msgpack_head(len(obj), 0x90, 16, (None, 0xdc, 0xdd)))
+        for item in obj:
+            _encode_msgpack(item, chunks, single_floats)
+    elif isinstance(obj, dict):
+        chunks.append(_msgpack_head(len(obj), 0x80, 16, (None, 0xde, 0xdf)))
+        for key, value in obj.items():
+            _encode_msgpack(key, chunks, single_floats)
+            _encode_msgpack(value, chunks, single_floats)
+    else:
+        raise TypeError('Cannot encode %s objects into MessagePack.' % type(obj).__name__)
+
+
+def _msgpack_head(length, fix_code, fix_limit, codes):
+    """Encode the head of a MessagePack string, array, or map.
+
+    Args:
+        length (int): The length.
+        fix_code (int): The code of the fixed-length form, if any.
+        fix_limit (int): The limit of the fixed-length form.
+        codes (tuple): The codes of the forms with 8, 16, and 32 bits lengths,
+            None if not available.
+
+    Returns:
+        bytes: The head.
+    """
+    if length < fix_limit:
+        return struct.pack('>B', fix_code | length)
+    if length < 0x100 and codes[0] is not None:
+        return struct.pack('>BB', codes[0], length)
+    if length < 0x10000:
+        return struct.pack('>BH', codes[1], length)
+    return struct.pack('>BI', codes[2], length)
+
+
+_MSGPACK_FORMATS = {
+    0xca: '>f', 0xcb: '>d',
+    0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q',
+    0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q'
+}
+"""Formats of the MessagePack numbers, keyed by code."""
+
+_MSGPACK_LENGTHS = {
+    0xc4: ('>B', 'bin'), 0xc5: ('>H', 'bin'), 0xc6: ('>I', 'bin'),
+    0xd9: ('>B', 'str'), 0xda: ('>H', 'str'), 0xdb: ('>I', 'str'),
+    0xdc: ('>H', 'array'), 0xdd: ('>I', 'array'),
+    0xde: ('>H', 'map'), 0xdf: ('>I', 'map')
+}
+"""Formats of the lengths and kinds of the MessagePack strings, arrays, and
+maps, keyed by code."""
+
+
+def _decode_msgpack(data, offset, depth):
+    """Decode a MessagePack object.
+
+    Args:
+        data (bytearray): The buffer.
+        offset (int): The offset of the object.
+        depth (int): The nesting depth of the object.
+
+    Returns:
+        tuple: The object and the offset following the object.
+
+    Raises:
+        :exc:`ValueError` is raised if the object is malformed, not
+            supported, or nested too deeply.
+    """
+    if depth > MAX_DEPTH:
+        raise ValueError('MessagePack object nested too deeply.')
+    head, offset = _read(data, offset, 1)
+    code = head[0]
+    if code < 0x80:
+        return code, offset
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if code == 0xc0:
+        return None, offset
+    if code == 0xc2:
+        return False, offset
+    if code == 0xc3:
+        return True, offset
+    if code in _MSGPACK_FORMATS:
+        fmt = _MSGPACK_FORMATS[code]
+        raw, offset = _read(data, offset, struct.calcsize(fmt))
+        return struct.unpack(fmt, bytes(raw))[0], offset
+    if 0xa0 <= code <= 0xbf:
+        kind, length = 'str', code & 0x1f
+    elif 0x90 <= code <= 0x9f:
+        kind, length = 'array', code & 0x0f
+    elif 0x80 <= code <= 0x8f:
+        kind, length = 'map', code & 0x0f
+    elif code in _MSGPACK_LENGTHS:
+        fmt, kind = _MSGPACK_LENGTHS[code]
+        raw, offset = _read(data, offset, struct.calcsize(fmt))
+        length = struct.unpack(fmt, bytes(raw))[0]
+    else:
+        raise ValueError('Unsupported MessagePack code 0x%02x.' % code)
+    if kind == 'str':
+        raw, offset = _read(data, offset, length)
+        return raw.decode('utf-8'), offset
+    if kind == 'bin':
+        raw, offset = _read(data, offset, length)
+        return bytes(raw), offset
+    if kind == 'array':
+        items = []
+        for _ in range(length):
+            item, offset = _decode_msgpack(data, offset, depth + 1)
+            items.append(item)
+        return items, offset
+    items = {}
+    for _ in range(length):
+        key, offset = _decode_msgpack(data, offset, depth + 1)
+        items[key], offset = _decode_msgpack(data, offset, depth + 1)
+    return items, offset
@@ -0,0 +1,452 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""sample_store
+
+The sample_store module keeps the most recent samples of the features of many
+devices, so that they can be written by the listeners of the features and read
+at any time by publishers running on other threads.
+
+Samples are stored per device into buffers of the :mod:`array` module which
+are allocated once, so that the memory taken by a device is fixed, appending a
+sample takes constant time, and no objects are allocated per sample. Each
+channel, i.e. a feature, is a ring of samples: the writer of a device always
+writes into a slot other than the one of the latest sample, and then publishes
+it by incrementing a counter, so that readers never lock and never see a
+partially written sample, e.g. an accelerometer sample with the new X value
+and the old Y and Z values.
+"""
+
+
+# IMPORT
+
+import threading
+import time
+from array import array
+
+from edge_st_sdk.telemetry.telemetry_encoder import get_feature_keys
+
+
+# CONSTANTS
+
+MIN_CAPACITY = 2
+"""Minimum number of samples per channel, needed to never write the latest
+sample while it is being read."""
+
+SNAPSHOT_RETRIES = 100
+"""Maximum number of attempts to read a channel while it is being written."""
+
+
+# CLASSES
+
+class _Channel(object):
+    """Ring of samples of a channel of a device."""
+
+    __slots__ = ('width', 'capacity', 'values', 'timestamps', 'written')
+
+    def __init__(self, width, capacity, typecode):
+        """Constructor.
+
+        Args:
+            width (int): Number of fields of a sample.
+            capacity (int): Number of samples.
+            typecode (str): Type code of the values, refer to :mod:`array`.
+        """
+        self.width = width
+        self.capacity = capacity
+        self.values = array(typecode, [0]) * (width * capacity)
+        self.timestamps = array('d', [0.0]) * capacity
+        self.written = 0
+
+
+class SampleSnapshot(object):
+    """Class holding a consistent copy of the latest samples of all the
+    channels of a device.
+
+    A snapshot can be given back to :meth:`DeviceSamples.snapshot` to be
+    refilled without allocating new buffers.
+    """
+
+    __slots__ = ('timestamps', 'values', 'valid')
+
+    def __init__(self, channels):
+        """Constructor.
+
+        Args:
+            channels (list): List of (width, typecode) tuples, one per
+                channel.
+        """
+        self.timestamps = array('d', [0.0]) * len(channels)
+        """Timestamps of the samples, one per channel."""
+        self.values = [array(typecode, [0]) * width \
+            for (width, typecode) in channels]
+        """Values of the samples, one array per channel."""
+        self.valid = [False] * len(channels)
+        """Whether a channel has got a sample, one flag per channel."""
+
+    def get_values(self, missing=None):
+        """Get the values of all the channels as a flat list.
+
+        Args:
+            missing: Value used for the fields of the channels without
+                samples.
+
+        Returns:
+            list: The values.
+        """
+        values = []
+        for (channel, channel_values) in enumerate(self.values):
+            if self.valid[channel]:
+                values.extend(channel_values)
+            else:
+                values.extend([missing] * len(channel_values))
+        return values
+
+
+class DeviceSamples(object):
+    """Class responsible for storing the samples of a device.
+
+    Writes are serialized by a lock, which is never contended when samples of
+    a device are written by a single thread, as it happens with BLE
+    notifications; reads never lock.
+    """
+
+    __slots__ = ('_channels', '_lock')
+
+    def __init__(self, channels, capacity):
+        """Constructor.
+
+        Args:
+            channels (list): List of (width, typecode) tuples, one per
+                channel.
+            capacity (int): Number of samples stored per channel.
+        """
+        self._channels = tuple(_Channel(width, capacity, typecode) \
+            for (width, typecode) in channels)
+        self._lock = threading.Lock()
+
+    def append(self, channel, values, timestamp=None):
+        """Append a sample to a channel, overwriting the oldest one if the
+        channel is full.
+
+        Args:
+            channel (int): Index of the channel.
+            values (list): Values of the sample, one per field.
+            timestamp (float): Time of the sample, in seconds since the epoch.
+                The current time if not given.
+
+        Raises:
+            :exc:`ValueError` is raised if the number of values does not match
+                the number of fields of the channel.
+        """
+        ring = self._channels[channel]
+        width = ring.width
+        if len(values) != width:
+            raise ValueError('Expected %d values, got %d.' % (width, len(values)))
+        with self._lock:
+            slot = ring.written % ring.capacity
+            start = slot * width
+            buffer = ring.values
+            for index in range(width):
+                buffer[start + index] = values[index]
+            ring.timestamps[slot] = time.time() if timestamp is None else timestamp
+            ring.written += 1
+
+    def get_count(self, channel):
+        """Get the number of samples appended to a channel so far.
+
+        Args:
+            channel (int): Index of the channel.
+
+        Returns:
+            int: The number of samples.
+        """
+        return self._channels[channel].written
+
+    def snapshot(self, out=None):
+        """Get a consistent copy of the latest sample of each channel.
+
+        Args:
+            out (:class:`SampleSnapshot`): A snapshot to refill, previously
+                returned by this method. A new one is allocated if not given.
+
+        Returns:
+            :class:`SampleSnapshot`: The snapshot.
+
+        Raises:
+            :exc:`RuntimeError` is raised if a channel could not be read
+                because of a writer appending samples faster than the reader
+                copies them.
+        """
+        if out is None:
+            out = SampleSnapshot([(ring.width, ring.values.typecode) \
+                for ring in self._channels])
+        for (channel, ring) in enumerate(self._channels):
+            width = ring.width
+            target = out.values[channel]
+            for _ in range(SNAPSHOT_RETRIES):
+                written = ring.written
+                if not written:
+                    out.valid[channel] = False
+                    break
+                slot = (written - 1) % ring.capacity
+                start = slot * width
+                buffer = ring.values
+                for index in range(width):
+                    target[index] = buffer[start + index]
+                out.timestamps[channel] = ring.timestamps[slot]
+                # The slot is overwritten only once "capacity - 1" further
+                # samples have been published.
+                if ring.written - written < ring.capacity - 1:
+                    out.valid[channel] = True
+                    break
+            else:
+                raise RuntimeError('Channel %d is being written too fast to be read.' \
+                    % channel)
+        return out
+
+    def get_series(self, channel, count=None):
+        """Get a consistent copy of the latest samples of a channel.
+
+        Args:
+            channel (int): Index of the channel.
+            count (int): Maximum number of samples. All the stored ones if not
+                given.
+
+        Returns:
+            tuple: A (timestamps, values) tuple of arrays, from the oldest to
+            the latest sample, with the values of each sample one after the
+            other.
+
+        Raises:
+            :exc:`RuntimeError` is raised if the channel could not be read
+                because of a writer appending samples faster than the reader
+                copies them.
+        """
+        ring = self._channels[channel]
+        width = ring.width
+        for _ in range(SNAPSHOT_RETRIES):
+            written = ring.written
+            # The latest slot is never written, hence at most "capacity - 1"
+            # samples can be read consistently while writing.
+            size = min(written, ring.capacity - 1)
+            if count is not None:
+                size = min(size, count)
+            timestamps = array('d')
+            values = array(ring.values.typecode)
+            for sample in range(written - size, written):
+                slot = sample % ring.capacity
+                timestamps.append(ring.timestamps[slot])
+                values.extend(ring.values[slot * width:(slot + 1) * width])
+            if ring.written - (written - size) < ring.capacity:
+                return (timestamps, values)
+        raise RuntimeError('Channel %d is being written too fast to be read.' \
+            % channel)
+
+
+class SampleStore(object):
+    """Class responsible for storing the samples of the features of many
+    devices.
+
+    The store is made of channels, each one with a fixed list of fields, e.g.
+    one channel per feature; each device added to the store gets the same
+    channels, allocated once.
+    """
+
+    def __init__(self, channels, capacity=MIN_CAPACITY):
+        """Constructor.
+
+        Args:
+            channels (list): List of (name, fields) or (name, fields, typecode)
+                tuples, one per channel, where "typecode" is the type code of
+                the values, refer to :mod:`array`, and defaults to 'd'.
+            capacity (int): Number of samples stored per channel and device,
+                at least :data:`MIN_CAPACITY`.
+
+        Raises:
+            :exc:`ValueError` is raised if the capacity is too small.
+        """
+        if capacity < MIN_CAPACITY:
+            raise ValueError('Capacity must be at least %d.' % MIN_CAPACITY)
+        self._capacity = capacity
+        self._names = []
+        self._fields = []
+        self._layout = []
+        self._indexes = {}
+        for channel in channels:
+            (name, fields) = channel[:2]
+            typecode = channel[2] if len(channel) > 2 else 'd'
+            self._indexes[name] = len(self._names)
+            self._names.append(name)
+            self._fields.append(list(fields))
+            self._layout.append((len(fields), typecode))
+        self._lock = threading.Lock()
+        self._devices = {}
+
+    @classmethod
+    def for_features(cls, features, capacity=MIN_CAPACITY, typecodes=None):
+        """Create a store with a channel per feature, named as the feature.
+
+        Args:
+            features (list): List of :class:`blue_st_sdk.feature.Feature`
+                objects.
+            capacity (int): Number of samples stored per channel and device.
+            typecodes (dict): Type codes of the values, keyed by feature name.
+                'd' for the features not given.
+
+        Returns:
+            :class:`SampleStore`: The store.
+        """
+        typecodes = typecodes or {}
+        return cls([(feature.get_name(), get_feature_keys(feature), \
+            typecodes.get(feature.get_name(), 'd')) for feature in features], \
+            capacity)
+
+    def get_channels(self):
+        """Get the names of the channels.
+
+        Returns:
+            list: The names of the channels.
+        """
+        return list(self._names)
+
+    def get_channel_index(self, name):
+        """Get the index of a channel.
+
+        Args:
+            name (str): Name of the channel.
+
+        Returns:
+            int: The index of the channel.
+        """
+        return self._indexes[name]
+
+    def get_fields(self, channel=None):
+        """Get the names of the fields.
+
+        Args:
+            channel (str): Name of the channel. All the channels if not given.
+
+        Returns:
+            list: The names of the fields, of all the channels one after the
+            other if no channel is given.
+        """
+        if channel is not None:
+            return list(self._fields[self._indexes[channel]])
+        return [field for fields in self._fields for field in fields]
+
+    def add_device(self, device_id):
+        """Add a device to the store, allocating its buffers.
+
+        Args:
+            device_id (str): Identifier of the device, e.g. the client
+                identifier.
+
+        Returns:
+            :class:`DeviceSamples`: The samples of the device.
+        """
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is None:
+                device = DeviceSamples(self._layout, self._capacity)
+                devices = dict(self._devices)
+                devices[device_id] = device
+                self._devices = devices
+            return device
+
+    def remove_device(self, device_id):
+        """Remove a device from the store.
+
+        Args:
+            device_id (str): Identifier of the device.
+        """
+        with self._lock:
+            devices = dict(self._devices)
+            devices.pop(device_id, None)
+            self._devices = devices
+
+    def get_device(self, device_id):
+        """Get the samples of a device.
+
+        Args:
+            device_id (str): Identifier of the device.
+
+        Returns:
+            :class:`DeviceSamples`: The samples of the device, or None if the
+            device has not been added.
+        """
+        return self._devices.get(device_id)
+
+    def get_devices(self):
+        """Get the identifiers of the devices.
+
+        Returns:
+            list: The identifiers of the devices.
+        """
+        return list(self._devices.keys())
+
+    def append(self, device_id, channel, values, timestamp=None):
+        """Append a sample to a channel of a device, adding the device if
+        needed.
+
+        Args:
+            device_id (str): Identifier of the device.
+            channel (str): Name of the channel.
+            values (list): Values of the sample, one per field.
+            timestamp (float): Time of the sample, in seconds since the epoch.
+                The current time if not given.
+        """
+        device = self._devices.get(device_id) or self.add_device(device_id)
+        device.append(self._indexes[channel], values, timestamp)
+
+    def append_sample(self, device_id, feature, sample):
+        """Append a sample of a BlueST feature of a device to the channel
+        named as the feature.
+
+        Args:
+            device_id (str): Identifier of the device.
+            feature (:class:`blue_st_sdk.feature.Feature`): The feature.
+            sample (:class:`blue_st_sdk.feature.Sample`): The sample.
+        """
+        self.append(device_id, feature.get_name(), sample.get_data())
+
+    def snapshot(self, device_id, out=None):
+        """Get a consistent copy of the latest sample of each channel of a
+        device.
+
+        Args:
+            device_id (str): Identifier of the device.
+            out (:class:`SampleSnapshot`): A snapshot to refill. A new one is
+                allocated if not given.
+
+        Returns:
+            :class:`SampleSnapshot`: The snapshot, or None if the device has
+            not been added.
+        """
+        device = self._devices.get(device_id)
+        return device.snapshot(out) if device is not None else None
@@ -0,0 +1,227 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""telemetry_encoder
+
+The telemetry_encoder module serializes the samples of BlueST features into
+JSON payloads, both for telemetry messages and for shadow documents.
+
+An encoder is compiled once for a fixed list of keys: the keys, the constant
+members, and the enclosing objects are formatted in advance into a template,
+so that encoding a sample only formats its values, e.g.:
+``{"Board_id":"IoT_Device_1","Temperature":25.1,"Humidity":40.2}`` or
+``{"state":{"desired":{"temperature":25.1,"humidity":40.2}}}``.
+"""
+
+
+# IMPORT
+
+import json
+
+
+# CONSTANTS
+
+_feature_keys = {}
+"""Names of the fields of the features, keyed by feature class and name."""
+
+
+# FUNCTIONS
+
+def get_feature_keys(feature):
+    """Get the names of the fields of a feature.
+
+    The description of the fields is retrieved only once per feature class
+    and name.
+
+    Args:
+        feature (:class:`blue_st_sdk.feature.Feature`): The feature.
+
+    Returns:
+        list: The names of the fields.
+    """
+    key = (type(feature), feature.get_name())
+    keys = _feature_keys.get(key)
+    if keys is None:
+        keys = [field.get_name() for field in feature.get_fields_description()]
+        _feature_keys[key] = keys
+    return keys
+
+
+def _format_value(value):
+    """Format a value as a JSON value, mapping the non-finite numbers to
+    null.
+
+    Args:
+        value: The value.
+
+    Returns:
+        str: The JSON value.
+    """
+    if type(value) is float and value - value:
+        return 'null'
+    return json.dumps(value)
+
+
+def _format_string(value):
+    """Format a value as a JSON string, as done by :func:`str`, with None
+    mapped to null.
+
+    Args:
+        value: The value.
+
+    Returns:
+        str: The JSON string.
+    """
+    if value is None:
+        return 'null'
+    return json.dumps(str(value))
+
+
+# CLASSES
+
+class TelemetryEncoder(object):
+    """Class responsible for serializing sequences of values with a fixed
+    list of keys into JSON documents.
+
+    Values which are int or finite float are formatted straight into the
+    precompiled template; any other value, e.g. None, is formatted through
+    :mod:`json`, with non-finite numbers mapped to null.
+    """
+
+    def __init__(self, keys, constants=None, path=None, as_strings=False):
+        """Constructor.
+
+        Args:
+            keys (list): Keys of the values to encode, in the order the values
+                are given.
+            constants (list): List of (key, value) constant members, placed
+                before the values.
+            path (list): Keys of the objects enclosing the members, from the
+                outermost one, e.g. ``['state', 'desired']`` for shadow
+                documents.
+            as_strings (bool): If True, the values are encoded as JSON strings,
+                as done by :func:`str`.
+        """
+        self._keys = list(keys)
+        self._size = len(self._keys)
+        self._format = _format_string if as_strings else _format_value
+        prefix = ''.join('{%s:' % json.dumps(key) for key in (path or []))
+        suffix = '}' * len(path or [])
+        members = ['%s:%s' % (json.dumps(key), json.dumps(value)) \
+            for key, value in (constants or [])]
+        keys = [json.dumps(key) for key in self._keys]
+        value_format = '"%s"' if as_strings else '%r'
+        self._template = self._compile(prefix, members, keys, value_format, suffix)
+        self._generic_template = self._compile(prefix, members, keys, '%s', suffix)
+
+    @staticmethod
+    def _compile(prefix, members, keys, value_format, suffix):
+        """Compile a template.
+
+        Args:
+            prefix (str): Beginning of the enclosing objects.
+            members (list): Constant members, formatted.
+            keys (list): Keys of the values, formatted.
+            value_format (str): Placeholder of the values.
+            suffix (str): End of the enclosing objects.
+
+        Returns:
+            str: The template, to be formatted with the "%" operator.
+        """
+        escape = lambda text: text.replace('%', '%%')
+        return escape(prefix) + '{' + ','.join( \
+            [escape(member) for member in members] \
+            + ['%s:%s' % (escape(key), value_format) for key in keys]) \
+            + '}' + escape(suffix)
+
+    @classmethod
+    def for_feature(cls, feature, constants=None, path=None, \
+        as_strings=False, key_map=None):
+        """Compile an encoder for the samples of a feature.
+
+        Args:
+            feature (:class:`blue_st_sdk.feature.Feature`): The feature.
+            constants (list): List of (key, value) constant members.
+            path (list): Keys of the objects enclosing the members.
+            as_strings (bool): If True, the values are encoded as JSON strings.
+            key_map (dict): Keys to use instead of the names of the fields,
+                keyed by field name.
+
+        Returns:
+            :class:`TelemetryEncoder`: The encoder.
+        """
+        keys = get_feature_keys(feature)
+        if key_map:
+            keys = [key_map.get(key, key) for key in keys]
+        return cls(keys, constants, path, as_strings)
+
+    def get_keys(self):
+        """Get the keys of the values to encode.
+
+        Returns:
+            list: The keys.
+        """
+        return list(self._keys)
+
+    def encode(self, values):
+        """Encode a sequence of values.
+
+        Args:
+            values (list): The values, one per key.
+
+        Returns:
+            str: The JSON document.
+
+        Raises:
+            :exc:`ValueError` is raised if the number of values does not match
+                the number of keys.
+        """
+        if len(values) != self._size:
+            raise ValueError('Expected %d values, got %d.' \
+                % (self._size, len(values)))
+        for value in values:
+            value_type = type(value)
+            if value_type is float:
+                if value - value:
+                    break
+            elif value_type is not int:
+                break
+        else:
+            return self._template % tuple(values)
+        return self._generic_template % tuple(self._format(v) for v in values)
+
+    def encode_sample(self, sample):
+        """Encode the data of a sample of a feature.
+
+        Args:
+            sample (:class:`blue_st_sdk.feature.Sample`): The sample.
+
+        Returns:
+            str: The JSON document.
+        """
+        return self.encode(sample.get_data())
@@ -0,0 +1,460 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""window_aggregator
+
+The window_aggregator module summarizes the samples of BlueST features over
+windows, so that only the summaries need to be published instead of every
+sample, or instead of the last sample only.
+
+Samples are kept in NumPy ring buffers, one per feature holding the last
+samples of all the devices, so that the statistics of the windows are computed
+for all the devices at once. Windows are either tumbling, i.e. emptied every
+time they are summarized, or sliding, i.e. always holding the most recent
+samples.
+
+The samples get into the windows through :class:`WindowListener` objects,
+i.e. feature listeners, and the summaries are published periodically by a
+:class:`WindowPublisher`, one message per device.
+
+Please note that this module requires NumPy.
+"""
+
+
+# IMPORT
+
+import threading
+
+import numpy
+
+from edge_st_sdk.telemetry.telemetry_encoder import get_feature_keys
+
+
+# CLASSES
+
+class FeatureWindow(object):
+    """Class responsible for holding the last samples of a feature for many
+    devices, and for computing their statistics.
+
+    Devices are identified by an index between zero and the maximum number of
+    devices. All methods are thread-safe.
+    """
+
+    STATISTICS = ('min', 'max', 'mean', 'std', 'count')
+    """Available statistics."""
+
+    def __init__(self, fields, max_devices, window_size, tumbling=True, \
+        statistics=STATISTICS):
+        """Constructor.
+
+        Args:
+            fields (list): Names of the fields of the feature.
+            max_devices (int): Maximum number of devices.
+            window_size (int): Maximum number of samples per window.
+            tumbling (bool): If True, windows are emptied every time they are
+                summarized; if False, windows slide, i.e. they always hold the
+                most recent samples, at most "window_size" of them.
+            statistics (list): Statistics to compute among
+                :attr:`STATISTICS`.
+
+        Raises:
+            :exc:`ValueError` is raised if a statistic is unknown.
+        """
+        unknown = set(statistics) - set(self.STATISTICS)
+        if unknown:
+            raise ValueError('Unknown statistics: %s.' % ', '.join(sorted(unknown)))
+        self._fields = list(fields)
+        self._window_size = window_size
+        self._tumbling = tumbling
+        self._statistics = [s for s in self.STATISTICS if s in statistics]
+        self._lock = threading.Lock()
+        self._data = numpy.full((max_devices, window_size, len(self._fields)), numpy.nan)
+        self._next = numpy.zeros(max_devices, dtype=numpy.intp)
+        self._count = numpy.zeros(max_devices, dtype=numpy.intp)
+
+    def get_fields(self):
+        """Get the names of the fields of the feature.
+
+        Returns:
+            list: The names of the fields.
+        """
+        return list(self._fields)
+
+    def get_statistics(self):
+        """Get the statistics computed.
+
+        Returns:
+            list: The statistics.
+        """
+        return list(self._statistics)
+
+    def add(self, device, values):
+        """Add a sample of a device.
+
+        Args:
+            device (int): Index of the device.
+            values (list): Values of the sample, one per field. None values
+                are ignored by the statistics.
+        """
+        values = [numpy.nan if value is None else value for value in values]
+        with self._lock:
+            index = self._next[device]
+            self._data[device, index] = values
+            self._next[device] = (index + 1) % self._window_size
+            if self._count[device] < self._window_size:
+                self._count[device] += 1
+
+    def add_many(self, devices, values):
+        """Add a sample of many devices at once.
+
+        Args:
+            devices (list): Indexes of the devices, each one at most once.
+            values (list): Values of the samples, one row per device and one
+                column per field.
+        """
+        devices = numpy.asarray(devices, dtype=numpy.intp)
+        values = numpy.asarray(values, dtype=numpy.float64)
+        with self._lock:
+            indexes = self._next[devices]
+            self._data[devices, indexes] = values
+            self._next[devices] = (indexes + 1) % self._window_size
+            self._count[devices] = numpy.minimum(self._count[devices] + 1, self._window_size)
+
+    def summarize(self):
+        """Compute the statistics of the windows of all the devices, and empty
+        the windows if tumbling.
+
+        Returns:
+            dict: The statistics, keyed by name, each one as an array with one
+            row per device and one column per field; the "count" statistic
+            counts the samples of the windows, missing values included. Rows
+            of devices without samples hold NaN values.
+        """
+        with self._lock:
+            data = self._data.copy() if self._tumbling is False else self._data
+            count = self._count.copy()
+            if self._tumbling:
+                self._data = numpy.full_like(data, numpy.nan)
+                self._next[:] = 0
+                self._count[:] = 0
+        summary = {}
+        valid = data == data
+        size = valid.sum(axis=1)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            if 'min' in self._statistics:
+                summary['min'] = numpy.where(valid, data, numpy.inf).min(axis=1)
+                summary['min'][size == 0] = numpy.nan
+            if 'max' in self._statistics:
+                summary['max'] = numpy.where(valid, data, -numpy.inf).max(axis=1)
+                summary['max'][size == 0] = numpy.nan
+            if 'mean' in self._statistics or 'std' in self._statistics:
+                mean = numpy.where(valid, data, 0).sum(axis=1) / size
+                if 'mean' in self._statistics:
+                    summary['mean'] = mean
+                if 'std' in self._statistics:
+                    deviation = numpy.where(valid, data - mean[:, numpy.newaxis, :], 0)
+                    summary['std'] = numpy.sqrt((deviation * deviation).sum(axis=1) / size)
+        if 'count' in self._statistics:
+            summary['count'] = count
+        return summary
+
+
+class WindowAggregator(object):
+    """Class responsible for summarizing the samples of the features of many
+    devices over windows.
+
+    Each feature can be given its own window size and statistics through
+    :meth:`add_feature`; the other features get the default ones when their
+    first sample comes in. All methods are thread-safe.
+    """
+
+    def __init__(self, max_devices, window_size, tumbling=True, \
+        statistics=FeatureWindow.STATISTICS):
+        """Constructor.
+
+        Args:
+            max_devices (int): Maximum number of devices.
+            window_size (int): Default maximum number of samples per window.
+            tumbling (bool): Default kind of windows, refer to
+                :class:`FeatureWindow`.
+            statistics (list): Default statistics, among
+                :attr:`FeatureWindow.STATISTICS`.
+        """
+        self._max_devices = max_devices
+        self._window_size = window_size
+        self._tumbling = tumbling
+        self._statistics = statistics
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._device_ids = []
+        self._windows = {}
+
+    def add_feature(self, feature_name, fields, window_size=None, \
+        tumbling=None, statistics=None):
+        """Configure the windows of a feature.
+
+        Args:
+            feature_name (str): Name of the feature.
+            fields (list): Names of the fields of the feature.
+            window_size (int): Maximum number of samples per window. The
+                default one if not given.
+            tumbling (bool): Kind of windows. The default one if not given.
+            statistics (list): Statistics to compute. The default ones if not
+                given.
+
+        Returns:
+            :class:`FeatureWindow`: The windows of the feature.
+        """
+        window = FeatureWindow(fields, self._max_devices, \
+            window_size if window_size is not None else self._window_size, \
+            tumbling if tumbling is not None else self._tumbling, \
+            statistics if statistics is not None else self._statistics)
+        with self._lock:
+            self._windows[feature_name] = window
+        return window
+
+    def get_device_index(self, device_id):
+        """Get the index of a device within the windows, assigning a new one
+        the first time.
+
+        Args:
+            device_id (str): Identifier of the device, e.g. the client
+                identifier.
+
+        Returns:
+            int: The index of the device.
+
+        Raises:
+            :exc:`ValueError` is raised if the maximum number of devices has
+                been reached.
+        """
+        index = self._devices.get(device_id)
+        if index is not None:
+            return index
+        with self._lock:
+            index = self._devices.get(device_id)
+            if index is None:
+                if len(self._device_ids) >= self._max_devices:
+                    raise ValueError('Maximum number of devices reached: %d.' \
+                        % self._max_devices)
+                index = len(self._device_ids)
+                self._device_ids.append(device_id)
+                self._devices[device_id] = index
+            return index
+
+    def add_sample(self, device_id, feature_name, values):
+        """Add a sample of a feature of a device.
+
+        Args:
+            device_id (str): Identifier of the device.
+            feature_name (str): Name of the feature, which must have been
+                configured through :meth:`add_feature`.
+            values (list): Values of the sample, one per field.
+        """
+        self._windows[feature_name].add(self.get_device_index(device_id), values)
+
+    def add_feature_sample(self, device_id, feature, sample):
+        """Add a sample of a BlueST feature of a device, configuring the
+        windows of the feature with the default settings if needed.
+
+        Args:
+            device_id (str): Identifier of the device.
+            feature (:class:`blue_st_sdk.feature.Feature`): The feature.
+            sample (:class:`blue_st_sdk.feature.Sample`): The sample.
+        """
+        window = self._windows.get(feature.get_name())
+        if window is None:
+            window = self.add_feature(feature.get_name(), get_feature_keys(feature))
+        window.add(self.get_device_index(device_id), sample.get_data())
+
+    def summarize(self):
+        """Compute the statistics of the windows of all the features and
+        devices, and empty the tumbling windows.
+
+        Returns:
+            dict: The statistics keyed by device identifier, then by feature
+            name, then by field name, then by statistic name, e.g.
+            ``{'IoT_Device_1': {'Temperature': {'Temperature': {'mean': 25.1,
+            'count': 5}}}}``. Devices and features without samples are
+            omitted; statistics of fields without values are None.
+        """
+        with self._lock:
+            windows = list(self._windows.items())
+            device_ids = list(self._device_ids)
+        summaries = {}
+        for feature_name, window in windows:
+            summary = window.summarize()
+            fields = window.get_fields()
+            count = summary.get('count')
+            rows = dict((name, values[:len(device_ids)].tolist()) \
+                for name, values in summary.items())
+            for index, device_id in enumerate(device_ids):
+                if count is not None and not count[index]:
+                    continue
+                feature_summary = {}
+                for field_index, field in enumerate(fields):
+                    field_summary = {}
+                    for name, values in rows.items():
+                        value = values[index]
+                        if name != 'count':
+                            value = value[field_index]
+                            if value != value:
+                                value = None
+                        field_summary[name] = value
+                    feature_summary[field] = field_summary
+                if count is None and all(v is None for f in feature_summary.values() \
+                    for v in f.values()):
+                    continue
+                summaries.setdefault(device_id, {})[feature_name] = feature_summary
+        return summaries
+
+
+class WindowListener(object):
+    """Feature listener adding the samples of a device's features to the
+    windows of an aggregator, e.g. to be registered on the features through
+    :meth:`edge_st_sdk.gateway.notification_pump.NotificationPump.add_listener`.
+    """
+
+    __slots__ = ('_aggregator', '_device_id')
+
+    def __init__(self, aggregator, device_id):
+        """Constructor.
+
+        Args:
+            aggregator (:class:`WindowAggregator`): The aggregator.
+            device_id (str): Identifier of the device the features belong to.
+        """
+        self._aggregator = aggregator
+        self._device_id = device_id
+
+    def on_update(self, feature, sample):
+        """Add a sample to the windows of its feature.
+
+        Args:
+            feature (:class:`blue_st_sdk.feature.Feature`): The feature.
+            sample (:class:`blue_st_sdk.feature.Sample`): The sample.
+        """
+        self._aggregator.add_feature_sample(self._device_id, feature, sample)
+
+
+class WindowPublisher(object):
+    """Class responsible for publishing the summaries of the windows of an
+    aggregator periodically, instead of the samples.
+
+    Each device's summary is published by its own client as a single message,
+    encoded in the format of the topic, i.e. a document holding the identifier
+    of the device under the "Board_id" key, and the statistics of its features
+    as returned by :meth:`WindowAggregator.summarize`.
+    """
+
+    DEVICE_KEY = 'Board_id'
+    """Key of the published documents holding the identifier of the device."""
+
+    def __init__(self, aggregator, period_s):
+        """Constructor.
+
+        Args:
+            aggregator (:class:`WindowAggregator`): The aggregator.
+            period_s (float): Publishing period in seconds, i.e. the duration
+                of the tumbling windows.
+        """
+        self._aggregator = aggregator
+        self._period_s = period_s
+        self._lock = threading.Lock()
+        self._destinations = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def add_client(self, device_id, client, topic, qos=0):
+        """Publish the summaries of a device.
+
+        Args:
+            device_id (str): Identifier of the device.
+            client (:class:`edge_st_sdk.edge_client.EdgeClient`): Client
+                publishing the summaries.
+            topic (str): Topic name to publish to.
+            qos (int): Quality of Service. Could be "0" or "1".
+        """
+        with self._lock:
+            self._destinations[device_id] = (client, topic, qos)
+
+    def remove_client(self, device_id):
+        """Stop publishing the summaries of a device.
+
+        Args:
+            device_id (str): Identifier of the device.
+        """
+        with self._lock:
+            self._destinations.pop(device_id, None)
+
+    def publish(self):
+        """Summarize the windows and publish the summaries of the devices with
+        samples.
+
+        Returns:
+            int: The number of summaries published.
+        """
+        summaries = self._aggregator.summarize()
+        with self._lock:
+            destinations = dict(self._destinations)
+        published = 0
+        for device_id, summary in summaries.items():
+            destination = destinations.get(device_id)
+            if destination is None:
+                continue
+            (client, topic, qos) = destination
+            document = dict(summary)
+            document[self.DEVICE_KEY] = device_id
+            try:
+                client.publish_object(topic, document, qos)
+                published += 1
+            except Exception as e:
+                print('Publishing the summary of %s failed: %s' % (device_id, str(e)))
+        return published
+
+    def start(self):
+        """Start publishing the summaries on a separate thread."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop publishing the summaries."""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        """Publish the summaries every period."""
+        while not self._stop_event.wait(self._period_s):
+            self.publish()
@@ -0,0 +1,6 @@
+__all__ = [
+    'certificates', \
+    'local_broker', \
+    'local_core', \
+    'local_discovery'
+]
@@ -0,0 +1,197 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""certificates
+
+The certificates module generates the certificates needed to run the local
+stand-ins of the Greengrass core and of the discovery service: a certification
+authority, playing the role of both the Amazon root one and the one of the
+group, a server certificate valid for the local host, and a device
+certificate.
+
+The certificates are generated through the "openssl" command line tool, so
+that no further Python packages are needed.
+"""
+
+
+# IMPORT
+
+import os
+import ssl
+import subprocess
+import tempfile
+
+from edge_st_sdk.utils.edge_st_exceptions import ConfigurationException
+
+
+# CONSTANTS
+
+OPENSSL = 'openssl'
+"""Command running the OpenSSL command line tool."""
+
+VALIDITY_DAYS = 7
+"""Validity of the certificates, in days."""
+
+SERVER_NAMES = ('DNS:localhost', 'IP:127.0.0.1')
+"""Subject alternative names of the server certificate."""
+
+
+# CLASSES
+
+class Certificates(object):
+    """Class holding the paths of a set of generated certificates."""
+
+    __slots__ = ('path', 'ca_certificate_path', 'ca_private_key_path', \
+        'server_certificate_path', 'server_private_key_path', \
+        'device_certificate_path', 'device_private_key_path')
+
+    def __init__(self, path):
+        """Constructor.
+
+        Args:
+            path (str): Directory holding the certificates.
+        """
+        self.path = path
+        self.ca_certificate_path = os.path.join(path, 'ca.crt')
+        self.ca_private_key_path = os.path.join(path, 'ca.key')
+        self.server_certificate_path = os.path.join(path, 'server.crt')
+        self.server_private_key_path = os.path.join(path, 'server.key')
+        self.device_certificate_path = os.path.join(path, 'device.crt')
+        self.device_private_key_path = os.path.join(path, 'device.key')
+
+    def get_ca_certificate(self):
+        """Get the certificate of the certification authority.
+
+        Returns:
+            str: The certificate, PEM encoded.
+        """
+        with open(self.ca_certificate_path) as f:
+            return f.read()
+
+
+# FUNCTIONS
+
+def _run(path, *args):
+    """Run the OpenSSL command line tool.
+
+    Args:
+        path (str): Working directory.
+        *args: Arguments of the tool.
+
+    Raises:
+        :exc:`edge_st_sdk.utils.edge_st_exceptions.ConfigurationException`
+        if the tool is missing or fails.
+    """
+    try:
+        process = subprocess.Popen((OPENSSL,) + args, cwd=path, \
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise ConfigurationException( \
+            'Cannot run "%s": %s' % (OPENSSL, str(e)))
+    (_, error) = process.communicate()
+    if process.returncode != 0:
+        raise ConfigurationException('"%s %s" failed: %s' % (OPENSSL, \
+            args[0], error.decode('utf-8', 'replace').strip()))
+
+
+def _issue(path, name, common_name, extensions):
+    """Issue a certificate signed by the certification authority.
+
+    Args:
+        path (str): Directory holding the certificates.
+        name (str): Base name of the files of the certificate.
+        common_name (str): Common name of the subject.
+        extensions (str): X.509 v3 extensions of the certificate, in the
+            format of the OpenSSL configuration files.
+    """
+    extensions_path = os.path.join(path, name + '.ext')
+    with open(extensions_path, 'w') as f:
+        f.write(extensions)
+    _run(path, 'req', '-new', '-newkey', 'rsa:2048', '-nodes', \
+        '-keyout', name + '.key', '-out', name + '.csr', \
+        '-subj', '/CN=' + common_name)
+    _run(path, 'x509', '-req', '-in', name + '.csr', '-CA', 'ca.crt', \
+        '-CAkey', 'ca.key', '-CAcreateserial', '-out', name + '.crt', \
+        '-days', str(VALIDITY_DAYS), '-sha256', '-extfile', name + '.ext')
+
+
+def generate_certificates(path=None):
+    """Generate a certification authority, a server certificate, and a device
+    certificate.
+
+    Args:
+        path (str): Directory where the certificates are written, created if
+            needed. A new temporary directory if not given.
+
+    Returns:
+        :class:`Certificates`: The certificates.
+
+    Raises:
+        :exc:`edge_st_sdk.utils.edge_st_exceptions.ConfigurationException`
+        if the OpenSSL command line tool is missing or fails.
+    """
+    if path is None:
+        path = tempfile.mkdtemp(prefix='edge_st_certificates_')
+    elif not os.path.exists(path):
+        os.makedirs(path)
+    _run(path, 'req', '-x509', '-new', '-newkey', 'rsa:2048', '-nodes', \
+        '-keyout', 'ca.key', '-out', 'ca.crt', '-days', str(VALIDITY_DAYS), \
+        '-sha256', '-subj', '/CN=EdgeSTSDK Local CA')
+    _issue(path, 'server', 'localhost', \
+        'basicConstraints=CA:FALSE\n' \
+        'keyUsage=digitalSignature,keyEncipherment\n' \
+        'extendedKeyUsage=serverAuth\n' \
+        'subjectAltName=%s\n' % (','.join(SERVER_NAMES)))
+    _issue(path, 'device', 'EdgeSTSDK Local Device', \
+        'basicConstraints=CA:FALSE\n' \
+        'keyUsage=digitalSignature,keyEncipherment\n' \
+        'extendedKeyUsage=clientAuth\n')
+    return Certificates(path)
+
+
+def create_server_context(certificates, require_client_certificate=True):
+    """Create the TLS context of a server authenticating with the server
+    certificate.
+
+    Args:
+        certificates (:class:`Certificates`): The certificates.
+        require_client_certificate (bool): If True, clients must authenticate
+            with a certificate signed by the certification authority, as
+            devices do with the Greengrass core and the discovery service.
+
+    Returns:
+        :class:`ssl.SSLContext`: The context.
+    """
+    context = ssl.SSLContext(getattr(ssl, 'PROTOCOL_TLS_SERVER', \
+        ssl.PROTOCOL_SSLv23))
+    context.load_cert_chain(certificates.server_certificate_path, \
+        certificates.server_private_key_path)
+    if require_client_certificate:
+        context.load_verify_locations(certificates.ca_certificate_path)
+        context.verify_mode = ssl.CERT_REQUIRED
+    return context
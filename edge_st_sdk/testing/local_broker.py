@@ -0,0 +1,836 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""local_broker
+
+The local_broker module runs a stand-in of the MQTT broker of a Greengrass
+core within the process, so that the clients of the SDK can be exercised and
+measured without an Amazon AWS account, e.g. by the benchmarks.
+
+The broker speaks MQTT 3.1 and 3.1.1 over TLS, with mutual authentication as
+the Greengrass core does, and supports the quality of service levels 0 and 1,
+wildcard subscriptions, and keep-alive. Retained messages and persistent
+sessions are not supported. Requests published to the shadow topics of any
+thing are served by the broker itself, which keeps the shadow documents in
+memory and answers on the "accepted", "rejected", "delta", and "documents"
+topics as the shadow service does.
+
+Each connection is served by its own thread, which is the only one touching
+its TLS socket: messages for a client are queued, and the thread is woken up
+to send them.
+"""
+
+
+# IMPORT
+
+import json
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+from edge_st_sdk.testing.certificates import create_server_context
+from edge_st_sdk.utils import shadow_document
+
+
+# CONSTANTS
+
+WAIT_s = 0.5
+"""Maximum time waited by the threads of the broker before checking whether
+it has been stopped."""
+
+SHADOW_OPERATIONS = ('get', 'update', 'delete')
+"""Operations of the shadow requests served by the broker."""
+
+_CONNECT = 1
+_CONNACK = 2
+_PUBLISH = 3
+_PUBACK = 4
+_SUBSCRIBE = 8
+_SUBACK = 9
+_UNSUBSCRIBE = 10
+_UNSUBACK = 11
+_PINGREQ = 12
+_PINGRESP = 13
+_DISCONNECT = 14
+"""Types of the MQTT control packets."""
+
+
+# FUNCTIONS
+
+def match_topic(topic_filter, topic):
+    """Check whether a topic name matches a topic filter.
+
+    Args:
+        topic_filter (str): The topic filter, possibly with "+" and "#"
+            wildcards.
+        topic (str): The topic name.
+
+    Returns:
+        bool: True if the topic name matches the filter, False otherwise.
+    """
+    if topic_filter == topic:
+        return True
+    # Topics starting with "$" are not matched by leading wildcards.
+    if topic.startswith('$') and topic_filter[:1] in ('+', '#'):
+        return False
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for (index, level) in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if index == len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[index]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def _encode_string(value):
+    """Encode a string as an MQTT length-prefixed UTF-8 string.
+
+    Args:
+        value (str): The string.
+
+    Returns:
+        bytearray: The encoded string.
+    """
+    data = value.encode('utf-8')
+    return bytearray(struct.pack('!H', len(data))) + bytearray(data)
+
+
+def _encode_packet(header, body):
+    """Encode an MQTT control packet.
+
+    Args:
+        header (int): First byte of the fixed header.
+        body (bytearray): Variable header and payload.
+
+    Returns:
+        bytes: The packet.
+    """
+    packet = bytearray([header])
+    length = len(body)
+    while True:
+        byte = length % 128
+        length //= 128
+        packet.append(byte | 0x80 if length else byte)
+        if not length:
+            break
+    return bytes(packet + body)
+
+
+def _delta(desired, reported):
+    """Compute the part of the desired state differing from the reported one.
+
+    Args:
+        desired (dict): The desired state.
+        reported (dict): The reported state.
+
+    Returns:
+        dict: The delta, empty if there are no differences.
+    """
+    delta = {}
+    for (key, value) in desired.items():
+        if isinstance(value, dict) and isinstance(reported.get(key), dict):
+            nested = _delta(value, reported[key])
+            if nested:
+                delta[key] = nested
+        elif key not in reported or reported[key] != value:
+            delta[key] = value
+    return delta
+
+
+# CLASSES
+
+class _Session(object):
+    """Connection of a client to the broker."""
+
+    __slots__ = ('socket', 'address', 'client_id', 'subscriptions', 'outbox', \
+        'lock', 'wake_reader', 'wake_writer', 'packet_id', 'keep_alive_s', \
+        'closed')
+
+    def __init__(self, client_socket, address):
+        """Constructor.
+
+        Args:
+            client_socket (:class:`socket.socket`): Socket of the connection,
+                before the TLS handshake.
+            address (tuple): Address of the client.
+        """
+        self.socket = client_socket
+        self.address = address
+        self.client_id = None
+        self.subscriptions = {}
+        self.outbox = deque()
+        self.lock = threading.Lock()
+        (self.wake_reader, self.wake_writer) = socket.socketpair()
+        self.packet_id = 0
+        self.keep_alive_s = 0
+        self.closed = False
+
+    def send(self, packet):
+        """Queue a packet, waking the thread of the session up to send it.
+
+        Args:
+            packet (bytes): The packet.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.outbox.append(packet)
+            if len(self.outbox) == 1:
+                try:
+                    self.wake_writer.send(b'\x00')
+                except socket.error:
+                    pass
+
+    def next_packet_id(self):
+        """Get the identifier of the next packet sent with quality of service
+        1.
+
+        Returns:
+            int: The identifier.
+        """
+        with self.lock:
+            self.packet_id = self.packet_id % 65535 + 1
+            return self.packet_id
+
+
+class LocalBroker(object):
+    """Class responsible for running a stand-in of the MQTT broker of a
+    Greengrass core, shadow service included.
+    """
+
+    def __init__(self, certificates, host='127.0.0.1', port=0, \
+        require_client_certificate=True):
+        """Constructor.
+
+        Args:
+            certificates
+                (:class:`edge_st_sdk.testing.certificates.Certificates`): The
+                certificates of the broker and of its certification authority.
+            host (str): Address to listen to. Local connections only by
+                default.
+            port (int): Port to listen to. A free port is chosen if 0.
+            require_client_certificate (bool): If True, clients must
+                authenticate with a certificate signed by the certification
+                authority.
+        """
+        self._context = create_server_context(certificates, \
+            require_client_certificate)
+        self._server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server_socket.bind((host, port))
+        self._lock = threading.Lock()
+        self._sessions = []
+        self._shadows = {}
+        self._publish_callbacks = []
+        self._received = 0
+        self._delivered = 0
+        self._running = False
+        self._thread = None
+        self._threads = []
+
+    def get_host(self):
+        """Get the address the broker listens to.
+
+        Returns:
+            str: The address.
+        """
+        return self._server_socket.getsockname()[0]
+
+    def get_port(self):
+        """Get the port the broker listens to.
+
+        Returns:
+            int: The port.
+        """
+        return self._server_socket.getsockname()[1]
+
+    def start(self):
+        """Start accepting connections on a separate thread."""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._server_socket.listen(128)
+        self._server_socket.settimeout(WAIT_s)
+        self._thread = threading.Thread(target=self._accept)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the broker, closing the connections of the clients."""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            sessions = list(self._sessions)
+            threads = list(self._threads)
+        self._thread.join()
+        self._thread = None
+        self._server_socket.close()
+        for session in sessions:
+            self._close(session)
+        for thread in threads:
+            thread.join(WAIT_s * 2)
+
+    def add_publish_callback(self, callback):
+        """Add a callback notified of the messages published to the broker.
+
+        Args:
+            callback (function): Function called with the client identifier,
+                the topic name, and the payload of each message, on the thread
+                of the publishing client. It should return quickly.
+        """
+        with self._lock:
+            self._publish_callbacks.append(callback)
+
+    def remove_publish_callback(self, callback):
+        """Remove a callback notified of the messages published to the broker.
+
+        Args:
+            callback (function): The callback.
+        """
+        with self._lock:
+            self._publish_callbacks = [c for c in self._publish_callbacks \
+                if c != callback]
+
+    def publish(self, topic, payload, qos=0):
+        """Publish a message to the subscribed clients, as if it came from the
+        cloud.
+
+        Args:
+            topic (str): Topic name.
+            payload (str): Payload.
+            qos (int): Quality of Service. Could be "0" or "1".
+        """
+        if not isinstance(payload, bytes):
+            payload = payload.encode('utf-8')
+        self._route(topic, payload, qos)
+
+    def get_shadow(self, thing_name):
+        """Get the state of the shadow of a thing.
+
+        Args:
+            thing_name (str): Name of the thing.
+
+        Returns:
+            dict: A copy of the shadow document, with the "state" and
+            "version" keys, or None if the shadow does not exist.
+        """
+        with self._lock:
+            shadow = self._shadows.get(thing_name)
+            if shadow is None:
+                return None
+            return json.loads(json.dumps(shadow))
+
+    def get_received(self):
+        """Get the number of messages published to the broker.
+
+        Returns:
+            int: The number of messages.
+        """
+        return self._received
+
+    def get_delivered(self):
+        """Get the number of messages delivered to the clients.
+
+        Returns:
+            int: The number of messages.
+        """
+        return self._delivered
+
+    def get_clients(self):
+        """Get the identifiers of the connected clients.
+
+        Returns:
+            list: The client identifiers.
+        """
+        with self._lock:
+            return [session.client_id for session in self._sessions \
+                if session.client_id is not None]
+
+    def _accept(self):
+        """Accept the connections, serving each one on its own thread."""
+        while self._running:
+            try:
+                (client_socket, address) = self._server_socket.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                if self._running:
+                    time.sleep(WAIT_s)
+                continue
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _Session(client_socket, address)
+            thread = threading.Thread(target=self._serve, args=(session,))
+            thread.daemon = True
+            with self._lock:
+                if not self._running:
+                    client_socket.close()
+                    return
+                self._sessions.append(session)
+                self._threads = [t for t in self._threads if t.is_alive()]
+                self._threads.append(thread)
+            thread.start()
+
+    def _close(self, session):
+        """Close the connection of a client.
+
+        Args:
+            session (:class:`_Session`): The session.
+        """
+        with session.lock:
+            if session.closed:
+                return
+            session.closed = True
+            session.outbox.clear()
+            try:
+                session.wake_writer.send(b'\x00')
+            except socket.error:
+                pass
+
+    def _serve(self, session):
+        """Serve the connection of a client until it is closed.
+
+        Args:
+            session (:class:`_Session`): The session.
+        """
+        try:
+            session.socket.settimeout(WAIT_s * 4)
+            session.socket = self._context.wrap_socket(session.socket, \
+                server_side=True)
+            session.socket.settimeout(None)
+            last_packet_s = time.time()
+            while not session.closed:
+                self._flush(session)
+                if not session.socket.pending():
+                    (readable, _, _) = select.select( \
+                        [session.socket, session.wake_reader], [], [], WAIT_s)
+                    if session.wake_reader in readable:
+                        session.wake_reader.recv(4096)
+                    if session.socket not in readable:
+                        # A client is disconnected after one and a half
+                        # keep-alive periods without packets.
+                        if session.keep_alive_s and time.time() \
+                            - last_packet_s > session.keep_alive_s * 1.5:
+                            break
+                        continue
+                packet = self._read_packet(session.socket)
+                if packet is None:
+                    break
+                last_packet_s = time.time()
+                if not self._handle(session, packet[0], packet[1]):
+                    break
+        except Exception as e:
+            if self._running and not session.closed:
+                print('Local broker connection of client "%s" failed: %s' \
+                    % (session.client_id, str(e)))
+        finally:
+            self._close(session)
+            with self._lock:
+                if session in self._sessions:
+                    self._sessions.remove(session)
+            for s in (session.socket, session.wake_reader, session.wake_writer):
+                try:
+                    s.close()
+                except socket.error:
+                    pass
+
+    def _flush(self, session):
+        """Send the packets queued for a client.
+
+        Args:
+            session (:class:`_Session`): The session.
+        """
+        while True:
+            with session.lock:
+                if not session.outbox:
+                    return
+                packets = b''.join(session.outbox)
+                session.outbox.clear()
+            session.socket.sendall(packets)
+
+    def _read_exactly(self, client_socket, size):
+        """Read a given number of bytes from a connection.
+
+        Args:
+            client_socket (:class:`ssl.SSLSocket`): The socket.
+            size (int): Number of bytes to read.
+
+        Returns:
+            bytearray: The bytes, or None if the connection has been closed.
+        """
+        data = bytearray()
+        while len(data) < size:
+            chunk = client_socket.recv(size - len(data))
+            if not chunk:
+                return None
+            data.extend(chunk)
+        return data
+
+    def _read_packet(self, client_socket):
+        """Read an MQTT control packet from a connection.
+
+        Args:
+            client_socket (:class:`ssl.SSLSocket`): The socket.
+
+        Returns:
+            tuple: The first byte of the fixed header and the rest of the
+            packet, or None if the connection has been closed.
+        """
+        header = self._read_exactly(client_socket, 1)
+        if header is None:
+            return None
+        length = 0
+        multiplier = 1
+        while True:
+            byte = self._read_exactly(client_socket, 1)
+            if byte is None:
+                return None
+            length += (byte[0] & 0x7F) * multiplier
+            if not byte[0] & 0x80:
+                break
+            multiplier *= 128
+        body = self._read_exactly(client_socket, length) if length \
+            else bytearray()
+        if body is None:
+            return None
+        return (header[0], body)
+
+    def _handle(self, session, header, body):
+        """Handle an MQTT control packet received from a client.
+
+        Args:
+            session (:class:`_Session`): The session.
+            header (int): First byte of the fixed header.
+            body (bytearray): Variable header and payload.
+
+        Returns:
+            bool: True if the connection is to be kept, False otherwise.
+        """
+        packet_type = header >> 4
+        if session.client_id is None and packet_type != _CONNECT:
+            return False
+        if packet_type == _CONNECT:
+            return self._handle_connect(session, body)
+        if packet_type == _PUBLISH:
+            self._handle_publish(session, header, body)
+        elif packet_type == _PUBACK:
+            pass
+        elif packet_type == _SUBSCRIBE:
+            self._handle_subscribe(session, body)
+        elif packet_type == _UNSUBSCRIBE:
+            self._handle_unsubscribe(session, body)
+        elif packet_type == _PINGREQ:
+            session.send(_encode_packet(_PINGRESP << 4, bytearray()))
+        elif packet_type == _DISCONNECT:
+            return False
+        else:
+            return False
+        return True
+
+    def _handle_connect(self, session, body):
+        """Handle a connection request.
+
+        Args:
+            session (:class:`_Session`): The session.
+            body (bytearray): Variable header and payload.
+
+        Returns:
+            bool: True if the connection has been accepted, False otherwise.
+        """
+        if session.client_id is not None:
+            return False
+        (length,) = struct.unpack('!H', bytes(body[:2]))
+        offset = 2 + length + 2
+        session.keep_alive_s = struct.unpack('!H', \
+            bytes(body[offset:offset + 2]))[0]
+        offset += 2
+        (length,) = struct.unpack('!H', bytes(body[offset:offset + 2]))
+        session.client_id = bytes(body[offset + 2:offset + 2 + length]) \
+            .decode('utf-8')
+        # A client connecting again takes over the previous connection.
+        with self._lock:
+            previous = [s for s in self._sessions if s is not session \
+                and s.client_id == session.client_id]
+        for s in previous:
+            self._close(s)
+        session.send(_encode_packet(_CONNACK << 4, bytearray([0, 0])))
+        return True
+
+    def _handle_subscribe(self, session, body):
+        """Handle a subscription request.
+
+        Args:
+            session (:class:`_Session`): The session.
+            body (bytearray): Variable header and payload.
+        """
+        packet_id = body[:2]
+        offset = 2
+        granted = bytearray()
+        while offset < len(body):
+            (length,) = struct.unpack('!H', bytes(body[offset:offset + 2]))
+            topic_filter = bytes(body[offset + 2:offset + 2 + length]) \
+                .decode('utf-8')
+            qos = min(body[offset + 2 + length] & 0x03, 1)
+            offset += 3 + length
+            with self._lock:
+                session.subscriptions[topic_filter] = qos
+            granted.append(qos)
+        session.send(_encode_packet(_SUBACK << 4, packet_id + granted))
+
+    def _handle_unsubscribe(self, session, body):
+        """Handle an unsubscription request.
+
+        Args:
+            session (:class:`_Session`): The session.
+            body (bytearray): Variable header and payload.
+        """
+        packet_id = body[:2]
+        offset = 2
+        while offset < len(body):
+            (length,) = struct.unpack('!H', bytes(body[offset:offset + 2]))
+            topic_filter = bytes(body[offset + 2:offset + 2 + length]) \
+                .decode('utf-8')
+            offset += 2 + length
+            with self._lock:
+                session.subscriptions.pop(topic_filter, None)
+        session.send(_encode_packet(_UNSUBACK << 4, packet_id))
+
+    def _handle_publish(self, session, header, body):
+        """Handle a message published by a client.
+
+        Args:
+            session (:class:`_Session`): The session.
+            header (int): First byte of the fixed header.
+            body (bytearray): Variable header and payload.
+        """
+        qos = (header >> 1) & 0x03
+        (length,) = struct.unpack('!H', bytes(body[:2]))
+        topic = bytes(body[2:2 + length]).decode('utf-8')
+        offset = 2 + length
+        if qos:
+            session.send(_encode_packet(_PUBACK << 4, \
+                body[offset:offset + 2]))
+            offset += 2
+        payload = bytes(body[offset:])
+        with self._lock:
+            self._received += 1
+            callbacks = list(self._publish_callbacks)
+        for callback in callbacks:
+            try:
+                callback(session.client_id, topic, payload)
+            except Exception as e:
+                # A failing callback must not affect the other messages.
+                print('Local broker publish callback failed: %s' % (str(e)))
+        levels = topic.split('/')
+        if len(levels) == 5 and levels[0] == '$aws' \
+            and levels[1] == 'things' and levels[3] == 'shadow' \
+            and levels[4] in SHADOW_OPERATIONS:
+            self._handle_shadow_request(levels[2], levels[4], payload)
+            return
+        self._route(topic, payload, min(qos, 1))
+
+    def _route(self, topic, payload, qos):
+        """Deliver a message to the clients subscribed to its topic.
+
+        Args:
+            topic (str): Topic name.
+            payload (bytes): Payload.
+            qos (int): Quality of Service of the publication.
+        """
+        deliveries = []
+        with self._lock:
+            for session in self._sessions:
+                granted = None
+                for (topic_filter, subscription_qos) in \
+                    session.subscriptions.items():
+                    if match_topic(topic_filter, topic):
+                        granted = max(granted, subscription_qos) \
+                            if granted is not None else subscription_qos
+                if granted is not None:
+                    deliveries.append((session, min(granted, qos)))
+            self._delivered += len(deliveries)
+        if not deliveries:
+            return
+        encoded_topic = _encode_string(topic)
+        for (session, delivery_qos) in deliveries:
+            if delivery_qos:
+                body = encoded_topic + bytearray(struct.pack('!H', \
+                    session.next_packet_id())) + bytearray(payload)
+            else:
+                body = encoded_topic + bytearray(payload)
+            session.send(_encode_packet((_PUBLISH << 4) | (delivery_qos << 1), \
+                body))
+
+    def _respond(self, thing_name, operation, status, response):
+        """Publish the response to a shadow request.
+
+        Args:
+            thing_name (str): Name of the thing.
+            operation (str): The operation.
+            status (str): Status of the response, e.g. "accepted".
+            response (dict): The response document.
+        """
+        self._route('$aws/things/%s/shadow/%s/%s' \
+            % (thing_name, operation, status), \
+            json.dumps(response, separators=(',', ':')).encode('utf-8'), 0)
+
+    def _reject(self, thing_name, operation, code, message, token):
+        """Reject a shadow request.
+
+        Args:
+            thing_name (str): Name of the thing.
+            operation (str): The operation.
+            code (int): Error code, as the HTTP status codes.
+            message (str): Error message.
+            token (str): Client token of the request, if any.
+        """
+        response = {'code': code, 'message': message, \
+            'timestamp': int(time.time())}
+        if token is not None:
+            response['clientToken'] = token
+        self._respond(thing_name, operation, 'rejected', response)
+
+    def _handle_shadow_request(self, thing_name, operation, payload):
+        """Serve a request to the shadow of a thing.
+
+        Args:
+            thing_name (str): Name of the thing.
+            operation (str): The operation.
+            payload (bytes): Payload of the request.
+        """
+        request = {}
+        if payload.strip():
+            try:
+                request = json.loads(payload.decode('utf-8'))
+            except ValueError:
+                self._reject(thing_name, operation, 400, \
+                    'Payload contains invalid json', None)
+                return
+            if not isinstance(request, dict):
+                self._reject(thing_name, operation, 400, \
+                    'Payload contains invalid json', None)
+                return
+        token = request.get('clientToken')
+        timestamp = int(time.time())
+        responses = []
+        with self._lock:
+            shadow = self._shadows.get(thing_name)
+            if operation == 'get':
+                if shadow is None:
+                    error = (404, "No shadow exists with name: '%s'" \
+                        % (thing_name))
+                else:
+                    error = None
+                    state = json.loads(json.dumps(shadow['state']))
+                    delta = _delta(state.get('desired', {}), \
+                        state.get('reported', {}))
+                    if delta:
+                        state['delta'] = delta
+                    responses.append(('accepted', {'state': state, \
+                        'metadata': {}, 'version': shadow['version'], \
+                        'timestamp': timestamp}))
+            elif operation == 'delete':
+                if shadow is None:
+                    error = (404, "No shadow exists with name: '%s'" \
+                        % (thing_name))
+                else:
+                    error = None
+                    del self._shadows[thing_name]
+                    responses.append(('accepted', {'version': \
+                        shadow['version'], 'timestamp': timestamp}))
+            else:
+                error = self._update_shadow(thing_name, shadow, request, \
+                    timestamp, responses)
+        if error is not None:
+            self._reject(thing_name, operation, error[0], error[1], token)
+            return
+        for (status, response) in responses:
+            if token is not None and status == 'accepted':
+                response['clientToken'] = token
+            self._respond(thing_name, operation, status, response)
+
+    def _update_shadow(self, thing_name, shadow, request, timestamp, \
+        responses):
+        """Apply an update request to the shadow of a thing. To be called while
+        holding the lock.
+
+        Args:
+            thing_name (str): Name of the thing.
+            shadow (dict): The shadow document, or None if it does not exist.
+            request (dict): The update request.
+            timestamp (int): Timestamp of the update.
+            responses (list): List the status and the document of the responses
+                to publish are appended to.
+
+        Returns:
+            tuple: The error code and message if the update is rejected, None
+            otherwise.
+        """
+        state = request.get('state')
+        if not isinstance(state, dict):
+            return (400, 'Missing required node: state')
+        for section in state:
+            if section not in ('desired', 'reported'):
+                return (400, 'Unsupported node: %s' % (section))
+            if state[section] is not None \
+                and not isinstance(state[section], dict):
+                return (400, 'Invalid node: %s' % (section))
+        version = shadow['version'] if shadow is not None else 0
+        if 'version' in request and request['version'] != version:
+            return (409, 'Version conflict')
+        previous = json.loads(json.dumps(shadow)) if shadow is not None \
+            else None
+        if shadow is None:
+            shadow = {'state': {}, 'version': 0}
+            self._shadows[thing_name] = shadow
+        for (section, value) in state.items():
+            if value is None:
+                shadow['state'].pop(section, None)
+            else:
+                shadow_document.merge(shadow['state'].setdefault(section, {}), \
+                    value)
+        shadow['version'] += 1
+        responses.append(('accepted', {'state': state, 'metadata': {}, \
+            'version': shadow['version'], 'timestamp': timestamp}))
+        current = json.loads(json.dumps(shadow))
+        responses.append(('documents', {'previous': previous, \
+            'current': current, 'timestamp': timestamp}))
+        if state.get('desired'):
+            delta = _delta(shadow['state'].get('desired', {}), \
+                shadow['state'].get('reported', {}))
+            if delta:
+                responses.append(('delta', {'state': delta, 'metadata': {}, \
+                    'version': shadow['version'], 'timestamp': timestamp}))
+        return None
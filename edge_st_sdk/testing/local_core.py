@@ -0,0 +1,169 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""local_core
+
+The local_core module puts together the stand-ins of a Greengrass core and of
+the discovery service, so that
+:class:`edge_st_sdk.aws.aws_greengrass.AWSGreengrass` and the clients it
+creates can be run entirely within the process, e.g. by benchmarks: the
+certificates are generated, the broker and the discovery server are started,
+and the discovery information points to the broker.
+"""
+
+
+# IMPORT
+
+import os
+import shutil
+import tempfile
+
+from edge_st_sdk.aws.aws_greengrass import AWSGreengrass
+from edge_st_sdk.testing.certificates import generate_certificates
+from edge_st_sdk.testing.local_broker import LocalBroker
+from edge_st_sdk.testing.local_discovery import LocalDiscoveryServer
+from edge_st_sdk.testing.local_discovery import create_discovery_document
+
+
+# CONSTANTS
+
+HOST = '127.0.0.1'
+"""Address the stand-ins listen to."""
+
+ENDPOINT = 'localhost'
+"""Endpoint of the discovery service, matching the server certificate."""
+
+
+# CLASSES
+
+class LocalCore(object):
+    """Class responsible for running a local Greengrass core and discovery
+    service."""
+
+    def __init__(self, path=None):
+        """Constructor.
+
+        Args:
+            path (str): Directory where the certificates and the discovery
+                caches are written. A new temporary directory, removed when
+                stopping, if not given.
+        """
+        self._temporary = path is None
+        self._path = tempfile.mkdtemp(prefix='edge_st_local_core_') \
+            if path is None else path
+        self._certificates = None
+        self._broker = None
+        self._discovery_server = None
+        self._instances = 0
+
+    def start(self):
+        """Generate the certificates and start the broker and the discovery
+        server.
+
+        Raises:
+            :exc:`edge_st_sdk.utils.edge_st_exceptions.ConfigurationException`
+            if the certificates cannot be generated.
+        """
+        if self._broker is not None:
+            return
+        self._certificates = generate_certificates( \
+            os.path.join(self._path, 'certificates'))
+        self._broker = LocalBroker(self._certificates, HOST)
+        self._broker.start()
+        self._discovery_server = LocalDiscoveryServer(self._certificates, \
+            create_discovery_document(HOST, self._broker.get_port(), \
+            self._certificates.get_ca_certificate()), HOST)
+        self._discovery_server.start()
+
+    def stop(self):
+        """Stop the broker and the discovery server."""
+        if self._broker is None:
+            return
+        self._discovery_server.stop()
+        self._broker.stop()
+        self._discovery_server = None
+        self._broker = None
+        if self._temporary:
+            shutil.rmtree(self._path, True)
+
+    def get_broker(self):
+        """Get the broker.
+
+        Returns:
+            :class:`edge_st_sdk.testing.local_broker.LocalBroker`: The broker.
+        """
+        return self._broker
+
+    def get_discovery_server(self):
+        """Get the discovery server.
+
+        Returns:
+            :class:`edge_st_sdk.testing.local_discovery.LocalDiscoveryServer`:
+            The discovery server.
+        """
+        return self._discovery_server
+
+    def get_certificates(self):
+        """Get the certificates.
+
+        Returns:
+            :class:`edge_st_sdk.testing.certificates.Certificates`: The
+            certificates, whose device certificate is accepted for any client.
+        """
+        return self._certificates
+
+    def get_greengrass(self):
+        """Get an Amazon AWS Greengrass instance discovering the local core.
+
+        Each instance gets its own discovery cache within the directory of the
+        core, so that it performs a discovery of its own.
+
+        Returns:
+            :class:`edge_st_sdk.aws.aws_greengrass.AWSGreengrass`: The
+            instance.
+        """
+        self._instances += 1
+        return AWSGreengrass(ENDPOINT, self._certificates.ca_certificate_path, \
+            os.path.join(self._path, 'discovery_cache_%d' % (self._instances)), \
+            discovery_port=self._discovery_server.get_port())
+
+    def get_client(self, greengrass, client_id):
+        """Get an Amazon AWS client of the local core, authenticating with the
+        device certificate.
+
+        Args:
+            greengrass (:class:`edge_st_sdk.aws.aws_greengrass.AWSGreengrass`):
+                The instance to get the client from.
+            client_id (str): Name of the client.
+
+        Returns:
+            :class:`edge_st_sdk.aws.aws_client.AWSClient`: The client.
+        """
+        return greengrass.get_client(client_id, \
+            self._certificates.device_certificate_path, \
+            self._certificates.device_private_key_path)
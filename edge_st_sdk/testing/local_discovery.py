@@ -0,0 +1,195 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""local_discovery
+
+The local_discovery module runs a stand-in of the Greengrass discovery service
+within the process, answering the discovery requests of any thing with canned
+discovery information pointing to a given core, e.g. to a
+:class:`edge_st_sdk.testing.local_broker.LocalBroker`.
+
+The service is served over HTTPS, with mutual authentication as the cloud
+does; the certification authority of the certificates is returned as the one
+of the group, so that the clients trust the local core as well.
+"""
+
+
+# IMPORT
+
+import json
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from edge_st_sdk.testing.certificates import create_server_context
+
+
+# CONSTANTS
+
+PATH_PREFIX = '/greengrass/discover/thing/'
+"""Path prefix of the discovery requests, followed by the name of the thing."""
+
+GROUP_ID = 'EdgeSTSDK_Local_Group'
+"""Default identifier of the group returned by the discovery."""
+
+CORE_THING_ARN = 'arn:aws:iot:local:000000000000:thing/EdgeSTSDK_Local_Core'
+"""Default ARN of the core returned by the discovery."""
+
+
+# FUNCTIONS
+
+def create_discovery_document(host, port, ca_certificate, group_id=GROUP_ID, \
+    core_thing_arn=CORE_THING_ARN):
+    """Create the discovery information of a group with a single core.
+
+    Args:
+        host (str): Address of the core.
+        port (int): Port of the core.
+        ca_certificate (str): PEM encoded certificate of the certification
+            authority of the group.
+        group_id (str): Identifier of the group.
+        core_thing_arn (str): ARN of the core.
+
+    Returns:
+        str: The JSON document, in the format of the discovery service.
+    """
+    return json.dumps({'GGGroups': [{
+        'GGGroupId': group_id,
+        'Cores': [{
+            'thingArn': core_thing_arn,
+            'Connectivity': [{
+                'Id': '%s:%d' % (host, port),
+                'HostAddress': host,
+                'PortNumber': port,
+                'Metadata': ''
+            }]
+        }],
+        'CAs': [ca_certificate]
+    }]})
+
+
+# CLASSES
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server serving each request on its own thread."""
+
+    daemon_threads = True
+
+
+class LocalDiscoveryServer(object):
+    """Class responsible for serving canned discovery information over
+    HTTPS."""
+
+    def __init__(self, certificates, discovery_document, host='127.0.0.1', \
+        port=0):
+        """Constructor.
+
+        Args:
+            certificates
+                (:class:`edge_st_sdk.testing.certificates.Certificates`): The
+                certificates of the server and of its certification authority.
+            discovery_document (str): JSON document returned to every thing,
+                e.g. as created by :func:`create_discovery_document`.
+            host (str): Address to listen to. Local connections only by
+                default.
+            port (int): Port to listen to. A free port is chosen if 0.
+        """
+        body = discovery_document.encode('utf-8')
+        self._requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with server._lock:
+                    server._requests += 1
+                if not self.path.startswith(PATH_PREFIX) \
+                    or len(self.path) == len(PATH_PREFIX):
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                # Lower case names, as the discovery provider of the AWS IoT
+                # SDK matches them case-sensitively.
+                self.send_header('content-type', 'application/json')
+                self.send_header('content-length', str(len(body)))
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _ThreadingHTTPServer((host, port), Handler)
+        # The handshakes are done on the threads serving the requests.
+        self._server.socket = create_server_context(certificates).wrap_socket( \
+            self._server.socket, server_side=True, \
+            do_handshake_on_connect=False)
+        self._thread = None
+
+    def get_port(self):
+        """Get the port the server listens to.
+
+        Returns:
+            int: The port.
+        """
+        return self._server.server_address[1]
+
+    def get_requests(self):
+        """Get the number of discovery requests served.
+
+        Returns:
+            int: The number of requests.
+        """
+        return self._requests
+
+    def start(self):
+        """Start serving the discovery requests on a separate thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving the discovery requests."""
+        if self._thread is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._thread = None
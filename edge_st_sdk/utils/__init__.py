@@ -1,3 +1,13 @@
 __all__ = [
-    'edge_st_exceptions'
+    'callback_executor', \
+    'drain_scheduler', \
+    'edge_st_exceptions', \
+    'metrics', \
+    'persistent_queue', \
+    'publish_coalescer', \
+    'publish_pipeline', \
+    'shadow_compactor', \
+    'shadow_document', \
+    'timer_wheel', \
+    'topic_router'
 ]
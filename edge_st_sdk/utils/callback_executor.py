@@ -0,0 +1,432 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""callback_executor
+
+The callback_executor module runs the callbacks of the subscriptions out of
+the network thread of the MQTT client, so that a slow callback, e.g. one
+writing to a BLE device, does not delay keepalives and the other messages.
+
+Callbacks are queued per topic, with a bounded number of pending callbacks
+per topic and a policy to apply when the bound is reached, and are run either
+by a pool of worker threads or by an :mod:`asyncio` event loop. Callbacks with
+the same key, by default the topic name of the message, are run one at a time
+in the order they were submitted; callbacks with different keys may run in
+parallel.
+"""
+
+
+# IMPORT
+
+import threading
+import time
+from collections import deque
+from enum import Enum
+
+
+# CONSTANTS
+
+WORKERS = 4
+"""Default number of worker threads."""
+
+QUEUE_SIZE = 100
+"""Default maximum number of pending callbacks per topic."""
+
+
+# CLASSES
+
+class DispatchOverflowPolicy(Enum):
+    """Policies to apply when the queue of a topic is full."""
+
+    DROP_OLDEST = 0
+    """The oldest pending callback of the topic is discarded."""
+
+    DROP_NEWEST = 1
+    """The new callback is discarded."""
+
+    BLOCK = 2
+    """The submitting thread waits for room in the queue. Blocking the
+    network thread delays keepalives, hence it is meant for topics whose
+    messages must not be lost."""
+
+
+class CallbackStats(object):
+    """Class holding the statistics of the callbacks of a topic."""
+
+    __slots__ = ('submitted', 'completed', 'dropped', 'pending', \
+        'wait_s_total', 'wait_s_max')
+
+    def __init__(self):
+        """Constructor."""
+        self.submitted = 0
+        """Number of callbacks submitted."""
+        self.completed = 0
+        """Number of callbacks run."""
+        self.dropped = 0
+        """Number of callbacks discarded because of a full queue."""
+        self.pending = 0
+        """Number of callbacks waiting to be run."""
+        self.wait_s_total = 0.0
+        """Total time spent in the queue by the callbacks run, in seconds."""
+        self.wait_s_max = 0.0
+        """Maximum time spent in the queue by a callback, in seconds."""
+
+    def get_mean_wait(self):
+        """Get the mean time spent in the queue by the callbacks run.
+
+        Returns:
+            float: The mean time in seconds, 0 if no callbacks have been run.
+        """
+        return self.wait_s_total / self.completed if self.completed else 0.0
+
+    def _add(self, stats):
+        """Add the statistics of another topic.
+
+        Args:
+            stats (:class:`CallbackStats`): The statistics.
+        """
+        self.submitted += stats.submitted
+        self.completed += stats.completed
+        self.dropped += stats.dropped
+        self.pending += stats.pending
+        self.wait_s_total += stats.wait_s_total
+        self.wait_s_max = max(self.wait_s_max, stats.wait_s_max)
+
+    def _copy(self):
+        """Copy the statistics.
+
+        Returns:
+            :class:`CallbackStats`: The copy.
+        """
+        copy = CallbackStats()
+        copy._add(self)
+        return copy
+
+
+class _Task(object):
+    """Callback waiting to be run."""
+
+    __slots__ = ('callback', 'args', 'topic', 'submitted', 'pending')
+
+    def __init__(self, callback, args, topic):
+        """Constructor.
+
+        Args:
+            callback (function): The callback.
+            args (tuple): Arguments of the callback.
+            topic (:class:`_Topic`): Topic of the callback.
+        """
+        self.callback = callback
+        self.args = args
+        self.topic = topic
+        self.submitted = time.time()
+        self.pending = True
+
+
+class _Topic(object):
+    """Pending callbacks of a topic."""
+
+    __slots__ = ('tasks', 'stats')
+
+    def __init__(self):
+        """Constructor."""
+        self.tasks = deque()
+        self.stats = CallbackStats()
+
+
+class _Lane(object):
+    """Pending callbacks with the same key, run one at a time."""
+
+    __slots__ = ('key', 'tasks', 'scheduled')
+
+    def __init__(self, key):
+        """Constructor.
+
+        Args:
+            key: The key.
+        """
+        self.key = key
+        self.tasks = deque()
+        self.scheduled = False
+
+
+class CallbackExecutor(object):
+    """Class responsible for running callbacks out of the thread submitting
+    them, with bounded queues per topic and ordering per key.
+    """
+
+    def __init__(self, workers=WORKERS, queue_size=QUEUE_SIZE, \
+        overflow_policy=DispatchOverflowPolicy.DROP_OLDEST, key=None, \
+        loop=None):
+        """Constructor.
+
+        Args:
+            workers (int): Number of worker threads. Not used if a loop is
+                given.
+            queue_size (int): Maximum number of pending callbacks per topic.
+                Unbounded if 0.
+            overflow_policy (:class:`DispatchOverflowPolicy`): Policy to apply
+                when the queue of a topic is full.
+            key (function): Function called with the topic name and the message
+                of a callback submitted through :meth:`wrap`, returning the key
+                of the callback, e.g. the identifier of a device. The topic
+                name of the message if not given.
+            loop (:class:`asyncio.AbstractEventLoop`): If given, callbacks are
+                handed over to the event loop, which runs them one at a time,
+                instead of to worker threads.
+        """
+        self._queue_size = queue_size
+        self._overflow_policy = overflow_policy
+        self._key = key
+        self._loop = loop
+        self._condition = threading.Condition()
+        self._topics = {}
+        self._lanes = {}
+        self._ready = deque()
+        self._shutdown = False
+        self._last_submitted = None
+        self._workers = []
+        if loop is None:
+            for _ in range(workers):
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, topic, key, callback, *args):
+        """Submit a callback.
+
+        Args:
+            topic (str): Topic the callback is queued for.
+            key: Key of the callback: callbacks with the same key are run one
+                at a time in the order they are submitted.
+            callback (function): The callback.
+            *args: Arguments of the callback.
+
+        Returns:
+            bool: True if the callback has been queued, False if it has been
+            discarded because the queue of the topic was full or the executor
+            has been shut down.
+        """
+        with self._condition:
+            if self._shutdown:
+                return False
+            state = self._topics.get(topic)
+            if state is None:
+                state = _Topic()
+                self._topics[topic] = state
+            stats = state.stats
+            while self._queue_size and stats.pending >= self._queue_size:
+                if self._overflow_policy == DispatchOverflowPolicy.DROP_NEWEST:
+                    stats.submitted += 1
+                    stats.dropped += 1
+                    return False
+                if self._overflow_policy == DispatchOverflowPolicy.DROP_OLDEST:
+                    self._drop_oldest(state)
+                else:
+                    self._condition.wait()
+                    if self._shutdown:
+                        return False
+            while state.tasks and not state.tasks[0].pending:
+                state.tasks.popleft()
+            task = _Task(callback, args, state)
+            state.tasks.append(task)
+            stats.submitted += 1
+            stats.pending += 1
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._run_handed_over, task)
+                return True
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = _Lane(key)
+                self._lanes[key] = lane
+            lane.tasks.append(task)
+            if not lane.scheduled:
+                lane.scheduled = True
+                self._ready.append(lane)
+                self._condition.notify()
+            return True
+
+    def wrap(self, topic, callback):
+        """Wrap the callback of a subscription, so that it is submitted to the
+        executor instead of being run by the network thread.
+
+        A message delivered to the same callback several times because of
+        overlapping subscriptions is submitted once.
+
+        Args:
+            topic (str): Topic name or filter of the subscription.
+            callback (function): Callback of the subscription, to be called
+                with the client, the user data, and the message.
+
+        Returns:
+            function: The callback to subscribe with.
+        """
+        def submitting_callback(client, userdata, message):
+            if self._last_submitted is not None \
+                and self._last_submitted[0] is message \
+                and self._last_submitted[1] == callback:
+                return
+            self._last_submitted = (message, callback)
+            key = self._key(message.topic, message) if self._key \
+                else message.topic
+            self.submit(topic, key, callback, client, userdata, message)
+
+        return submitting_callback
+
+    def get_stats(self, topic=None):
+        """Get the statistics of the callbacks.
+
+        Args:
+            topic (str): Topic the callbacks have been queued for. All the
+                topics if not given.
+
+        Returns:
+            :class:`CallbackStats`: A copy of the statistics.
+        """
+        with self._condition:
+            if topic is not None:
+                state = self._topics.get(topic)
+                return state.stats._copy() if state else CallbackStats()
+            stats = CallbackStats()
+            for state in self._topics.values():
+                stats._add(state.stats)
+            return stats
+
+    def get_topics(self):
+        """Get the topics callbacks have been queued for.
+
+        Returns:
+            list: The topics.
+        """
+        with self._condition:
+            return list(self._topics.keys())
+
+    def shutdown(self, wait=True):
+        """Stop accepting callbacks, and stop the worker threads once the
+        pending callbacks have been run.
+
+        Args:
+            wait (bool): If True, wait for the worker threads to end.
+        """
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                if worker is not threading.current_thread():
+                    worker.join()
+
+    def _drop_oldest(self, state):
+        """Discard the oldest pending callback of a topic.
+
+        Args:
+            state (:class:`_Topic`): The topic.
+        """
+        while state.tasks:
+            task = state.tasks.popleft()
+            if task.pending:
+                task.pending = False
+                state.stats.pending -= 1
+                state.stats.dropped += 1
+                return
+
+    def _take(self, task):
+        """Take a task out of the pending ones, updating the statistics,
+        including the time spent in the queue.
+
+        Must be called with the lock held.
+
+        Args:
+            task (:class:`_Task`): The task.
+        """
+        task.pending = False
+        wait_s = time.time() - task.submitted
+        stats = task.topic.stats
+        stats.pending -= 1
+        stats.wait_s_total += wait_s
+        stats.wait_s_max = max(stats.wait_s_max, wait_s)
+        self._condition.notify_all()
+
+    def _run(self, task):
+        """Run the callback of a task.
+
+        Args:
+            task (:class:`_Task`): The task.
+        """
+        try:
+            task.callback(*task.args)
+        except Exception as e:
+            # A failing callback must not stop the executor.
+            print('Callback "%s" failed: %s' \
+                % (getattr(task.callback, '__name__', task.callback), str(e)))
+        with self._condition:
+            task.topic.stats.completed += 1
+
+    def _run_handed_over(self, task):
+        """Run a task handed over to the event loop.
+
+        Args:
+            task (:class:`_Task`): The task.
+        """
+        with self._condition:
+            if not task.pending:
+                return
+            self._take(task)
+        self._run(task)
+
+    def _work(self):
+        """Run the pending callbacks, one lane at a time."""
+        while True:
+            with self._condition:
+                task = None
+                while task is None:
+                    while not self._ready:
+                        if self._shutdown:
+                            return
+                        self._condition.wait()
+                    lane = self._ready.popleft()
+                    while lane.tasks:
+                        candidate = lane.tasks.popleft()
+                        if candidate.pending:
+                            task = candidate
+                            break
+                    if task is None:
+                        lane.scheduled = False
+                        del self._lanes[lane.key]
+                self._take(task)
+            self._run(task)
+            with self._condition:
+                # The lane is rescheduled only now, so that its callbacks never
+                # run concurrently.
+                if lane.tasks:
+                    self._ready.append(lane)
+                    self._condition.notify()
+                else:
+                    lane.scheduled = False
+                    del self._lanes[lane.key]
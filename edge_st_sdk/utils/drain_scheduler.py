@@ -0,0 +1,291 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""drain_scheduler
+
+The drain_scheduler module paces the sending of a backlog of messages, e.g.
+of an offline queue after a reconnection, adapting the rate to how fast the
+messages get acknowledged.
+
+The rate grows while the acknowledgements keep up, and is halved whenever an
+acknowledgement is slow or missing, or a message fails to be sent, e.g.
+because the broker is throttling the client; the number of messages waiting
+for an acknowledgement is capped as well.
+
+When draining the offline queue of
+:class:`edge_st_sdk.aws.aws_client.AWSClient`, the in-memory queue of the
+underlying client and its fixed rate draining are disabled, so that the rate of
+the scheduler is the one actually seen on the wire after a reconnection.
+"""
+
+
+# IMPORT
+
+import threading
+import time
+
+
+# CLASSES
+
+class DrainStatus(object):
+    """Progress of the draining of a backlog."""
+
+    __slots__ = ('pending', 'in_flight', 'drained', 'failed', 'rate_Hz', \
+        'eta_s')
+
+    def __init__(self, pending, in_flight, drained, failed, rate_Hz, eta_s):
+        """Constructor.
+
+        Args:
+            pending (int): Number of messages still to be acknowledged.
+            in_flight (int): Number of messages sent and waiting for an
+                acknowledgement.
+            drained (int): Number of messages acknowledged since the draining
+                started.
+            failed (int): Number of messages failed or not acknowledged in time
+                since the draining started.
+            rate_Hz (float): Current sending rate in messages per second.
+            eta_s (float): Estimated time in seconds to drain the pending
+                messages.
+        """
+        self.pending = pending
+        self.in_flight = in_flight
+        self.drained = drained
+        self.failed = failed
+        self.rate_Hz = rate_Hz
+        self.eta_s = eta_s
+
+
+class AdaptiveDrainScheduler(object):
+    """Class responsible for pacing the sending of a backlog of messages.
+
+    The sender asks for a slot through :meth:`acquire` before sending each
+    message, and reports the outcome through :meth:`on_ack` or
+    :meth:`on_failure` with the returned token. Messages not acknowledged in
+    time are reported by :meth:`expire`, and should be sent again.
+    """
+
+    MIN_RATE_Hz = 2
+    """Default minimum sending rate, i.e. the fixed draining frequency of the
+    underlying client."""
+
+    MAX_RATE_Hz = 500
+    """Default maximum sending rate."""
+
+    MAX_IN_FLIGHT = 32
+    """Default maximum number of messages waiting for an acknowledgement."""
+
+    INCREASE_FACTOR = 0.1
+    """Relative increase of the rate for every message acknowledged in time,
+    by at least one message per second."""
+
+    DECREASE_FACTOR = 0.5
+    """Relative decrease of the rate on a slow, missing, or failed
+    acknowledgement."""
+
+    _SMOOTHING = 0.2
+    """Weight of the last sample in the average acknowledgement latency."""
+
+    def __init__(self, min_rate_Hz=MIN_RATE_Hz, max_rate_Hz=MAX_RATE_Hz, \
+        max_in_flight=MAX_IN_FLIGHT, slow_ack_s=1, ack_timeout_s=10):
+        """Constructor.
+
+        Args:
+            min_rate_Hz (float): Minimum and initial sending rate in messages
+                per second.
+            max_rate_Hz (float): Maximum sending rate in messages per second.
+            max_in_flight (int): Maximum number of messages waiting for an
+                acknowledgement.
+            slow_ack_s (float): Latency in seconds beyond which an
+                acknowledgement is considered slow.
+            ack_timeout_s (float): Latency in seconds beyond which an
+                acknowledgement is considered missing.
+        """
+        self._min_rate_Hz = float(min_rate_Hz)
+        self._max_rate_Hz = float(max_rate_Hz)
+        self._max_in_flight = max_in_flight
+        self._slow_ack_s = slow_ack_s
+        self._ack_timeout_s = ack_timeout_s
+        self._condition = threading.Condition()
+        self._rate_Hz = self._min_rate_Hz
+        self._in_flight = {}
+        self._tokens = 0
+        self._next_send = 0
+        self._decreased_at = 0
+        self._latency_s = None
+        self._drained = 0
+        self._failed = 0
+
+    def start(self):
+        """Start draining a new backlog, forgetting the messages in flight and
+        the progress, but keeping the rate reached so far."""
+        with self._condition:
+            self._in_flight.clear()
+            self._drained = 0
+            self._failed = 0
+            self._condition.notify_all()
+
+    def acquire(self, timeout_s=None):
+        """Wait for the next sending slot, according to the current rate and
+        to the number of messages in flight.
+
+        Args:
+            timeout_s (float): Maximum time in seconds to wait. If not given,
+                waits until a slot is available.
+
+        Returns:
+            int: The token identifying the message to send, or None if no slot
+            became available in time.
+        """
+        deadline = time.time() + timeout_s if timeout_s is not None else None
+        with self._condition:
+            while True:
+                now = time.time()
+                if len(self._in_flight) < self._max_in_flight \
+                    and now >= self._next_send:
+                    break
+                wait_s = self._next_send - now \
+                    if len(self._in_flight) < self._max_in_flight else None
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    wait_s = min(wait_s, deadline - now) \
+                        if wait_s is not None else deadline - now
+                self._condition.wait(wait_s)
+            self._tokens += 1
+            self._in_flight[self._tokens] = now
+            self._next_send = max(now, self._next_send) + 1.0 / self._rate_Hz
+            return self._tokens
+
+    def on_ack(self, token):
+        """Report that a message has been acknowledged.
+
+        The rate is increased if the acknowledgement came in time, or decreased
+        if it was slow.
+
+        Args:
+            token (int): The token returned by :meth:`acquire`.
+        """
+        with self._condition:
+            sent = self._in_flight.pop(token, None)
+            if sent is None:
+                return
+            now = time.time()
+            latency_s = now - sent
+            self._drained += 1
+            self._latency_s = latency_s if self._latency_s is None else \
+                self._latency_s + self._SMOOTHING * (latency_s - self._latency_s)
+            if latency_s > self._slow_ack_s:
+                self._decrease(sent, now)
+            else:
+                self._rate_Hz = min(self._max_rate_Hz, self._rate_Hz \
+                    + max(1, self._rate_Hz * self.INCREASE_FACTOR))
+            self._condition.notify_all()
+
+    def on_failure(self, token):
+        """Report that a message failed to be sent, and decrease the rate.
+
+        Args:
+            token (int): The token returned by :meth:`acquire`.
+        """
+        with self._condition:
+            sent = self._in_flight.pop(token, None)
+            if sent is None:
+                return
+            self._failed += 1
+            self._decrease(sent, time.time())
+            self._condition.notify_all()
+
+    def expire(self):
+        """Forget the messages whose acknowledgement is missing, and decrease
+        the rate if there are any.
+
+        Returns:
+            list: The tokens of the expired messages, which should be sent
+            again.
+        """
+        with self._condition:
+            now = time.time()
+            expired = [token for token, sent in self._in_flight.items() \
+                if now - sent > self._ack_timeout_s]
+            for token in expired:
+                self._decrease(self._in_flight.pop(token), now)
+            self._failed += len(expired)
+            if expired:
+                self._condition.notify_all()
+            return expired
+
+    def get_in_flight(self):
+        """Get the number of messages waiting for an acknowledgement.
+
+        Returns:
+            int: The number of messages in flight.
+        """
+        return len(self._in_flight)
+
+    def get_rate(self):
+        """Get the current sending rate.
+
+        Returns:
+            float: The rate in messages per second.
+        """
+        return self._rate_Hz
+
+    def get_status(self, pending):
+        """Get the progress of the draining.
+
+        Args:
+            pending (int): Number of messages still to be acknowledged, in
+                flight included.
+
+        Returns:
+            :class:`DrainStatus`: The progress of the draining.
+        """
+        with self._condition:
+            rate_Hz = self._rate_Hz
+            if self._latency_s:
+                rate_Hz = min(rate_Hz, self._max_in_flight / self._latency_s)
+            eta_s = pending / rate_Hz if pending else 0
+            return DrainStatus(pending, len(self._in_flight), self._drained, \
+                self._failed, self._rate_Hz, eta_s)
+
+    def _decrease(self, sent, now):
+        """Decrease the rate, at most once per round of messages, i.e. only
+        for messages sent after the last decrease.
+
+        Must be called with the lock held.
+
+        Args:
+            sent (float): Sending time of the message.
+            now (float): Current time.
+        """
+        if sent < self._decreased_at:
+            return
+        self._rate_Hz = max(self._min_rate_Hz, self._rate_Hz * self.DECREASE_FACTOR)
+        self._decreased_at = now
+        self._next_send = now + 1.0 / self._rate_Hz
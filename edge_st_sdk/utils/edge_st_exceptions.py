@@ -44,3 +44,35 @@ class WrongInstantiationException(Exception):
             msg (str): The message to raise.
         """
         super(WrongInstantiationException, self).__init__(msg)
+
+
+class ShadowRequestException(Exception):
+    """Exception raised whenever a shadow request is rejected or times out."""
+
+    def __init__(self, msg, response_status=None, payload=None, token=None):
+        """Constructor
+
+        Args:
+            msg (str): The message to raise.
+            response_status (str): Status of the response, i.e. "rejected" or
+                "timeout".
+            payload (str): Payload of the response, if any (JSON formatted
+                string).
+            token (str): Token of the shadow request.
+        """
+        super(ShadowRequestException, self).__init__(msg)
+        self.response_status = response_status
+        self.payload = payload
+        self.token = token
+
+
+class ConfigurationException(Exception):
+    """Exception raised whenever a configuration is not valid."""
+
+    def __init__(self, msg):
+        """Constructor
+
+        Args:
+            msg (str): The message to raise.
+        """
+        super(ConfigurationException, self).__init__(msg)
@@ -0,0 +1,596 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""metrics
+
+The metrics module provides a registry of counters, gauges, and histograms,
+labeled e.g. by client identifier, and an optional HTTP endpoint exposing
+them in the Prometheus text format, without external dependencies.
+
+The clients of the SDK record their metrics in :data:`REGISTRY`. Recording a
+value takes a lock held for a few operations only, and the values of the
+labels of frequently updated metrics can be resolved once through
+:meth:`MetricFamily.labels`.
+"""
+
+
+# IMPORT
+
+import bisect
+import math
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+# CONSTANTS
+
+LATENCY_BUCKETS_s = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, \
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Default upper bounds of the buckets of the histograms, in seconds."""
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+"""Content type of the Prometheus text format."""
+
+
+# FUNCTIONS
+
+def start_metrics_server(port, host='127.0.0.1', registry=None):
+    """Start serving the metrics over HTTP, in the Prometheus text format.
+
+    Args:
+        port (int): Port to listen to. A free port is chosen if 0.
+        host (str): Address to listen to. Local connections only by default.
+        registry (:class:`MetricsRegistry`): The registry. :data:`REGISTRY` if
+            not given.
+
+    Returns:
+        :class:`MetricsServer`: The server, to be stopped through
+        :meth:`MetricsServer.stop`.
+    """
+    server = MetricsServer(port, host, registry)
+    server.start()
+    return server
+
+
+def _escape(value):
+    """Escape the value of a label as per the Prometheus text format.
+
+    Args:
+        value (str): The value.
+
+    Returns:
+        str: The escaped value.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _format_number(value):
+    """Format a sample value as per the Prometheus text format.
+
+    Args:
+        value (float): The value.
+
+    Returns:
+        str: The formatted value.
+    """
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=''):
+    """Format the labels of a sample.
+
+    Args:
+        names (tuple): Names of the labels.
+        values (tuple): Values of the labels.
+        extra (str): Further formatted label, e.g. the bound of a bucket.
+
+    Returns:
+        str: The formatted labels, empty if there are none.
+    """
+    labels = ['%s="%s"' % (name, _escape(value)) \
+        for (name, value) in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+# CLASSES
+
+class _Value(object):
+    """Value of a counter or a gauge for a set of label values."""
+
+    __slots__ = ('_lock', '_value', '_function')
+
+    def __init__(self):
+        """Constructor."""
+        self._lock = threading.Lock()
+        self._value = 0.0
+        self._function = None
+
+    def inc(self, amount=1):
+        """Increase the value.
+
+        Args:
+            amount (float): The amount.
+        """
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        """Decrease the value. Meant for gauges only.
+
+        Args:
+            amount (float): The amount.
+        """
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value):
+        """Set the value. Meant for gauges only.
+
+        Args:
+            value (float): The value.
+        """
+        with self._lock:
+            self._value = value
+
+    def set_function(self, function):
+        """Set a function returning the value when collected, e.g. the size of
+        a queue, instead of recording it.
+
+        Args:
+            function (function): Function without arguments. None to record the
+                value again.
+        """
+        self._function = function
+
+    def get(self):
+        """Get the value.
+
+        Returns:
+            float: The value.
+        """
+        function = self._function
+        if function is not None:
+            try:
+                return float(function())
+            except Exception as e:
+                print('Collecting a metric failed: %s' % (str(e)))
+                return float('nan')
+        return self._value
+
+
+class _HistogramValue(object):
+    """Value of a histogram for a set of label values."""
+
+    __slots__ = ('_lock', '_bounds', '_counts', '_sum', '_count')
+
+    def __init__(self, bounds):
+        """Constructor.
+
+        Args:
+            bounds (tuple): Sorted upper bounds of the buckets.
+        """
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        """Record an observation.
+
+        Args:
+            value (float): The observed value.
+        """
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def get(self):
+        """Get the cumulative counts of the buckets, the sum, and the count of
+        the observations.
+
+        Returns:
+            tuple: List of (upper bound, cumulative count) tuples, including the
+            "+Inf" bucket, the sum, and the count.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+            count = self._count
+        buckets = []
+        cumulative = 0
+        for (bound, bucket_count) in zip(self._bounds + (float('inf'),), counts):
+            cumulative += bucket_count
+            buckets.append((bound, cumulative))
+        return (buckets, total, count)
+
+    def get_percentile(self, percentile):
+        """Estimate a percentile of the observations, interpolating within the
+        bucket holding it.
+
+        Args:
+            percentile (float): The percentile, from 0 to 100.
+
+        Returns:
+            float: The estimate, or NaN if nothing has been observed.
+        """
+        (buckets, _, count) = self.get()
+        if not count:
+            return float('nan')
+        rank = count * percentile / 100.0
+        lower = 0.0
+        previous = 0
+        for (bound, cumulative) in buckets:
+            if cumulative >= rank and cumulative > previous:
+                if math.isinf(bound):
+                    return lower
+                fraction = (rank - previous) / float(cumulative - previous)
+                return lower + (bound - lower) * fraction
+            lower = bound
+            previous = cumulative
+        return lower
+
+
+class MetricFamily(object):
+    """Class holding a metric, with a value for each set of label values."""
+
+    COUNTER = 'counter'
+    """Type of the metrics whose value only increases."""
+
+    GAUGE = 'gauge'
+    """Type of the metrics whose value increases and decreases."""
+
+    HISTOGRAM = 'histogram'
+    """Type of the metrics counting observations in buckets."""
+
+    def __init__(self, name, documentation, metric_type, label_names=(), \
+        buckets=LATENCY_BUCKETS_s):
+        """Constructor.
+
+        Args:
+            name (str): Name of the metric.
+            documentation (str): Description of the metric.
+            metric_type (str): Type of the metric.
+            label_names (tuple): Names of the labels.
+            buckets (tuple): Upper bounds of the buckets, for histograms only.
+        """
+        self._name = name
+        self._documentation = documentation
+        self._type = metric_type
+        self._label_names = tuple(label_names)
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def get_name(self):
+        """Get the name of the metric.
+
+        Returns:
+            str: The name.
+        """
+        return self._name
+
+    def get_type(self):
+        """Get the type of the metric.
+
+        Returns:
+            str: The type.
+        """
+        return self._type
+
+    def get_label_names(self):
+        """Get the names of the labels.
+
+        Returns:
+            tuple: The names.
+        """
+        return self._label_names
+
+    def labels(self, *label_values):
+        """Get the value of the metric for a set of label values, creating it
+        if needed.
+
+        Args:
+            *label_values: Values of the labels, in the order of their names.
+
+        Returns:
+            The value, with :meth:`inc`, :meth:`dec`, :meth:`set`, and
+            :meth:`set_function` methods for counters and gauges, and with an
+            :meth:`observe` method for histograms.
+
+        Raises:
+            :exc:`ValueError` if the number of values does not match the number
+                of labels.
+        """
+        value = self._values.get(label_values)
+        if value is not None:
+            return value
+        if len(label_values) != len(self._label_names):
+            raise ValueError('Metric "%s" has %d labels, %d values given.' \
+                % (self._name, len(self._label_names), len(label_values)))
+        with self._lock:
+            value = self._values.get(label_values)
+            if value is None:
+                value = _HistogramValue(self._buckets) \
+                    if self._type == self.HISTOGRAM else _Value()
+                values = dict(self._values)
+                values[label_values] = value
+                self._values = values
+            return value
+
+    def remove(self, *label_values):
+        """Remove the value of the metric for a set of label values.
+
+        Args:
+            *label_values: Values of the labels, in the order of their names.
+        """
+        with self._lock:
+            values = dict(self._values)
+            values.pop(label_values, None)
+            self._values = values
+
+    def render(self):
+        """Render the metric in the Prometheus text format.
+
+        Returns:
+            list: The lines.
+        """
+        lines = [
+            '# HELP %s %s' % (self._name, \
+                self._documentation.replace('\\', '\\\\').replace('\n', '\\n')),
+            '# TYPE %s %s' % (self._name, self._type)]
+        for (label_values, value) in sorted(self._values.items()):
+            if self._type != self.HISTOGRAM:
+                lines.append('%s%s %s' % (self._name, \
+                    _format_labels(self._label_names, label_values), \
+                    _format_number(value.get())))
+                continue
+            (buckets, total, count) = value.get()
+            for (bound, cumulative) in buckets:
+                lines.append('%s_bucket%s %d' % (self._name, \
+                    _format_labels(self._label_names, label_values, \
+                        'le="%s"' % (_format_number(bound))), cumulative))
+            labels = _format_labels(self._label_names, label_values)
+            lines.append('%s_sum%s %s' % (self._name, labels, \
+                _format_number(total)))
+            lines.append('%s_count%s %d' % (self._name, labels, count))
+        return lines
+
+
+class MetricsRegistry(object):
+    """Class holding a set of metrics."""
+
+    def __init__(self):
+        """Constructor."""
+        self._lock = threading.Lock()
+        self._families = {}
+
+    def counter(self, name, documentation, label_names=()):
+        """Get a counter, creating it if needed.
+
+        Args:
+            name (str): Name of the metric.
+            documentation (str): Description of the metric.
+            label_names (tuple): Names of the labels.
+
+        Returns:
+            :class:`MetricFamily`: The metric.
+
+        Raises:
+            :exc:`ValueError` if a different metric with the same name exists.
+        """
+        return self._get_family(name, documentation, MetricFamily.COUNTER, \
+            label_names)
+
+    def gauge(self, name, documentation, label_names=()):
+        """Get a gauge, creating it if needed.
+
+        Args:
+            name (str): Name of the metric.
+            documentation (str): Description of the metric.
+            label_names (tuple): Names of the labels.
+
+        Returns:
+            :class:`MetricFamily`: The metric.
+
+        Raises:
+            :exc:`ValueError` if a different metric with the same name exists.
+        """
+        return self._get_family(name, documentation, MetricFamily.GAUGE, \
+            label_names)
+
+    def histogram(self, name, documentation, label_names=(), \
+        buckets=LATENCY_BUCKETS_s):
+        """Get a histogram, creating it if needed.
+
+        Args:
+            name (str): Name of the metric.
+            documentation (str): Description of the metric.
+            label_names (tuple): Names of the labels.
+            buckets (tuple): Upper bounds of the buckets.
+
+        Returns:
+            :class:`MetricFamily`: The metric.
+
+        Raises:
+            :exc:`ValueError` if a different metric with the same name exists.
+        """
+        return self._get_family(name, documentation, MetricFamily.HISTOGRAM, \
+            label_names, buckets)
+
+    def get(self, name):
+        """Get a metric.
+
+        Args:
+            name (str): Name of the metric.
+
+        Returns:
+            :class:`MetricFamily`: The metric, or None if not existing.
+        """
+        return self._families.get(name)
+
+    def get_names(self):
+        """Get the names of the metrics.
+
+        Returns:
+            list: The names, sorted.
+        """
+        return sorted(self._families.keys())
+
+    def render(self):
+        """Render the metrics in the Prometheus text format.
+
+        Returns:
+            str: The metrics.
+        """
+        lines = []
+        for name in self.get_names():
+            lines.extend(self._families[name].render())
+        return '\n'.join(lines) + '\n'
+
+    def _get_family(self, name, documentation, metric_type, label_names, \
+        buckets=LATENCY_BUCKETS_s):
+        """Get a metric, creating it if needed.
+
+        Args:
+            name (str): Name of the metric.
+            documentation (str): Description of the metric.
+            metric_type (str): Type of the metric.
+            label_names (tuple): Names of the labels.
+            buckets (tuple): Upper bounds of the buckets, for histograms only.
+
+        Returns:
+            :class:`MetricFamily`: The metric.
+
+        Raises:
+            :exc:`ValueError` if a different metric with the same name exists.
+        """
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = MetricFamily(name, documentation, metric_type, \
+                    label_names, buckets)
+                self._families[name] = family
+            elif family.get_type() != metric_type \
+                or family.get_label_names() != tuple(label_names):
+                raise ValueError('Metric "%s" already exists with a different '
+                    'type or labels.' % (name))
+            return family
+
+
+REGISTRY = MetricsRegistry()
+"""Registry of the metrics of the SDK."""
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server handling each request on a separate thread."""
+
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    """Class responsible for exposing the metrics of a registry over HTTP, in
+    the Prometheus text format.
+    """
+
+    def __init__(self, port, host='127.0.0.1', registry=None, path='/metrics'):
+        """Constructor.
+
+        Args:
+            port (int): Port to listen to. A free port is chosen if 0.
+            host (str): Address to listen to. Local connections only by
+                default.
+            registry (:class:`MetricsRegistry`): The registry. :data:`REGISTRY`
+                if not given.
+            path (str): Path the metrics are served at.
+        """
+        registry = registry if registry is not None else REGISTRY
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] != path:
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    def get_port(self):
+        """Get the port the server listens to.
+
+        Returns:
+            int: The port.
+        """
+        return self._server.server_address[1]
+
+    def start(self):
+        """Start serving the metrics on a separate thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving the metrics."""
+        if self._thread is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._thread = None
+
@@ -0,0 +1,672 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""persistent_queue
+
+The persistent_queue module implements a bounded first-in first-out queue of
+MQTT messages stored on disk, so that the messages published while the
+connection is down survive both long outages and restarts of the process.
+
+The queue is an append-only log split into segment files. Each record holds a
+message with a header made of its length, a CRC-32 checksum, a flags byte, the
+eviction priority, the quality of service, and the length of the topic. The
+position of the head of the queue is stored in a small file of its own, which
+is overwritten in place whenever a message is removed. Segments are read
+through memory maps and are deleted as soon as the head moves past them.
+
+After a crash the queue is rebuilt by scanning the records from the head: a
+truncated or corrupted record ends the segment, and the messages removed but
+not yet recorded in the head file are replayed, i.e. delivery is
+at-least-once.
+"""
+
+
+# IMPORT
+
+import collections
+import mmap
+import os
+import struct
+import threading
+import zlib
+from enum import Enum
+
+
+# CONSTANTS
+
+_SEGMENT_EXT = '.log'
+"""Extension of the segment files."""
+
+_HEAD_FILE = 'head'
+"""Name of the file storing the position of the head of the queue."""
+
+_RECORD_HEADER = struct.Struct('>IIBBBH')
+"""Header of a record: length of what follows the flags, CRC-32 checksum of
+the flags and of what follows them, flags, priority, quality of service,
+length of the topic."""
+
+_HEAD = struct.Struct('>QQI')
+"""Content of the head file: segment, offset, CRC-32 checksum."""
+
+_FLAG_DELETED = 0x01
+"""Flag of the records evicted from the middle of the queue."""
+
+_FLAG_TEXT = 0x02
+"""Flag of the records whose payload is a text string."""
+
+
+# CLASSES
+
+class OverflowPolicy(Enum):
+    """Policy applied when a new message does not fit the queue."""
+
+    DROP_OLDEST = 0
+    """Evict the oldest messages."""
+
+    DROP_NEWEST = 1
+    """Reject the new message."""
+
+    PRIORITY = 2
+    """Evict the oldest messages with the lowest priority, provided that it is
+    not higher than the priority of the new message, which is rejected
+    otherwise."""
+
+
+class PersistentQueueMessage(object):
+    """Message read from a :class:`PersistentQueue`."""
+
+    __slots__ = ('topic', 'payload', 'qos', 'priority', '_position')
+
+    def __init__(self, topic, payload, qos, priority, position):
+        """Constructor.
+
+        Args:
+            topic (str): Topic name.
+            payload (str): Payload.
+            qos (int): Quality of Service.
+            priority (int): Eviction priority.
+            position (tuple): Segment and offset of the record.
+        """
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.priority = priority
+        self._position = position
+
+
+class PersistentQueue(object):
+    """Class responsible for storing MQTT messages on disk in first-in
+    first-out order, within a maximum number of messages and bytes.
+
+    Messages are consumed in two steps: :meth:`peek` reads the oldest message,
+    and :meth:`remove` removes it once it has been delivered. All methods are
+    thread-safe.
+    """
+
+    SEGMENT_BYTES = 4 * 1024 * 1024
+    """Default size of a segment file in bytes."""
+
+    def __init__(self, path, max_messages=0, max_bytes=0, \
+        overflow_policy=OverflowPolicy.DROP_OLDEST, segment_bytes=SEGMENT_BYTES, \
+        sync=False):
+        """Constructor.
+
+        Opens the queue stored in the given directory, if any, or creates a new
+        one.
+
+        Args:
+            path (str): Path of the directory holding the queue.
+            max_messages (int): Maximum number of messages. Zero means no
+                limit.
+            max_bytes (int): Maximum size of the messages on disk in bytes,
+                headers included. Zero means no limit.
+            overflow_policy (:class:`OverflowPolicy`): Policy applied when a new
+                message does not fit the queue.
+            segment_bytes (int): Size of a segment file in bytes, beyond which a
+                new segment is started.
+            sync (bool): If True, every new message is flushed to the disk
+                before :meth:`put` returns, so as to survive power failures
+                too, at the cost of much slower writes.
+        """
+        self._path = path
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._overflow_policy = overflow_policy
+        self._segment_bytes = segment_bytes
+        self._sync = sync
+        self._lock = threading.RLock()
+        self._segments = []
+        self._maps = {}
+        self._writer = None
+        self._writer_segment = None
+        self._head = (0, 0)
+        self._entries = {}
+        self._size = 0
+        self._bytes = 0
+        self._dropped = 0
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+        if not os.path.exists(self._get_head_path()):
+            open(self._get_head_path(), 'wb').close()
+        self._head_file = open(self._get_head_path(), 'r+b')
+        self._recover()
+
+    def get_size(self):
+        """Get the number of messages in the queue.
+
+        Returns:
+            int: The number of messages.
+        """
+        return self._size
+
+    def get_bytes(self):
+        """Get the size of the messages in the queue, headers included.
+
+        Returns:
+            int: The size in bytes.
+        """
+        return self._bytes
+
+    def get_dropped(self):
+        """Get the number of messages dropped because of the limits of the
+        queue.
+
+        Returns:
+            int: The number of dropped messages.
+        """
+        return self._dropped
+
+    def put(self, topic, payload, qos, priority=0):
+        """Append a message to the queue, evicting older messages if needed.
+
+        Args:
+            topic (str): Topic name.
+            payload (str): Payload, either a text or a binary string.
+            qos (int): Quality of Service.
+            priority (int): Eviction priority, from 0 (lowest) to 255.
+
+        Returns:
+            bool: True if the message has been queued, False if it has been
+            rejected.
+        """
+        flags = 0
+        if not isinstance(payload, bytes):
+            payload = payload.encode('utf-8')
+            flags = _FLAG_TEXT
+        topic_bytes = topic.encode('utf-8')
+        body = struct.pack('>BBH', priority, qos, len(topic_bytes)) \
+            + topic_bytes + payload
+        record_bytes = _RECORD_HEADER.size + len(topic_bytes) + len(payload)
+        with self._lock:
+            if not self._make_room(record_bytes, priority):
+                self._dropped += 1
+                return False
+            if self._writer is None \
+                or (self._writer.tell() > 0 \
+                and self._writer.tell() + record_bytes > self._segment_bytes):
+                self._open_writer(self._segments[-1] + 1 if self._segments else self._head[0])
+            offset = self._writer.tell()
+            crc = zlib.crc32(struct.pack('>B', flags) + body) & 0xffffffff
+            self._writer.write(struct.pack('>IIB', len(body), crc, flags) + body)
+            self._writer.flush()
+            if self._sync:
+                os.fsync(self._writer.fileno())
+            if not self._size:
+                for segment in [s for s in self._segments if s < self._writer_segment]:
+                    self._delete_segment(segment)
+                self._write_head((self._writer_segment, offset))
+            self._entries.setdefault(priority, collections.deque()).append( \
+                (self._writer_segment, offset, record_bytes))
+            self._size += 1
+            self._bytes += record_bytes
+            return True
+
+    def peek(self, after=None):
+        """Read a message of the queue, without removing it.
+
+        Args:
+            after (:class:`PersistentQueueMessage`): If given, the message
+                following this one is read, so that many messages can be read
+                before removing them. The oldest message is read if this one
+                has already been removed from the head of the queue.
+
+        Returns:
+            :class:`PersistentQueueMessage`: The oldest message, or the one
+            following the given message, or None if there is no such message.
+        """
+        with self._lock:
+            if not self._size:
+                return None
+            position = self._head
+            if after is not None and after._position >= self._head:
+                position = self._get_next_position(after._position)
+                if position is None:
+                    return None
+            _, flags, priority, qos, topic, payload = self._read(*position)
+            if flags & _FLAG_TEXT:
+                payload = payload.decode('utf-8')
+            return PersistentQueueMessage(topic, payload, qos, priority, position)
+
+    def remove(self, message):
+        """Remove a message read through :meth:`peek`, either from the head of
+        the queue or from the middle, if read in advance.
+
+        Nothing happens if the message has already been evicted.
+
+        Args:
+            message (:class:`PersistentQueueMessage`): The message to remove.
+        """
+        with self._lock:
+            entries = self._entries.get(message.priority)
+            if not entries:
+                return
+            for entry in entries:
+                if (entry[0], entry[1]) == message._position:
+                    self._evict(message.priority, entry)
+                    return
+
+    def clear(self):
+        """Remove all the messages from the queue."""
+        with self._lock:
+            self._close_files(False)
+            for segment in self._segments:
+                os.remove(self._get_segment_path(segment))
+            next_segment = self._segments[-1] + 1 if self._segments else self._head[0]
+            self._segments = []
+            self._entries = {}
+            self._size = 0
+            self._bytes = 0
+            self._write_head((next_segment, 0))
+
+    def close(self):
+        """Close the files of the queue. The queue must not be used anymore."""
+        with self._lock:
+            self._close_files(True)
+
+    def _make_room(self, record_bytes, priority):
+        """Evict messages according to the overflow policy until a new
+        message fits the queue.
+
+        Must be called with the lock held.
+
+        Args:
+            record_bytes (int): Size of the new message in bytes.
+            priority (int): Priority of the new message.
+
+        Returns:
+            bool: True if the new message fits the queue, False otherwise.
+        """
+        if self._max_bytes and record_bytes > self._max_bytes:
+            return False
+        while (self._max_messages and self._size + 1 > self._max_messages) \
+            or (self._max_bytes and self._bytes + record_bytes > self._max_bytes):
+            if self._overflow_policy == OverflowPolicy.DROP_NEWEST:
+                return False
+            if self._overflow_policy == OverflowPolicy.DROP_OLDEST:
+                victim = self._find_entry(self._head)
+            else:
+                victim = min(p for p in self._entries if self._entries[p])
+                if victim > priority:
+                    return False
+                victim = (victim, self._entries[victim][0])
+            self._evict(*victim)
+            self._dropped += 1
+        return True
+
+    def _find_entry(self, position):
+        """Find the entry of the record at a given position.
+
+        Must be called with the lock held.
+
+        Args:
+            position (tuple): Segment and offset of the record.
+
+        Returns:
+            tuple: The priority and the entry of the record.
+        """
+        for priority, entries in self._entries.items():
+            if entries and (entries[0][0], entries[0][1]) == position:
+                return priority, entries[0]
+        raise ValueError('No message at position %s.' % (position,))
+
+    def _evict(self, priority, entry):
+        """Remove a message from the queue.
+
+        The head is moved forward if the message is the oldest one, otherwise
+        its record is marked as deleted.
+
+        Must be called with the lock held.
+
+        Args:
+            priority (int): Priority of the message.
+            entry (tuple): Segment, offset and size of the record.
+        """
+        self._entries[priority].remove(entry)
+        self._size -= 1
+        self._bytes -= entry[2]
+        segment, offset, _ = entry
+        if (segment, offset) != self._head:
+            self._mark_deleted(segment, offset)
+            return
+        self._advance()
+
+    def _advance(self):
+        """Move the head past the oldest record and the deleted records
+        following it, deleting the segments left behind, and persist it.
+
+        Must be called with the lock held.
+        """
+        segment, offset = self._head
+        while True:
+            offset += self._read(segment, offset)[0]
+            while offset >= self._get_segment_end(segment) \
+                and segment != self._segments[-1]:
+                self._delete_segment(segment)
+                segment = self._segments[0]
+                offset = 0
+            if offset >= self._get_segment_end(segment) \
+                or not self._read(segment, offset)[1] & _FLAG_DELETED:
+                break
+        self._write_head((segment, offset))
+
+    def _get_next_position(self, position):
+        """Get the position of the first record following a given one which
+        has not been deleted.
+
+        Must be called with the lock held.
+
+        Args:
+            position (tuple): Segment and offset of the record.
+
+        Returns:
+            tuple: Segment and offset of the following record, or None if there
+            is no such record.
+        """
+        segment, offset = position
+        offset += self._read(segment, offset)[0]
+        while True:
+            if offset >= self._get_segment_end(segment):
+                following = [s for s in self._segments if s > segment]
+                if not following:
+                    return None
+                segment = following[0]
+                offset = 0
+                continue
+            size, flags = self._read(segment, offset)[:2]
+            if not flags & _FLAG_DELETED:
+                return segment, offset
+            offset += size
+
+    def _read(self, segment, offset):
+        """Read a record.
+
+        Must be called with the lock held.
+
+        Args:
+            segment (int): Segment of the record.
+            offset (int): Offset of the record within the segment.
+
+        Returns:
+            tuple: Size, flags, priority, quality of service, topic and payload
+            of the record.
+        """
+        data = self._get_map(segment, offset + _RECORD_HEADER.size)
+        length, _, flags, priority, qos, topic_length = \
+            _RECORD_HEADER.unpack_from(data, offset)
+        start = offset + _RECORD_HEADER.size
+        end = offset + 9 + length
+        data = self._get_map(segment, end)
+        topic = data[start:start + topic_length].decode('utf-8')
+        payload = data[start + topic_length:end]
+        return end - offset, flags, priority, qos, topic, payload
+
+    def _get_map(self, segment, size):
+        """Get a memory map of a segment covering at least a given size.
+
+        Must be called with the lock held.
+
+        Args:
+            segment (int): The segment.
+            size (int): The minimum size of the map.
+
+        Returns:
+            :class:`mmap.mmap`: The memory map.
+        """
+        data = self._maps.get(segment)
+        if data is None or len(data) < size:
+            if data is not None:
+                data.close()
+            with open(self._get_segment_path(segment), 'rb') as segment_file:
+                data = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = data
+        return data
+
+    def _get_segment_end(self, segment):
+        """Get the size of a segment.
+
+        Must be called with the lock held.
+
+        Args:
+            segment (int): The segment.
+
+        Returns:
+            int: The size of the segment in bytes.
+        """
+        if segment == self._writer_segment:
+            return self._writer.tell()
+        return os.path.getsize(self._get_segment_path(segment))
+
+    def _mark_deleted(self, segment, offset):
+        """Mark a record as deleted, in place.
+
+        Must be called with the lock held.
+
+        Args:
+            segment (int): Segment of the record.
+            offset (int): Offset of the record within the segment.
+        """
+        flags = self._read(segment, offset)[1] | _FLAG_DELETED
+        with open(self._get_segment_path(segment), 'r+b') as segment_file:
+            segment_file.seek(offset + 8)
+            segment_file.write(struct.pack('>B', flags))
+
+    def _open_writer(self, segment):
+        """Start appending records to a segment.
+
+        Must be called with the lock held.
+
+        Args:
+            segment (int): The segment.
+        """
+        if self._writer:
+            self._writer.close()
+        self._writer = open(self._get_segment_path(segment), 'ab')
+        self._writer.seek(0, os.SEEK_END)
+        self._writer_segment = segment
+        if segment not in self._segments:
+            self._segments.append(segment)
+
+    def _delete_segment(self, segment):
+        """Delete a segment file.
+
+        Must be called with the lock held.
+
+        Args:
+            segment (int): The segment.
+        """
+        data = self._maps.pop(segment, None)
+        if data is not None:
+            data.close()
+        if segment == self._writer_segment:
+            self._writer.close()
+            self._writer = None
+            self._writer_segment = None
+        self._segments.remove(segment)
+        os.remove(self._get_segment_path(segment))
+
+    def _write_head(self, head):
+        """Persist the position of the head, overwriting the head file in
+        place.
+
+        Must be called with the lock held.
+
+        Args:
+            head (tuple): Segment and offset of the head.
+        """
+        self._head = head
+        data = struct.pack('>QQ', head[0], head[1])
+        self._head_file.seek(0)
+        self._head_file.write(data + struct.pack('>I', zlib.crc32(data) & 0xffffffff))
+        self._head_file.flush()
+        if self._sync:
+            os.fsync(self._head_file.fileno())
+
+    def _read_head(self):
+        """Read the position of the head from the head file.
+
+        Returns:
+            tuple: Segment and offset of the head, or None if the head file is
+            missing or corrupted.
+        """
+        self._head_file.seek(0)
+        data = self._head_file.read(_HEAD.size)
+        if len(data) != _HEAD.size:
+            return None
+        segment, offset, crc = _HEAD.unpack(data)
+        if zlib.crc32(data[:16]) & 0xffffffff != crc:
+            return None
+        return segment, offset
+
+    def _recover(self):
+        """Rebuild the state of the queue from the files on disk, truncating
+        the segments at their first invalid record."""
+        self._segments = sorted( \
+            int(name[:-len(_SEGMENT_EXT)]) for name in os.listdir(self._path) \
+            if name.endswith(_SEGMENT_EXT) and name[:-len(_SEGMENT_EXT)].isdigit())
+        head = self._read_head()
+        if not self._segments:
+            self._head = (head[0], 0) if head else (0, 0)
+            return
+        if head is None or head[0] < self._segments[0]:
+            head = (self._segments[0], 0)
+        for segment in [s for s in self._segments if s < head[0]]:
+            self._segments.remove(segment)
+            os.remove(self._get_segment_path(segment))
+        self._head = None
+        for segment in list(self._segments):
+            offset = head[1] if segment == head[0] else 0
+            end = self._get_valid_end(segment, offset)
+            if end < os.path.getsize(self._get_segment_path(segment)):
+                with open(self._get_segment_path(segment), 'r+b') as segment_file:
+                    segment_file.truncate(end)
+                data = self._maps.pop(segment, None)
+                if data is not None:
+                    data.close()
+            while offset < end:
+                size, flags, priority, _, _, _ = self._read(segment, offset)
+                if not flags & _FLAG_DELETED:
+                    if self._head is None:
+                        self._head = (segment, offset)
+                    self._entries.setdefault(priority, collections.deque()).append( \
+                        (segment, offset, size))
+                    self._size += 1
+                    self._bytes += size
+                offset += size
+        self._open_writer(self._segments[-1])
+        if self._head is None:
+            self._head = (self._writer_segment, self._writer.tell())
+        for segment in [s for s in self._segments if s < self._head[0]]:
+            self._delete_segment(segment)
+        self._write_head(self._head)
+
+    def _get_valid_end(self, segment, offset):
+        """Find the end of the valid records of a segment.
+
+        Args:
+            segment (int): The segment.
+            offset (int): Offset of the first record to check.
+
+        Returns:
+            int: The offset of the first invalid record, or the size of the
+            segment if all the records are valid.
+        """
+        size = os.path.getsize(self._get_segment_path(segment))
+        if not size:
+            return 0
+        data = self._get_map(segment, size)
+        while offset + _RECORD_HEADER.size <= size:
+            length, crc, flags = struct.unpack_from('>IIB', data, offset)
+            end = offset + 9 + length
+            if length < 4 or end > size:
+                break
+            check = zlib.crc32(struct.pack('>B', flags & ~_FLAG_DELETED) \
+                + data[offset + 9:end]) & 0xffffffff
+            if check != crc:
+                break
+            offset = end
+        return offset
+
+    def _close_files(self, close_head):
+        """Close the memory maps and the files of the queue.
+
+        Must be called with the lock held.
+
+        Args:
+            close_head (bool): If True, the head file is closed too.
+        """
+        for data in self._maps.values():
+            data.close()
+        self._maps = {}
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+            self._writer_segment = None
+        if close_head:
+            self._head_file.close()
+
+    def _get_segment_path(self, segment):
+        """Get the path of a segment file.
+
+        Args:
+            segment (int): The segment.
+
+        Returns:
+            str: The path of the segment file.
+        """
+        return os.path.join(self._path, '%016d%s' % (segment, _SEGMENT_EXT))
+
+    def _get_head_path(self):
+        """Get the path of the head file.
+
+        Returns:
+            str: The path of the head file.
+        """
+        return os.path.join(self._path, _HEAD_FILE)
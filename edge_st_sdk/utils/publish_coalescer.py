@@ -0,0 +1,236 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+"""publish_coalescer
+
+The publish_coalescer module packs messages bound for the same topic into a
+single envelope message, so that many samples cost a single MQTT message.
+
+An envelope is a JSON document whose "batch" key holds the list of the
+coalesced payloads, in publishing order, e.g.:
+``{"batch":[{"Temperature":"25.1"},{"Temperature":"25.2"}]}``
+
+Only JSON payloads can be coalesced: binary payloads, e.g. CBOR or MessagePack
+documents, are published as they are.
+"""
+
+
+# IMPORT
+
+import sys
+import threading
+import time
+
+
+# CONSTANTS
+
+_PY2 = sys.version_info[0] == 2
+"""True if running on Python 2, where strings are sequences of bytes."""
+
+_TEXT_TYPE = type(u'')
+"""Type of the text strings."""
+
+_BINARY_TYPES = (bytearray,) if _PY2 else (bytes, bytearray)
+"""Types of the binary payloads, which are not coalesced."""
+
+
+# FUNCTIONS
+
+def _encoded_size(payload):
+    """Get the size of a JSON payload once encoded in UTF-8.
+
+    Args:
+        payload (str): The payload.
+
+    Returns:
+        int: The size in bytes.
+    """
+    if isinstance(payload, _TEXT_TYPE):
+        return len(payload.encode('utf-8'))
+    return len(payload)
+
+
+# CLASSES
+
+class PublishCoalescer(object):
+    """Class responsible for coalescing the messages published on the same
+    topic into envelope messages.
+
+    A topic's envelope is published as soon as it reaches the maximum number
+    of messages or the maximum size, or when its oldest message has waited for
+    the maximum latency, whichever comes first.
+    """
+
+    ENVELOPE_KEY = 'batch'
+    """Key of the envelope's JSON document holding the coalesced payloads."""
+
+    MAX_PAYLOAD_BYTES = 128 * 1024
+    """Default maximum size of an envelope, i.e. the AWS IoT message limit."""
+
+    def __init__(self, publish, max_messages=0, max_bytes=MAX_PAYLOAD_BYTES, \
+        max_latency_s=0):
+        """Constructor.
+
+        Args:
+            publish: Function to be called to publish an envelope, with the
+                topic, the payload, and the quality of service as arguments.
+            max_messages (int): Maximum number of messages per envelope. Zero
+                means no limit.
+            max_bytes (int): Maximum size of an envelope in bytes. Zero means
+                no limit.
+            max_latency_s (float): Maximum time in seconds a message may wait
+                for its envelope to be published. Zero means that envelopes are
+                published only when full or when explicitly flushed.
+        """
+        self._publish = publish
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._max_latency_s = max_latency_s
+        self._prefix = '{"' + self.ENVELOPE_KEY + '":['
+        self._suffix = ']}'
+        self._batches = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._timer_thread = None
+        if max_latency_s > 0:
+            self._timer_thread = threading.Thread(target=self._run_timer)
+            self._timer_thread.daemon = True
+            self._timer_thread.start()
+
+    def add(self, topic, payload, qos):
+        """Add a message to the envelope of its topic.
+
+        Args:
+            topic (str): Topic name to publish to.
+            payload (str): Payload to publish (JSON formatted string). Binary
+                payloads are published right away, without coalescing.
+            qos (int): Quality of Service. Could be "0" or "1". The envelope is
+                published with the highest quality of service of its messages.
+        """
+        if isinstance(payload, _BINARY_TYPES):
+            self._publish(topic, payload, qos)
+            return
+        size = _encoded_size(payload)
+        ready = []
+        with self._condition:
+            batch = self._batches.get(topic)
+            if batch is not None and self._max_bytes and \
+                batch.size + size + 1 > self._max_bytes:
+                ready.append(self._pop(topic))
+                batch = None
+            if batch is None:
+                batch = _Batch(len(self._prefix) + len(self._suffix) - 1)
+                self._batches[topic] = batch
+                self._condition.notify()
+            batch.append(payload, size, qos)
+            if (self._max_messages and len(batch.payloads) >= self._max_messages) \
+                or (self._max_bytes and batch.size >= self._max_bytes):
+                ready.append(self._pop(topic))
+        for envelope in ready:
+            self._publish(*envelope)
+
+    def flush(self, topics=None):
+        """Publish the pending envelopes.
+
+        Args:
+            topics (list): Topics whose envelopes have to be published. All of
+                them if not given.
+        """
+        with self._condition:
+            if topics is None:
+                topics = list(self._batches.keys())
+            ready = [self._pop(topic) for topic in topics if topic in self._batches]
+        for envelope in ready:
+            self._publish(*envelope)
+
+    def close(self):
+        """Publish the pending envelopes and stop the coalescer."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self.flush()
+
+    def _pop(self, topic):
+        """Remove the batch of a topic and build its envelope.
+
+        Must be called with the lock held.
+
+        Args:
+            topic (str): Topic name.
+
+        Returns:
+            tuple: Topic, envelope payload, and quality of service.
+        """
+        batch = self._batches.pop(topic)
+        return (topic, self._prefix + ','.join(batch.payloads) + self._suffix, batch.qos)
+
+    def _run_timer(self):
+        """Publish the envelopes whose oldest message has waited for too
+        long."""
+        while True:
+            ready = []
+            with self._condition:
+                if self._closed:
+                    return
+                now = time.time()
+                timeout = None
+                for topic in list(self._batches.keys()):
+                    deadline = self._batches[topic].created + self._max_latency_s
+                    if deadline <= now:
+                        ready.append(self._pop(topic))
+                    elif timeout is None or deadline - now < timeout:
+                        timeout = deadline - now
+                if not ready:
+                    self._condition.wait(timeout)
+            for envelope in ready:
+                self._publish(*envelope)
+
+
+class _Batch(object):
+    """Messages waiting to be published within the same envelope."""
+
+    __slots__ = ('payloads', 'size', 'qos', 'created')
+
+    def __init__(self, overhead):
+        """Constructor.
+
+        Args:
+            overhead (int): Size in bytes of the envelope without payloads.
+        """
+        self.payloads = []
+        self.size = overhead
+        self.qos = 0
+        self.created = time.time()
+
+    def append(self, payload, size, qos):
+        self.payloads.append(payload)
+        # One more byte for the separator.
+        self.size += size + 1
+        if qos > self.qos:
+            self.qos = qos
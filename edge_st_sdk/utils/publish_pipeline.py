@@ -0,0 +1,373 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""publish_pipeline
+
+The publish_pipeline module queues outgoing messages in front of a client,
+so that producers are told when messages cannot be accepted instead of having
+them silently lost, and can slow down before that happens.
+
+Messages are accepted into a bounded queue, waiting for room or not as chosen
+by the producer, and are published in order by a sender thread while the
+client is able to send them. Messages whose publication fails, e.g. because
+the queue of the underlying MQTT client is full, are retried before being
+counted as failed. A callback is notified when the number of queued messages
+reaches the high watermark, and when it gets back down to the low watermark.
+"""
+
+
+# IMPORT
+
+import threading
+import time
+from collections import deque
+
+
+# CONSTANTS
+
+WAIT_s = 0.1
+"""Maximum time waited by the sender thread before checking whether the client
+has become ready or the pipeline has been closed."""
+
+RETRIES = 3
+"""Number of times the publication of a message is retried after a failure."""
+
+RETRY_DELAY_s = 0.1
+"""Time waited before the first retry, doubled at each further retry."""
+
+
+# CLASSES
+
+class PublishStats(object):
+    """Class holding the counters of the messages of a topic."""
+
+    __slots__ = ('accepted', 'dropped', 'published', 'failed')
+
+    def __init__(self):
+        """Constructor."""
+        self.accepted = 0
+        """Number of messages accepted into the queue."""
+        self.dropped = 0
+        """Number of messages not accepted because the queue was full or the
+        pipeline closed."""
+        self.published = 0
+        """Number of messages handed over to the client."""
+        self.failed = 0
+        """Number of messages whose publication failed despite the
+        retries."""
+
+    def _add(self, stats):
+        """Add the counters of another topic.
+
+        Args:
+            stats (:class:`PublishStats`): The counters.
+        """
+        self.accepted += stats.accepted
+        self.dropped += stats.dropped
+        self.published += stats.published
+        self.failed += stats.failed
+
+
+class PublishPipeline(object):
+    """Class responsible for queueing messages and publishing them on a
+    separate thread, applying backpressure to the producers.
+    """
+
+    def __init__(self, publish, capacity, ready=None, high_watermark=0, \
+        low_watermark=0, watermark_callback=None):
+        """Constructor.
+
+        Args:
+            publish (function): Function called with the topic name, the
+                payload, and the quality of service of a message to publish it;
+                it may either return False or raise an exception if the message
+                cannot be published.
+            capacity (int): Maximum number of queued messages.
+            ready (function): Function without arguments returning whether the
+                messages can be published, e.g. whether the client is
+                connected. Messages are kept in the queue while it returns
+                False. Always ready if not given.
+            high_watermark (int): Number of queued messages at which the
+                watermark callback is notified of the backpressure. The
+                capacity if 0.
+            low_watermark (int): Number of queued messages at which the
+                watermark callback is notified of the end of the backpressure.
+                Half of the high watermark if 0.
+            watermark_callback (function): Function called with a boolean
+                telling whether the backpressure is on, and with the number of
+                queued messages, when a watermark is crossed. It is called on
+                the thread submitting or sending the message, and must not
+                submit messages itself.
+        """
+        if capacity <= 0:
+            raise ValueError('The capacity must be positive.')
+        self._publish = publish
+        self._capacity = capacity
+        self._ready = ready
+        self._high_watermark = min(high_watermark or capacity, capacity)
+        self._low_watermark = min(low_watermark or self._high_watermark // 2, \
+            self._high_watermark - 1)
+        self._watermark_callback = watermark_callback
+        self._condition = threading.Condition()
+        self._messages = deque()
+        self._stats = {}
+        self._pressure = False
+        self._sending = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._send)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, topic, payload, qos, block=True, timeout_s=None):
+        """Submit a message to publish.
+
+        Args:
+            topic (str): Topic name to publish to.
+            payload (str): Payload to publish.
+            qos (int): Quality of Service. Could be "0" or "1".
+            block (bool): If True, wait for room in the queue when full,
+                otherwise drop the message right away.
+            timeout_s (float): Maximum time to wait for room in the queue, in
+                seconds. Wait forever if None.
+
+        Returns:
+            bool: True if the message has been accepted, False if it has been
+            dropped.
+        """
+        with self._condition:
+            stats = self._get_stats(topic)
+            if len(self._messages) >= self._capacity and block \
+                and not self._closed:
+                deadline = time.time() + timeout_s \
+                    if timeout_s is not None else None
+                while len(self._messages) >= self._capacity \
+                    and not self._closed:
+                    if deadline is None:
+                        self._condition.wait()
+                        continue
+                    remaining_s = deadline - time.time()
+                    if remaining_s <= 0:
+                        break
+                    self._condition.wait(remaining_s)
+            if len(self._messages) >= self._capacity or self._closed:
+                stats.dropped += 1
+                return False
+            self._messages.append((topic, payload, qos))
+            stats.accepted += 1
+            self._condition.notify_all()
+            size = len(self._messages)
+            notify = not self._pressure and size >= self._high_watermark
+            if notify:
+                self._pressure = True
+        if notify and self._watermark_callback:
+            self._watermark_callback(True, size)
+        return True
+
+    def get_size(self):
+        """Get the number of queued messages.
+
+        Returns:
+            int: The number of messages.
+        """
+        return len(self._messages)
+
+    def get_capacity(self):
+        """Get the maximum number of queued messages.
+
+        Returns:
+            int: The number of messages.
+        """
+        return self._capacity
+
+    def is_under_pressure(self):
+        """Check whether the high watermark has been reached, and the low
+        watermark not yet reached again since.
+
+        Returns:
+            bool: True if the backpressure is on, False otherwise.
+        """
+        return self._pressure
+
+    def get_stats(self, topic=None):
+        """Get the counters of the messages.
+
+        Args:
+            topic (str): Topic name. All the topics if not given.
+
+        Returns:
+            :class:`PublishStats`: A copy of the counters.
+        """
+        stats = PublishStats()
+        with self._condition:
+            if topic is not None:
+                if topic in self._stats:
+                    stats._add(self._stats[topic])
+            else:
+                for topic_stats in self._stats.values():
+                    stats._add(topic_stats)
+        return stats
+
+    def get_topics(self):
+        """Get the topics messages have been submitted to.
+
+        Returns:
+            list: The topic names.
+        """
+        with self._condition:
+            return list(self._stats.keys())
+
+    def flush(self, timeout_s=None):
+        """Wait for the queued messages to be sent.
+
+        Args:
+            timeout_s (float): Maximum time to wait, in seconds. Wait forever
+                if None.
+
+        Returns:
+            bool: True if the queue has been emptied, False otherwise.
+        """
+        deadline = time.time() + timeout_s if timeout_s is not None else None
+        with self._condition:
+            while self._messages or self._sending:
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining_s = deadline - time.time()
+                if remaining_s <= 0:
+                    return False
+                self._condition.wait(remaining_s)
+            return True
+
+    def close(self, timeout_s=None):
+        """Stop accepting messages, and stop the sender thread once the queued
+        messages have been sent.
+
+        Args:
+            timeout_s (float): Maximum time to wait for the queued messages to
+                be sent, in seconds; the ones left are discarded. Wait forever
+                if None.
+
+        Returns:
+            int: The number of messages discarded.
+        """
+        self.flush(timeout_s)
+        with self._condition:
+            self._closed = True
+            discarded = len(self._messages)
+            self._messages.clear()
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        return discarded
+
+    def _get_stats(self, topic):
+        """Get the counters of a topic, creating them if needed. To be called
+        while holding the lock.
+
+        Args:
+            topic (str): Topic name.
+
+        Returns:
+            :class:`PublishStats`: The counters.
+        """
+        stats = self._stats.get(topic)
+        if stats is None:
+            stats = PublishStats()
+            self._stats[topic] = stats
+        return stats
+
+    def _is_ready(self):
+        """Check whether the messages can be published.
+
+        Returns:
+            bool: True if the messages can be published, False otherwise.
+        """
+        try:
+            return self._ready is None or self._ready()
+        except Exception as e:
+            print('Publish readiness check failed: %s' % (str(e)))
+            return False
+
+    def _send(self):
+        """Publish the queued messages, in order."""
+        while True:
+            with self._condition:
+                self._sending = False
+                self._condition.notify_all()
+                while not self._messages and not self._closed:
+                    self._condition.wait(WAIT_s)
+                if not self._messages:
+                    return
+                message = self._messages[0]
+                self._sending = True
+            if not self._is_ready():
+                with self._condition:
+                    if not self._closed:
+                        self._condition.wait(WAIT_s)
+                continue
+            published = self._publish_message(message)
+            with self._condition:
+                if self._messages and self._messages[0] is message:
+                    self._messages.popleft()
+                stats = self._get_stats(message[0])
+                if published:
+                    stats.published += 1
+                else:
+                    stats.failed += 1
+                size = len(self._messages)
+                notify = self._pressure and size <= self._low_watermark
+                if notify:
+                    self._pressure = False
+                self._condition.notify_all()
+            if notify and self._watermark_callback:
+                self._watermark_callback(False, size)
+
+    def _publish_message(self, message):
+        """Publish a message, retrying on failures.
+
+        Args:
+            message (tuple): Topic name, payload, and quality of service.
+
+        Returns:
+            bool: True if the message has been published, False otherwise.
+        """
+        (topic, payload, qos) = message
+        delay_s = RETRY_DELAY_s
+        for attempt in range(RETRIES + 1):
+            try:
+                if self._publish(topic, payload, qos) is not False:
+                    return True
+                error = 'message not handed over'
+            except Exception as e:
+                # E.g. the queue of the underlying MQTT client being full.
+                error = str(e)
+            if attempt == RETRIES:
+                print('Publishing to topic "%s" failed: %s' % (topic, error))
+                return False
+            time.sleep(delay_s)
+            delay_s *= 2
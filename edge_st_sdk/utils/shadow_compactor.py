@@ -0,0 +1,205 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""shadow_compactor
+
+The shadow_compactor module folds the shadow updates issued while the core is
+unreachable into a single pending update, so that only the merged final state
+is sent once the connection is back, whatever the length of the outage.
+
+Updates are merged key by key into nested objects, the last writer winning,
+as the shadow service would merge them. Null values are kept, so that the
+deletions are sent as well. Optimistic locking versions are dropped, as they
+refer to the single updates and not to the merged one.
+
+A key deleted and then recreated as an object cannot be expressed by a single
+update, as the deletion must remove the nested keys stored on the cloud before
+the new ones are written: such deletions are kept apart, to be sent as a reset
+update before the merged one, e.g.:
+
+>>> compactor = ShadowUpdateCompactor()
+>>> compactor.add('{"state":{"reported":{"a":null}}}')
+>>> compactor.add('{"state":{"reported":{"a":{"y":2}}}}')
+>>> reset, payload, callback, folded = compactor.take()
+>>> reset
+'{"state":{"reported":{"a":null}}}'
+>>> payload
+'{"state":{"reported":{"a":{"y":2}}}}'
+"""
+
+
+# IMPORT
+
+import json
+import threading
+
+
+# CONSTANTS
+
+DROPPED_KEYS = ('clientToken', 'version')
+"""Top-level keys of the updates not carried by the merged update."""
+
+
+# FUNCTIONS
+
+def _fold(state, update, resets):
+    """Merge an update into the pending state, in place, keeping null values.
+
+    Args:
+        state (dict): The pending state.
+        update (dict): The update to fold.
+        resets (dict): The deletions to send before the pending state, updated
+            with the keys deleted and then recreated as objects, whose value is
+            null.
+    """
+    for key, value in update.items():
+        if not isinstance(value, dict):
+            # The whole key is overwritten: previous deletions do not matter.
+            resets.pop(key, None)
+            state[key] = value
+            continue
+        current = state.get(key)
+        if current is None and key in state:
+            # Deleted, then recreated.
+            resets[key] = None
+        if not isinstance(current, dict):
+            current = state[key] = {}
+        nested_resets = resets.get(key)
+        if nested_resets is None:
+            # Either reset as a whole already, or nothing to reset so far.
+            nested_resets = {}
+            _fold(current, value, nested_resets)
+            if nested_resets and key not in resets:
+                resets[key] = nested_resets
+        else:
+            _fold(current, value, nested_resets)
+            if not nested_resets:
+                del resets[key]
+
+
+def _call_all(callbacks):
+    """Get a callback calling all the given ones with the same response.
+
+    Args:
+        callbacks (list): The callbacks of shadow requests.
+
+    Returns:
+        function: The callback.
+    """
+    def callback(payload, response_status, token):
+        for pending_callback in callbacks:
+            pending_callback(payload, response_status, token)
+    return callback
+
+
+# CLASSES
+
+class ShadowUpdateCompactor(object):
+    """Class responsible for folding shadow updates into a single pending
+    one."""
+
+    def __init__(self):
+        """Constructor."""
+        self._lock = threading.Lock()
+        self._document = None
+        self._resets = None
+        self._callbacks = []
+        self._callback_set = set()
+        self._folded = 0
+
+    def add(self, payload, callback=None):
+        """Fold an update into the pending one.
+
+        Args:
+            payload (str): JSON document string of the update.
+            callback: Function to be called with the response to the merged
+                update. Each distinct callback is called once, whatever the
+                number of updates it was given for, hence callbacks must be
+                hashable.
+
+        Raises:
+            :exc:`ValueError` if the payload is not a JSON object.
+        """
+        document = json.loads(payload)
+        if not isinstance(document, dict):
+            raise ValueError('The shadow update is not a JSON object.')
+        for key in DROPPED_KEYS:
+            document.pop(key, None)
+        with self._lock:
+            if self._document is None:
+                self._document = {}
+                self._resets = {}
+            _fold(self._document, document, self._resets)
+            if callback is not None and callback not in self._callback_set:
+                self._callback_set.add(callback)
+                self._callbacks.append(callback)
+            self._folded += 1
+
+    def take(self):
+        """Take the pending update out of the compactor.
+
+        Returns:
+            tuple: The JSON document string of the reset update, to be sent
+            before the merged one, or None if no key has been deleted and then
+            recreated, the JSON document string of the merged update, or None
+            if there are no pending updates, the callback to be called with the
+            response to the merged update, or None if there are no callbacks,
+            and the number of updates folded into it.
+        """
+        with self._lock:
+            document = self._document
+            resets = self._resets
+            callbacks = self._callbacks
+            folded = self._folded
+            self._document = None
+            self._resets = None
+            self._callbacks = []
+            self._callback_set = set()
+            self._folded = 0
+        if document is None:
+            return (None, None, None, 0)
+        reset = json.dumps(resets, separators=(',', ':')) if resets else None
+        return (reset, json.dumps(document, separators=(',', ':')), \
+            _call_all(callbacks) if callbacks else None, folded)
+
+    def has_pending(self):
+        """Check whether there is a pending update.
+
+        Returns:
+            bool: True if there is a pending update, False otherwise.
+        """
+        return self._document is not None
+
+    def get_folded(self):
+        """Get the number of updates folded into the pending one.
+
+        Returns:
+            int: The number of updates.
+        """
+        return self._folded
+
@@ -0,0 +1,91 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+"""shadow_document
+
+The shadow_document module provides functions to compare and merge the state
+sections of shadow JSON documents, following the shadow update semantics:
+updates are merged key by key into nested objects, and a null value deletes the
+corresponding key.
+"""
+
+
+# FUNCTIONS
+
+def diff(previous, current):
+    """Compute the minimal update turning a state into another one, given that
+    the keys missing from the latter are left untouched.
+
+    Args:
+        previous (dict): The previous state.
+        current (dict): The current state.
+
+    Returns:
+        dict: The keys of the current state which are missing from the previous
+        one or whose value is different, recursively; empty if nothing
+        changed.
+    """
+    changes = {}
+    for key, value in current.items():
+        if key not in previous:
+            changes[key] = value
+            continue
+        old_value = previous[key]
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            nested_changes = diff(old_value, value)
+            if nested_changes:
+                changes[key] = nested_changes
+        elif value != old_value or type(value) != type(old_value):
+            changes[key] = value
+    return changes
+
+
+def merge(state, update, delete_nulls=True):
+    """Merge an update into a state, in place.
+
+    Args:
+        state (dict): The state to update.
+        update (dict): The update to apply.
+        delete_nulls (bool): If True, null values delete the corresponding
+            keys; otherwise, they are stored as they are, which allows to keep
+            track of the deletions already sent.
+
+    Returns:
+        dict: The updated state.
+    """
+    for key, value in update.items():
+        if value is None and delete_nulls:
+            state.pop(key, None)
+        elif isinstance(value, dict) and isinstance(state.get(key), dict):
+            merge(state[key], value, delete_nulls)
+        elif isinstance(value, dict):
+            state[key] = merge({}, value, delete_nulls)
+        else:
+            state[key] = value
+    return state
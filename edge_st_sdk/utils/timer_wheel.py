@@ -0,0 +1,321 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""timer_wheel
+
+The timer_wheel module runs many short-lived timers, e.g. the timeouts of
+requests, on a single thread.
+
+Timers are kept in a hierarchical timing wheel: the lowest level has a slot
+per tick, each higher level has a slot per revolution of the level below, and
+timers move down a level at a time as their expiration gets closer. Scheduling
+and cancelling a timer take a constant time, whatever the number of timers,
+and the thread sleeps while no timers are scheduled.
+"""
+
+
+# IMPORT
+
+import math
+import threading
+import time
+
+
+# CONSTANTS
+
+TICK_s = 0.01
+"""Default resolution of the timers, in seconds."""
+
+SLOTS = (256, 64, 64, 64)
+"""Default number of slots of each level of the wheel, covering about 19 days
+with the default resolution."""
+
+
+# CLASSES
+
+class Timer(object):
+    """Class holding a timer scheduled on a :class:`TimerWheel`."""
+
+    __slots__ = ('_wheel', '_expiration', '_function', '_args', '_active')
+
+    def __init__(self, wheel, expiration, function, args):
+        """Constructor.
+
+        Args:
+            wheel (:class:`TimerWheel`): The wheel.
+            expiration (int): Tick at which the timer expires.
+            function (function): Function to call when the timer expires.
+            args (tuple): Arguments of the function.
+        """
+        self._wheel = wheel
+        self._expiration = expiration
+        self._function = function
+        self._args = args
+        self._active = True
+
+    def cancel(self):
+        """Cancel the timer, unless already expired.
+
+        Returns:
+            bool: True if the timer has been cancelled, False if it had already
+            expired or been cancelled.
+        """
+        return self._wheel._cancel(self)
+
+    def is_active(self):
+        """Check whether the timer is still to expire.
+
+        Returns:
+            bool: True if the timer is active, False otherwise.
+        """
+        return self._active
+
+
+class TimerWheel(object):
+    """Class responsible for running timers on a single thread."""
+
+    def __init__(self, tick_s=TICK_s, slots=SLOTS):
+        """Constructor.
+
+        Args:
+            tick_s (float): Resolution of the timers, in seconds.
+            slots (tuple): Number of slots of each level of the wheel. Timers
+                beyond the span of the wheel are moved down when their
+                expiration gets within it.
+        """
+        self._tick_s = tick_s
+        self._slots = tuple(slots)
+        self._granularities = []
+        granularity = 1
+        for size in self._slots:
+            self._granularities.append(granularity)
+            granularity *= size
+        self._span = granularity
+        self._levels = [[[] for _ in range(size)] for size in self._slots]
+        self._condition = threading.Condition()
+        self._start_s = time.time()
+        self._tick = 0
+        self._active = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Start running the timers."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop running the timers, waiting for the thread to end. Timers not
+        yet expired are kept."""
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            thread = self._thread
+            self._thread = None
+            self._condition.notify()
+        if thread is not threading.current_thread():
+            thread.join()
+
+    def schedule(self, delay_s, function, *args):
+        """Schedule a timer.
+
+        Args:
+            delay_s (float): Time after which the timer expires, in seconds,
+                rounded up to the next tick of the wheel.
+            function (function): Function to call on the thread of the wheel
+                when the timer expires. It should return quickly, as it delays
+                the other timers.
+            *args: Arguments of the function.
+
+        Returns:
+            :class:`Timer`: The timer.
+        """
+        with self._condition:
+            self._catch_up()
+            expiration = int(math.ceil( \
+                (time.time() - self._start_s + delay_s) / self._tick_s))
+            timer = Timer(self, max(expiration, self._tick + 1), function, \
+                args)
+            self._insert(timer)
+            self._active += 1
+            if self._active == 1:
+                self._condition.notify()
+            return timer
+
+    def get_active(self):
+        """Get the number of timers still to expire.
+
+        Returns:
+            int: The number of timers.
+        """
+        return self._active
+
+    def _cancel(self, timer):
+        """Cancel a timer, leaving it in its slot until it is reached.
+
+        Args:
+            timer (:class:`Timer`): The timer.
+
+        Returns:
+            bool: True if the timer has been cancelled, False otherwise.
+        """
+        with self._condition:
+            if not timer._active:
+                return False
+            timer._active = False
+            self._active -= 1
+            return True
+
+    def _insert(self, timer):
+        """Put a timer into the slot of the lowest level covering its
+        expiration. To be called while holding the lock.
+
+        Args:
+            timer (:class:`Timer`): The timer.
+        """
+        expiration = timer._expiration
+        delta = expiration - self._tick
+        for (level, size) in enumerate(self._slots):
+            granularity = self._granularities[level]
+            if delta < granularity * size:
+                self._levels[level][(expiration // granularity) % size] \
+                    .append(timer)
+                return
+        # Beyond the span of the wheel: parked in the farthest slot.
+        level = len(self._slots) - 1
+        granularity = self._granularities[level]
+        self._levels[level][((self._tick + self._span - 1) // granularity) \
+            % self._slots[level]].append(timer)
+
+    def _catch_up(self):
+        """Skip the ticks elapsed while no timers were active, which cannot
+        have expired anything. To be called while holding the lock."""
+        if self._active == 0:
+            self._tick = max(self._tick, self._get_current_tick())
+
+    def _get_current_tick(self):
+        """Get the tick corresponding to the current time.
+
+        Returns:
+            int: The tick.
+        """
+        return int((time.time() - self._start_s) / self._tick_s)
+
+    def _advance(self):
+        """Advance the wheel by a tick, moving the timers of the higher levels
+        down when their slot is reached. To be called while holding the lock.
+
+        Returns:
+            list: The timers expired.
+        """
+        self._tick += 1
+        tick = self._tick
+        for level in range(len(self._slots) - 1, 0, -1):
+            granularity = self._granularities[level]
+            if tick % granularity:
+                continue
+            slots = self._levels[level]
+            index = (tick // granularity) % self._slots[level]
+            timers = slots[index]
+            if timers:
+                slots[index] = []
+                for timer in timers:
+                    if timer._active:
+                        self._insert(timer)
+        slots = self._levels[0]
+        index = tick % self._slots[0]
+        timers = slots[index]
+        if not timers:
+            return timers
+        slots[index] = []
+        expired = []
+        for timer in timers:
+            if not timer._active:
+                continue
+            if timer._expiration <= tick:
+                timer._active = False
+                self._active -= 1
+                expired.append(timer)
+            else:
+                self._insert(timer)
+        return expired
+
+    def _run(self):
+        """Advance the wheel in step with time, calling the functions of the
+        expired timers."""
+        while True:
+            with self._condition:
+                while self._running and self._active == 0:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                expired = []
+                current = self._get_current_tick()
+                while self._tick < current:
+                    expired.extend(self._advance())
+                    if self._active == 0:
+                        self._tick = current
+                if not expired:
+                    wait_s = (self._tick + 1) * self._tick_s \
+                        - (time.time() - self._start_s)
+                    if wait_s > 0:
+                        self._condition.wait(wait_s)
+                    continue
+            for timer in expired:
+                try:
+                    timer._function(*timer._args)
+                except Exception as e:
+                    # A failing function must not stop the other timers.
+                    print('Timer function "%s" failed: %s' % (getattr( \
+                        timer._function, '__name__', timer._function), str(e)))
+
+
+# FUNCTIONS
+
+_shared_wheel = None
+_shared_wheel_lock = threading.Lock()
+
+
+def get_shared_timer_wheel():
+    """Get the wheel shared by the clients of the SDK, started on first use.
+
+    Returns:
+        :class:`TimerWheel`: The wheel.
+    """
+    global _shared_wheel
+    with _shared_wheel_lock:
+        if _shared_wheel is None:
+            _shared_wheel = TimerWheel()
+            _shared_wheel.start()
+        return _shared_wheel
@@ -0,0 +1,389 @@
+################################################################################
+# COPYRIGHT(c) 2018 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+"""topic_router
+
+The topic_router module dispatches the messages received by a client to the
+handlers registered for their topic, decoding each message only once.
+
+Handlers are registered for topic filters, which are kept in a trie indexed
+by topic level, so that matching a topic takes a time proportional to the
+number of its levels rather than to the number of filters. Handlers may also
+be registered for a key, e.g. the identifier of the target device, extracted
+once from each decoded message: a message is then dispatched only to the
+handlers registered for its key, and to the ones registered without key.
+"""
+
+
+# IMPORT
+
+import threading
+
+
+# CLASSES
+
+class _TrieNode(object):
+    """Node of a :class:`TopicTrie`, standing for a topic level."""
+
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        """Constructor."""
+        self.children = {}
+        self.values = []
+
+
+class TopicTrie(object):
+    """Class responsible for matching topic names against a set of topic
+    filters, with "+" and "#" wildcards.
+
+    Each topic filter is associated to a list of values. As per the MQTT
+    specification, filters starting with a wildcard do not match topic names
+    starting with "$", e.g. "$aws/things/..." shadow topics.
+
+    Not thread-safe: concurrent readers and writers must be synchronized by
+    the caller.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self._root = _TrieNode()
+        self._size = 0
+
+    def add(self, topic_filter, value):
+        """Associate a value to a topic filter.
+
+        Args:
+            topic_filter (str): Topic filter, possibly with wildcards.
+            value: The value.
+        """
+        node = self._root
+        for level in topic_filter.split('/'):
+            child = node.children.get(level)
+            if child is None:
+                child = _TrieNode()
+                node.children[level] = child
+            node = child
+        node.values.append(value)
+        self._size += 1
+
+    def remove(self, topic_filter, value):
+        """Remove the association of a value to a topic filter.
+
+        Args:
+            topic_filter (str): Topic filter, possibly with wildcards.
+            value: The value.
+
+        Returns:
+            bool: True if the value was associated to the topic filter, False
+            otherwise.
+        """
+        path = [self._root]
+        levels = topic_filter.split('/')
+        for level in levels:
+            node = path[-1].children.get(level)
+            if node is None:
+                return False
+            path.append(node)
+        node = path[-1]
+        for index, item in enumerate(node.values):
+            if item is value or item == value:
+                del node.values[index]
+                break
+        else:
+            return False
+        self._size -= 1
+        # Pruning the branches left empty.
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.values or node.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+        return True
+
+    def get(self, topic_filter):
+        """Get the values associated to a topic filter.
+
+        Args:
+            topic_filter (str): Topic filter, possibly with wildcards.
+
+        Returns:
+            list: The values.
+        """
+        node = self._root
+        for level in topic_filter.split('/'):
+            node = node.children.get(level)
+            if node is None:
+                return []
+        return list(node.values)
+
+    def match(self, topic):
+        """Get the values associated to the topic filters matching a topic
+        name.
+
+        Args:
+            topic (str): Topic name.
+
+        Returns:
+            list: The values.
+        """
+        levels = topic.split('/')
+        size = len(levels)
+        matches = []
+        nodes = [(self._root, 0)]
+        while nodes:
+            (node, depth) = nodes.pop()
+            children = node.children
+            wildcards = depth > 0 or not topic.startswith('$')
+            if wildcards:
+                child = children.get('#')
+                if child is not None:
+                    matches.extend(child.values)
+            if depth == size:
+                matches.extend(node.values)
+                continue
+            child = children.get(levels[depth])
+            if child is not None:
+                nodes.append((child, depth + 1))
+            if wildcards:
+                child = children.get('+')
+                if child is not None:
+                    nodes.append((child, depth + 1))
+        return matches
+
+    def __len__(self):
+        """Get the number of associations.
+
+        Returns:
+            int: The number of associations.
+        """
+        return self._size
+
+
+class _Routes(object):
+    """Handlers registered for a topic filter."""
+
+    __slots__ = ('unkeyed', 'keyed')
+
+    def __init__(self):
+        """Constructor."""
+        self.unkeyed = []
+        self.keyed = {}
+
+
+class TopicRouter(object):
+    """Class responsible for dispatching messages to the handlers of their
+    topic and key.
+
+    Handlers are called with the topic name and the decoded object. Handlers
+    can be added and removed while messages are being routed.
+    """
+
+    def __init__(self, decoder, key=None):
+        """Constructor.
+
+        Args:
+            decoder (function): Function called with the topic name and the
+                payload of a message, returning the decoded object; it may
+                raise :exc:`ValueError` for malformed payloads.
+            key: Either a function called with the topic name and the decoded
+                object and returning the key of the message, or the name of
+                the member of the decoded object holding the key. Messages
+                without key are dispatched to the handlers registered without
+                key only.
+        """
+        self._decoder = decoder
+        self._key = None
+        self.set_key(key)
+        self._lock = threading.Lock()
+        self._trie = TopicTrie()
+        self._last_message = None
+
+    def set_key(self, key):
+        """Set how to get the key of the messages.
+
+        Args:
+            key: Either a function called with the topic name and the decoded
+                object, or the name of the member of the decoded object
+                holding the key. None to not dispatch by key.
+        """
+        if key is None or callable(key):
+            self._key = key
+        else:
+            self._key = lambda topic, obj: obj.get(key) \
+                if isinstance(obj, dict) else None
+
+    def add_route(self, topic_filter, handler, key=None):
+        """Register a handler.
+
+        Args:
+            topic_filter (str): Topic filter, possibly with wildcards.
+            handler (function): Function called with the topic name and the
+                decoded object.
+            key: Key of the messages to dispatch to the handler. All the
+                messages matching the topic filter if None.
+
+        Returns:
+            bool: True if it is the first handler of the topic filter, False
+            otherwise.
+        """
+        with self._lock:
+            trie = self._copy_trie()
+            routes = trie.get(topic_filter)
+            first = not routes
+            if first:
+                routes = _Routes()
+            else:
+                routes = self._copy_routes(routes[0])
+                trie.remove(topic_filter, trie.get(topic_filter)[0])
+            if key is None:
+                routes.unkeyed.append(handler)
+            else:
+                routes.keyed[key] = routes.keyed.get(key, []) + [handler]
+            trie.add(topic_filter, routes)
+            self._trie = trie
+            return first
+
+    def remove_route(self, topic_filter, handler, key=None):
+        """Unregister a handler.
+
+        Args:
+            topic_filter (str): Topic filter the handler was registered for.
+            handler (function): The handler.
+            key: Key the handler was registered for.
+
+        Returns:
+            bool: True if no more handlers are registered for the topic filter,
+            False otherwise.
+        """
+        with self._lock:
+            trie = self._copy_trie()
+            routes = trie.get(topic_filter)
+            if not routes:
+                return True
+            trie.remove(topic_filter, routes[0])
+            routes = self._copy_routes(routes[0])
+            if key is None:
+                routes.unkeyed = [h for h in routes.unkeyed if h is not handler]
+            else:
+                handlers = [h for h in routes.keyed.get(key, []) if h is not handler]
+                if handlers:
+                    routes.keyed[key] = handlers
+                else:
+                    routes.keyed.pop(key, None)
+            empty = not routes.unkeyed and not routes.keyed
+            if not empty:
+                trie.add(topic_filter, routes)
+            self._trie = trie
+            return empty
+
+    def _copy_trie(self):
+        """Copy the trie, so that it can be changed while routing with the
+        current one.
+
+        Returns:
+            :class:`TopicTrie`: The copy.
+        """
+        trie = TopicTrie()
+        nodes = [(self._trie._root, [])]
+        while nodes:
+            (node, levels) = nodes.pop()
+            for routes in node.values:
+                trie.add('/'.join(levels), routes)
+            for (level, child) in node.children.items():
+                nodes.append((child, levels + [level]))
+        return trie
+
+    @staticmethod
+    def _copy_routes(routes):
+        """Copy the handlers of a topic filter.
+
+        Args:
+            routes (:class:`_Routes`): The handlers.
+
+        Returns:
+            :class:`_Routes`: The copy.
+        """
+        copy = _Routes()
+        copy.unkeyed = list(routes.unkeyed)
+        copy.keyed = dict(routes.keyed)
+        return copy
+
+    def route(self, topic, payload):
+        """Dispatch a message to the handlers registered for its topic and
+        key.
+
+        Args:
+            topic (str): Topic name of the message.
+            payload (str): Payload of the message.
+
+        Returns:
+            int: The number of handlers called.
+        """
+        matches = self._trie.match(topic)
+        if not matches:
+            return 0
+        try:
+            obj = self._decoder(topic, payload)
+        except ValueError as e:
+            print("Discarding message on topic %s: %s" % (topic, str(e)))
+            return 0
+        handlers = []
+        key = None
+        key_computed = False
+        for routes in matches:
+            handlers.extend(routes.unkeyed)
+            if routes.keyed and self._key is not None:
+                if not key_computed:
+                    try:
+                        key = self._key(topic, obj)
+                    except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+                        key = None
+                    key_computed = True
+                if key is not None:
+                    handlers.extend(routes.keyed.get(key, ()))
+        for handler in handlers:
+            handler(topic, obj)
+        return len(handlers)
+
+    def on_message(self, client, userdata, message):
+        """Dispatch a message received by an MQTT client, to be registered as
+        the callback of the subscriptions of the topic filters.
+
+        A message delivered to several callbacks because of overlapping
+        subscriptions is dispatched only once.
+
+        Args:
+            client: The MQTT client.
+            userdata: User data of the MQTT client.
+            message: The message, with "topic" and "payload" attributes.
+        """
+        if message is self._last_message:
+            return
+        self._last_message = message
+        self.route(message.topic, message.payload)